@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+asyncio 上游后端并发基准测试
+
+在子进程中启动一个 asyncio 模拟 IMAP 服务器和令牌端点 (每个响应前等待 --latency-ms 模拟网络往返)，
+让 --polls 个不同的邮箱同时获取最新邮件，每种方式跑 --rounds 轮 (第一轮需要刷新令牌并建立连接，之后复用连接池):
+- sync: 现有的 requests + imaplib 实现，在 --threads 个线程中并发 (相当于 Flask 的请求线程)
+- asyncio (adapter): 同样的 --threads 个线程，通过 run_sync() 调用 asyncio 后端
+- asyncio (native): 在后端事件循环中用 asyncio.gather 同时发起全部请求
+
+用法:
+    python scripts/bench_async_upstream.py [--polls 2000] [--threads 64] [--latency-ms 20] [--rounds 2]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import email
+import asyncio
+import logging
+import pathlib
+import argparse
+import statistics
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+project_root = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+MESSAGE = (b"From: sender@example.com\r\nTo: user@example.com\r\nSubject: Your code is 123456\r\n"
+           b"Date: Mon, 1 Jan 2024 00:00:00 +0000\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n"
+           b"Your verification code is 123456\r\n")
+MESSAGE_COUNT = 20
+
+
+class Counters:
+    """子进程与主进程共享的计数: 当前连接数、最大连接数、令牌请求数。"""
+
+    def __init__(self):
+        self._values = multiprocessing.Array('q', 3, lock=False)
+
+    connections = property(lambda self: self._values[0], lambda self, value: self._values.__setitem__(0, value))
+    max_connections = property(lambda self: self._values[1], lambda self, value: self._values.__setitem__(1, value))
+    token_requests = property(lambda self: self._values[2], lambda self, value: self._values.__setitem__(2, value))
+
+
+class FakeUpstream:
+    """模拟 IMAP 服务器和令牌端点，在子进程中运行，避免与被测客户端争用 GIL。"""
+
+    def __init__(self, latency, counters):
+        self.latency = latency
+        self.counters = counters
+
+    @classmethod
+    def start(cls, latency, counters):
+        """启动子进程，返回 (IMAP 端口, 令牌端点端口)。"""
+        parent, child = multiprocessing.Pipe()
+        multiprocessing.Process(target=cls(latency, counters)._run, args=(child,), daemon=True).start()
+        return parent.recv()
+
+    def _run(self, pipe):
+        async def serve():
+            pipe.send((await self._serve(self._handle_imap), await self._serve(self._handle_token)))
+            await asyncio.Event().wait()
+        asyncio.run(serve())
+
+    async def _serve(self, handler):
+        server = await asyncio.start_server(handler, '127.0.0.1', 0, backlog=8192)
+        return server.sockets[0].getsockname()[1]
+
+    async def _reply(self, writer, data):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        writer.write(data)
+        await writer.drain()
+
+    async def _handle_imap(self, reader, writer):
+        counters = self.counters
+        counters.connections += 1
+        counters.max_connections = max(counters.max_connections, counters.connections)
+        try:
+            await self._reply(writer, b"* OK fake IMAP ready\r\n")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                parts = line.decode().strip().split(' ', 2)
+                tag, command = parts[0], parts[1].upper()
+                if command == 'CAPABILITY':
+                    await self._reply(writer, f"* CAPABILITY IMAP4rev1 AUTH=XOAUTH2\r\n{tag} OK done\r\n".encode())
+                elif command == 'AUTHENTICATE':
+                    await self._reply(writer, b"+ \r\n")
+                    await reader.readline()
+                    await self._reply(writer, f"{tag} OK authenticated\r\n".encode())
+                elif command in ('SELECT', 'EXAMINE'):
+                    await self._reply(writer, f"* {MESSAGE_COUNT} EXISTS\r\n* 0 RECENT\r\n* OK [UIDVALIDITY 1] ok\r\n"
+                                              f"* OK [UIDNEXT {MESSAGE_COUNT + 1}] ok\r\n{tag} OK done\r\n".encode())
+                elif command == 'FETCH':
+                    number = parts[2].split(' ', 1)[0]
+                    await self._reply(writer, f"* {number} FETCH (RFC822 {{{len(MESSAGE)}}}\r\n".encode() + MESSAGE
+                                      + f")\r\n{tag} OK done\r\n".encode())
+                elif command == 'NOOP':
+                    await self._reply(writer, f"{tag} OK done\r\n".encode())
+                elif command == 'LOGOUT':
+                    await self._reply(writer, f"* BYE\r\n{tag} OK done\r\n".encode())
+                    return
+                else:
+                    await self._reply(writer, f"{tag} BAD unknown command\r\n".encode())
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            counters.connections -= 1
+            writer.close()
+
+    async def _handle_token(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b''):
+                        break
+                    match = re.match(rb'content-length:\s*(\d+)', header, re.IGNORECASE)
+                    if match:
+                        length = int(match.group(1))
+                await reader.readexactly(length)
+                self.counters.token_requests += 1
+                body = json.dumps({"access_token": "bench-token", "token_type": "Bearer", "expires_in": 3600}).encode()
+                await self._reply(writer, b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                                          + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def summarize(name, polls, wall, samples, threads, counters):
+    samples.sort()
+    print(f"{name:<21} {polls:>6} {wall:>8.2f}s {polls / wall:>9.0f}/s {statistics.mean(samples):>8.0f}ms "
+          f"{samples[len(samples) // 2]:>8.0f}ms {samples[min(len(samples) - 1, int(len(samples) * 0.99))]:>8.0f}ms "
+          f"{threads:>8} {counters.max_connections:>9}")
+
+
+def run_threads(func, accounts, threads):
+    def timed(account):
+        start = time.perf_counter()
+        result = func(account)
+        assert result and result['subject'] == 'Your code is 123456', result
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        samples = list(executor.map(timed, accounts))
+    return time.perf_counter() - start, samples
+
+
+def run_native(cloud_email_api, accounts):
+    backend = cloud_email_api.async_upstream
+
+    async def poll(account):
+        start = time.perf_counter()
+        raw = await backend.fetch_latest(account[1], account[2], account[0])
+        result = cloud_email_api.parse_email_message(email.message_from_bytes(raw))
+        assert result['subject'] == 'Your code is 123456', result
+        return (time.perf_counter() - start) * 1000
+
+    async def poll_all():
+        return await asyncio.gather(*(poll(account) for account in accounts))
+
+    start = time.perf_counter()
+    samples = backend.run_sync(poll_all())
+    return time.perf_counter() - start, list(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark concurrent latest-email polls per upstream backend.')
+    parser.add_argument('--polls', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--rounds', type=int, default=2)
+    args = parser.parse_args()
+
+    counters = Counters()
+    imap_port, token_port = FakeUpstream.start(args.latency_ms / 1000, counters)
+    os.environ.update({
+        'IMAP_SERVER': '127.0.0.1',
+        'IMAP_PORT': str(imap_port),
+        'IMAP_USE_SSL': 'false',
+        'TOKEN_URL': f'http://127.0.0.1:{token_port}/token',
+        'TOKEN_HTTP_POOL_SIZE': str(args.threads),
+        'IMAP_POOL_MAX_CONNECTIONS': str(args.polls),
+        'ASYNC_UPSTREAM_MAX_CONCURRENCY': str(args.polls),
+    })
+    logging.disable(logging.CRITICAL)
+    from src.api import cloud_email_api
+
+    accounts = [(f"user{i}@example.com", f"refresh-{i}", "bench-client") for i in range(args.polls)]
+
+    def latest(account):
+        return cloud_email_api.get_latest_email(account[1], account[2], account[0])
+
+    print(f"{args.polls} mailboxes, {args.latency_ms:.0f}ms simulated latency per response")
+    print(f"{'backend':<21} {'polls':>6} {'wall':>9} {'rate':>11} {'mean':>10} {'p50':>10} {'p99':>10} "
+          f"{'threads':>8} {'max conns':>9}")
+    modes = [
+        ('sync', 'sync', lambda: run_threads(latest, accounts, args.threads), args.threads),
+        ('asyncio (adapter)', 'asyncio', lambda: run_threads(latest, accounts, args.threads), args.threads + 1),
+        ('asyncio (native)', 'asyncio', lambda: run_native(cloud_email_api, accounts), 1),
+    ]
+    for name, backend, run, threads in modes:
+        cloud_email_api.UPSTREAM_BACKEND = backend
+        cloud_email_api.token_cache.clear()
+        cloud_email_api.imap_pool.close_all()
+        cloud_email_api.async_upstream.close()
+        for round_number in range(args.rounds):
+            counters.max_connections = counters.connections
+            token_requests = counters.token_requests
+            wall, samples = run()
+            summarize(f"{name} #{round_number + 1}", args.polls, wall, samples, threads, counters)
+            if round_number == 0:
+                assert counters.token_requests - token_requests == args.polls
+    cloud_email_api.imap_pool.close_all()
+    cloud_email_api.async_upstream.close()
+
+
+if __name__ == '__main__':
+    main()
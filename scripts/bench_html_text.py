@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+HTML 转文本基准测试
+
+用 tests/html_corpus.py 生成营销邮件风格的 HTML，对比:
+- bs4: BeautifulSoup(html.parser).get_text()
+- stream: src.api.html_text 的流式解析器
+两者的一致性 (去掉空白后文本相同) 由 tests/test_html_text.py 检查。
+性能: 每封邮件的耗时、吞吐量、tracemalloc 峰值内存，以及 parse_email_message() 整体耗时。
+
+用法:
+    python scripts/bench_html_text.py [--messages 40] [--repeat 3]
+"""
+
+import sys
+import time
+import random
+import logging
+import pathlib
+import argparse
+import tracemalloc
+from email.mime.text import MIMEText
+from email import message_from_bytes
+
+project_root = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.api import cloud_email_api
+from src.api.html_text import html_to_text, html_to_text_bs4
+from tests.html_corpus import marketing_html
+
+
+def timed(func, corpus, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in corpus:
+            func(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(func, content):
+    tracemalloc.start()
+    func(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark HTML-to-text extraction.')
+    parser.add_argument('--messages', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    rng = random.Random(args.seed)
+    sizes = (20_000, 100_000, 300_000)
+    corpus = {size: [marketing_html(rng, size) for _ in range(args.messages)] for size in sizes}
+
+    print(f"{'size':>8} {'extractor':<8} {'ms/msg':>8} {'MB/s':>7} {'peak mem':>10}")
+    for size, documents in corpus.items():
+        total_bytes = sum(len(html.encode()) for html in documents)
+        for name, func in (('bs4', html_to_text_bs4), ('stream', html_to_text)):
+            best = timed(func, documents, args.repeat)
+            print(f"{size // 1000:>6}KB {name:<8} {best / len(documents) * 1000:>8.2f} "
+                  f"{total_bytes / best / 1e6:>7.1f} {peak_memory(func, documents[0]) / 1e6:>8.1f}MB")
+
+    messages = [message_from_bytes(MIMEText(html, 'html', 'utf-8').as_bytes()) for html in corpus[100_000]]
+    print(f"\nparse_email_message() on {len(messages)} x 100KB HTML messages:")
+    for name in ('bs4', 'stream'):
+        cloud_email_api.HTML_TEXT_EXTRACTOR = name
+        best = timed(cloud_email_api.parse_email_message, messages, args.repeat)
+        print(f"  HTML_TEXT_EXTRACTOR={name:<7} {best / len(messages) * 1000:>7.2f} ms/msg")
+
+
+if __name__ == '__main__':
+    main()
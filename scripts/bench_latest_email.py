@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+获取最新邮件基准测试
+
+在本地启动一个模拟 IMAP 服务器 (邮箱中有大量邮件)，在同一个已认证的连接上对比:
+- 旧实现: SEARCH ALL 列出所有邮件序号后取最后一个，再 FETCH
+- 当前实现: 直接用 SELECT 返回的邮件数量作为最新邮件的序号
+- cached: 当前实现加上已解析邮件缓存，最新邮件没有变化时只查询 UID (第一次请求之后都命中缓存)
+
+用法:
+    python scripts/bench_latest_email.py [--messages 1000 10000 50000] [--requests 200] [--body-kb 0]
+"""
+
+import sys
+import time
+import email
+import imaplib
+import logging
+import pathlib
+import argparse
+import threading
+import statistics
+import socketserver
+
+project_root = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.api import cloud_email_api
+
+MESSAGE = (b"From: sender@example.com\r\nTo: user@example.com\r\nSubject: Your code is 123456\r\n"
+           b"Date: Mon, 1 Jan 2024 00:00:00 +0000\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n"
+           b"Your verification code is 123456\r\n")
+
+
+class FakeImapHandler(socketserver.StreamRequestHandler):
+    """只实现基准测试需要的命令: CAPABILITY, AUTHENTICATE, SELECT/EXAMINE, SEARCH, FETCH, UID FETCH, LOGOUT。"""
+
+    # 避免 Nagle 算法与延迟确认叠加带来的 40ms 停顿
+    disable_nagle_algorithm = True
+
+    def write(self, data):
+        data = data if isinstance(data, bytes) else data.encode()
+        self.server.bytes_sent += len(data)
+        self.wfile.write(data)
+
+    def handle(self):
+        count = self.server.message_count
+        message = self.server.message
+        self.write("* OK fake IMAP ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.decode().strip().split(' ', 2)
+            tag, command = parts[0], parts[1].upper()
+            if command == 'CAPABILITY':
+                self.write(f"* CAPABILITY IMAP4rev1 AUTH=XOAUTH2\r\n{tag} OK done\r\n")
+            elif command == 'AUTHENTICATE':
+                self.write("+ \r\n")
+                self.rfile.readline()
+                self.write(f"{tag} OK authenticated\r\n")
+            elif command in ('SELECT', 'EXAMINE'):
+                self.write(f"* {count} EXISTS\r\n* 0 RECENT\r\n* OK [UIDVALIDITY 1] ok\r\n"
+                           f"* OK [UIDNEXT {count + 1}] ok\r\n{tag} OK [READ-ONLY] done\r\n")
+            elif command == 'SEARCH':
+                self.write("* SEARCH " + " ".join(map(str, range(1, count + 1))) + f"\r\n{tag} OK done\r\n")
+            elif command == 'FETCH' and parts[2].upper().endswith('(UID)'):
+                # 序号与 UID 相同
+                number = parts[2].split(' ', 1)[0]
+                self.write(f"* {number} FETCH (UID {number})\r\n{tag} OK done\r\n")
+            elif command in ('FETCH', 'UID'):
+                number = parts[2].split(' ')[1 if command == 'UID' else 0]
+                self.write(f"* {number} FETCH (UID {number} RFC822 {{{len(message)}}}\r\n".encode() + message + b")\r\n")
+                self.write(f"{tag} OK done\r\n")
+            elif command == 'LOGOUT':
+                self.write(f"* BYE\r\n{tag} OK done\r\n")
+                return
+            else:
+                self.write(f"{tag} BAD unknown command\r\n")
+
+
+class FakeImapServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, message_count, message):
+        super().__init__(('127.0.0.1', 0), FakeImapHandler)
+        self.message_count = message_count
+        self.message = message
+        self.bytes_sent = 0
+
+
+def legacy_fetch_latest(mail, mailbox):
+    """旧实现: SEARCH ALL 取最后一个序号。"""
+    status, _ = mail.select(mailbox, readonly=True)
+    assert status == 'OK'
+    status, message_ids_bytes = mail.search(None, 'ALL')
+    latest_id = message_ids_bytes[0].split()[-1]
+    status, message_data = mail.fetch(latest_id, '(RFC822)')
+    return cloud_email_api.parse_email_message(email.message_from_bytes(message_data[0][1]))
+
+
+def measure(func, mail, server, total):
+    samples = []
+    server.bytes_sent = 0
+    for _ in range(total):
+        start = time.perf_counter()
+        result = func(mail, 'INBOX')
+        samples.append((time.perf_counter() - start) * 1000)
+        assert result and result['subject'] == 'Your code is 123456'
+    samples.sort()
+    return {
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "kb": server.bytes_sent / total / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark fetching the newest message.')
+    parser.add_argument('--messages', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--body-kb', type=int, default=0, help='extra HTML body size per message')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    message = MESSAGE
+    if args.body_kb:
+        row = b'<tr><td style="padding:8px;color:#333">Weekly deals &amp; offers for members</td></tr>\r\n'
+        html = b'<html><body><table>' + row * (args.body_kb * 1024 // len(row)) + b'</table></body></html>\r\n'
+        message = (MESSAGE.replace(b'Content-Type: text/plain; charset=utf-8\r\n\r\n',
+                                   b'Content-Type: multipart/alternative; boundary="b"\r\n\r\n--b\r\n'
+                                   b'Content-Type: text/plain; charset=utf-8\r\n\r\n')
+                   + b'--b\r\nContent-Type: text/html; charset=utf-8\r\n\r\n' + html + b'--b--\r\n')
+
+    def cached_fetch_latest(mail, mailbox):
+        return cloud_email_api._fetch_latest_email(mail, mailbox, 'full', 'bench@example.com')
+
+    print(f"{'messages':>8} | {'legacy mean':>12} {'p50':>9} {'p99':>9} {'KB/req':>8} | "
+          f"{'current mean':>12} {'p50':>9} {'p99':>9} {'KB/req':>8} | "
+          f"{'cached mean':>12} {'p50':>9} {'p99':>9} {'KB/req':>8}")
+    for count in args.messages:
+        server = FakeImapServer(count, message)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        mail = imaplib.IMAP4('127.0.0.1', server.server_address[1])
+        mail.authenticate('XOAUTH2', lambda _: b'user=bench\x01auth=Bearer token\x01\x01')
+
+        legacy = measure(legacy_fetch_latest, mail, server, args.requests)
+        current = measure(cloud_email_api._fetch_latest_email, mail, server, args.requests)
+        cloud_email_api.message_cache.clear()
+        cached = measure(cached_fetch_latest, mail, server, args.requests)
+        print(f"{count:>8} | {legacy['mean']:>10.2f}ms {legacy['p50']:>7.2f}ms {legacy['p99']:>7.2f}ms "
+              f"{legacy['kb']:>8.1f} | {current['mean']:>10.2f}ms {current['p50']:>7.2f}ms "
+              f"{current['p99']:>7.2f}ms {current['kb']:>8.1f} | {cached['mean']:>10.2f}ms {cached['p50']:>7.2f}ms "
+              f"{cached['p99']:>7.2f}ms {cached['kb']:>8.1f}")
+        mail.logout()
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+租约分配器规模基准测试
+
+在 1M 个账号、100k 个并发租约的规模下，对比:
+- 旧实现: 每次分配全量扫描租约字典寻找过期项，再线性遍历打乱后的账号列表
+- LeaseAllocator: 空闲池 O(1) 随机取出 + 过期堆
+
+用法:
+    python scripts/bench_lease_allocator.py [--accounts 1000000] [--leases 100000]
+"""
+
+import sys
+import time
+import random
+import logging
+import argparse
+import pathlib
+import tracemalloc
+
+project_root = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.pool.lease_allocator import LeaseAllocator
+
+LEASE_DURATION = 600
+
+
+def legacy_allocate(accounts, leases, now):
+    """旧版分配逻辑 (不含目录扫描部分)。"""
+    expired = [e for e, ts in leases.items() if now - ts > LEASE_DURATION]
+    for e in expired:
+        leases.pop(e, None)
+    candidates = list(accounts)
+    random.shuffle(candidates)
+    leased = set(leases.keys())
+    for email in candidates:
+        if email not in leased:
+            leases[email] = now
+            return email
+    return None
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<42} {elapsed * 1e6 / count:>10.2f} us/op  ({count} ops, {elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the lease allocator at scale.')
+    parser.add_argument('--accounts', type=int, default=1_000_000)
+    parser.add_argument('--leases', type=int, default=100_000)
+    parser.add_argument('--legacy-ops', type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    accounts = [f"user{i}@example.com" for i in range(args.accounts)]
+    print(f"accounts={args.accounts} concurrent_leases={args.leases}")
+
+    # --- LeaseAllocator ---
+    allocator = LeaseAllocator(LEASE_DURATION)
+    timed("allocator: load accounts", args.accounts, lambda: allocator.add_accounts(accounts))
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    now = time.time()
+    timed("allocator: allocate (fill to N leases)", args.leases,
+          lambda: [allocator.allocate(now) for _ in range(args.leases)])
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{'allocator: memory per lease':<42} {(after - before) / args.leases:>10.1f} bytes")
+
+    leased = list(allocator.leases)
+    timed("allocator: get (valid lease)", args.leases, lambda: [allocator.get(e, now) for e in leased])
+
+    def churn():
+        for email in leased[:args.leases // 2]:
+            allocator.release(email)
+            allocator.allocate(now)
+    timed("allocator: release + allocate at N leases", args.leases // 2, churn)
+
+    # 让一半租约同时到期，测量回收成本
+    expiring = list(allocator.leases)[:args.leases // 2]
+    with allocator.lock:
+        for email in expiring:
+            allocator.leases[email].expires_at = now - 1
+        allocator._heap = [(l.expires_at, l.email) for l in allocator.leases.values()]
+        import heapq
+        heapq.heapify(allocator._heap)
+    timed("allocator: expire (per expired lease)", len(expiring), lambda: allocator.expire(now))
+    timed("allocator: allocate with nothing expiring", 10000, lambda: [allocator.allocate(now) for _ in range(10000)])
+
+    # --- 旧实现 ---
+    leases = {}
+    for email in accounts[:args.leases]:
+        leases[email] = now
+    timed("legacy: allocate at N leases", args.legacy_ops,
+          lambda: [legacy_allocate(accounts, leases, now) for _ in range(args.legacy_ops)])
+
+
+if __name__ == '__main__':
+    main()
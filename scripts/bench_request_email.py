@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/request-email 延迟基准测试
+
+对比旧实现 (每次请求 glob 目录 + is_file + shuffle) 与新的内存账号索引，
+分别在 1k、10k、100k 个账号文件下测量单次请求延迟。
+
+用法:
+    python scripts/bench_request_email.py [--sizes 1000 10000 100000] [--requests 200]
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import logging
+import argparse
+import pathlib
+import tempfile
+import threading
+import statistics
+
+project_root = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from flask import jsonify
+
+from src import email_service
+
+
+legacy_leases = {}  # 旧实现的租约表 {"email": timestamp}
+legacy_lock = threading.Lock()
+
+
+def legacy_request_email(oauth_dir_path):
+    """旧版 /request-email 的分配逻辑 (用于对比)。"""
+    with legacy_lock:
+        current_time = time.time()
+        expired = [e for e, ts in legacy_leases.items()
+                   if current_time - ts > email_service.LEASE_DURATION_SECONDS]
+        for e in expired:
+            legacy_leases.pop(e, None)
+
+    all_json_files = list(oauth_dir_path.glob('*.json'))
+    available_files = [f for f in all_json_files if f.is_file() and not f.name.endswith('.used')]
+    if not available_files:
+        return jsonify({"error": "No available email accounts at the moment."}), 409
+    random.shuffle(available_files)
+
+    with legacy_lock:
+        leased = set(legacy_leases.keys())
+        for file_path in available_files:
+            if file_path.suffix == '.json' and '_at_' in file_path.stem:
+                candidate = file_path.stem.replace('_at_', '@')
+                if candidate not in leased:
+                    legacy_leases[candidate] = time.time()
+                    return jsonify({"email": candidate}), 200
+    return jsonify({"error": "No available email accounts at the moment."}), 409
+
+
+def populate(oauth_dir, count):
+    """生成 count 个账号文件。"""
+    for i in range(count):
+        email = f"user{i}@example.com"
+        with open(oauth_dir / f"{email.replace('@', '_at_')}.json", 'w', encoding='utf-8') as f:
+            json.dump({"email": email, "password": "x", "client_id": "cid", "refresh_token": "rt"}, f)
+
+
+def measure(client, path, requests_count):
+    """调用 path requests_count 次，每次之后释放租约以保持账号池大小不变。"""
+    samples = []
+    for _ in range(requests_count):
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.get_json()
+        legacy_leases.clear()
+        email_service.lease_allocator.clear()
+    samples.sort()
+    return {
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /request-email latency.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    app = email_service.app
+    app.add_url_rule('/legacy-request-email', 'legacy_request_email',
+                     lambda: legacy_request_email(email_service.get_data_dir('oauth')))
+    client = app.test_client()
+    original_get_data_dir = email_service.get_data_dir
+
+    print(f"{'accounts':>10} | {'legacy mean':>12} {'p50':>9} {'p99':>9} | {'index mean':>12} {'p50':>9} {'p99':>9} | build")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            oauth_dir = pathlib.Path(tmp) / 'oauth'
+            oauth_dir.mkdir()
+            populate(oauth_dir, size)
+            email_service.get_data_dir = lambda subdir=None: oauth_dir
+            email_service.account_store = None
+
+            start = time.perf_counter()
+            email_service.get_account_store()
+            build_ms = (time.perf_counter() - start) * 1000
+
+            # 旧实现在大目录下非常慢，适当减少请求次数
+            legacy_requests = max(10, args.requests * 1000 // size)
+            legacy = measure(client, '/legacy-request-email', legacy_requests)
+            indexed = measure(client, '/request-email', args.requests)
+
+            print(f"{size:>10} | {legacy['mean']:>10.3f}ms {legacy['p50']:>7.3f}ms {legacy['p99']:>7.3f}ms | "
+                  f"{indexed['mean']:>10.3f}ms {indexed['p50']:>7.3f}ms {indexed['p99']:>7.3f}ms | {build_ms:.0f}ms")
+            email_service.get_data_dir = original_get_data_dir
+            email_service.lease_allocator.remove_accounts(email_service.account_store.index.snapshot())
+            email_service.account_store = None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+令牌刷新延迟基准测试
+
+在本地启动一个模拟 OAuth 令牌端点 (默认使用 openssl 生成的自签名证书走 HTTPS)，
+对比旧实现 (每次 requests.post 新建 TCP+TLS 连接) 与共享连接池 Session 的单次刷新延迟。
+
+用法:
+    python scripts/bench_token_refresh.py [--requests 300] [--threads 1 8] [--no-tls]
+"""
+
+import os
+import ssl
+import sys
+import json
+import time
+import logging
+import pathlib
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+project_root = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.api import cloud_email_api
+
+
+class TokenHandler(BaseHTTPRequestHandler):
+    """模拟令牌端点，返回固定的 access token。"""
+
+    protocol_version = 'HTTP/1.1'
+    # 避免 Nagle 算法与延迟确认叠加带来的 40ms 停顿，模拟真实端点的响应时间
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({"access_token": "bench-token", "token_type": "Bearer", "expires_in": 3600}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(use_tls, cert_dir):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), TokenHandler)
+    server.daemon_threads = True
+    scheme = 'http'
+    if use_tls:
+        cert, key = os.path.join(cert_dir, 'cert.pem'), os.path.join(cert_dir, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                        '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                        '-keyout', key, '-out', cert],
+                       check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        # 两种实现都信任这张自签名证书
+        os.environ['REQUESTS_CA_BUNDLE'] = cert
+        scheme = 'https'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}/token"
+
+
+def legacy_refresh(url):
+    """旧实现: 不使用 Session，每次新建连接。"""
+    response = requests.post(url, data={'grant_type': 'refresh_token', 'refresh_token': 'rt', 'client_id': 'cid'})
+    response.raise_for_status()
+    return response.json()['access_token']
+
+
+def pooled_refresh(url):
+    token, _ = cloud_email_api._request_access_token('rt', 'cid')
+    assert token
+    return token
+
+
+def measure(func, url, total, threads):
+    def timed(_):
+        start = time.perf_counter()
+        func(url)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        samples = sorted(pool.map(timed, range(total)))
+    elapsed = time.perf_counter() - start
+    return {
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "rps": total / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark token refresh latency.')
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--no-tls', action='store_true', help='使用明文 HTTP (不需要 openssl)')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as cert_dir:
+        server, url = start_server(not args.no_tls, cert_dir)
+        cloud_email_api.TOKEN_URL = url
+
+        print(f"token endpoint: {url}")
+        print(f"{'threads':>7} | {'legacy mean':>12} {'p50':>9} {'p99':>9} {'req/s':>8} | "
+              f"{'pooled mean':>12} {'p50':>9} {'p99':>9} {'req/s':>8}")
+        for threads in args.threads:
+            legacy = measure(legacy_refresh, url, args.requests, threads)
+            pooled = measure(pooled_refresh, url, args.requests, threads)
+            print(f"{threads:>7} | {legacy['mean']:>10.2f}ms {legacy['p50']:>7.2f}ms {legacy['p99']:>7.2f}ms "
+                  f"{legacy['rps']:>8.0f} | {pooled['mean']:>10.2f}ms {pooled['p50']:>7.2f}ms "
+                  f"{pooled['p99']:>7.2f}ms {pooled['rps']:>8.0f}")
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+验证码提取基准测试
+
+生成一批仿照真实服务格式的验证邮件 (数字/字母数字验证码、魔法链接、中日文、只有 HTML、
+带日期/金额/订单号等干扰数字、不含验证码的普通邮件)，经 parse_email_message 解析后对比:
+- naive: 客户端常见做法，在正文和 HTML 中搜索第一个 4-8 位数字
+- per-rule: 与提取器相同的规则，但每条规则单独编译、逐条搜索
+- extractor: CodeExtractor (字面量定位关键词/说明/链接后运行锚定正则，纯文本优先，HTML 兜底)
+输出准确率、每封邮件的提取耗时，以及 /get-latest-email 与 /get-verification-code 的响应大小。
+
+用法:
+    python scripts/bench_verification_code.py [--messages 5000] [--repeat 3]
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import string
+import logging
+import pathlib
+import argparse
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email import message_from_bytes
+
+project_root = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.api import cloud_email_api, code_extractor
+from src.api.code_extractor import CodeExtractor
+
+HTML_FRAME = ('<html><head><style>.otp{{font-size:32px}} td{{padding:8px}}</style><title>{subject}</title></head>'
+              '<body><table width="600"><tr><td><img src="https://cdn.example.com/logo-2x.png" width="120"></td></tr>'
+              '<tr><td>{body}</td></tr><tr><td style="color:#999">© 2011-2024 Example Inc. · 500 Howard St, '
+              'San Francisco, CA 94105<br><a href="https://example.com/unsubscribe?u={order}">Unsubscribe</a> · '
+              '<a href="https://example.com/privacy">Privacy</a></td></tr></table></body></html>')
+
+# (发件人, 主题, 纯文本 (None 表示只有 HTML), HTML (None 表示只有纯文本), 期望结果: code/link/None)
+TEMPLATES = [
+    ("GitHub <noreply@github.com>", "[GitHub] Please verify your device",
+     "Hey {user}!\n\nA sign in attempt requires further verification because we did not recognize your device. "
+     "To complete the sign in, enter the verification code on the unrecognized device.\n\nDevice: Chrome on Windows\n"
+     "Verification code: {code6}\n\nIf you did not attempt to sign in to your account, your password may be compromised.\n"
+     "Thanks,\nThe GitHub Team", None, 'code6'),
+    ("Google <no-reply@accounts.google.com>", "G-{code6} is your Google verification code",
+     "G-{code6} is your Google verification code.\n\nDon't share this code with anyone.", None, 'code6'),
+    ("Microsoft account team <account-security-noreply@accountprotection.microsoft.com>", "Microsoft account security code",
+     "Microsoft account\nSecurity code\n\nPlease use the following security code for the Microsoft account {masked}.\n\n"
+     "Security code: {code4}\n\nIf you don't recognize the Microsoft account {masked}, you can click here to remove your "
+     "email address from that account.\n\nThanks,\nThe Microsoft account team",
+     "<p>Please use the following security code for the Microsoft account {masked}.</p><p>Security code: "
+     "<span style=\"font-weight:bold\">{code4}</span></p>", 'code4'),
+    ("某某科技 <service@notice.example.cn>", "【某某科技】登录验证",
+     "【某某科技】您的验证码为：{code6}，{minutes}分钟内有效。如非本人操作，请忽略本短信。订单尾号 {order4}。", None, 'code6'),
+    ("Amazon <account-update@amazon.com>", "Your Amazon verification code",
+     None,
+     "<p>To verify your identity, please use the following code:</p><p class=\"otp\">{code6}</p>"
+     "<p>Amazon takes your account security very seriously. Order #{order} total ${amount} placed on {date}.</p>",
+     'code6'),
+    ("Slack <feedback@slack.com>", "Confirm your email address on Slack",
+     "Click the link below to sign in to your workspace:\n\n{link}\n\nThis link will expire in 24 hours and can only "
+     "be used once.\n\nSlack Technologies, 500 Howard Street, San Francisco, CA 94105",
+     "<p>Click the button below to sign in.</p><a href=\"{link}\">Sign in to Slack</a>", 'link'),
+    ("Figma <support@figma.com>", "Sign in to Figma",
+     "Click the button below to log in. This message was sent on {date}.",
+     "<p>Click the button below to log in.</p><a href=\"{link_html}\">Log in</a>", 'link'),
+    ("Steam Support <noreply@steampowered.com>", "Your Steam account: Access from new web or mobile device",
+     "Dear {user},\n\nHere is the Steam Guard code you need to login to account {user}:\n\nLogin Code\n\n{alnum5}\n\n"
+     "This email was generated because of a login attempt from a web or mobile device located at 203.0.113.{octet}.",
+     None, 'alnum5'),
+    ("Epic Games <help@acct.epicgames.com>", "Your Epic Games security code",
+     "Hello,\n\nYour security code is: {alnum6}\n\nThis code will expire in 15 minutes.", None, 'alnum6'),
+    ("X <info@x.com>", "{code6} is your X verification code",
+     "{code6} is your X verification code.\n\nPlease enter this code to confirm your email address.", None, 'code6'),
+    ("Example Bank <alerts@bank.example>", "Your one-time passcode",
+     "Your one-time passcode is {code8}. It expires in 10 minutes.\n"
+     "Transaction amount ${amount} at MERCHANT {order4} on {date} at 12:{minutes}.", None, 'code8'),
+    ("Service <no-reply@service.example.jp>", "【重要】認証コードのお知らせ",
+     "{user} 様\n\n認証コード：{code6}\n\n有効期限は{minutes}分です。", None, 'code6'),
+    ("Shop <orders@shop.example>", "Your order has shipped",
+     "Hi {user},\n\nYour order #{order} placed on {date} has shipped. Total: ${amount}.\nTracking number 1Z999AA1{order}.\n"
+     "Questions? Call 1-800-555-{order4}.", None, None),
+    ("Weird <noreply@mail.weird.example>", "Account notice",
+     "Reference: {order}\nLogin token [[{code6}]]\nValid until {date}.", None, 'code6'),
+]
+SENDER_RULES = {"weird.example": [r"\[\[(?P<code>\d{6})\]\]"]}
+
+
+def render(template, rng):
+    sender, subject, text, html, expected = template
+    values = {
+        'code4': f"{rng.randint(1000, 9999)}",
+        'code6': f"{rng.randint(100000, 999999)}",
+        'code8': f"{rng.randint(10000000, 99999999)}",
+        'alnum5': ''.join(rng.choice('BCDFGHJKMNPQRTVWXY') + rng.choice('23456789') for _ in range(3))[:5],
+        'alnum6': ''.join(rng.choice('BCDFGHJKMNPQRTVWXY') + rng.choice('23456789') for _ in range(3)),
+        'user': rng.choice(['alice', 'bob', 'carol', 'dave']) + str(rng.randint(1, 99)),
+        'masked': f"{rng.choice('abcdef')}{rng.choice('ghijk')}***@outlook.com",
+        'minutes': str(rng.randint(10, 59)),
+        'order': str(rng.randint(1000000, 9999999)),
+        'order4': str(rng.randint(1000, 9999)),
+        'amount': f"{rng.randint(1, 9)},{rng.randint(100, 999)}.{rng.randint(10, 99)}",
+        'date': f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        'octet': str(rng.randint(1, 254)),
+    }
+    token = ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(24))
+    values['link'] = f"https://app.slack.com/z-app-{values['order']}/magic-login/{token}?x=1"
+    values['link_html'] = f"https://www.figma.com/auth/magic_link?token={token}&amp;redirect=files"
+    expected_value = None
+    if expected == 'link':
+        expected_value = (values['link_html'].replace('&amp;', '&') if 'link_html' in (html or '')
+                          else values['link'])
+    elif expected:
+        expected_value = values[expected]
+
+    fill = lambda s: s.format(**values) if s else None
+    text, html, subject = fill(text), fill(html), fill(subject)
+    if html is not None:
+        html = HTML_FRAME.format(subject=subject, body=html, order=values['order'])
+    if text is not None and html is not None:
+        msg = MIMEMultipart('alternative')
+        msg.attach(MIMEText(text, 'plain', 'utf-8'))
+        msg.attach(MIMEText(html, 'html', 'utf-8'))
+    else:
+        msg = MIMEText(text if text is not None else html, 'plain' if text is not None else 'html', 'utf-8')
+    msg['From'] = sender
+    msg['Subject'] = subject
+    msg['Date'] = 'Mon, 1 Jan 2024 00:00:00 +0000'
+    return msg.as_bytes(), expected_value
+
+
+NAIVE_RE = re.compile(r'\b(\d{4,8})\b')
+
+
+def naive_extract(message):
+    for content in (message.get('content'), message.get('html_content')):
+        match = NAIVE_RE.search(content or '')
+        if match:
+            return match.group(1)
+    return None
+
+
+_KEYWORD = '|'.join(re.escape(keyword) for keyword in code_extractor._KEYWORDS)
+_SUFFIX = '|'.join(re.escape(suffix) for suffix in code_extractor._SUFFIXES)
+# 与提取器相同的规则，写成独立的不区分大小写正则，按优先级逐条搜索
+PER_RULE = [(name, kind, re.compile(pattern, re.IGNORECASE | re.MULTILINE)) for name, kind, pattern in (
+    ('keyword_number', 'numeric', rf'(?:{_KEYWORD})[^\d]{{0,60}}?{code_extractor._NUMBER}'),
+    ('number_keyword', 'numeric', rf'{code_extractor._NUMBER}\s*(?:{_SUFFIX})'),
+    ('keyword_alnum', 'alphanumeric', rf'(?:{_KEYWORD})[^\d]{{0,40}}?(?-i:{code_extractor._ALNUM})'),
+    ('link', 'link', code_extractor._URL_RE.pattern),
+    ('lone_number', 'numeric', r'^[ \t]*' + code_extractor._NUMBER + r'[ \t]*$'),
+)]
+
+
+def per_rule_extract(message):
+    sources = [f"{message.get('subject') or ''}\n{message.get('content') or ''}"]
+    if message.get('html_content'):
+        sources.append(code_extractor.html_search_text(message['html_content']))
+    for content in sources:
+        for name, kind, pattern in PER_RULE:
+            for match in pattern.finditer(content):
+                code = match.group('code') if kind != 'link' else match.group(0)
+                if kind == 'link' and (not code_extractor._LINK_HINT_RE.search(code)
+                                       or code_extractor._LINK_EXCLUDE_RE.search(code)):
+                    continue
+                return code_extractor._normalize(code, kind)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark verification-code extraction.')
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rng = random.Random(args.seed)
+    corpus = []
+    for index in range(args.messages):
+        raw, expected = render(TEMPLATES[index % len(TEMPLATES)], rng)
+        corpus.append((cloud_email_api.parse_email_message(message_from_bytes(raw)), expected))
+
+    extractor = CodeExtractor(SENDER_RULES)
+
+    def combined(message):
+        match = extractor.extract_message(message)
+        return match.code if match else None
+
+    print(f"{len(corpus)} messages from {len(TEMPLATES)} templates")
+    print(f"{'extractor':<10} {'accuracy':>9} {'us/msg':>8}")
+    for name, func in (('naive', naive_extract), ('per-rule', per_rule_extract), ('extractor', combined)):
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            results = [func(message) for message, _ in corpus]
+            best = min(best, time.perf_counter() - start)
+        correct = sum(result == expected for result, (_, expected) in zip(results, corpus))
+        print(f"{name:<10} {correct / len(corpus):>8.1%} {best / len(corpus) * 1e6:>8.1f}")
+        if name == 'extractor':
+            misses = {TEMPLATES[i % len(TEMPLATES)][1] for i, (result, (_, expected)) in enumerate(zip(results, corpus))
+                      if result != expected}
+            for subject in sorted(misses):
+                print(f"  miss: {subject}")
+
+    full = sum(len(json.dumps({"success": True, "data": message}, ensure_ascii=False).encode()) for message, _ in corpus)
+    extracted = 0
+    for message, _ in corpus:
+        match = extractor.extract_message(message)
+        body = match.to_dict() if match else {"verification_code": None}
+        body.update({key: message.get(key) for key in ('sender', 'subject', 'date', 'date_iso')})
+        extracted += len(json.dumps(body, ensure_ascii=False).encode())
+    print(f"response size: /get-latest-email {full / len(corpus):.0f} B/msg, "
+          f"/get-verification-code {extracted / len(corpus):.0f} B/msg")
+
+
+if __name__ == '__main__':
+    main()
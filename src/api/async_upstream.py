@@ -0,0 +1,627 @@
+"""
+异步上游后端模块
+- 在 asyncio streams 上实现令牌刷新 (HTTP/1.1 POST)、获取最新邮件、清空邮箱，一个事件循环线程即可同时处理数千个邮箱
+- 已认证的 IMAP 连接按账号保留在事件循环内的连接池中；access token 与同步后端共用 TokenCache，同一账号的并发刷新只请求一次
+- 每个阶段 (刷新令牌、连接并认证、每条 IMAP 命令) 的超时取默认值与 Deadline 剩余预算中较小的一个
+- run_sync() 把协程提交到后台事件循环线程并等待结果，供现有的同步调用方使用
+"""
+
+import re
+import ssl
+import json
+import time
+import base64
+import asyncio
+import imaplib
+import logging
+import threading
+import urllib.parse
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from src.api.deadline import Deadline, DeadlineExceeded
+from src.api.token_cache import CredentialsRejected, TokenCache, check_token_error
+
+_LITERAL_RE = re.compile(rb'\{(\d+)\}\r\n$')
+_EXISTS_RE = re.compile(rb'^\* (\d+) EXISTS\b', re.IGNORECASE)
+_UIDVALIDITY_RE = re.compile(rb'\[UIDVALIDITY (\d+)\]', re.IGNORECASE)
+_FETCH_UID_RE = re.compile(rb'\bUID (\d+)')
+# StreamReader 单行上限；FETCH 的邮件内容以字面量读取，不受此限制
+_READ_LIMIT = 1 << 20
+# 空闲连接的清理间隔 (秒)
+_SWEEP_INTERVAL = 30
+
+# 一条响应: (去掉字面量后的行, 字面量列表)
+Response = Tuple[bytes, List[bytes]]
+
+
+async def _wait(awaitable: Awaitable, deadline: Deadline, stage_timeout: Optional[float], stage: str):
+    """
+    在 min(stage_timeout, 剩余预算) 内等待 awaitable。
+
+    Raises:
+        DeadlineExceeded: 预算用完。
+        TimeoutError: 只是该阶段超时 (预算还有剩余)。
+    """
+    try:
+        timeout = deadline.timeout(stage_timeout, stage)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        if deadline.expired():
+            raise DeadlineExceeded(f"deadline exceeded during {stage}") from None
+        raise TimeoutError(f"{stage} timed out") from None
+
+
+def _quote(mailbox: str) -> str:
+    return '"' + mailbox.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class LatestMessage(NamedTuple):
+    """fetch_latest_message() 的结果: raw 是原始邮件 (RFC822)，cached 是 lookup 返回的值，两者只有一个不为 None。"""
+    uidvalidity: Optional[int]
+    uid: Optional[int]
+    raw: Optional[bytes]
+    cached: Any
+
+
+class AsyncImapClient:
+    """asyncio streams 上的最小 IMAP4rev1 客户端，只实现本模块需要的命令。"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.closed = False
+        self._tag = 0
+
+    @classmethod
+    async def open(cls, host: str, port: int, ssl_context: Optional[ssl.SSLContext]) -> 'AsyncImapClient':
+        reader, writer = await asyncio.open_connection(host, port, ssl=ssl_context, limit=_READ_LIMIT)
+        client = cls(reader, writer)
+        try:
+            greeting, _ = await client._read_response()
+            if not greeting.upper().startswith((b'* OK', b'* PREAUTH')):
+                raise imaplib.IMAP4.abort(f"unexpected greeting: {greeting!r}")
+        except BaseException:
+            client.close()
+            raise
+        return client
+
+    async def _read_response(self) -> Response:
+        line = await self.reader.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("connection closed by server")
+        literals = []
+        match = _LITERAL_RE.search(line)
+        while match:
+            literals.append(await self.reader.readexactly(int(match.group(1))))
+            rest = await self.reader.readline()
+            if not rest:
+                raise imaplib.IMAP4.abort("connection closed by server")
+            line = line[:match.start()] + rest
+            match = _LITERAL_RE.search(line)
+        return line.rstrip(b'\r\n'), literals
+
+    async def command(self, name: str, args: str = '',
+                      continuation: Optional[Callable[[bytes], bytes]] = None) -> Tuple[str, List[Response], bytes]:
+        """
+        发送一条命令并读取到它的标签响应。
+
+        Returns:
+            (状态 'OK'/'NO'/'BAD', 未标记响应列表, 标签响应的文本)。
+
+        Raises:
+            imaplib.IMAP4.abort: 服务器发送 BYE 或断开连接。
+        """
+        self._tag += 1
+        tag = b'A%d' % self._tag
+        self.writer.write(tag + b' ' + name.encode() + (b' ' + args.encode() if args else b'') + b'\r\n')
+        await self.writer.drain()
+        untagged = []
+        while True:
+            line, literals = await self._read_response()
+            if line.startswith(tag + b' '):
+                status, _, text = line[len(tag) + 1:].partition(b' ')
+                return status.decode('ascii', 'replace').upper(), untagged, text
+            if line.startswith(b'+'):
+                self.writer.write((continuation(line) if continuation else b'') + b'\r\n')
+                await self.writer.drain()
+            elif line.upper().startswith(b'* BYE'):
+                raise imaplib.IMAP4.abort(line.decode('utf-8', 'replace'))
+            else:
+                untagged.append((line, literals))
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+
+class AsyncUpstream:
+    """
+    异步上游后端: 令牌刷新、获取最新邮件、清空邮箱。
+
+    协程方法只能在后台事件循环中运行；同步代码通过 run_sync() 调用。
+    """
+
+    def __init__(self, imap_host: str, imap_port: int, use_ssl: bool, token_url: str, token_scope: str,
+                 token_cache: TokenCache, max_concurrency: int = 1000,
+                 token_connect_timeout: float = 5, token_read_timeout: float = 15,
+                 connect_timeout: float = 15, command_timeout: float = 30,
+                 idle_timeout: float = 120, max_lifetime: float = 3000,
+                 on_credentials_rejected: Optional[Callable[[str, Exception], None]] = None):
+        """
+        Args:
+            max_concurrency: 同时进行的上游操作数 (也是最多同时打开的 IMAP 连接数)。
+            idle_timeout: 空闲连接保留的秒数，<= 0 表示不复用连接。
+            max_lifetime: 连接最长复用的秒数。
+            on_credentials_rejected: 刷新令牌被令牌端点拒绝时的回调 (邮箱地址, 异常)。回调可能做阻塞操作
+                (重命名账号文件、写数据库)，在默认线程池中调用，不占用事件循环线程。
+        """
+        self.imap_host = imap_host
+        self.imap_port = imap_port
+        self.use_ssl = use_ssl
+        self.token_url = token_url
+        self.token_scope = token_scope
+        self.token_cache = token_cache
+        self.max_concurrency = max_concurrency
+        self.token_connect_timeout = token_connect_timeout
+        self.token_read_timeout = token_read_timeout
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.on_credentials_rejected = on_credentials_rejected
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        # 以下状态只在事件循环线程中访问
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._idle: Dict[str, List[AsyncImapClient]] = {}
+        self._token_flights: Dict[Tuple[str, str], Tuple[asyncio.Future, List[int]]] = {}
+        self._last_sweep = time.time()
+        self.open_connections = 0
+        self.in_flight = 0
+        self.created = 0
+        self.reused = 0
+
+    # --- 事件循环线程 ---
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='async-upstream', daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run_sync(self, coro: Awaitable) -> Any:
+        """在后台事件循环中运行协程并阻塞等待结果 (超时由协程内的 Deadline 控制)。"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def close(self):
+        """关闭所有空闲连接并停止事件循环。"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def close_idle():
+            for clients in self._idle.values():
+                for client in clients:
+                    self._close_client(client)
+            self._idle.clear()
+            # Semaphore 绑定在当前事件循环上，重新启动时重新创建
+            self._semaphore = None
+
+        asyncio.run_coroutine_threadsafe(close_idle(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "open": self.open_connections,
+            "idle": sum(len(clients) for clients in self._idle.values()),
+            "in_flight": self.in_flight,
+            "created": self.created,
+            "reused": self.reused,
+        }
+
+    def _get_ssl_context(self) -> ssl.SSLContext:
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    # --- 令牌 ---
+
+    async def _post_form(self, url: str, fields: Dict[str, str], deadline: Deadline) -> Tuple[int, bytes]:
+        """发送一个 application/x-www-form-urlencoded POST 请求，返回 (状态码, 响应体)。"""
+        parts = urllib.parse.urlsplit(url)
+        https = parts.scheme == 'https'
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        body = urllib.parse.urlencode(fields).encode()
+        reader, writer = await _wait(
+            asyncio.open_connection(parts.hostname, parts.port or (443 if https else 80),
+                                    ssl=self._get_ssl_context() if https else None, limit=_READ_LIMIT),
+            deadline, self.token_connect_timeout, 'token connect')
+        try:
+            writer.write((f"POST {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+                          f"Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n"
+                          f"Accept: application/json\r\nConnection: close\r\n\r\n").encode() + body)
+            return await _wait(self._read_http_response(reader, writer), deadline, self.token_read_timeout, 'token read')
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_http_response(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Tuple[int, bytes]:
+        await writer.drain()
+        status_line = await reader.readline()
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise ConnectionError(f"invalid HTTP status line: {status_line!r}")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            return status, b''.join(chunks)
+        if 'content-length' in headers:
+            return status, await reader.readexactly(int(headers['content-length']))
+        return status, await reader.read()
+
+    async def _request_access_token(self, refresh_token: str, client_id: str,
+                                    deadline: Deadline) -> Tuple[Optional[str], float]:
+        """
+        向令牌端点请求新的访问令牌，失败时返回 (None, 0)。
+
+        Raises:
+            CredentialsRejected: 令牌端点拒绝了刷新令牌。
+        """
+        logging.info("正在尝试刷新 access token (asyncio)...")
+        fields = {
+            'grant_type': 'refresh_token',
+            'refresh_token': refresh_token,
+            'client_id': client_id,
+            'scope': self.token_scope,
+        }
+        try:
+            status, body = await self._post_form(self.token_url, fields, deadline)
+        except DeadlineExceeded:
+            raise
+        except (OSError, asyncio.IncompleteReadError, ConnectionError) as e:
+            logging.error(f"请求 token 时出错: {e}")
+            return None, 0
+        try:
+            token_info = json.loads(body)
+        except ValueError:
+            logging.error(f"解析 token 响应时出错。状态码: {status}, 响应内容: {body[:500]!r}")
+            return None, 0
+        check_token_error(status, token_info)
+        if status == 200 and isinstance(token_info, dict) and 'access_token' in token_info:
+            logging.info("成功获取新的 access token。")
+            return token_info['access_token'], float(token_info.get('expires_in', 3600))
+        error = token_info.get('error_description', token_info.get('error', '未知错误')) if isinstance(token_info, dict) else body
+        logging.error(f"刷新 token 失败 (状态码 {status}): {error}")
+        return None, 0
+
+    async def get_access_token(self, refresh_token: str, client_id: str, deadline: Deadline) -> Optional[str]:
+        """获取访问令牌，优先使用缓存；同一账号的并发请求只刷新一次。"""
+        if not refresh_token or not client_id:
+            logging.error("无效或未配置 Refresh Token / Client ID。")
+            return None
+        token = self.token_cache.peek(client_id, refresh_token)
+        if token:
+            return token
+        key = (client_id, refresh_token)
+        flight = self._token_flights.get(key)
+        if flight is not None:
+            future, waiters = flight
+            waiters[0] += 1
+            return await _wait(asyncio.shield(future), deadline, None, 'token refresh')
+
+        future = asyncio.get_running_loop().create_future()
+        waiters = [0]
+        self._token_flights[key] = (future, waiters)
+        token, expires_in = None, 0
+        try:
+            token, expires_in = await self._request_access_token(refresh_token, client_id, deadline)
+        finally:
+            del self._token_flights[key]
+            self.token_cache.put(client_id, refresh_token, token, expires_in, coalesced=waiters[0])
+            future.set_result(token)
+        return token
+
+    # --- IMAP 连接 ---
+
+    def _close_client(self, client: AsyncImapClient):
+        if not client.closed:
+            client.close()
+            self.open_connections -= 1
+
+    async def _command(self, client: AsyncImapClient, deadline: Deadline, name: str, args: str = '',
+                       continuation: Optional[Callable[[bytes], bytes]] = None) -> Tuple[str, List[Response], bytes]:
+        """执行一条命令，超时不超过 min(command_timeout, 剩余预算)；出错的连接会被关闭。"""
+        try:
+            return await _wait(client.command(name, args, continuation), deadline, self.command_timeout, name)
+        except DeadlineExceeded:
+            self._close_client(client)
+            raise
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self._close_client(client)
+            raise imaplib.IMAP4.abort(f"{name} failed: {e}") from e
+        except imaplib.IMAP4.abort:
+            self._close_client(client)
+            raise
+
+    async def _connect(self, email_address: str, access_token: str, deadline: Deadline) -> Optional[AsyncImapClient]:
+        """连接并用 XOAUTH2 认证，失败时返回 None。"""
+        client = None
+        try:
+            client = await _wait(
+                AsyncImapClient.open(self.imap_host, self.imap_port, self._get_ssl_context() if self.use_ssl else None),
+                deadline, self.connect_timeout, 'IMAP connect')
+            self.open_connections += 1
+            self.created += 1
+            auth = base64.b64encode(f"user={email_address}\1auth=Bearer {access_token}\1\1".encode('utf-8'))
+            sent = []
+
+            def respond(_line: bytes) -> bytes:
+                # 第一次 "+" 发送凭据；认证失败时服务器会再发一次 "+" 附带错误信息，回复空行
+                if sent:
+                    return b''
+                sent.append(True)
+                return auth
+
+            status, _, text = await self._command(client, deadline, 'AUTHENTICATE', 'XOAUTH2', respond)
+            if status != 'OK':
+                logging.error(f"IMAP 认证失败: {status} {text.decode('utf-8', 'replace')}")
+                self._close_client(client)
+                return None
+            return client
+        except DeadlineExceeded:
+            raise
+        except (OSError, asyncio.IncompleteReadError, imaplib.IMAP4.error) as e:
+            logging.error(f"连接到 IMAP 服务器时出错: {e}")
+            if client is not None:
+                self._close_client(client)
+            return None
+
+    async def _token_for(self, refresh_token: str, client_id: str, email_address: str,
+                         deadline: Deadline) -> Optional[str]:
+        """获取访问令牌；刷新令牌被拒绝时通知 on_credentials_rejected 并返回 None。"""
+        try:
+            return await self.get_access_token(refresh_token, client_id, deadline)
+        except CredentialsRejected as e:
+            logging.error(f"刷新令牌已被拒绝: {email_address} ({e})")
+            if self.on_credentials_rejected is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self.on_credentials_rejected, email_address, e)
+            return None
+
+    async def _open(self, refresh_token: str, client_id: str, email_address: str,
+                    deadline: Deadline) -> Optional[AsyncImapClient]:
+        """获取令牌并建立已认证的连接；使用缓存令牌认证失败时刷新令牌重试一次。"""
+        cached = self.token_cache.is_cached(client_id, refresh_token)
+        access_token = await self._token_for(refresh_token, client_id, email_address, deadline)
+        if not access_token:
+            if deadline.expired():
+                raise DeadlineExceeded("deadline exceeded while waiting for access token")
+            return None
+        client = await self._connect(email_address, access_token, deadline)
+        if client is None and cached:
+            logging.info("使用缓存的 access token 认证失败，重新获取令牌后重试...")
+            self.token_cache.invalidate(client_id, refresh_token)
+            access_token = await self._token_for(refresh_token, client_id, email_address, deadline)
+            if not access_token:
+                return None
+            client = await self._connect(email_address, access_token, deadline)
+        if client is None and deadline.expired():
+            raise DeadlineExceeded("deadline exceeded while connecting to IMAP server")
+        return client
+
+    def _take_idle(self, key: str) -> Optional[AsyncImapClient]:
+        now = time.time()
+        clients = self._idle.get(key)
+        while clients:
+            client = clients.pop()
+            if not clients:
+                del self._idle[key]
+            if self._expired(client, now):
+                self._close_client(client)
+                continue
+            return client
+        return None
+
+    def _expired(self, client: AsyncImapClient, now: float) -> bool:
+        return (client.closed or now - client.last_used > self.idle_timeout
+                or now - client.created_at > self.max_lifetime)
+
+    def _release(self, key: str, client: AsyncImapClient):
+        now = time.time()
+        if self.idle_timeout <= 0 or client.closed:
+            self._close_client(client)
+        else:
+            client.last_used = now
+            self._idle.setdefault(key, []).append(client)
+        if now - self._last_sweep > _SWEEP_INTERVAL:
+            self._last_sweep = now
+            for idle_key in list(self._idle):
+                alive = []
+                for idle_client in self._idle[idle_key]:
+                    if self._expired(idle_client, now):
+                        self._close_client(idle_client)
+                    else:
+                        alive.append(idle_client)
+                if alive:
+                    self._idle[idle_key] = alive
+                else:
+                    del self._idle[idle_key]
+
+    async def with_connection(self, refresh_token: str, client_id: str, email_address: str, timeout: Optional[float],
+                              operation: Callable[[AsyncImapClient, Deadline], Awaitable[Any]], default: Any = None,
+                              deadline: Optional[Deadline] = None) -> Any:
+        """
+        取出该账号的已认证连接并执行 await operation(client, deadline)，完成后归还连接。
+
+        与同步后端的 with_imap_connection 相同: timeout 是整个调用的时间预算 (不超过 deadline)，
+        复用的连接已断开时用新连接重试一次，预算用完时抛出 DeadlineExceeded。
+        """
+        deadline = deadline.child(timeout) if deadline is not None else Deadline.after(timeout)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        await _wait(self._semaphore.acquire(), deadline, None, 'upstream slot')
+        self.in_flight += 1
+        try:
+            key = email_address.lower()
+            for attempt in range(2):
+                client = self._take_idle(key)
+                reused = client is not None
+                if reused:
+                    self.reused += 1
+                else:
+                    client = await self._open(refresh_token, client_id, email_address, deadline)
+                    if client is None:
+                        return default
+                try:
+                    result = await operation(client, deadline)
+                except imaplib.IMAP4.abort as e:
+                    self._close_client(client)
+                    if deadline.expired():
+                        raise DeadlineExceeded(f"deadline exceeded while talking to IMAP server: {e}") from e
+                    if reused and attempt == 0:
+                        logging.info(f"复用的 IMAP 连接已断开 ({e})，重新连接后重试...")
+                        continue
+                    raise
+                except BaseException:
+                    self._close_client(client)
+                    raise
+                self._release(key, client)
+                return result
+            return default
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    # --- 操作 ---
+
+    async def _select(self, client: AsyncImapClient, deadline: Deadline, mailbox: str, readonly: bool) -> Optional[int]:
+        """选择邮箱文件夹，返回邮件数量；失败时返回 None。"""
+        selected = await self._select_info(client, deadline, mailbox, readonly)
+        return selected[0] if selected else None
+
+    async def _select_info(self, client: AsyncImapClient, deadline: Deadline, mailbox: str,
+                           readonly: bool) -> Optional[Tuple[int, Optional[int]]]:
+        """选择邮箱文件夹，返回 (邮件数量, UIDVALIDITY)；失败时返回 None。"""
+        status, untagged, text = await self._command(client, deadline, 'EXAMINE' if readonly else 'SELECT', _quote(mailbox))
+        if status != 'OK':
+            logging.error(f"选择邮箱文件夹 '{mailbox}' 失败: {status} - {text.decode('utf-8', 'replace')}")
+            return None
+        message_count, uidvalidity = 0, None
+        for line, _ in untagged:
+            match = _EXISTS_RE.match(line)
+            if match:
+                message_count = int(match.group(1))
+            match = _UIDVALIDITY_RE.search(line)
+            if match:
+                uidvalidity = int(match.group(1))
+        return message_count, uidvalidity
+
+    async def fetch_latest(self, refresh_token: str, client_id: str, email_address: str, mailbox: str = "INBOX",
+                           timeout: Optional[float] = 30, deadline: Optional[Deadline] = None) -> Optional[bytes]:
+        """
+        获取最新一封邮件的原始内容 (RFC822)；邮箱为空或操作失败时返回 None。
+
+        Raises:
+            DeadlineExceeded: 时间预算用完。
+            imaplib.IMAP4.error: 连接在重试后仍然失败。
+        """
+        latest = await self.fetch_latest_message(refresh_token, client_id, email_address, mailbox, timeout, deadline)
+        return latest.raw if latest else None
+
+    async def fetch_latest_message(self, refresh_token: str, client_id: str, email_address: str,
+                                   mailbox: str = "INBOX", timeout: Optional[float] = 30,
+                                   deadline: Optional[Deadline] = None,
+                                   lookup: Optional[Callable[[int, int], Any]] = None) -> Optional['LatestMessage']:
+        """
+        获取最新一封邮件；邮箱为空或操作失败时返回 None。
+
+        给出 lookup 时先只查询最新邮件的 UID，lookup(UIDVALIDITY, UID) 返回非 None 的值 (例如缓存的解析结果)
+        时不再下载邮件，该值放在 LatestMessage.cached 中返回；没有 lookup 时 UID 随邮件内容在同一条 FETCH 中获取。
+
+        Raises:
+            DeadlineExceeded: 时间预算用完。
+            imaplib.IMAP4.error: 连接在重试后仍然失败。
+        """
+        async def operation(client: AsyncImapClient, deadline: Deadline) -> Optional[LatestMessage]:
+            selected = await self._select_info(client, deadline, mailbox, readonly=True)
+            if not selected or not selected[0]:
+                return None
+            message_count, uidvalidity = selected
+            fetch, fetch_args, uid = 'FETCH', f'{message_count} (UID RFC822)', None
+            if lookup is not None and uidvalidity is not None:
+                status, untagged, text = await self._command(client, deadline, 'FETCH', f'{message_count} (UID)')
+                match = next((m for m in (_FETCH_UID_RE.search(line) for line, _ in untagged) if m), None)
+                if status == 'OK' and match:
+                    uid = int(match.group(1))
+                    cached = lookup(uidvalidity, uid)
+                    if cached is not None:
+                        return LatestMessage(uidvalidity, uid, None, cached)
+                    # 按 UID 获取，确保得到的正是刚才查询到的那封邮件
+                    fetch, fetch_args = 'UID FETCH', f'{uid} (RFC822)'
+            status, untagged, text = await self._command(client, deadline, fetch, fetch_args)
+            if status != 'OK':
+                logging.error(f"获取邮件内容失败: {status} - {text.decode('utf-8', 'replace')}")
+                return None
+            for line, literals in untagged:
+                if literals:
+                    if uid is None:
+                        match = _FETCH_UID_RE.search(line)
+                        uid = int(match.group(1)) if match else None
+                    return LatestMessage(uidvalidity, uid, literals[0], None)
+            return None
+
+        return await self.with_connection(refresh_token, client_id, email_address, timeout, operation,
+                                          default=None, deadline=deadline)
+
+    async def clear(self, refresh_token: str, client_id: str, email_address: str, mailbox: str = "INBOX",
+                    timeout: Optional[float] = 30, deadline: Optional[Deadline] = None) -> bool:
+        """
+        清空邮箱文件夹: 一条 STORE 标记 SELECT 时已有的全部邮件，再 EXPUNGE。
+
+        Raises:
+            DeadlineExceeded: 时间预算用完。
+            imaplib.IMAP4.error: 连接在重试后仍然失败。
+        """
+        async def operation(client: AsyncImapClient, deadline: Deadline) -> bool:
+            message_count = await self._select(client, deadline, mailbox, readonly=False)
+            if message_count is None:
+                return False
+            if message_count == 0:
+                return True
+            status, _, text = await self._command(client, deadline, 'STORE', f'1:{message_count} +FLAGS.SILENT (\\Deleted)')
+            if status != 'OK':
+                logging.error(f"标记邮件为删除失败: {status} - {text.decode('utf-8', 'replace')}")
+                return False
+            status, _, text = await self._command(client, deadline, 'EXPUNGE')
+            if status != 'OK':
+                logging.error(f"永久删除邮件 (Expunge) 失败: {status} - {text.decode('utf-8', 'replace')}")
+                return False
+            logging.info(f"成功清空 {email_address} 的 {message_count} 封邮件。")
+            return True
+
+        return await self.with_connection(refresh_token, client_id, email_address, timeout, operation,
+                                          default=False, deadline=deadline)
@@ -0,0 +1,113 @@
+"""
+批量清空邮箱任务模块
+- 一个任务清空多个账号的邮箱，所有任务共用一个线程池，同时清空的账号数不超过 max_workers
+- 任务在后台运行，可随时查询进度 (已完成/成功/失败数量和失败原因)
+- 只保留最近 keep_finished 个已结束的任务
+"""
+
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+# 清空单个账号: 成功返回 True，失败返回 False 或抛出异常
+ClearFunc = Callable[[str], bool]
+
+
+class ClearJob:
+    """一个批量清空任务的进度。"""
+
+    def __init__(self, emails: List[str]):
+        self.id = uuid.uuid4().hex
+        self.total = len(emails)
+        self.succeeded = 0
+        self.failed: Dict[str, str] = {}
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> int:
+        return self.succeeded + len(self.failed)
+
+    def _record(self, email: str, error: Optional[str]) -> bool:
+        """记录一个账号的结果，返回任务是否已全部完成。"""
+        with self._lock:
+            if error is None:
+                self.succeeded += 1
+            else:
+                self.failed[email] = error
+            if self.done == self.total:
+                self.finished_at = time.time()
+                return True
+            return False
+
+    def progress(self) -> Dict[str, Any]:
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                "job_id": self.id,
+                "state": "finished" if self.finished_at is not None else "running",
+                "total": self.total,
+                "done": self.done,
+                "succeeded": self.succeeded,
+                "failed": len(self.failed),
+                "failures": dict(self.failed),
+                "elapsed_seconds": round(end - self.started_at, 3),
+            }
+
+
+class ClearJobManager:
+    """创建并跟踪批量清空任务。"""
+
+    def __init__(self, max_workers: int = 8, keep_finished: int = 20):
+        """
+        Args:
+            max_workers: 所有任务合计同时清空的账号数。
+            keep_finished: 保留的已结束任务数，超出时丢弃最早的。
+        """
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='clear-job')
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, ClearJob]" = OrderedDict()
+
+    def submit(self, emails: List[str], clear: ClearFunc) -> ClearJob:
+        """创建任务并在后台开始清空，立即返回任务对象。"""
+        job = ClearJob(emails)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune_locked()
+        if not emails:
+            job.finished_at = job.started_at
+        logging.info(f"批量清空任务 {job.id} 已创建，共 {job.total} 个邮箱")
+        for email in emails:
+            self._executor.submit(self._run_one, job, email, clear)
+        return job
+
+    def _run_one(self, job: ClearJob, email: str, clear: ClearFunc):
+        try:
+            error = None if clear(email) else "clear failed"
+        except Exception as e:
+            logging.warning(f"批量清空任务 {job.id} 清空 {email} 时出错: {e}")
+            error = str(e) or type(e).__name__
+        if job._record(email, error):
+            progress = job.progress()
+            logging.info(f"批量清空任务 {job.id} 完成: 成功 {progress['succeeded']}，失败 {progress['failed']}，"
+                         f"耗时 {progress['elapsed_seconds']} 秒")
+
+    def _prune_locked(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[ClearJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.progress() for job in jobs]
@@ -2,86 +2,247 @@ import requests
 import logging
 import os
 import imaplib
+import threading
 import email as email_module
 from email.header import decode_header
 from email.utils import parsedate_to_datetime
-from bs4 import BeautifulSoup
 import chardet
 import re
 import json
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Callable, Optional, List, Dict, Any, Tuple, Iterator
 from datetime import datetime
 
+from src.api.token_cache import CredentialsRejected, TokenCache, check_token_error
+from src.api.http_session import SharedSession
+from src.api.imap_pool import ImapConnectionPool, ImapPoolExhausted
+from src.api.idle_watcher import IdleWatcher
+from src.api.deadline import Deadline, DeadlineExceeded
+from src.api.async_upstream import AsyncUpstream
+from src.api.html_text import html_to_text, html_to_text_bs4
+from src.api.message_cache import MessageCache
+from src.api.partial_fetch import (
+    SUMMARY_HEADER_FIELDS, parse_fetch_response, find_body_item, find_text_part, decode_partial, known_charset
+)
+
 # 配置日志记录
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # IMAP 服务器配置
-IMAP_SERVER = 'outlook.office365.com'
-TOKEN_URL = "https://login.microsoftonline.com/common/oauth2/v2.0/token"
+IMAP_SERVER = os.getenv('IMAP_SERVER', 'outlook.office365.com')
+IMAP_PORT = int(os.getenv('IMAP_PORT', 993))
+IMAP_USE_SSL = os.getenv('IMAP_USE_SSL', 'true').lower() == 'true'
+# 各阶段的默认超时 (秒): 建立连接并认证、单条 IMAP 命令；实际超时不超过调用剩余的时间预算
+IMAP_CONNECT_TIMEOUT = float(os.getenv('IMAP_CONNECT_TIMEOUT', 15))
+IMAP_COMMAND_TIMEOUT = float(os.getenv('IMAP_COMMAND_TIMEOUT', 30))
+# get_all_emails 每条 FETCH 命令获取的邮件数量
+IMAP_FETCH_CHUNK_SIZE = max(1, int(os.getenv('IMAP_FETCH_CHUNK_SIZE', 200)))
 
-def get_new_access_token(refresh_token: str, client_id: str) -> Optional[str]:
-    """
-    使用刷新令牌获取新的访问令牌。
+# 获取方式: full 下载完整邮件 (RFC822，包括附件)；summary 只获取 From/Subject/Date 头部和正文的前 IMAP_SUMMARY_MAX_BYTES 字节
+FETCH_PROFILES = ('full', 'summary')
+IMAP_SUMMARY_MAX_BYTES = max(1, int(os.getenv('IMAP_SUMMARY_MAX_BYTES', 8192)))
 
-    Args:
-        refresh_token: OAuth2 刷新令牌。
-        client_id: 应用程序的 client ID。
+# HTML 正文转文本: stream 使用标准库 html.parser 流式提取 (合并空白)；bs4 使用 BeautifulSoup (保留原始空白)
+HTML_TEXT_EXTRACTOR = os.getenv('HTML_TEXT_EXTRACTOR', 'stream').lower()
+
+# 正文解码: 声明的 charset 和 UTF-8 都解码失败时，chardet 只检测前 CHARSET_DETECT_MAX_BYTES 字节
+CHARSET_DETECT_MAX_BYTES = max(1, int(os.getenv('CHARSET_DETECT_MAX_BYTES', 4096)))
+_decode_stats = {'declared': 0, 'utf8': 0, 'detected': 0, 'fallback': 0}
+_decode_stats_lock = threading.Lock()
+
+# IMAP 连接池: 按账号保留已认证的连接，IMAP_POOL_IDLE_SECONDS=0 表示每次请求后关闭连接
+imap_pool = ImapConnectionPool(
+    max_connections=int(os.getenv('IMAP_POOL_MAX_CONNECTIONS', 50)),
+    idle_timeout=float(os.getenv('IMAP_POOL_IDLE_SECONDS', 120)),
+    max_lifetime=float(os.getenv('IMAP_POOL_MAX_LIFETIME_SECONDS', 3000)),
+    noop_interval=float(os.getenv('IMAP_POOL_NOOP_INTERVAL_SECONDS', 30)),
+)
+
+# 已解析邮件缓存: 最新邮件的 UIDVALIDITY 和 UID 没有变化时直接返回上次的解析结果，MESSAGE_CACHE_MAX_ENTRIES=0 表示禁用
+message_cache = MessageCache(
+    max_entries=int(os.getenv('MESSAGE_CACHE_MAX_ENTRIES', 1000)),
+    max_bytes=int(float(os.getenv('MESSAGE_CACHE_MAX_MB', 64)) * (1 << 20)),
+    ttl=float(os.getenv('MESSAGE_CACHE_TTL_SECONDS', 3600)),
+)
+
+# IMAP IDLE 监听: 租用期间保持 INBOX 的 IDLE 连接，只在服务器推送新邮件后才重新获取
+IDLE_WATCHER_ENABLED = os.getenv('IDLE_WATCHER_ENABLED', 'false').lower() == 'true'
+idle_watcher = IdleWatcher(
+    max_sessions=int(os.getenv('IDLE_WATCHER_MAX_SESSIONS', 200)),
+    refresh_interval=float(os.getenv('IDLE_REFRESH_SECONDS', 1500)),
+    setup_workers=int(os.getenv('IDLE_SETUP_WORKERS', 4)),
+)
+
+TOKEN_URL = os.getenv('TOKEN_URL', "https://login.microsoftonline.com/common/oauth2/v2.0/token")
+TOKEN_SCOPE = 'https://outlook.office.com/IMAP.AccessAsUser.All offline_access'
+
+# 令牌端点的连接池与超时 (秒)
+TOKEN_HTTP_POOL_SIZE = int(os.getenv('TOKEN_HTTP_POOL_SIZE', 10))
+TOKEN_CONNECT_TIMEOUT = float(os.getenv('TOKEN_CONNECT_TIMEOUT', 5))
+TOKEN_READ_TIMEOUT = float(os.getenv('TOKEN_READ_TIMEOUT', 15))
+token_session = SharedSession(TOKEN_HTTP_POOL_SIZE)
+
+# access token 缓存: 在令牌到期前 TOKEN_EXPIRY_MARGIN_SECONDS 秒重新获取
+TOKEN_EXPIRY_MARGIN_SECONDS = int(os.getenv('TOKEN_EXPIRY_MARGIN_SECONDS', 300))
+token_cache = TokenCache(margin_seconds=TOKEN_EXPIRY_MARGIN_SECONDS)
+
+# 刷新令牌被令牌端点拒绝 (invalid_grant 等) 时的回调，参数为邮箱地址；服务用它隔离失效的账号
+_credentials_rejected_listeners: List[Callable[[str], None]] = []
+
+def add_credentials_rejected_listener(listener: Callable[[str], None]):
+    """注册刷新令牌被拒绝时的回调 (参数为邮箱地址)。"""
+    _credentials_rejected_listeners.append(listener)
+
+def _credentials_rejected(email_address: str, error: Exception):
+    logging.warning(f"刷新令牌已失效，通知隔离账号 {email_address}: {error}")
+    for listener in list(_credentials_rejected_listeners):
+        try:
+            listener(email_address)
+        except Exception as e:
+            logging.error(f"处理失效账号 {email_address} 时出错: {e}", exc_info=True)
+
+# 上游后端: sync 使用 requests + imaplib (每个进行中的请求占用一个线程)；
+# asyncio 在一个后台事件循环线程中完成令牌刷新、获取最新邮件 (profile=full) 和清空邮箱，其他操作仍使用 sync
+UPSTREAM_BACKEND = os.getenv('UPSTREAM_BACKEND', 'sync').lower()
+async_upstream = AsyncUpstream(
+    IMAP_SERVER, IMAP_PORT, IMAP_USE_SSL, TOKEN_URL, TOKEN_SCOPE, token_cache,
+    max_concurrency=int(os.getenv('ASYNC_UPSTREAM_MAX_CONCURRENCY', 1000)),
+    token_connect_timeout=TOKEN_CONNECT_TIMEOUT,
+    token_read_timeout=TOKEN_READ_TIMEOUT,
+    connect_timeout=IMAP_CONNECT_TIMEOUT,
+    command_timeout=IMAP_COMMAND_TIMEOUT,
+    idle_timeout=imap_pool.idle_timeout,
+    max_lifetime=imap_pool.max_lifetime,
+    on_credentials_rejected=_credentials_rejected,
+)
+
+def _request_access_token(refresh_token: str, client_id: str,
+                          deadline: Optional[Deadline] = None) -> Tuple[Optional[str], float]:
+    """
+    向令牌端点请求新的访问令牌，连接和读取超时不超过 deadline 的剩余时间。
 
     Returns:
-        成功时返回访问令牌，失败时返回 None。
+        (访问令牌, 有效期秒数)，失败时返回 (None, 0)。
+
+    Raises:
+        CredentialsRejected: 令牌端点拒绝了刷新令牌。
     """
     logging.info("正在尝试刷新 access token...")
-    
-    if not refresh_token:
-        logging.error("无效或未配置 Refresh Token。")
-        return None
-    if not client_id:
-        logging.error("无效或未配置 Client ID。")
-        return None
 
     token_data = {
         'grant_type': 'refresh_token',
         'refresh_token': refresh_token,
         'client_id': client_id,
-        'scope': 'https://outlook.office.com/IMAP.AccessAsUser.All offline_access',
+        'scope': TOKEN_SCOPE,
     }
 
+    deadline = deadline or Deadline()
     try:
         logging.debug(f"请求 Token URL: {TOKEN_URL}")
-        response = requests.post(TOKEN_URL, data=token_data)
+        timeout = (deadline.timeout(TOKEN_CONNECT_TIMEOUT, 'token connect'),
+                   deadline.timeout(TOKEN_READ_TIMEOUT, 'token read'))
+        response = token_session.get().post(TOKEN_URL, data=token_data, timeout=timeout)
         logging.debug(f"Token 响应状态码: {response.status_code}")
+        if response.status_code in (400, 401):
+            try:
+                error_info = response.json()
+            except ValueError:
+                error_info = None
+            check_token_error(response.status_code, error_info)
         response.raise_for_status()  # 对于错误状态码(4xx或5xx)抛出异常
         token_info = response.json()
         
         if 'access_token' in token_info:
             logging.info("成功获取新的 access token。")
-            return token_info['access_token']
+            return token_info['access_token'], float(token_info.get('expires_in', 3600))
         else:
             logging.error(f"刷新 token 失败: {token_info.get('error_description', token_info.get('error', '未知错误'))}")
-            return None
+            return None, 0
     except requests.exceptions.RequestException as e:
+        if deadline.expired():
+            raise DeadlineExceeded(f"deadline exceeded while refreshing access token: {e}") from e
         logging.error(f"请求 token 时出错: {e}")
         if hasattr(e, 'response') and e.response is not None:
             logging.error(f"响应状态码: {e.response.status_code}, 响应内容: {e.response.text}")
-        return None
-    except json.JSONDecodeError:
+        return None, 0
+    except (json.JSONDecodeError, ValueError):
         logging.error(f"解析 token 响应时出错。响应内容: {response.text}")
+        return None, 0
+
+def _check_token_args(refresh_token: str, client_id: str) -> bool:
+    if not refresh_token:
+        logging.error("无效或未配置 Refresh Token。")
+        return False
+    if not client_id:
+        logging.error("无效或未配置 Client ID。")
+        return False
+    return True
+
+def get_new_access_token(refresh_token: str, client_id: str, deadline: Optional[Deadline] = None) -> Optional[str]:
+    """
+    使用刷新令牌获取新的访问令牌 (不使用缓存)。
+
+    Args:
+        refresh_token: OAuth2 刷新令牌。
+        client_id: 应用程序的 client ID。
+        deadline: 时间预算，None 表示只使用各阶段的默认超时。
+
+    Returns:
+        成功时返回访问令牌，失败时返回 None。
+    """
+    if not _check_token_args(refresh_token, client_id):
+        return None
+    try:
+        return _request_access_token(refresh_token, client_id, deadline)[0]
+    except CredentialsRejected as e:
+        logging.error(f"刷新令牌已被拒绝: {e}")
         return None
 
-def connect_to_imap(email_address: str, access_token: str) -> Tuple[Optional[imaplib.IMAP4_SSL], bool]:
+def get_access_token(refresh_token: str, client_id: str, deadline: Optional[Deadline] = None) -> Optional[str]:
+    """
+    获取访问令牌，优先使用缓存；同一账号的并发请求只会刷新一次。
+
+    Returns:
+        成功时返回访问令牌，失败时返回 None。
+
+    Raises:
+        CredentialsRejected: 令牌端点拒绝了刷新令牌 (只有实际发起刷新的调用会收到)。
+    """
+    if not _check_token_args(refresh_token, client_id):
+        return None
+    deadline = deadline or Deadline()
+    return token_cache.get(client_id, refresh_token,
+                           lambda: _request_access_token(refresh_token, client_id, deadline),
+                           wait_timeout=deadline.remaining())
+
+def get_async_upstream_stats() -> Dict[str, int]:
+    """返回 asyncio 上游后端的连接统计。"""
+    return async_upstream.stats()
+
+def get_message_cache_stats() -> Dict[str, Any]:
+    """返回已解析邮件缓存的命中率、淘汰和过期次数等统计。"""
+    return message_cache.stats()
+
+def get_token_cache_stats() -> Dict[str, int]:
+    """返回 access token 缓存的命中/未命中等统计。"""
+    return token_cache.stats()
+
+def connect_to_imap(email_address: str, access_token: str, timeout: Optional[float] = None) -> Tuple[Optional[imaplib.IMAP4], bool]:
     """
     连接到 IMAP 服务器并使用 OAuth2 进行认证。
 
     Args:
         email_address: 邮箱地址。
         access_token: OAuth2 访问令牌。
+        timeout: 套接字超时时间 (秒)，None 表示不超时。
 
     Returns:
         成功时返回 (IMAP 连接对象, True)，失败时返回 (None, False)。
     """
+    mail = None
     try:
-        logging.info(f"正在连接到 IMAP 服务器: {IMAP_SERVER}...")
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER)
+        logging.info(f"正在连接到 IMAP 服务器: {IMAP_SERVER}:{IMAP_PORT}...")
+        imap_class = imaplib.IMAP4_SSL if IMAP_USE_SSL else imaplib.IMAP4
+        mail = imap_class(IMAP_SERVER, IMAP_PORT, timeout=timeout)
         logging.info("连接成功。")
         
         auth_string = f"user={email_address}\1auth=Bearer {access_token}\1\1"
@@ -92,12 +253,179 @@ def connect_to_imap(email_address: str, access_token: str) -> Tuple[Optional[ima
         return mail, True
     except imaplib.IMAP4.error as e:
         logging.error(f"IMAP 错误: {e}")
-        return None, False
     except Exception as e:
         logging.error(f"连接到 IMAP 服务器时发生意外错误: {e}")
         import traceback
         traceback.print_exc()
-        return None, False
+    # 认证失败时关闭已经建立的套接字
+    if mail is not None:
+        try:
+            mail.shutdown()
+        except Exception:
+            pass
+    return None, False
+
+def _token_for(refresh_token: str, client_id: str, email_address: str, deadline: Deadline) -> Optional[str]:
+    """获取访问令牌；刷新令牌被拒绝时通知回调并返回 None。"""
+    try:
+        return get_access_token(refresh_token, client_id, deadline)
+    except CredentialsRejected as e:
+        _credentials_rejected(email_address, e)
+        return None
+
+def open_imap_connection(refresh_token: str, client_id: str, email_address: str,
+                         deadline: Optional[Deadline] = None) -> Optional[imaplib.IMAP4]:
+    """
+    获取访问令牌并连接、认证 IMAP。
+
+    使用缓存的令牌认证失败时 (令牌可能已被提前吊销)，丢弃缓存并用新令牌重试一次。
+    刷新令牌被令牌端点拒绝时通知 add_credentials_rejected_listener 注册的回调。
+    连接和认证的超时为 IMAP_CONNECT_TIMEOUT 与 deadline 剩余时间中较小的一个。
+
+    Returns:
+        成功时返回 IMAP 连接对象，失败时返回 None。
+
+    Raises:
+        DeadlineExceeded: 时间预算已经用完。
+    """
+    deadline = deadline or Deadline()
+    cached = token_cache.is_cached(client_id, refresh_token)
+    access_token = _token_for(refresh_token, client_id, email_address, deadline)
+    if not access_token:
+        if deadline.expired():
+            raise DeadlineExceeded("deadline exceeded while waiting for access token")
+        return None
+
+    mail, success = connect_to_imap(email_address, access_token, deadline.timeout(IMAP_CONNECT_TIMEOUT, 'IMAP connect'))
+    if (not success or not mail) and cached:
+        logging.info("使用缓存的 access token 认证失败，重新获取令牌后重试...")
+        token_cache.invalidate(client_id, refresh_token)
+        access_token = _token_for(refresh_token, client_id, email_address, deadline)
+        if not access_token:
+            return None
+        mail, success = connect_to_imap(email_address, access_token, deadline.timeout(IMAP_CONNECT_TIMEOUT, 'IMAP connect'))
+    if not success or not mail:
+        if deadline.expired():
+            raise DeadlineExceeded("deadline exceeded while connecting to IMAP server")
+        return None
+    return mail
+
+class _DeadlineConnection:
+    """IMAP 连接的包装: 每条命令前把套接字超时设为 min(IMAP_COMMAND_TIMEOUT, 剩余预算)。"""
+
+    _COMMANDS = frozenset(('select', 'examine', 'search', 'fetch', 'store', 'expunge', 'uid', 'noop', 'close', 'status'))
+
+    def __init__(self, mail: imaplib.IMAP4, deadline: Deadline):
+        self._mail = mail
+        self._deadline = deadline
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._mail, name)
+        if name not in self._COMMANDS:
+            return attr
+
+        def command(*args, **kwargs):
+            self._mail.sock.settimeout(self._deadline.timeout(IMAP_COMMAND_TIMEOUT, name.upper()))
+            return attr(*args, **kwargs)
+        return command
+
+def with_imap_connection(refresh_token: str, client_id: str, email_address: str, timeout: Optional[float],
+                         operation: Callable[[imaplib.IMAP4], Any], default: Any = None,
+                         deadline: Optional[Deadline] = None) -> Any:
+    """
+    从连接池取出该账号的已认证连接并执行 operation(mail)，完成后归还连接。
+
+    timeout 是整个调用 (刷新令牌、连接、各条 IMAP 命令) 的时间预算，且不超过 deadline；
+    每个阶段的超时为该阶段的默认超时与剩余预算中较小的一个。
+    复用的连接已被服务器断开 (BYE、令牌过期、网络错误) 时，丢弃它并用新连接重试一次。
+    operation 抛出的其他异常会向上传递，出错的连接不会放回连接池。
+
+    Returns:
+        operation 的返回值；无法建立连接时返回 default。
+
+    Raises:
+        DeadlineExceeded: 时间预算在完成前用完。
+        ImapPoolExhausted: 连接数已达上限且在预算内没有可用连接。
+    """
+    deadline = deadline.child(timeout) if deadline is not None else Deadline.after(timeout)
+    key = email_address.lower()
+    for attempt in range(2):
+        pooled, reused = imap_pool.acquire(
+            key, lambda: open_imap_connection(refresh_token, client_id, email_address, deadline),
+            timeout=deadline.timeout(imap_pool.acquire_timeout, 'IMAP pool acquire'))
+        if pooled is None:
+            if deadline.expired():
+                raise DeadlineExceeded("deadline exceeded while connecting to IMAP server")
+            return default
+        try:
+            result = operation(_DeadlineConnection(pooled.conn, deadline))
+        except (imaplib.IMAP4.abort, OSError) as e:
+            imap_pool.discard(pooled)
+            if deadline.expired():
+                raise DeadlineExceeded(f"deadline exceeded while talking to IMAP server: {e}") from e
+            if reused and attempt == 0:
+                logging.info(f"复用的 IMAP 连接已断开 ({e})，重新连接后重试...")
+                continue
+            raise
+        except BaseException:
+            imap_pool.discard(pooled)
+            raise
+        # 连接池取出空闲连接时的 NOOP 检查也受命令超时限制
+        if pooled.conn.sock is not None:
+            pooled.conn.sock.settimeout(IMAP_COMMAND_TIMEOUT)
+        imap_pool.release(pooled)
+        return result
+    return default
+
+def get_imap_pool_stats() -> Dict[str, int]:
+    """返回 IMAP 连接池的统计。"""
+    return imap_pool.stats()
+
+def watch_mailbox(email_address: str, get_credentials: Callable[[], Optional[Tuple[str, str]]],
+                  mailbox: str = "INBOX", timeout: float = 30) -> bool:
+    """
+    开始用 IMAP IDLE 监听账号的邮箱 (IDLE_WATCHER_ENABLED 为 false 时不做任何事)。
+
+    get_credentials 在后台线程中调用，返回 (refresh_token, client_id)，账号不存在时返回 None。
+
+    Returns:
+        是否已开始监听。
+    """
+    if not IDLE_WATCHER_ENABLED:
+        return False
+
+    def connect():
+        credentials = get_credentials()
+        if not credentials:
+            return None
+        refresh_token, client_id = credentials
+        return open_imap_connection(refresh_token, client_id, email_address, Deadline.after(timeout))
+
+    return idle_watcher.watch(email_address.lower(), connect, mailbox, address=email_address)
+
+def unwatch_mailbox(email_address: str):
+    """停止监听账号的邮箱。"""
+    if IDLE_WATCHER_ENABLED:
+        idle_watcher.unwatch(email_address.lower())
+
+def get_mailbox_version(email_address: str) -> Optional[int]:
+    """
+    返回邮箱的变化版本号；账号没有处于 IDLE 监听时返回 None (调用方需要直接查询邮箱)。
+    """
+    key = email_address.lower()
+    if not IDLE_WATCHER_ENABLED or not idle_watcher.is_watching(key):
+        return None
+    return idle_watcher.version(key)
+
+def wait_for_mailbox_change(email_address: str, version: int, timeout: float) -> int:
+    """等待 IDLE 监听报告邮箱变化 (版本号大于 version) 或超时，返回当前版本号。"""
+    return idle_watcher.wait_for_change(email_address.lower(), version, timeout)
+
+def get_idle_watcher_stats() -> Dict[str, int]:
+    """返回 IDLE 监听的统计。"""
+    return idle_watcher.stats()
+
+_FETCH_UID_RE = re.compile(rb'\bUID (\d+)')
 
 def decode_mime_words(s: str) -> str:
     """解码邮件头部（如主题）中可能使用 MIME 编码的文本。"""
@@ -114,33 +442,73 @@ def decode_mime_words(s: str) -> str:
         return s  # 出错时返回原始字符串
 
 def strip_html(content: str) -> str:
-    """从字符串中移除 HTML 标签。"""
+    """
+    从字符串中移除 HTML 标签。HTML_TEXT_EXTRACTOR=stream 时使用流式解析器 (解析出错时回退到 BeautifulSoup)，
+    bs4 时使用 BeautifulSoup。
+    """
     if not content:
         return ""
-    soup = BeautifulSoup(content, "html.parser")
-    return soup.get_text()
+    if HTML_TEXT_EXTRACTOR == 'stream':
+        try:
+            return html_to_text(content)
+        except Exception as e:
+            logging.warning(f"流式解析 HTML 出错，改用 BeautifulSoup: {e}")
+    return html_to_text_bs4(content)
 
-def safe_decode(byte_content: bytes) -> str:
-    """使用检测到的编码或 UTF-8 解码字节内容。"""
+def safe_decode(byte_content: bytes, charset: Optional[str] = None) -> str:
+    """
+    解码字节内容: 先用邮件部分声明的 charset，其次严格按 UTF-8 解码，都失败时才用 chardet 检测
+    (只检测前 CHARSET_DETECT_MAX_BYTES 字节)，最后依次尝试常见编码。
+    """
     if not byte_content:
         return ""
     try:
-        result = chardet.detect(byte_content)
+        encoding = known_charset(charset)
+        if encoding:
+            try:
+                text = byte_content.decode(encoding)
+                _count_decode('declared')
+                return text
+            except UnicodeDecodeError:
+                pass
+        # ISO-2022-JP 等 7 位编码用 ESC 序列切换字符集，按 UTF-8 也能"解码成功"，交给检测
+        if encoding != 'utf-8' and b'\x1b' not in byte_content:
+            try:
+                text = byte_content.decode('utf-8')
+                _count_decode('utf8')
+                return text
+            except UnicodeDecodeError:
+                pass
+        result = chardet.detect(byte_content[:CHARSET_DETECT_MAX_BYTES])
         encoding = result['encoding']
         if encoding:
-            return byte_content.decode(encoding, errors='replace')
-        else:
-            # 如果检测失败，尝试常见编码
-            for enc in ['utf-8', 'iso-8859-1', 'windows-1252']:
-                try:
-                    return byte_content.decode(enc)
-                except UnicodeDecodeError:
-                    continue
-            return byte_content.decode('utf-8', errors='ignore')  # 最后的备选方案
+            try:
+                text = byte_content.decode(encoding, errors='replace')
+                _count_decode('detected')
+                return text
+            except LookupError:
+                pass
+        # 如果检测失败，尝试常见编码
+        _count_decode('fallback')
+        for enc in ['utf-8', 'iso-8859-1', 'windows-1252']:
+            try:
+                return byte_content.decode(enc)
+            except UnicodeDecodeError:
+                continue
+        return byte_content.decode('utf-8', errors='ignore')  # 最后的备选方案
     except Exception as e:
         logging.error(f"解码内容时出错: {e}")
         return ""
 
+def _count_decode(path: str):
+    with _decode_stats_lock:
+        _decode_stats[path] += 1
+
+def get_decode_stats() -> Dict[str, int]:
+    """返回 safe_decode 各解码路径 (声明的 charset、UTF-8、chardet 检测、备选编码) 的使用次数。"""
+    with _decode_stats_lock:
+        return dict(_decode_stats)
+
 def remove_extra_blank_lines(text: str) -> str:
     """移除文本中多余的空行。"""
     if not text:
@@ -148,6 +516,90 @@ def remove_extra_blank_lines(text: str) -> str:
     # 将多个空行替换为单个空行
     return re.sub(r'\n\s*\n', '\n\n', text)
 
+def _parse_header_fields(msg: email_module.message.Message) -> Tuple[str, str, str, str]:
+    """解析发件人、主题、日期及 ISO 格式的日期。"""
+    subject = decode_mime_words(msg.get("subject", "No Subject"))
+    sender = decode_mime_words(msg.get("from", "No Sender"))
+    date_str = msg.get("date", "")
+    
+    # 尝试解析日期为 ISO 格式
+    date_iso = ""
+    try:
+        if date_str:
+            dt = parsedate_to_datetime(date_str)
+            date_iso = dt.isoformat()
+    except Exception as e:
+        logging.warning(f"解析日期时出错: {date_str}, 错误: {e}")
+    return sender, subject, date_str, date_iso
+
+def _fetch_summaries(mail: imaplib.IMAP4, message_set: str, use_uid: bool) -> Optional[List[Tuple[Optional[int], Dict[str, Any]]]]:
+    """
+    摘要方式获取邮件: 第一条 FETCH 获取头部字段和 BODYSTRUCTURE，
+    再按正文所在的部分分组，每组一条 FETCH 获取正文的前 IMAP_SUMMARY_MAX_BYTES 字节。
+
+    Args:
+        message_set: 序号或 UID 集合，如 "5" 或 "1:200"。
+        use_uid: message_set 是否为 UID。
+
+    Returns:
+        [(UID, 邮件字典)]，顺序与服务器响应一致；邮件字典的字段与 parse_email_message 相同，
+        另有 'truncated' 表示正文是否被截断。FETCH 失败时返回 None。
+    """
+    def fetch(ids: str, items: str):
+        if use_uid:
+            return mail.uid('FETCH', ids, items)
+        return mail.fetch(ids, items)
+
+    status, message_data = fetch(message_set, f'(UID BODY.PEEK[HEADER.FIELDS ({SUMMARY_HEADER_FIELDS})] BODYSTRUCTURE)')
+    if status != 'OK':
+        logging.error(f"获取邮件头部失败: {status}")
+        return None
+
+    summaries = []
+    sections: Dict[str, List[Tuple[str, Dict[str, Any], Any]]] = {}
+    for sequence, items in parse_fetch_response(message_data):
+        uid = int(items['UID']) if isinstance(items.get('UID'), bytes) else None
+        headers = email_module.message_from_bytes(find_body_item(items, 'BODY[HEADER') or b'')
+        sender, subject, date_str, date_iso = _parse_header_fields(headers)
+        email_dict = {
+            "sender": sender,
+            "subject": subject,
+            "date": date_str,
+            "date_iso": date_iso,
+            "content": "",
+            "html_content": None,
+            "truncated": False,
+        }
+        summaries.append((uid, email_dict))
+        part = find_text_part(items.get('BODYSTRUCTURE'))
+        if part is not None:
+            ids = str(uid if use_uid else sequence)
+            sections.setdefault(part.section, []).append((ids, email_dict, part))
+
+    for section, members in sections.items():
+        status, message_data = fetch(','.join(ids for ids, _, _ in members),
+                                     f'(BODY.PEEK[{section}]<0.{IMAP_SUMMARY_MAX_BYTES}>)')
+        if status != 'OK':
+            logging.warning(f"获取邮件正文部分 {section} 失败: {status}")
+            continue
+        bodies = {}
+        for sequence, items in parse_fetch_response(message_data):
+            key = items['UID'].decode() if use_uid and isinstance(items.get('UID'), bytes) else str(sequence)
+            bodies[key] = find_body_item(items, f'BODY[{section}]')
+        for ids, email_dict, part in members:
+            raw = bodies.get(ids)
+            if raw is None:
+                continue
+            payload = decode_partial(raw, part.encoding)
+            charset = known_charset(part.charset)
+            text = payload.decode(charset, errors='replace') if charset else safe_decode(payload)
+            if part.subtype == 'html':
+                email_dict["html_content"] = text
+                text = strip_html(text)
+            email_dict["content"] = remove_extra_blank_lines(text.strip())
+            email_dict["truncated"] = part.size > IMAP_SUMMARY_MAX_BYTES
+    return summaries
+
 def parse_email_message(msg: email_module.message.Message) -> Dict[str, Any]:
     """
     解析邮件消息为字典格式。
@@ -160,18 +612,7 @@ def parse_email_message(msg: email_module.message.Message) -> Dict[str, Any]:
     """
     try:
         # 解析基本信息
-        subject = decode_mime_words(msg.get("subject", "No Subject"))
-        sender = decode_mime_words(msg.get("from", "No Sender"))
-        date_str = msg.get("date", "")
-        
-        # 尝试解析日期为 ISO 格式
-        date_iso = ""
-        try:
-            if date_str:
-                dt = parsedate_to_datetime(date_str)
-                date_iso = dt.isoformat()
-        except Exception as e:
-            logging.warning(f"解析日期时出错: {date_str}, 错误: {e}")
+        sender, subject, date_str, date_iso = _parse_header_fields(msg)
         
         # 解析邮件正文
         body = ""
@@ -186,7 +627,7 @@ def parse_email_message(msg: email_module.message.Message) -> Dict[str, Any]:
                 if part.get_content_maintype() == 'text' and "attachment" not in content_disposition:
                     payload = part.get_payload(decode=True)
                     if payload:
-                        part_content = safe_decode(payload)
+                        part_content = safe_decode(payload, part.get_content_charset())
                         if content_type == "text/html":
                             html_body += part_content
                             body += strip_html(part_content) + "\n"
@@ -196,7 +637,7 @@ def parse_email_message(msg: email_module.message.Message) -> Dict[str, Any]:
             content_type = msg.get_content_type()
             payload = msg.get_payload(decode=True)
             if payload:
-                part_content = safe_decode(payload)
+                part_content = safe_decode(payload, msg.get_content_charset())
                 if content_type == "text/html":
                     html_body = part_content
                     body = strip_html(part_content)
@@ -230,7 +671,8 @@ def parse_email_message(msg: email_module.message.Message) -> Dict[str, Any]:
             "error": str(e)
         }
 
-def get_latest_email(refresh_token: str, client_id: str, email: str, mailbox: str = "INBOX", timeout: int = 30) -> Optional[Dict[str, Any]]:
+def get_latest_email(refresh_token: str, client_id: str, email: str, mailbox: str = "INBOX", timeout: int = 30,
+                     profile: str = "full", deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
     """
     使用 IMAP 获取指定邮箱的最新一封邮件。
 
@@ -239,88 +681,27 @@ def get_latest_email(refresh_token: str, client_id: str, email: str, mailbox: st
         client_id: 应用程序的 client ID。
         email: 目标邮箱地址。
         mailbox: 要查询的邮箱文件夹 (默认为 "INBOX")。
-        timeout: 请求超时时间 (秒，默认为 30)。
+        timeout: 整个调用的时间预算 (秒，默认为 30)。
+        profile: 获取方式，"full" 或 "summary" (只获取头部和截断的正文)。
+        deadline: 调用方的截止时间，timeout 不会超过它。
 
     Returns:
         包含邮件信息的字典 (如 'sender', 'subject', 'date', 'content')，
         如果操作失败或未找到邮件则返回 None。
+
+    Raises:
+        DeadlineExceeded: 时间预算用完。
+        ImapPoolExhausted: IMAP 连接数已达上限且等待超时。
     """
-    mail = None
-    
     try:
-        # 设置超时
-        imaplib.IMAP4_SSL.timeout = timeout
-        
-        # 获取访问令牌
-        access_token = get_new_access_token(refresh_token, client_id)
-        if not access_token:
-            return None
-        
-        # 连接到 IMAP 服务器
-        mail, success = connect_to_imap(email, access_token)
-        if not success or not mail:
-            return None
-        
-        # 选择邮箱文件夹
-        logging.info(f"正在选择邮箱文件夹: {mailbox}...")
-        status, select_data = mail.select(mailbox, readonly=True)
-        if status != 'OK':
-            logging.error(f"选择邮箱文件夹 '{mailbox}' 失败: {status} - {select_data}")
-            return None
-        
-        # 获取邮件数量
-        message_count = int(select_data[0].decode())
-        logging.info(f"文件夹 '{mailbox}' 包含 {message_count} 封邮件。")
-        
-        if message_count == 0:
-            logging.info(f"文件夹 '{mailbox}' 中没有邮件。")
-            return None
-        
-        # 获取最新一封邮件的 ID
-        status, message_ids_bytes = mail.search(None, 'ALL')
-        if status != 'OK':
-            logging.error(f"搜索邮件失败: {status}")
-            return None
-        
-        message_ids = message_ids_bytes[0].split()
-        if not message_ids:
-            logging.info(f"文件夹 '{mailbox}' 中没有找到邮件。")
-            return None
-        
-        # 获取最新一封邮件（最后一个 ID）
-        latest_id = message_ids[-1]
-        logging.info(f"正在获取最新邮件 (ID: {latest_id.decode()})...")
-        
-        status, message_data = mail.fetch(latest_id, '(RFC822)')
-        if status != 'OK':
-            logging.error(f"获取邮件内容失败: {status}")
-            return None
-        
-        # 解析邮件内容
-        raw_email = message_data[0][1]
-        
-        # 添加详细的调试日志
-        raw_email_type = type(raw_email)
-        raw_email_preview = str(raw_email)[:100] + "..." if len(str(raw_email)) > 100 else str(raw_email)
-        logging.debug(f"raw_email 类型: {raw_email_type}, 值预览: {raw_email_preview}")
-        
-        # 添加类型检查，根据 raw_email 的类型使用不同的函数
-        if isinstance(raw_email, bytes):
-            logging.debug("使用 email_module.message_from_bytes 处理字节类型数据")
-            msg = email_module.message_from_bytes(raw_email)
-        elif isinstance(raw_email, str):
-            logging.debug("使用 email_module.message_from_string 处理字符串类型数据")
-            msg = email_module.message_from_string(raw_email)
-        else:
-            logging.error(f"无法处理的邮件内容类型: {raw_email_type}")
-            return None
-        
-        # 解析邮件为字典格式
-        email_dict = parse_email_message(msg)
-        logging.info(f"成功获取最新邮件: {email_dict.get('subject', '无主题')}")
-        
-        return email_dict
-        
+        if UPSTREAM_BACKEND == 'asyncio' and profile == 'full':
+            return _fetch_latest_email_async(refresh_token, client_id, email, mailbox, timeout, deadline)
+        # 从连接池获取已认证的连接 (访问令牌优先使用缓存)
+        return with_imap_connection(refresh_token, client_id, email, timeout,
+                                    lambda mail: _fetch_latest_email(mail, mailbox, profile, email), default=None,
+                                    deadline=deadline)
+    except (DeadlineExceeded, ImapPoolExhausted):
+        raise
     except imaplib.IMAP4.error as e:
         logging.error(f"IMAP 错误: {e}")
         return None
@@ -329,16 +710,153 @@ def get_latest_email(refresh_token: str, client_id: str, email: str, mailbox: st
         import traceback
         traceback.print_exc()
         return None
-    finally:
-        if mail:
-            try:
-                mail.close()
-                mail.logout()
-                logging.info("IMAP 连接已关闭。")
-            except Exception as e:
-                logging.warning(f"关闭 IMAP 连接时出错: {e}")
 
-def get_all_emails(refresh_token: str, client_id: str, email: str, mailbox: str = "INBOX", timeout: int = 60) -> Optional[List[Dict[str, Any]]]:
+def _fetch_latest_email_async(refresh_token: str, client_id: str, email: str, mailbox: str, timeout: int,
+                              deadline: Optional[Deadline]) -> Optional[Dict[str, Any]]:
+    """
+    通过 asyncio 后端获取最新一封邮件 (profile=full)，UID 没有变化时使用已解析邮件缓存；
+    缓存禁用时不单独查询 UID。
+    """
+    def lookup(uidvalidity: int, uid: int) -> Optional[Dict[str, Any]]:
+        return message_cache.get(MessageCache.key(email, mailbox, uidvalidity, uid, 'full'))
+
+    latest = async_upstream.run_sync(
+        async_upstream.fetch_latest_message(refresh_token, client_id, email, mailbox, timeout, deadline,
+                                            lookup=lookup if message_cache.max_entries > 0 else None))
+    if latest is None:
+        return None
+    if latest.cached is not None:
+        logging.info(f"最新邮件 (UID {latest.uid}) 没有变化，使用缓存的解析结果")
+        return latest.cached
+    if not latest.raw:
+        return None
+    email_dict = parse_email_message(email_module.message_from_bytes(latest.raw))
+    if latest.uid is not None and latest.uidvalidity is not None:
+        email_dict.update(uid=latest.uid, uidvalidity=latest.uidvalidity)
+        message_cache.put(MessageCache.key(email, mailbox, latest.uidvalidity, latest.uid, 'full'), email_dict)
+    return email_dict
+
+def _selected_uidvalidity(mail: imaplib.IMAP4) -> Optional[int]:
+    """返回刚选择的文件夹的 UIDVALIDITY；服务器没有提供时返回 None。"""
+    _, uidvalidity_data = mail.response('UIDVALIDITY')
+    if not uidvalidity_data or not uidvalidity_data[0]:
+        return None
+    return int(uidvalidity_data[0])
+
+def _fetch_response_uid(data: list) -> Optional[int]:
+    """返回 FETCH 响应中第一个 UID 数据项的值，没有时返回 None。"""
+    for item in data:
+        match = _FETCH_UID_RE.search(item[0] if isinstance(item, tuple) else item or b'')
+        if match:
+            return int(match.group(1))
+    return None
+
+def _latest_uid(mail: imaplib.IMAP4, message_id: bytes) -> Optional[int]:
+    """返回序号为 message_id 的邮件的 UID；查询失败时返回 None。"""
+    status, data = mail.fetch(message_id, '(UID)')
+    if status != 'OK':
+        return None
+    return _fetch_response_uid(data)
+
+def _fetch_latest_email(mail: imaplib.IMAP4, mailbox: str, profile: str = "full",
+                        email: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    在已认证的连接上获取最新一封邮件。
+
+    给出 email 时返回的字典带有 'uid' 和 'uidvalidity' 字段 (用于 ETag)。缓存已启用时先只查询最新邮件的 UID，
+    它的解析结果已在 message_cache 中时不再下载邮件；缓存禁用时 UID 随邮件内容在同一条 FETCH 中获取。
+    """
+    # 选择邮箱文件夹
+    logging.info(f"正在选择邮箱文件夹: {mailbox}...")
+    status, select_data = mail.select(mailbox, readonly=True)
+    if status != 'OK':
+        logging.error(f"选择邮箱文件夹 '{mailbox}' 失败: {status} - {select_data}")
+        return None
+    
+    # 获取邮件数量
+    message_count = int(select_data[0].decode())
+    logging.info(f"文件夹 '{mailbox}' 包含 {message_count} 封邮件。")
+    
+    if message_count == 0:
+        logging.info(f"文件夹 '{mailbox}' 中没有邮件。")
+        return None
+    
+    # 最新一封邮件的序号就是 SELECT 返回的邮件数量，不需要 SEARCH ALL 列出所有序号
+    latest_id = str(message_count).encode()
+
+    uidvalidity = _selected_uidvalidity(mail) if email is not None else None
+    uid = None
+    cache_key = None
+    if uidvalidity is not None and message_cache.max_entries > 0:
+        uid = _latest_uid(mail, latest_id)
+        if uid is not None:
+            cache_key = MessageCache.key(email, mailbox, uidvalidity, uid, profile)
+            cached = message_cache.get(cache_key)
+            if cached is not None:
+                logging.info(f"最新邮件 (UID {uid}) 没有变化，使用缓存的解析结果")
+                return cached
+    logging.info(f"正在获取最新邮件 (ID: {latest_id.decode()})...")
+
+    if profile == "summary":
+        if uid is not None:
+            summaries = _fetch_summaries(mail, str(uid), use_uid=True)
+        else:
+            summaries = _fetch_summaries(mail, latest_id.decode(), use_uid=False)
+        if not summaries:
+            return None
+        fetched_uid, email_dict = summaries[0]
+        if uidvalidity is not None and fetched_uid is not None:
+            email_dict.update(uid=fetched_uid, uidvalidity=uidvalidity)
+        if cache_key is not None:
+            message_cache.put(cache_key, email_dict)
+        return email_dict
+
+    if uid is not None:
+        # 按 UID 获取，确保缓存的正是刚才查询到的那封邮件
+        status, message_data = mail.uid('FETCH', str(uid), '(RFC822)')
+    else:
+        status, message_data = mail.fetch(latest_id, '(UID RFC822)' if uidvalidity is not None else '(RFC822)')
+    if status != 'OK':
+        logging.error(f"获取邮件内容失败: {status}")
+        return None
+    if not message_data or not isinstance(message_data[0], tuple):
+        # 邮件在查询 UID 之后被删除
+        logging.warning(f"最新邮件已不存在: {message_data}")
+        return None
+    
+    # 解析邮件内容
+    raw_email = message_data[0][1]
+    
+    # 添加详细的调试日志
+    raw_email_type = type(raw_email)
+    raw_email_preview = str(raw_email)[:100] + "..." if len(str(raw_email)) > 100 else str(raw_email)
+    logging.debug(f"raw_email 类型: {raw_email_type}, 值预览: {raw_email_preview}")
+    
+    # 添加类型检查，根据 raw_email 的类型使用不同的函数
+    if isinstance(raw_email, bytes):
+        logging.debug("使用 email_module.message_from_bytes 处理字节类型数据")
+        msg = email_module.message_from_bytes(raw_email)
+    elif isinstance(raw_email, str):
+        logging.debug("使用 email_module.message_from_string 处理字符串类型数据")
+        msg = email_module.message_from_string(raw_email)
+    else:
+        logging.error(f"无法处理的邮件内容类型: {raw_email_type}")
+        return None
+    
+    # 解析邮件为字典格式
+    email_dict = parse_email_message(msg)
+    logging.info(f"成功获取最新邮件: {email_dict.get('subject', '无主题')}")
+    if uidvalidity is not None:
+        uid = uid if uid is not None else _fetch_response_uid(message_data)
+        if uid is not None:
+            email_dict.update(uid=uid, uidvalidity=uidvalidity)
+    if cache_key is not None:
+        message_cache.put(cache_key, email_dict)
+    
+    return email_dict
+
+def get_all_emails(refresh_token: str, client_id: str, email: str, mailbox: str = "INBOX", timeout: int = 60,
+                   profile: str = "full", deadline: Optional[Deadline] = None) -> Optional[List[Dict[str, Any]]]:
     """
     使用 IMAP 获取指定邮箱的所有邮件。
 
@@ -347,82 +865,79 @@ def get_all_emails(refresh_token: str, client_id: str, email: str, mailbox: str
         client_id: 应用程序的 client ID。
         email: 目标邮箱地址。
         mailbox: 要查询的邮箱文件夹 (默认为 "INBOX")。
-        timeout: 请求超时时间 (秒，默认为 60，因为获取所有邮件可能耗时更长)。
+        timeout: 整个调用的时间预算 (秒，默认为 60，因为获取所有邮件可能耗时更长)。
+        profile: 获取方式，"full" 或 "summary" (只获取头部和截断的正文)。
+        deadline: 调用方的截止时间，timeout 不会超过它。
 
     Returns:
         包含邮件信息字典的列表，如果操作失败或没有邮件则返回 None。
+
+    Raises:
+        DeadlineExceeded: 时间预算用完。
+        ImapPoolExhausted: IMAP 连接数已达上限且等待超时。
     """
-    mail = None
-    
     try:
-        # 设置超时
-        imaplib.IMAP4_SSL.timeout = timeout
-        
-        # 获取访问令牌
-        access_token = get_new_access_token(refresh_token, client_id)
-        if not access_token:
-            return None
-        
-        # 连接到 IMAP 服务器
-        mail, success = connect_to_imap(email, access_token)
-        if not success or not mail:
-            return None
-        
-        # 选择邮箱文件夹
-        logging.info(f"正在选择邮箱文件夹: {mailbox}...")
-        status, select_data = mail.select(mailbox, readonly=True)
-        if status != 'OK':
-            logging.error(f"选择邮箱文件夹 '{mailbox}' 失败: {status} - {select_data}")
-            return None
-        
-        # 获取邮件数量
-        message_count = int(select_data[0].decode())
-        logging.info(f"文件夹 '{mailbox}' 包含 {message_count} 封邮件。")
-        
-        if message_count == 0:
-            logging.info(f"文件夹 '{mailbox}' 中没有邮件。")
-            return []
-        
-        # 获取所有邮件的 ID
-        status, message_ids_bytes = mail.search(None, 'ALL')
+        # 从连接池获取已认证的连接 (访问令牌优先使用缓存)
+        return with_imap_connection(refresh_token, client_id, email, timeout,
+                                    lambda mail: _fetch_all_emails(mail, mailbox, profile), deadline=deadline, default=None)
+    except (DeadlineExceeded, ImapPoolExhausted):
+        raise
+    except imaplib.IMAP4.error as e:
+        logging.error(f"IMAP 错误: {e}")
+        return None
+    except Exception as e:
+        logging.error(f"获取所有邮件时发生意外错误: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def _fetch_all_emails(mail: imaplib.IMAP4, mailbox: str, profile: str = "full") -> Optional[List[Dict[str, Any]]]:
+    """在已认证的连接上获取所有邮件。"""
+    # 选择邮箱文件夹
+    logging.info(f"正在选择邮箱文件夹: {mailbox}...")
+    status, select_data = mail.select(mailbox, readonly=True)
+    if status != 'OK':
+        logging.error(f"选择邮箱文件夹 '{mailbox}' 失败: {status} - {select_data}")
+        return None
+    
+    # 获取邮件数量
+    message_count = int(select_data[0].decode())
+    logging.info(f"文件夹 '{mailbox}' 包含 {message_count} 封邮件。")
+    
+    if message_count == 0:
+        logging.info(f"文件夹 '{mailbox}' 中没有邮件。")
+        return []
+    
+    # 按序号范围分块 FETCH，每块一次往返，而不是每封邮件一次
+    all_emails = []
+    logging.info(f"正在获取 {message_count} 封邮件 (每次最多 {IMAP_FETCH_CHUNK_SIZE} 封)...")
+    
+    for first in range(1, message_count + 1, IMAP_FETCH_CHUNK_SIZE):
+        last = min(first + IMAP_FETCH_CHUNK_SIZE - 1, message_count)
+        if profile == "summary":
+            summaries = _fetch_summaries(mail, f'{first}:{last}', use_uid=False)
+            if summaries is None:
+                logging.warning(f"获取邮件 {first}:{last} 摘要失败")
+                continue
+            all_emails.extend(email_dict for _, email_dict in summaries)
+            continue
+        status, message_data = mail.fetch(f'{first}:{last}', '(RFC822)')
         if status != 'OK':
-            logging.error(f"搜索邮件失败: {status}")
-            return None
-        
-        message_ids = message_ids_bytes[0].split()
-        if not message_ids:
-            logging.info(f"文件夹 '{mailbox}' 中没有找到邮件。")
-            return []
-        
-        # 获取所有邮件
-        all_emails = []
-        logging.info(f"正在获取 {len(message_ids)} 封邮件...")
+            logging.warning(f"获取邮件 {first}:{last} 内容失败: {status}")
+            continue
         
-        # 为了提高性能，可以考虑批量获取或限制获取的邮件数量
-        for msg_id in message_ids:
+        # 每个邮件对应一个 (响应头, 邮件内容) 元组，元组之间夹着结尾的 b')'
+        for item in message_data:
+            if not isinstance(item, tuple):
+                continue
             try:
-                status, message_data = mail.fetch(msg_id, '(RFC822)')
-                if status != 'OK':
-                    logging.warning(f"获取邮件 ID {msg_id.decode()} 内容失败: {status}")
-                    continue
-                
-                # 解析邮件内容
-                raw_email = message_data[0][1]
-                
-                # 添加详细的调试日志
-                raw_email_type = type(raw_email)
-                raw_email_preview = str(raw_email)[:100] + "..." if len(str(raw_email)) > 100 else str(raw_email)
-                logging.debug(f"raw_email 类型: {raw_email_type}, 值预览: {raw_email_preview}")
-                
-                # 添加类型检查，根据 raw_email 的类型使用不同的函数
+                raw_email = item[1]
                 if isinstance(raw_email, bytes):
-                    logging.debug("使用 email_module.message_from_bytes 处理字节类型数据")
                     msg = email_module.message_from_bytes(raw_email)
                 elif isinstance(raw_email, str):
-                    logging.debug("使用 email_module.message_from_string 处理字符串类型数据")
                     msg = email_module.message_from_string(raw_email)
                 else:
-                    logging.warning(f"无法处理的邮件内容类型: {raw_email_type}, 邮件 ID: {msg_id.decode()}")
+                    logging.warning(f"无法处理的邮件内容类型: {type(raw_email)}, 响应: {item[0][:40]}")
                     continue
                 
                 # 解析邮件为字典格式
@@ -431,29 +946,213 @@ def get_all_emails(refresh_token: str, client_id: str, email: str, mailbox: str
                 
                 logging.debug(f"已获取邮件: {email_dict.get('subject', '无主题')}")
             except Exception as e:
-                logging.warning(f"处理邮件 ID {msg_id.decode()} 时出错: {e}")
-        
-        logging.info(f"成功获取 {len(all_emails)} 封邮件。")
-        return all_emails
-        
+                logging.warning(f"处理邮件 {item[0][:40]} 时出错: {e}")
+    
+    logging.info(f"成功获取 {len(all_emails)} 封邮件。")
+    return all_emails
+
+def list_uids_after(refresh_token: str, client_id: str, email: str, mailbox: str = "INBOX", since_uid: int = 0,
+                    timeout: int = 60, deadline: Optional[Deadline] = None) -> Tuple[Optional[int], List[int]]:
+    """
+    只用一条 UID SEARCH 列出 UID 大于 since_uid 的邮件 (从小到大)，不下载邮件。
+
+    Returns:
+        (文件夹的 UIDVALIDITY, UID 列表)；服务器没有提供 UIDVALIDITY 时第一项为 None。
+
+    Raises:
+        ConnectionError: 无法建立连接或选择邮箱失败。
+        imaplib.IMAP4.error: IMAP 命令出错。
+        DeadlineExceeded: 时间预算用完。
+        ImapPoolExhausted: IMAP 连接数已达上限且等待超时。
+    """
+    listing = with_imap_connection(refresh_token, client_id, email, timeout,
+                                   lambda mail: _search_uids_after(mail, mailbox, since_uid), default=None,
+                                   deadline=deadline)
+    if listing is None:
+        raise ConnectionError(f"无法读取邮箱 {email} 的文件夹 '{mailbox}'")
+    return listing
+
+def iter_emails(refresh_token: str, client_id: str, email: str, mailbox: str = "INBOX", since_uid: int = 0,
+                limit: Optional[int] = None, timeout: int = 60, profile: str = "full",
+                deadline: Optional[Deadline] = None, uids: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    按 UID 从小到大逐封生成 UID 大于 since_uid 的邮件，内存中最多保留一块 (IMAP_FETCH_CHUNK_SIZE 封) 原始邮件。
+
+    每块使用一条 UID FETCH 命令 (profile="summary" 时为头部和截断的正文)，块之间把连接归还连接池，
+    调用方中途停止迭代不会占用连接。生成的邮件字典带有 'uid' 字段，可作为下一页的 since_uid。
+    已经用 list_uids_after() 列出 UID 时可以通过 uids 传入，跳过开头的 UID SEARCH。
+
+    timeout 是每一块 (以及开头的 UID SEARCH) 的时间预算，且不超过 deadline。
+
+    Raises:
+        ConnectionError: 无法建立连接或选择邮箱失败 (在生成第一封邮件之前)。
+        imaplib.IMAP4.error: IMAP 命令出错。
+        DeadlineExceeded: 时间预算用完。
+        ImapPoolExhausted: IMAP 连接数已达上限且等待超时。
+    """
+    if uids is None:
+        _, uids = list_uids_after(refresh_token, client_id, email, mailbox, since_uid, timeout, deadline)
+    if limit is not None:
+        uids = uids[:limit]
+
+    for start in range(0, len(uids), IMAP_FETCH_CHUNK_SIZE):
+        chunk = uids[start:start + IMAP_FETCH_CHUNK_SIZE]
+        emails = with_imap_connection(refresh_token, client_id, email, timeout,
+                                      lambda mail: _fetch_uid_range(mail, mailbox, chunk[0], chunk[-1], profile),
+                                      default=None, deadline=deadline)
+        if emails is None:
+            raise ConnectionError(f"获取邮箱 {email} 的邮件 UID {chunk[0]}:{chunk[-1]} 失败")
+        yield from emails
+
+def _search_uids_after(mail: imaplib.IMAP4, mailbox: str,
+                       since_uid: int) -> Optional[Tuple[Optional[int], List[int]]]:
+    """返回文件夹的 UIDVALIDITY 和其中 UID 大于 since_uid 的所有 UID (从小到大)。"""
+    status, select_data = mail.select(mailbox, readonly=True)
+    if status != 'OK':
+        logging.error(f"选择邮箱文件夹 '{mailbox}' 失败: {status} - {select_data}")
+        return None
+    _, uidvalidity_data = mail.response('UIDVALIDITY')
+    uidvalidity = int(uidvalidity_data[0]) if uidvalidity_data and uidvalidity_data[0] else None
+    if int(select_data[0]) == 0:
+        return uidvalidity, []
+    status, data = mail.uid('SEARCH', None, f'UID {since_uid + 1}:*')
+    if status != 'OK':
+        logging.error(f"搜索邮件失败: {status}")
+        return None
+    # "n:*" 在没有更大的 UID 时仍会返回最大的 UID，需要再过滤一次
+    return uidvalidity, sorted(uid for uid in map(int, data[0].split()) if uid > since_uid)
+
+def _fetch_uid_range(mail: imaplib.IMAP4, mailbox: str, first_uid: int, last_uid: int,
+                     profile: str = "full") -> Optional[List[Dict[str, Any]]]:
+    """获取 UID 在 [first_uid, last_uid] 范围内的邮件 (从小到大)。"""
+    status, select_data = mail.select(mailbox, readonly=True)
+    if status != 'OK':
+        logging.error(f"选择邮箱文件夹 '{mailbox}' 失败: {status} - {select_data}")
+        return None
+    if profile == "summary":
+        summaries = _fetch_summaries(mail, f'{first_uid}:{last_uid}', use_uid=True)
+        if summaries is None:
+            return None
+        emails = []
+        for uid, email_dict in summaries:
+            if uid is not None and first_uid <= uid <= last_uid:
+                email_dict['uid'] = uid
+                emails.append(email_dict)
+        emails.sort(key=lambda e: e['uid'])
+        return emails
+    status, message_data = mail.uid('FETCH', f'{first_uid}:{last_uid}', '(UID RFC822)')
+    if status != 'OK':
+        logging.error(f"获取邮件 UID {first_uid}:{last_uid} 失败: {status}")
+        return None
+    emails = []
+    for item in message_data:
+        if not isinstance(item, tuple):
+            continue
+        match = _FETCH_UID_RE.search(item[0])
+        if not match:
+            continue
+        uid = int(match.group(1))
+        if not first_uid <= uid <= last_uid:
+            continue
+        try:
+            email_dict = parse_email_message(email_module.message_from_bytes(item[1]))
+        except Exception as e:
+            logging.warning(f"处理邮件 UID {uid} 时出错: {e}")
+            continue
+        email_dict['uid'] = uid
+        emails.append(email_dict)
+    emails.sort(key=lambda e: e['uid'])
+    return emails
+
+def get_emails_after_uid(refresh_token: str, client_id: str, email: str, after_uid: Optional[int],
+                         mailbox: str = "INBOX", limit: int = 10, timeout: int = 30,
+                         profile: str = "full", deadline: Optional[Deadline] = None) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    获取邮箱中 UID 大于 after_uid 的新邮件，用于轮询等待新邮件。
+
+    SELECT 返回的 UIDNEXT 表明没有新邮件时不发送 FETCH。只检查最新的 limit 封邮件，
+    两次调用之间到达的邮件超过 limit 封时，较早的几封会被跳过。
+
+    Args:
+        after_uid: 上一次调用返回的游标；None 表示第一次调用，返回最新的 limit 封邮件。
+
+    Returns:
+        (游标, 邮件列表)，邮件按从新到旧排列并带有 'uid' 字段；游标应在下一次调用时传入。
+        操作失败时返回 None。
+
+    Raises:
+        DeadlineExceeded: 时间预算用完。
+        ImapPoolExhausted: IMAP 连接数已达上限且等待超时。
+    """
+    try:
+        return with_imap_connection(refresh_token, client_id, email, timeout,
+                                    lambda mail: _fetch_emails_after_uid(mail, mailbox, after_uid, limit, profile),
+                                    default=None, deadline=deadline)
+    except (DeadlineExceeded, ImapPoolExhausted):
+        raise
     except imaplib.IMAP4.error as e:
         logging.error(f"IMAP 错误: {e}")
         return None
     except Exception as e:
-        logging.error(f"获取所有邮件时发生意外错误: {e}")
-        import traceback
-        traceback.print_exc()
+        logging.error(f"获取新邮件时发生意外错误: {e}", exc_info=True)
         return None
-    finally:
-        if mail:
-            try:
-                mail.close()
-                mail.logout()
-                logging.info("IMAP 连接已关闭。")
-            except Exception as e:
-                logging.warning(f"关闭 IMAP 连接时出错: {e}")
 
-def clear_mailbox(refresh_token: str, client_id: str, email: str, mailbox: str = "INBOX", timeout: int = 30) -> bool:
+def _fetch_emails_after_uid(mail: imaplib.IMAP4, mailbox: str, after_uid: Optional[int],
+                            limit: int, profile: str = "full") -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+    """在已认证的连接上获取 UID 大于 after_uid 的最新邮件。"""
+    status, select_data = mail.select(mailbox, readonly=True)
+    if status != 'OK':
+        logging.error(f"选择邮箱文件夹 '{mailbox}' 失败: {status} - {select_data}")
+        return None
+    message_count = int(select_data[0])
+    _, uid_next_data = mail.response('UIDNEXT')
+    uid_next = int(uid_next_data[0]) if uid_next_data and uid_next_data[0] else None
+    cursor = after_uid or 0
+    if message_count == 0:
+        return (uid_next - 1 if uid_next else cursor), []
+    if after_uid is not None and uid_next is not None and uid_next <= after_uid + 1:
+        return cursor, []
+
+    first = max(1, message_count - limit + 1)
+    if profile == "summary":
+        summaries = _fetch_summaries(mail, f'{first}:{message_count}', use_uid=False)
+        if summaries is None:
+            return None
+        emails = []
+        for uid, email_dict in summaries:
+            if uid is None:
+                continue
+            cursor = max(cursor, uid)
+            if after_uid is None or uid > after_uid:
+                email_dict['uid'] = uid
+                emails.append(email_dict)
+        emails.sort(key=lambda e: e['uid'], reverse=True)
+        return cursor, emails
+
+    status, message_data = mail.fetch(f'{first}:{message_count}', '(UID RFC822)')
+    if status != 'OK':
+        logging.error(f"获取邮件内容失败: {status}")
+        return None
+
+    emails = []
+    for item in message_data:
+        if not isinstance(item, tuple):
+            continue
+        match = _FETCH_UID_RE.search(item[0])
+        if not match:
+            continue
+        uid = int(match.group(1))
+        cursor = max(cursor, uid)
+        if after_uid is not None and uid <= after_uid:
+            continue
+        email_dict = parse_email_message(email_module.message_from_bytes(item[1]))
+        email_dict['uid'] = uid
+        emails.append(email_dict)
+    emails.reverse()
+    return cursor, emails
+
+def clear_mailbox(refresh_token: str, client_id: str, email: str, mailbox: str = "INBOX", timeout: int = 30,
+                  deadline: Optional[Deadline] = None) -> bool:
     """
     使用 IMAP 清空指定邮箱的文件夹。
 
@@ -462,88 +1161,26 @@ def clear_mailbox(refresh_token: str, client_id: str, email: str, mailbox: str =
         client_id: 应用程序的 client ID。
         email: 目标邮箱地址。
         mailbox: 要清空的邮箱文件夹 (默认为 "INBOX")。
-        timeout: 请求超时时间 (秒，默认为 30)。
+        timeout: 整个调用的时间预算 (秒，默认为 30)。
+        deadline: 调用方的截止时间，timeout 不会超过它。
 
     Returns:
         如果清空操作成功则返回 True，否则返回 False。
+
+    Raises:
+        DeadlineExceeded: 时间预算用完。
+        ImapPoolExhausted: IMAP 连接数已达上限且等待超时。
     """
-    mail = None
-    
     try:
-        # 设置超时
-        imaplib.IMAP4_SSL.timeout = timeout
-        
-        # 获取访问令牌
-        access_token = get_new_access_token(refresh_token, client_id)
-        if not access_token:
-            return False
-        
-        # 连接到 IMAP 服务器
-        mail, success = connect_to_imap(email, access_token)
-        if not success or not mail:
-            return False
-        
-        # 选择邮箱文件夹
-        logging.info(f"正在选择邮箱文件夹: {mailbox}...")
-        status, select_data = mail.select(mailbox)  # 非只读模式
-        if status != 'OK':
-            logging.error(f"选择邮箱文件夹 '{mailbox}' 失败: {status} - {select_data}")
-            return False
-        
-        # 获取邮件数量
-        message_count = int(select_data[0].decode())
-        logging.info(f"文件夹 '{mailbox}' 包含 {message_count} 封邮件。")
-        
-        if message_count == 0:
-            logging.info(f"文件夹 '{mailbox}' 中没有邮件需要清空。")
-            return True  # 没有邮件也算成功
-        
-        # 搜索所有邮件
-        logging.info(f"正在搜索文件夹 '{mailbox}' 中的所有邮件...")
-        status, message_ids_bytes = mail.search(None, 'ALL')
-        if status != 'OK':
-            logging.error(f"搜索邮件失败: {status}")
-            return False
-        
-        message_ids = message_ids_bytes[0].split()
-        if not message_ids:
-            logging.info(f"文件夹 '{mailbox}' 中没有找到邮件。")
-            return True  # 没有邮件也算成功
-        
-        # 标记所有邮件为删除
-        logging.info(f"正在标记 {len(message_ids)} 封邮件为删除...")
-        marked_count = 0
-        
-        for msg_id in message_ids:
-            status, store_data = mail.store(msg_id, '+FLAGS', r'\Deleted')
-            if status == 'OK':
-                marked_count += 1
-            else:
-                logging.warning(f"标记邮件 ID {msg_id.decode()} 为删除失败: {status} - {store_data}")
-        
-        logging.info(f"成功标记 {marked_count}/{len(message_ids)} 封邮件为删除。")
-        
-        # 执行永久删除
-        if marked_count > 0:
-            logging.info("正在永久删除已标记的邮件 (Expunge)...")
-            status, expunge_data = mail.expunge()
-            
-            if status == 'OK':
-                deleted_count = len(expunge_data) if expunge_data and expunge_data[0] is not None else marked_count
-                if expunge_data and expunge_data[0] is None:
-                    logging.info(f"Expunge 操作成功执行，但返回数据为 [None]。假定所有标记邮件已删除 ({marked_count} 封)。")
-                else:
-                    logging.info(f"成功永久删除 {deleted_count} 封邮件。")
-                
-                return True
-            else:
-                logging.error(f"永久删除邮件 (Expunge) 失败: {status} - {expunge_data}")
-                return False
-        else:
-            logging.info("没有成功标记的邮件，无需执行 Expunge。")
-            # 如果标记失败但没有邮件需要标记，也算成功
-            return len(message_ids) == 0 or marked_count == len(message_ids)
-        
+        if UPSTREAM_BACKEND == 'asyncio':
+            return async_upstream.run_sync(
+                async_upstream.clear(refresh_token, client_id, email, mailbox, timeout, deadline))
+        # 从连接池获取已认证的连接 (访问令牌优先使用缓存)
+        return with_imap_connection(refresh_token, client_id, email, timeout,
+                                    lambda mail: _clear_selected_mailbox(mail, mailbox), default=False,
+                                    deadline=deadline)
+    except (DeadlineExceeded, ImapPoolExhausted):
+        raise
     except imaplib.IMAP4.error as e:
         logging.error(f"IMAP 错误: {e}")
         return False
@@ -552,14 +1189,43 @@ def clear_mailbox(refresh_token: str, client_id: str, email: str, mailbox: str =
         import traceback
         traceback.print_exc()
         return False
-    finally:
-        if mail:
-            try:
-                mail.close()
-                mail.logout()
-                logging.info("IMAP 连接已关闭。")
-            except Exception as e:
-                logging.warning(f"关闭 IMAP 连接时出错: {e}")
+
+def _clear_selected_mailbox(mail: imaplib.IMAP4, mailbox: str) -> bool:
+    """在已认证的连接上清空邮箱文件夹。"""
+    # 选择邮箱文件夹
+    logging.info(f"正在选择邮箱文件夹: {mailbox}...")
+    status, select_data = mail.select(mailbox)  # 非只读模式
+    if status != 'OK':
+        logging.error(f"选择邮箱文件夹 '{mailbox}' 失败: {status} - {select_data}")
+        return False
+    
+    # 获取邮件数量
+    message_count = int(select_data[0].decode())
+    logging.info(f"文件夹 '{mailbox}' 包含 {message_count} 封邮件。")
+    
+    if message_count == 0:
+        logging.info(f"文件夹 '{mailbox}' 中没有邮件需要清空。")
+        return True  # 没有邮件也算成功
+    
+    # 一条命令标记 SELECT 时已有的全部邮件 (之后到达的新邮件不受影响)，.SILENT 让服务器不逐封返回新标记
+    logging.info(f"正在标记 {message_count} 封邮件为删除...")
+    status, store_data = mail.store(f'1:{message_count}', '+FLAGS.SILENT', r'\Deleted')
+    if status != 'OK':
+        logging.error(f"标记邮件为删除失败: {status} - {store_data}")
+        return False
+    
+    # 执行永久删除
+    logging.info("正在永久删除已标记的邮件 (Expunge)...")
+    status, expunge_data = mail.expunge()
+    if status != 'OK':
+        logging.error(f"永久删除邮件 (Expunge) 失败: {status} - {expunge_data}")
+        return False
+    
+    if expunge_data and expunge_data[0] is not None:
+        logging.info(f"成功永久删除 {len(expunge_data)} 封邮件。")
+    else:
+        logging.info(f"Expunge 操作成功执行，但返回数据为 [None]。假定所有标记邮件已删除 ({message_count} 封)。")
+    return True
 
 # 可以在这里添加一些简单的测试代码
 if __name__ == '__main__':
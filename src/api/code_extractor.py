@@ -0,0 +1,224 @@
+"""
+验证码提取模块
+- 从邮件主题和纯文本正文中提取 4-8 位数字验证码、字母数字混合验证码和登录/验证链接，找不到时才回退到 HTML (正文文本和 href)
+- 通用规则是多模式匹配: 先在小写文本上用一个正则定位关键词、说明文字和链接，只在这些位置运行预编译的锚定正则，按规则优先级返回
+- 可按发件人 (完整地址或域名，同时适用于子域名) 配置专用规则，优先于通用规则
+"""
+
+import re
+import json
+import html
+import logging
+from email.utils import parseaddr
+from typing import Any, Dict, Iterable, List, Optional, Pattern
+
+from src.api.html_text import html_to_text_and_links, html_to_text_bs4
+
+KIND_NUMERIC = 'numeric'
+KIND_ALPHANUMERIC = 'alphanumeric'
+KIND_LINK = 'link'
+
+# 验证码前的关键词 (小写)；拉丁字母关键词要求前后不是字母数字
+_KEYWORDS = ('code', 'otp', 'passcode', 'pin', 'verification', 'one-time password', 'one time password',
+             'código', 'codigo', 'bestätigungscode', 'sicherheitscode', 'kod',
+             '验证码', '驗證碼', '校验码', '校驗碼', '动态码', '確認碼', '确认码', '认证码', '認証コード', '確認コード',
+             '인증번호', '인증 번호', '인증코드', '인증 코드')
+# 验证码后的说明 (例如 "123456 is your code")
+_SUFFIXES = (' is your', ' is the', '是您的', '是你的', '为您的', '为你的', '為您的', '為你的')
+# 数字验证码: 4-8 位或 3+3/4+4 分组；前面不能是单词字符、小数点、金额、编号符号，后面不能接单词字符或日期/时间/金额的分隔符加数字
+_NUMBER = r'(?<![\w.,/#$€£¥])(?:[A-Z]-)?(?P<code>\d{4,8}|\d{3}[ -]\d{3}|\d{4}[ -]\d{4})(?![\w]|[.,:/-]\d)'
+# 字母数字验证码: 至少包含一个数字和一个大写字母 (区分大小写，避免匹配普通单词)
+_ALNUM = (r'(?<![\w-])(?P<code>(?=[A-Z0-9-]*\d)(?=[A-Z0-9-]*[A-Z])'
+          r'(?:[A-Z0-9]{3,5}-[A-Z0-9]{3,5}|[A-Z0-9]{5,8}))(?![\w-])')
+
+# 关键词和说明在转为小写的文本上匹配 (不用 IGNORECASE，正则引擎可以按首字符快速跳过)
+_KEYWORD_RE = re.compile('|'.join(re.escape(keyword) for keyword in sorted(_KEYWORDS, key=len, reverse=True)))
+_SUFFIX_RE = re.compile('|'.join(re.escape(suffix) for suffix in _SUFFIXES))
+
+# 规则 (按优先级): 关键词后的数字、数字后的说明、关键词后的字母数字、登录/验证链接、单独一行的数字
+# 关键词与验证码之间不能有数字，所以间隔用贪婪的 \D 即可，不必逐个位置尝试
+_KEYWORD_NUMBER_RE = re.compile(r'\D{0,60}' + _NUMBER)
+_NUMBER_SUFFIX_RE = re.compile(_NUMBER + r'\s*\Z')
+_KEYWORD_ALNUM_RE = re.compile(r'\D{0,40}' + _ALNUM)
+_URL_RE = re.compile(r'https?://[^\s<>"\'()\[\]]+', re.IGNORECASE)
+_LONE_NUMBER_RE = re.compile(r'^[ \t]*' + _NUMBER + r'[ \t]*$', re.MULTILINE)
+# 登录/验证链接的路径或参数特征
+_LINK_HINT_RE = re.compile(r'verif|confirm|activat|magic|login|log-in|signin|sign-in|auth|token|otp|passwordless|validate',
+                           re.IGNORECASE)
+_LINK_EXCLUDE_RE = re.compile(r'unsubscribe|privacy|preferences', re.IGNORECASE)
+# "Name <user@example.com>" 形式的发件人，直接取尖括号内的地址，其余情况交给 parseaddr
+_ADDRESS_RE = re.compile(r'<([^<>\s]+@[^<>\s]+)>\s*$')
+
+
+class CodeMatch:
+    """提取结果。"""
+
+    __slots__ = ('code', 'kind', 'source', 'rule')
+
+    def __init__(self, code: str, kind: str, source: str, rule: str):
+        self.code = code
+        self.kind = kind
+        self.source = source
+        self.rule = rule
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"verification_code": self.code, "code_type": self.kind, "source": self.source}
+
+
+def _normalize(code: str, kind: str) -> str:
+    if kind == KIND_LINK:
+        return html.unescape(code).rstrip('.,;:!?')
+    if kind == KIND_NUMERIC:
+        return code.replace(' ', '').replace('-', '')
+    return code
+
+
+def _infer_kind(code: str) -> str:
+    if code.startswith(('http://', 'https://')):
+        return KIND_LINK
+    return KIND_NUMERIC if code.replace(' ', '').replace('-', '').isdigit() else KIND_ALPHANUMERIC
+
+
+def html_search_text(content: str) -> str:
+    """
+    把 HTML 转换为查找验证码用的文本: 与 strip_html 相同的流式解析器 (出错时回退到 BeautifulSoup)，
+    末尾按行附上所有 href 链接。
+    """
+    try:
+        text, links = html_to_text_and_links(content)
+    except Exception as e:
+        logging.warning(f"流式解析 HTML 出错，改用 BeautifulSoup: {e}")
+        return html_to_text_bs4(content)
+    return text + '\n' + '\n'.join(links) if links else text
+
+
+class CodeExtractor:
+    """
+    预编译的验证码提取器。
+
+    sender_rules 把发件人地址或域名映射到正则列表；正则中名为 code 的分组 (没有时为第一个分组，
+    再没有时为整个匹配) 就是验证码，类型按内容推断。
+    """
+
+    def __init__(self, sender_rules: Optional[Dict[str, Iterable[str]]] = None):
+        self._sender_rules: Dict[str, List[Pattern]] = {}
+        for sender, patterns in (sender_rules or {}).items():
+            try:
+                self._sender_rules[sender.lower()] = [re.compile(pattern, re.IGNORECASE | re.MULTILINE)
+                                                      for pattern in patterns]
+            except re.error as e:
+                raise ValueError(f"invalid verification code pattern for {sender}: {e}") from e
+
+    @classmethod
+    def from_file(cls, path: str) -> 'CodeExtractor':
+        """从 JSON 文件加载发件人规则: {"github.com": ["..."], "noreply@example.com": ["..."]}。"""
+        with open(path, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+        if not isinstance(rules, dict) or not all(isinstance(v, list) for v in rules.values()):
+            raise ValueError(f"{path} must map sender addresses or domains to lists of patterns")
+        extractor = cls(rules)
+        logging.info(f"已加载 {len(rules)} 个发件人的验证码规则: {path}")
+        return extractor
+
+    def rules_for(self, sender: Optional[str]) -> List[Pattern]:
+        """返回适用于发件人的专用规则: 先按完整地址，再按域名逐级向上查找。"""
+        if not self._sender_rules or not sender:
+            return []
+        match = _ADDRESS_RE.search(sender)
+        address = (match.group(1) if match else parseaddr(sender)[1]).lower()
+        if address in self._sender_rules:
+            return self._sender_rules[address]
+        domain = address.rpartition('@')[2]
+        while domain:
+            if domain in self._sender_rules:
+                return self._sender_rules[domain]
+            domain = domain.partition('.')[2]
+        return []
+
+    @staticmethod
+    def _match_sender_rules(rules: List[Pattern], text: str, source: str) -> Optional[CodeMatch]:
+        for pattern in rules:
+            match = pattern.search(text)
+            if match:
+                if 'code' in pattern.groupindex:
+                    code = match.group('code')
+                else:
+                    code = match.group(1) if pattern.groups else match.group(0)
+                kind = _infer_kind(code)
+                return CodeMatch(_normalize(code, kind), kind, source, 'sender')
+        return None
+
+    @staticmethod
+    def _scan(text: str, source: str) -> Optional[CodeMatch]:
+        """
+        先定位关键词、说明和链接，只在这些位置运行预编译的锚定正则，按优先级返回第一个结果。
+        """
+        lower = text.lower()
+        if len(lower) != len(text):
+            # 极少数字符转小写后长度改变，此时按字符逐个转换保持位置对应
+            lower = ''.join(ch if len(ch.lower()) != 1 else ch.lower() for ch in text)
+
+        keyword_hits = []
+        for keyword in _KEYWORD_RE.finditer(lower):
+            start, end = keyword.span()
+            if lower[start].isascii() and ((start > 0 and lower[start - 1].isalnum())
+                                           or (end < len(lower) and lower[end].isalnum())):
+                continue
+            keyword_hits.append(end)
+            match = _KEYWORD_NUMBER_RE.match(text, end)
+            if match:
+                return CodeMatch(_normalize(match.group('code'), KIND_NUMERIC), KIND_NUMERIC, source, 'keyword_number')
+
+        for suffix in _SUFFIX_RE.finditer(lower):
+            start = suffix.start()
+            match = _NUMBER_SUFFIX_RE.search(text, max(0, start - 24), start)
+            if match:
+                return CodeMatch(_normalize(match.group('code'), KIND_NUMERIC), KIND_NUMERIC, source, 'number_keyword')
+
+        for end in keyword_hits:
+            match = _KEYWORD_ALNUM_RE.match(text, end)
+            if match:
+                return CodeMatch(match.group('code'), KIND_ALPHANUMERIC, source, 'keyword_alnum')
+
+        position = lower.find('http')
+        while position >= 0:
+            match = _URL_RE.match(text, position)
+            if match:
+                url = match.group(0)
+                if _LINK_HINT_RE.search(url) and not _LINK_EXCLUDE_RE.search(url):
+                    return CodeMatch(_normalize(url, KIND_LINK), KIND_LINK, source, 'link')
+                position = match.end()
+            position = lower.find('http', position + 1)
+
+        match = _LONE_NUMBER_RE.search(text)
+        if match:
+            return CodeMatch(_normalize(match.group('code'), KIND_NUMERIC), KIND_NUMERIC, source, 'lone_number')
+        return None
+
+    def extract(self, subject: Optional[str], text: Optional[str], html_content: Optional[str] = None,
+                sender: Optional[str] = None) -> Optional[CodeMatch]:
+        """
+        先在主题和纯文本正文中查找，找不到时再在 HTML (转换后的文本和 href 链接) 中查找。
+
+        Returns:
+            CodeMatch；没有找到时返回 None。
+        """
+        rules = self.rules_for(sender)
+        sources = [('text', lambda: f"{subject or ''}\n{text or ''}")]
+        if html_content:
+            sources.append(('html', lambda: html_search_text(html_content)))
+        for source, load in sources:
+            content = load()
+            if rules:
+                match = self._match_sender_rules(rules, content, source)
+                if match:
+                    return match
+            match = self._scan(content, source)
+            if match:
+                return match
+        return None
+
+    def extract_message(self, message: Dict[str, Any]) -> Optional[CodeMatch]:
+        """从 parse_email_message() 返回的字典中提取。"""
+        return self.extract(message.get('subject'), message.get('content'), message.get('html_content'),
+                            message.get('sender'))
@@ -0,0 +1,59 @@
+"""
+请求截止时间模块
+- Deadline 表示一次上游调用 (刷新令牌、连接、SELECT、SEARCH、FETCH 等) 的总时间预算
+- 每个阶段的超时取该阶段的默认超时与剩余预算中较小的一个，预算用完时抛出 DeadlineExceeded
+"""
+
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求的时间预算已经用完。"""
+
+
+class Deadline:
+    """单调时钟上的截止时间；expires_at 为 None 表示不限时。"""
+
+    __slots__ = ('expires_at',)
+
+    def __init__(self, expires_at: Optional[float] = None):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: Optional[float]) -> 'Deadline':
+        """从现在起 seconds 秒后截止 (None 表示不限时)。"""
+        return cls(None if seconds is None else time.monotonic() + seconds)
+
+    def child(self, seconds: Optional[float]) -> 'Deadline':
+        """返回不晚于当前截止时间、且最多 seconds 秒后截止的 Deadline。"""
+        if seconds is None:
+            return Deadline(self.expires_at)
+        expires_at = time.monotonic() + seconds
+        if self.expires_at is not None:
+            expires_at = min(expires_at, self.expires_at)
+        return Deadline(expires_at)
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数 (可能为负)；不限时返回 None。"""
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def timeout(self, stage_timeout: Optional[float], stage: str = '') -> Optional[float]:
+        """
+        返回某个阶段可用的超时秒数: min(阶段默认超时, 剩余预算)。
+
+        Raises:
+            DeadlineExceeded: 预算已经用完。
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return stage_timeout
+        if remaining <= 0:
+            raise DeadlineExceeded(f"deadline exceeded before {stage or 'next stage'}")
+        return remaining if stage_timeout is None else min(stage_timeout, remaining)
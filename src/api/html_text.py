@@ -0,0 +1,118 @@
+"""
+HTML 转文本模块
+- 基于标准库 html.parser 的事件回调逐段输出文本，不构建文档树，内存与 HTML 大小无关
+- 跳过 <style>、<script>、<template> 的内容和注释；块级标签换行，表格单元格之间用空格分隔
+- 按 HTML 规则合并空白 (<pre> 内保留原样)，每行去掉首尾空格，连续空行合并为一个
+- 可以同时收集 href 链接 (验证码提取用它查找 HTML 中的登录/验证链接)
+- 保留 BeautifulSoup 实现 (需要安装 beautifulsoup4) 作为备选
+"""
+
+import re
+from html.parser import HTMLParser
+from typing import List, Tuple
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+_SKIP_TAGS = frozenset(('style', 'script', 'template'))
+_BLOCK_TAGS = frozenset((
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'fieldset', 'figcaption', 'figure',
+    'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre',
+    'section', 'table', 'tbody', 'thead', 'tfoot', 'tr', 'ul',
+))
+_CELL_TAGS = frozenset(('td', 'th'))
+
+# HTML 中的空白字符 (不包括 &nbsp;)
+_WHITESPACE_RE = re.compile(r'[ \t\n\r\f]+')
+_SPACES_RE = re.compile(r' {2,}')
+_LINE_EDGE_RE = re.compile(r'[ \t]*\n[ \t]*')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+
+class HtmlTextParser(HTMLParser):
+    """
+    流式 HTML 转文本解析器，可以多次 feed() 分块输入，最后 close() 后用 text() 取结果。
+
+    collect_links 为 True 时，跳过的标签以外的 href 属性值 (已反转义) 按出现顺序保存在 links 中。
+    """
+
+    def __init__(self, collect_links: bool = False):
+        super().__init__(convert_charrefs=True)
+        self.links: List[str] = []
+        self._collect_links = collect_links
+        self._pieces: List[str] = []
+        self._skip_depth = 0
+        self._pre_depth = 0
+        self._has_pre = False
+
+    def handle_starttag(self, tag, attrs):
+        if self._collect_links and not self._skip_depth:
+            self.links.extend(value for name, value in attrs if name == 'href' and value)
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self._pieces.append('\n')
+            if tag == 'pre':
+                self._pre_depth += 1
+                self._has_pre = True
+        elif tag in _CELL_TAGS:
+            self._pieces.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self._pieces.append('\n')
+            if tag == 'pre':
+                self._pre_depth = max(0, self._pre_depth - 1)
+        elif tag in _CELL_TAGS:
+            self._pieces.append(' ')
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        self._pieces.append(data if self._pre_depth else _WHITESPACE_RE.sub(' ', data))
+
+    def unknown_decl(self, data):
+        # <![CDATA[...]]> 的内容按文本处理
+        if data.startswith('CDATA[') and not self._skip_depth:
+            self._pieces.append(data[6:])
+
+    def text(self) -> str:
+        """返回目前为止的文本 (每行去掉首尾空格，连续空行合并)。"""
+        text = ''.join(self._pieces)
+        if not self._has_pre:
+            text = _SPACES_RE.sub(' ', text)
+        text = _LINE_EDGE_RE.sub('\n', text)
+        return _BLANK_LINES_RE.sub('\n\n', text).strip()
+
+
+def html_to_text(content: str) -> str:
+    """用流式解析器把 HTML 转换为文本。"""
+    if not content:
+        return ""
+    parser = HtmlTextParser()
+    parser.feed(content)
+    parser.close()
+    return parser.text()
+
+
+def html_to_text_and_links(content: str) -> Tuple[str, List[str]]:
+    """用流式解析器把 HTML 转换为文本，同时返回其中的 href 链接。"""
+    if not content:
+        return "", []
+    parser = HtmlTextParser(collect_links=True)
+    parser.feed(content)
+    parser.close()
+    return parser.text(), parser.links
+
+
+def html_to_text_bs4(content: str) -> str:
+    """用 BeautifulSoup (html.parser) 把 HTML 转换为文本，空白保持原样。"""
+    if not content:
+        return ""
+    if BeautifulSoup is None:
+        raise ImportError("HTML_TEXT_EXTRACTOR=bs4 需要安装 beautifulsoup4 包: pip install beautifulsoup4")
+    return BeautifulSoup(content, "html.parser").get_text()
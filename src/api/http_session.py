@@ -0,0 +1,53 @@
+"""
+HTTP 连接池模块
+- 共享的 requests.Session，复用 TCP/TLS 连接 (keep-alive)，避免每次请求重新握手
+- 连接池大小可配置；并发请求超出时临时新建连接、用完即丢弃，不会无限期等待空闲连接
+  (requests 不给 urllib3 传等待超时，阻塞模式下的等待不受连接/读取超时和调用方截止时间约束)
+"""
+
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def create_pooled_session(pool_size: int = 10, block: bool = False) -> requests.Session:
+    """
+    创建带连接池的 Session。
+
+    Args:
+        pool_size: 每个主机保持的最大连接数。
+        block: 连接池耗尽时是否等待空闲连接 (False 时临时新建连接，用完即丢弃)。
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=block)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class SharedSession:
+    """
+    线程安全的共享 Session，首次使用时创建。
+
+    requests.Session 的连接池 (urllib3) 本身是线程安全的，这里只保证只创建一次。
+    """
+
+    def __init__(self, pool_size: int = 10):
+        self.pool_size = pool_size
+        self._session: Optional[requests.Session] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = create_pooled_session(self.pool_size)
+        return self._session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
@@ -0,0 +1,417 @@
+"""
+IMAP IDLE 监听模块
+- 对每个被监听的账号保持一个处于 IDLE 状态的 INBOX 连接，服务器推送 EXISTS/EXPUNGE 时发布事件
+- 所有 IDLE 套接字由一个 selectors 线程统一读取；建立连接、认证、SELECT 等阻塞操作在少量工作线程中完成
+- 连接断开 (BYE、网络错误) 后按退避时间自动重连；IDLE 每隔 refresh_interval 秒重新发起，避免被服务器超时断开
+- 每个账号维护一个变化版本号，调用方可以据此判断自上次获取后邮箱是否有变化，或等待下一次变化
+"""
+
+import re
+import time
+import socket
+import logging
+import selectors
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+EVENT_EXISTS = 'exists'
+EVENT_EXPUNGE = 'expunge'
+EVENT_RECONNECT = 'reconnect'
+
+_UNTAGGED_RE = re.compile(rb'^\* (\d+) (EXISTS|EXPUNGE)\b', re.IGNORECASE)
+
+# connect 回调: 返回已认证的 IMAP 连接，失败时返回 None
+Connector = Callable[[], Optional[object]]
+# 事件回调参数: (key, 事件类型, 当前邮件数量)
+Listener = Callable[[str, str, int], None]
+
+
+class IdleSession:
+    """一个账号的 IDLE 连接状态。"""
+
+    __slots__ = ('key', 'address', 'connect', 'mailbox', 'mail', 'sock', 'tag', 'state', 'buffer',
+                 'exists', 'idle_started_at', 'failures', 'stopped')
+
+    def __init__(self, key: str, connect: Connector, mailbox: str, address: Optional[str] = None):
+        self.key = key
+        # 调用方使用的原始邮箱地址 (key 可能经过规范化，例如转为小写)
+        self.address = address or key
+        self.connect = connect
+        self.mailbox = mailbox
+        self.mail = None
+        self.sock = None
+        self.tag = b''
+        # connecting -> starting (已发送 IDLE，等待 "+") -> idling -> done_sent (已发送 DONE，等待标签响应)
+        self.state = 'connecting'
+        self.buffer = b''
+        self.exists = 0
+        self.idle_started_at = 0.0
+        self.failures = 0
+        self.stopped = False
+
+
+class IdleWatcher:
+    """
+    IMAP IDLE 监听管理器。
+
+    watch/unwatch 可以在任意线程 (包括持有租约锁的回调) 中调用，它们只提交任务，不做网络操作。
+    """
+
+    def __init__(self, max_sessions: int = 200, refresh_interval: float = 1500, setup_workers: int = 4,
+                 timeout: float = 30, reconnect_backoff: Tuple[float, float] = (1.0, 60.0)):
+        """
+        Args:
+            max_sessions: 最多同时监听的账号数。
+            refresh_interval: 重新发起 IDLE 的间隔 (秒)，RFC 2177 建议小于 29 分钟。
+            setup_workers: 建立连接用的工作线程数。
+            timeout: 建立连接和 SELECT 的套接字超时 (秒)。
+            reconnect_backoff: 重连等待时间的 (初始值, 最大值)，每次失败翻倍。
+        """
+        self.max_sessions = max_sessions
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.reconnect_backoff = reconnect_backoff
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._sessions: Dict[str, IdleSession] = {}
+        self._versions: Dict[str, int] = {}
+        self._listeners: List[Listener] = []
+        self._validator: Optional[Callable[[str], bool]] = None
+        self._on_invalid: Optional[Callable[[str], None]] = None
+        self._validate_interval = 30.0
+        self._executor = ThreadPoolExecutor(max_workers=setup_workers, thread_name_prefix='imap-idle-setup')
+        self._selector = selectors.DefaultSelector()
+        self._commands: Deque[Tuple[str, IdleSession]] = deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.events = 0
+        self.reconnects = 0
+
+    # --- 订阅与查询 ---
+
+    def add_listener(self, listener: Listener):
+        """注册事件回调 (在监听线程中调用，不能阻塞)。"""
+        self._listeners.append(listener)
+
+    def set_validator(self, validator: Callable[[str], bool], interval: float = 30.0,
+                      on_invalid: Optional[Callable[[str], None]] = None):
+        """
+        设置定期检查回调: 参数为 watch() 时传入的原始邮箱地址，返回 False 的账号会被停止监听。
+
+        用于发现在其他进程中结束的租约 (共享租约后端时本进程收不到结束事件)。
+        指定 on_invalid 时由它负责停止监听 (参数同样为原始地址)，调用方可以顺带清理自己的状态。
+        """
+        self._validator = validator
+        self._on_invalid = on_invalid
+        self._validate_interval = interval
+
+    def is_watching(self, key: str) -> bool:
+        """该账号当前是否处于 IDLE 状态 (此时版本号可以可靠地反映邮箱变化)。"""
+        session = self._sessions.get(key)
+        return session is not None and session.state in ('idling', 'done_sent')
+
+    def version(self, key: str) -> int:
+        """返回账号的变化版本号，每次收到 EXISTS/EXPUNGE 或重新连接后递增。"""
+        return self._versions.get(key, 0)
+
+    def wait_for_change(self, key: str, since: int, timeout: float) -> int:
+        """等待版本号大于 since 或超时，返回当前版本号。"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self._versions.get(key, 0) <= since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return self._versions.get(key, 0)
+
+    # --- 开始与停止 ---
+
+    def watch(self, key: str, connect: Connector, mailbox: str = 'INBOX', address: Optional[str] = None) -> bool:
+        """
+        开始监听账号 (已在监听时忽略)，连接在后台建立。
+
+        key 是规范化后的账号标识，address 是传给 validator 的原始邮箱地址 (默认与 key 相同)。
+
+        Returns:
+            False 表示已达到 max_sessions，未开始监听。
+        """
+        with self._lock:
+            if key in self._sessions:
+                return True
+            if len(self._sessions) >= self.max_sessions:
+                logging.warning(f"IDLE 监听数量已达上限 ({self.max_sessions})，跳过 {key}")
+                return False
+            session = IdleSession(key, connect, mailbox, address)
+            self._sessions[key] = session
+            self._start_locked()
+        self._executor.submit(self._setup, session, 0.0)
+        return True
+
+    def unwatch(self, key: str):
+        """停止监听账号并关闭连接。"""
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            self._versions.pop(key, None)
+            if session is None:
+                return
+            session.stopped = True
+        self._command('remove', session)
+
+    def close(self):
+        """停止所有监听。"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self._running = False
+        for session in sessions:
+            session.stopped = True
+            self._command('remove', session)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            idling = sum(1 for s in self._sessions.values() if s.state in ('idling', 'done_sent'))
+            return {
+                "sessions": len(self._sessions),
+                "idling": idling,
+                "events": self.events,
+                "reconnects": self.reconnects,
+            }
+
+    # --- 建立连接 (工作线程) ---
+
+    def _setup(self, session: IdleSession, delay: float):
+        if delay:
+            time.sleep(delay)
+        if session.stopped:
+            return
+        mail = None
+        try:
+            mail = session.connect()
+            if mail is None:
+                raise ConnectionError("connect failed")
+            status, data = mail.select(session.mailbox, readonly=True)
+            if status != 'OK':
+                raise ConnectionError(f"SELECT {session.mailbox} failed: {data}")
+            session.exists = int(data[0])
+            session.mail = mail
+            session.sock = mail.socket()
+            session.tag = mail._new_tag()
+            session.buffer = b''
+            session.sock.sendall(session.tag + b' IDLE\r\n')
+            session.sock.setblocking(False)
+            session.state = 'starting'
+            session.failures = 0
+            self._command('add', session)
+        except Exception as e:
+            if mail is not None:
+                self._close_mail(mail)
+            session.mail = session.sock = None
+            self._schedule_reconnect(session, f"建立 IDLE 连接失败: {e}")
+
+    def _schedule_reconnect(self, session: IdleSession, reason: str):
+        if session.stopped:
+            return
+        session.state = 'connecting'
+        session.failures += 1
+        initial, maximum = self.reconnect_backoff
+        delay = min(initial * (2 ** (session.failures - 1)), maximum)
+        logging.info(f"{reason} ({session.key})，{delay:.0f} 秒后重连")
+        with self._lock:
+            self.reconnects += 1
+            running = self._running
+        if running:
+            self._executor.submit(self._setup, session, delay)
+
+    @staticmethod
+    def _close_mail(mail):
+        try:
+            mail.shutdown()
+        except Exception:
+            pass
+
+    # --- 监听线程 ---
+
+    def _start_locked(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='imap-idle-watcher', daemon=True)
+        self._thread.start()
+
+    def _command(self, op: str, session: IdleSession):
+        self._commands.append((op, session))
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass
+
+    def _run(self):
+        last_validate = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._running and not self._commands:
+                    break
+            for key, _ in self._selector.select(timeout=1.0):
+                if key.data is None:
+                    try:
+                        self._wake_r.recv(4096)
+                    except OSError:
+                        pass
+                    continue
+                self._on_readable(key.data)
+            self._process_commands()
+            now = time.monotonic()
+            self._refresh_idle(time.time())
+            if self._validator is not None and now - last_validate >= self._validate_interval:
+                last_validate = now
+                self._validate()
+
+    def _process_commands(self):
+        while self._commands:
+            op, session = self._commands.popleft()
+            if op == 'add':
+                if session.stopped:
+                    self._drop(session, logout=True)
+                    continue
+                self._selector.register(session.sock, selectors.EVENT_READ, session)
+                # 建立连接期间可能错过了新邮件，通知调用方重新获取
+                self._publish(session, EVENT_RECONNECT)
+            elif op == 'remove':
+                self._drop(session, logout=True)
+
+    def _drop(self, session: IdleSession, logout: bool = False):
+        sock = session.sock
+        if sock is not None:
+            try:
+                self._selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+        if session.mail is not None:
+            if logout:
+                try:
+                    sock.setblocking(True)
+                    sock.settimeout(5)
+                    sock.sendall(b'DONE\r\n')
+                except OSError:
+                    pass
+            self._close_mail(session.mail)
+        session.mail = session.sock = None
+
+    def _on_readable(self, session: IdleSession):
+        sock = session.sock
+        chunks = []
+        closed = False
+        try:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    closed = True
+                    break
+                chunks.append(data)
+                # SSL 套接字可能已经解密了 select 看不到的数据
+                pending = getattr(sock, 'pending', None)
+                if pending is None or not pending():
+                    break
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as e:
+            if not type(e).__name__.startswith('SSLWant'):
+                closed = True
+        if chunks:
+            session.buffer += b''.join(chunks)
+            while b'\r\n' in session.buffer:
+                line, session.buffer = session.buffer.split(b'\r\n', 1)
+                if not self._on_line(session, line):
+                    closed = True
+                    break
+        if closed:
+            self._drop(session)
+            self._schedule_reconnect(session, "IDLE 连接已断开")
+
+    def _on_line(self, session: IdleSession, line: bytes) -> bool:
+        """处理一行服务器响应，返回 False 表示需要重连。"""
+        if line.startswith(b'+'):
+            if session.state == 'starting':
+                session.state = 'idling'
+                session.idle_started_at = time.time()
+            return True
+        if line.startswith(b'* BYE'):
+            return False
+        match = _UNTAGGED_RE.match(line)
+        if match:
+            count, kind = int(match.group(1)), match.group(2).upper()
+            if kind == b'EXISTS':
+                grew = count > session.exists
+                session.exists = count
+                if grew:
+                    self._publish(session, EVENT_EXISTS)
+            else:
+                session.exists = max(session.exists - 1, 0)
+                self._publish(session, EVENT_EXPUNGE)
+            return True
+        if session.tag and line.startswith(session.tag + b' '):
+            if session.state == 'done_sent' and line[len(session.tag) + 1:].upper().startswith(b'OK'):
+                return self._send_idle(session)
+            return False
+        return True
+
+    def _send_idle(self, session: IdleSession) -> bool:
+        session.tag = session.mail._new_tag()
+        session.state = 'starting'
+        try:
+            session.sock.send(session.tag + b' IDLE\r\n')
+        except OSError:
+            return False
+        return True
+
+    def _refresh_idle(self, now: float):
+        for key in list(self._selector.get_map().values()):
+            session = key.data
+            if session is None or session.state != 'idling':
+                continue
+            if now - session.idle_started_at >= self.refresh_interval:
+                try:
+                    session.sock.send(b'DONE\r\n')
+                    session.state = 'done_sent'
+                except OSError:
+                    self._drop(session)
+                    self._schedule_reconnect(session, "重新发起 IDLE 失败")
+
+    def _validate(self):
+        with self._lock:
+            sessions = [(key, session.address) for key, session in self._sessions.items()]
+        for key, address in sessions:
+            try:
+                valid = self._validator(address)
+            except Exception as e:
+                logging.error(f"检查 IDLE 监听账号 {address} 时出错: {e}")
+                continue
+            if not valid:
+                logging.info(f"账号 {address} 已不再租用，停止 IDLE 监听")
+                if self._on_invalid is not None:
+                    try:
+                        self._on_invalid(address)
+                    except Exception as e:
+                        logging.error(f"停止 IDLE 监听账号 {address} 时出错: {e}", exc_info=True)
+                # 回调没有停止监听时由这里兜底
+                self.unwatch(key)
+
+    def _publish(self, session: IdleSession, event: str):
+        with self._changed:
+            if session.stopped:
+                return
+            self._versions[session.key] = self._versions.get(session.key, 0) + 1
+            self.events += 1
+            self._changed.notify_all()
+        for listener in self._listeners:
+            try:
+                listener(session.key, event, session.exists)
+            except Exception as e:
+                logging.error(f"IDLE 事件回调出错: {e}", exc_info=True)
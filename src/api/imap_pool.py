@@ -0,0 +1,259 @@
+"""
+IMAP 连接池模块
+- 按账号保留已认证的 IMAP 连接，空闲超过 idle_timeout 或存活超过 max_lifetime 后关闭
+- 取出空闲较久的连接时先发送 NOOP 检查，失效则重新连接
+- 限制打开的连接总数，达到上限时优先关闭最久未使用的空闲连接，否则等待
+"""
+
+import time
+import imaplib
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.api.deadline import DeadlineExceeded
+
+
+class ImapPoolExhausted(Exception):
+    """连接数已达上限且在等待时间内没有可用连接。"""
+
+
+class PooledConnection:
+    """连接池中的一个连接。"""
+
+    __slots__ = ('key', 'conn', 'created_at', 'last_used')
+
+    def __init__(self, key: str, conn, now: float):
+        self.key = key
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+def close_connection(conn):
+    """尽力关闭 IMAP 连接 (LOGOUT)，忽略所有错误。"""
+    try:
+        conn.logout()
+    except Exception as e:
+        logging.debug(f"关闭 IMAP 连接时出错: {e}")
+        try:
+            conn.shutdown()
+        except Exception:
+            pass
+
+
+class ImapConnectionPool:
+    """
+    按账号复用的 IMAP 连接池。
+
+    connect 回调负责建立并认证连接 (失败时返回 None)；连接池只负责复用、检查和关闭。
+    网络操作 (连接、NOOP、LOGOUT) 都在锁外进行。
+    """
+
+    def __init__(self, max_connections: int = 50, idle_timeout: float = 120, max_lifetime: float = 3000,
+                 noop_interval: float = 30, acquire_timeout: float = 10):
+        """
+        Args:
+            max_connections: 最多同时打开的连接数 (包括正在使用的)。
+            idle_timeout: 空闲连接保留的秒数，<= 0 表示不复用连接 (用完即关闭)。
+            max_lifetime: 连接最长存活秒数，应小于 access token 的有效期。
+            noop_interval: 空闲超过该秒数的连接在取出时先用 NOOP 检查。
+            acquire_timeout: 连接数达到上限时最多等待的秒数。
+        """
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.noop_interval = noop_interval
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+        self._idle: Dict[str, List[PooledConnection]] = {}
+        self._open = 0
+        self._reaper: Optional[threading.Timer] = None
+        self.created = 0
+        self.reused = 0
+        self.health_check_failures = 0
+        self.evicted = 0
+
+    # --- 内部操作 (调用方需持有锁) ---
+
+    def _expired(self, pooled: PooledConnection, now: float) -> bool:
+        return now - pooled.last_used > self.idle_timeout or now - pooled.created_at > self.max_lifetime
+
+    def _pop_lru_idle_locked(self) -> Optional[PooledConnection]:
+        oldest = None
+        for connections in self._idle.values():
+            if connections and (oldest is None or connections[0].last_used < oldest.last_used):
+                oldest = connections[0]
+        if oldest is not None:
+            self._remove_idle_locked(oldest)
+        return oldest
+
+    def _remove_idle_locked(self, pooled: PooledConnection):
+        connections = self._idle[pooled.key]
+        connections.remove(pooled)
+        if not connections:
+            del self._idle[pooled.key]
+
+    # --- 取出与归还 ---
+
+    def acquire(self, key: str, connect: Callable[[], Optional[imaplib.IMAP4]],
+                timeout: Optional[float] = None) -> Tuple[Optional[PooledConnection], bool]:
+        """
+        取出 key 对应账号的连接，没有可用的空闲连接时调用 connect 新建。
+
+        连接数达到上限时最多等待 timeout 秒 (None 表示 acquire_timeout)。
+
+        Returns:
+            (连接, 是否为复用的连接)；connect 失败时返回 (None, False)。
+
+        Raises:
+            ImapPoolExhausted: 连接数已达上限且等待超时。
+            DeadlineExceeded: connect 抛出的 DeadlineExceeded (名额已释放)。
+        """
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        to_close = []
+        pooled = None
+        with self._cond:
+            self._start_reaper_locked()
+            while True:
+                now = time.time()
+                connections = self._idle.get(key)
+                while connections:
+                    candidate = connections.pop()
+                    if not connections:
+                        del self._idle[key]
+                    if self._expired(candidate, now):
+                        to_close.append(candidate)
+                        self._open -= 1
+                        continue
+                    pooled = candidate
+                    break
+                if pooled is not None:
+                    break
+                if self._open < self.max_connections:
+                    self._open += 1
+                    break
+                victim = self._pop_lru_idle_locked()
+                if victim is not None:
+                    # 关闭其他账号最久未使用的连接，把名额让给当前账号
+                    to_close.append(victim)
+                    self.evicted += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ImapPoolExhausted(f"all {self.max_connections} IMAP connections are in use")
+                self._cond.wait(remaining)
+
+        for stale in to_close:
+            close_connection(stale.conn)
+
+        if pooled is not None:
+            if time.time() - pooled.last_used <= self.noop_interval or self._healthy(pooled):
+                with self._cond:
+                    self.reused += 1
+                return pooled, True
+            close_connection(pooled.conn)
+
+        # 已经占用了一个名额，新建连接
+        conn = None
+        try:
+            conn = connect()
+        except DeadlineExceeded:
+            # 调用方的时间预算用完，释放名额后交给调用方处理
+            self._release_slot()
+            raise
+        except Exception:
+            logging.error(f"建立 IMAP 连接时出错: {key}", exc_info=True)
+        if conn is None:
+            self._release_slot()
+            return None, False
+        with self._cond:
+            self.created += 1
+        return PooledConnection(key, conn, time.time()), False
+
+    def _release_slot(self):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def _healthy(self, pooled: PooledConnection) -> bool:
+        try:
+            status, _ = pooled.conn.noop()
+            if status == 'OK':
+                return True
+        except (imaplib.IMAP4.error, OSError) as e:
+            logging.info(f"IMAP 连接健康检查失败，重新连接: {pooled.key} ({e})")
+        with self._cond:
+            self.health_check_failures += 1
+        return False
+
+    def release(self, pooled: PooledConnection):
+        """归还连接；不复用连接或连接已超过存活时间时直接关闭。"""
+        now = time.time()
+        if self.idle_timeout <= 0 or now - pooled.created_at > self.max_lifetime:
+            self.discard(pooled)
+            return
+        pooled.last_used = now
+        with self._cond:
+            self._idle.setdefault(pooled.key, []).append(pooled)
+            self._cond.notify()
+
+    def discard(self, pooled: PooledConnection):
+        """关闭连接并释放名额 (连接出错或不再可用时)。"""
+        close_connection(pooled.conn)
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    # --- 后台清理 ---
+
+    def _start_reaper_locked(self):
+        if self._reaper is not None or self.idle_timeout <= 0:
+            return
+        self._reaper = threading.Timer(max(1.0, min(self.idle_timeout / 2, 30)), self._reap)
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def _reap(self):
+        now = time.time()
+        with self._cond:
+            self._reaper = None
+            stale = [pooled for connections in self._idle.values() for pooled in connections
+                     if self._expired(pooled, now)]
+            for pooled in stale:
+                self._remove_idle_locked(pooled)
+            self._open -= len(stale)
+            if stale:
+                self._cond.notify(len(stale))
+            if self._open:
+                self._start_reaper_locked()
+        for pooled in stale:
+            close_connection(pooled.conn)
+        if stale:
+            logging.info(f"已关闭 {len(stale)} 个空闲的 IMAP 连接")
+
+    def close_all(self):
+        """关闭所有空闲连接。"""
+        with self._cond:
+            idle = [pooled for connections in self._idle.values() for pooled in connections]
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+            if self._reaper is not None:
+                self._reaper.cancel()
+                self._reaper = None
+        for pooled in idle:
+            close_connection(pooled.conn)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            idle = sum(len(connections) for connections in self._idle.values())
+            return {
+                "open": self._open,
+                "idle": idle,
+                "in_use": self._open - idle,
+                "created": self.created,
+                "reused": self.reused,
+                "health_check_failures": self.health_check_failures,
+                "evicted": self.evicted,
+            }
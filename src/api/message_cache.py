@@ -0,0 +1,101 @@
+"""
+已解析邮件缓存模块
+- 按 (邮箱, 文件夹, UIDVALIDITY, UID, 获取方式) 缓存 parse_email_message() 的结果，最新邮件没有变化时
+  只需一次 UID 查询，不再重新下载和解析
+- UIDVALIDITY 变化 (文件夹被重建) 后旧的键自然失效；同一 UID 的邮件在 IMAP 中不会改变，所以不需要主动失效
+- LRU 淘汰，同时限制条目数和估算的总字节数，条目超过 TTL 后过期
+- 记录命中、未命中、淘汰和过期次数
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+MessageKey = Tuple[str, str, int, int, str]
+
+
+def _estimate_size(message: Dict[str, Any]) -> int:
+    """估算已解析邮件占用的字节数 (按字符串字段的长度)。"""
+    return 256 + sum(len(value) for value in message.values() if isinstance(value, str))
+
+
+class MessageCache:
+    """线程安全的已解析邮件 LRU 缓存。"""
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 64 << 20, ttl: float = 3600):
+        """
+        Args:
+            max_entries: 最多缓存的邮件数量，0 表示禁用缓存。
+            max_bytes: 缓存邮件的估算总字节数上限，单封超过该值的邮件不缓存。
+            ttl: 条目的最长保留时间 (秒)。
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[MessageKey, Tuple[Dict[str, Any], int, float]]' = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(email: str, mailbox: str, uidvalidity: int, uid: int, profile: str) -> MessageKey:
+        return (email.lower(), mailbox, uidvalidity, uid, profile)
+
+    def _remove_locked(self, key: MessageKey):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: MessageKey) -> Optional[Dict[str, Any]]:
+        """返回缓存的邮件副本；不存在或已过期时返回 None。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            message, _, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove_locked(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(message)
+
+    def put(self, key: MessageKey, message: Dict[str, Any]):
+        """缓存邮件的副本，超出条目数或字节数上限时淘汰最久未使用的条目。"""
+        if self.max_entries <= 0:
+            return
+        size = _estimate_size(message)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
+            self._entries[key] = (dict(message), size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove_locked(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
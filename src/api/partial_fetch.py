@@ -0,0 +1,203 @@
+"""
+IMAP 部分获取模块
+- 解析 imaplib 返回的 FETCH 响应 (括号列表、带引号字符串、NIL、{n} 字面量)
+- 从 BODYSTRUCTURE 中找出正文所在的部分 (优先 text/plain，其次 text/html) 及其编码和字符集
+- 解码按字节截断的正文片段 (base64 截断到 4 字节边界，quoted-printable 容忍不完整的转义)
+"""
+
+import re
+import base64
+import quopri
+import codecs
+from typing import Any, Dict, List, Optional, Tuple
+
+# 摘要模式获取的头部字段
+SUMMARY_HEADER_FIELDS = 'FROM SUBJECT DATE'
+
+_FETCH_START_RE = re.compile(rb'^\d+ \(')
+_LITERAL_SUFFIX_RE = re.compile(rb'\{\d+\}$')
+_TOKEN_RE = re.compile(
+    rb'\s*(?:(?P<open>\()|(?P<close>\))|"(?P<quoted>(?:[^"\\]|\\.)*)"'
+    rb'|(?P<atom>[^\s()"\[\]]+(?:\[[^\]]*\](?:<\d+>)?)?))'
+)
+
+
+class _Literal:
+    """FETCH 响应中 {n} 字面量的内容。"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+class TextPart:
+    """正文所在的部分。"""
+
+    __slots__ = ('section', 'subtype', 'charset', 'encoding', 'size')
+
+    def __init__(self, section: str, subtype: str, charset: Optional[str], encoding: str, size: int):
+        self.section = section
+        self.subtype = subtype
+        self.charset = charset
+        self.encoding = encoding
+        self.size = size
+
+
+def _tokenize(segments: List[Any]):
+    for segment in segments:
+        if isinstance(segment, _Literal):
+            yield 'literal', segment.data
+            continue
+        position = 0
+        while position < len(segment):
+            match = _TOKEN_RE.match(segment, position)
+            if not match or match.end() == position:
+                break
+            position = match.end()
+            kind = match.lastgroup
+            if kind == 'quoted':
+                yield 'string', re.sub(rb'\\(.)', rb'\1', match.group('quoted'))
+            elif kind is not None:
+                yield kind, match.group(kind)
+
+
+def _parse_tokens(tokens) -> List[Any]:
+    """把 token 流解析为嵌套列表；NIL 转为 None，其他原子和字符串保持为 bytes。"""
+    stack: List[List[Any]] = [[]]
+    for kind, value in tokens:
+        if kind == 'open':
+            stack.append([])
+        elif kind == 'close':
+            if len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+        elif kind == 'atom' and value.upper() == b'NIL':
+            stack[-1].append(None)
+        else:
+            stack[-1].append(value)
+    while len(stack) > 1:
+        done = stack.pop()
+        stack[-1].append(done)
+    return stack[0]
+
+
+def parse_fetch_response(message_data: List[Any]) -> List[Tuple[int, Dict[str, Any]]]:
+    """
+    解析 mail.fetch()/mail.uid('FETCH', ...) 返回的数据。
+
+    Returns:
+        [(序号, {大写的数据项名称: 值})]，例如 {'UID': b'42', 'BODYSTRUCTURE': [...], 'BODY[1]<0>': b'...'}。
+    """
+    messages: List[List[Any]] = []
+    for item in message_data:
+        if item is None:
+            continue
+        head = item[0] if isinstance(item, tuple) else item
+        if _FETCH_START_RE.match(head) or not messages:
+            messages.append([])
+        if isinstance(item, tuple):
+            messages[-1].append(_LITERAL_SUFFIX_RE.sub(b'', head))
+            messages[-1].append(_Literal(item[1]))
+        else:
+            messages[-1].append(item)
+
+    results = []
+    for segments in messages:
+        parsed = _parse_tokens(_tokenize(segments))
+        if len(parsed) < 2 or not isinstance(parsed[1], list):
+            continue
+        attributes = parsed[1]
+        items = {}
+        for index in range(0, len(attributes) - 1, 2):
+            name = attributes[index]
+            if isinstance(name, bytes):
+                items[name.decode('ascii', 'replace').upper()] = attributes[index + 1]
+        try:
+            results.append((int(parsed[0]), items))
+        except (TypeError, ValueError):
+            continue
+    return results
+
+
+def find_body_item(items: Dict[str, Any], prefix: str) -> Optional[bytes]:
+    """返回名称以 prefix 开头的数据项 (例如 'BODY[HEADER.FIELDS' 或 'BODY[1]')。"""
+    for name, value in items.items():
+        if name.startswith(prefix):
+            return value if isinstance(value, bytes) else None
+    return None
+
+
+def _text(value: Any) -> str:
+    return value.decode('ascii', 'replace').lower() if isinstance(value, bytes) else ''
+
+
+def _params(value: Any) -> Dict[str, str]:
+    if not isinstance(value, list):
+        return {}
+    return {_text(value[i]): value[i + 1].decode('ascii', 'replace') if isinstance(value[i + 1], bytes) else ''
+            for i in range(0, len(value) - 1, 2)}
+
+
+def _walk_parts(structure: List[Any], section: str):
+    """生成 BODYSTRUCTURE 中的单一部分: (section, 部分结构)。"""
+    if structure and isinstance(structure[0], list):
+        number = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            number += 1
+            yield from _walk_parts(child, f"{section}.{number}" if section else str(number))
+    elif len(structure) >= 7:
+        yield section or '1', structure
+
+
+def find_text_part(structure: Any) -> Optional[TextPart]:
+    """
+    从 BODYSTRUCTURE 中选出正文部分: 第一个非附件的 text/plain，没有时取第一个 text/html。
+    """
+    if not isinstance(structure, list):
+        return None
+    html = None
+    for section, part in _walk_parts(structure, ''):
+        if _text(part[0]) != 'text':
+            continue
+        subtype = _text(part[1])
+        params = _params(part[2])
+        if 'name' in params:
+            continue
+        try:
+            size = int(part[6])
+        except (TypeError, ValueError):
+            size = 0
+        text_part = TextPart(section, subtype, params.get('charset'), _text(part[5]) or '7bit', size)
+        if subtype == 'plain':
+            return text_part
+        if subtype == 'html' and html is None:
+            html = text_part
+    return html
+
+
+def decode_partial(data: bytes, encoding: str) -> bytes:
+    """解码可能在任意字节处截断的传输编码内容。"""
+    if encoding == 'base64':
+        compact = re.sub(rb'[^A-Za-z0-9+/=]', b'', data)
+        compact = compact[:len(compact) // 4 * 4]
+        try:
+            return base64.b64decode(compact)
+        except (ValueError, TypeError):
+            return b''
+    if encoding == 'quoted-printable':
+        # 去掉末尾被截断的 "=X" 转义
+        return quopri.decodestring(re.sub(rb'=[0-9A-Fa-f]?$', b'', data))
+    return data
+
+
+def known_charset(charset: Optional[str]) -> Optional[str]:
+    """charset 是 Python 支持的编码时返回它，否则返回 None。"""
+    if not charset:
+        return None
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return None
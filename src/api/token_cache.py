@@ -0,0 +1,171 @@
+"""
+访问令牌缓存模块
+- 按 (client_id, refresh_token) 缓存 access token，在 expires_in 到期前留出安全余量后才重新获取
+- 同一账号的并发请求只触发一次刷新 (single-flight)，其余请求等待并共享结果
+- 记录命中、未命中、刷新、合并等待和失败次数
+- 令牌端点明确拒绝刷新令牌时 (invalid_grant 等) 抛出 CredentialsRejected，由调用方隔离账号
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# fetch 回调返回 (access_token, expires_in 秒)，失败时返回 (None, 0)
+TokenFetcher = Callable[[], Tuple[Optional[str], float]]
+
+# 令牌端点返回这些错误时刷新令牌本身已经失效 (被吊销、过期或应用未获授权)，重试也不会成功
+REJECTED_TOKEN_ERRORS = frozenset(('invalid_grant', 'invalid_client', 'unauthorized_client'))
+
+
+class CredentialsRejected(Exception):
+    """令牌端点拒绝了刷新令牌，账号已经无法使用。"""
+
+
+def check_token_error(status: int, token_info: Any):
+    """
+    检查令牌端点的错误响应 (HTTP 状态码和解析后的 JSON)。
+
+    Raises:
+        CredentialsRejected: 响应表明刷新令牌已经失效。
+    """
+    if status in (400, 401) and isinstance(token_info, dict) and token_info.get('error') in REJECTED_TOKEN_ERRORS:
+        raise CredentialsRejected(token_info.get('error_description') or token_info['error'])
+
+
+class _Flight:
+    """正在进行中的一次刷新。"""
+
+    __slots__ = ('event', 'token')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.token: Optional[str] = None
+
+
+class TokenCache:
+    """线程安全的 access token 缓存。"""
+
+    def __init__(self, margin_seconds: float = 300, max_entries: int = 10000, wait_timeout: float = 60):
+        """
+        Args:
+            margin_seconds: 在令牌到期前多少秒视为过期 (最多为有效期的一半)。
+            max_entries: 最多缓存的令牌数量，超出时先清理已过期的，再淘汰最早加入的。
+            wait_timeout: 等待其他线程刷新结果的最长时间 (秒)。
+        """
+        self.margin_seconds = margin_seconds
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._tokens: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._inflight: Dict[Tuple[str, str], _Flight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    def _put_locked(self, key: Tuple[str, str], token: str, expires_in: float, now: float):
+        margin = min(self.margin_seconds, expires_in / 2)
+        self._tokens.pop(key, None)
+        if len(self._tokens) >= self.max_entries:
+            for stale in [k for k, (_, valid_until) in self._tokens.items() if valid_until <= now]:
+                del self._tokens[stale]
+            while len(self._tokens) >= self.max_entries:
+                del self._tokens[next(iter(self._tokens))]
+        self._tokens[key] = (token, now + expires_in - margin)
+
+    def get(self, client_id: str, refresh_token: str, fetch: TokenFetcher,
+            wait_timeout: Optional[float] = None) -> Optional[str]:
+        """
+        返回有效的 access token，缓存中没有或即将过期时调用 fetch 获取。
+
+        同一个 key 同时只有一个线程调用 fetch，其他线程等待它的结果，
+        最多等待 wait_timeout 秒 (不超过 self.wait_timeout)。
+        fetch 抛出的异常 (例如 CredentialsRejected) 只传给调用 fetch 的线程，等待者得到 None。
+        """
+        key = (client_id, refresh_token)
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is not None and entry[1] > time.time():
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if wait_timeout is None or wait_timeout > self.wait_timeout:
+                wait_timeout = self.wait_timeout
+            if not flight.event.wait(max(0.0, wait_timeout)):
+                logging.warning("等待其他请求刷新 access token 超时")
+            return flight.token
+
+        token = None
+        try:
+            token, expires_in = fetch()
+        finally:
+            with self._lock:
+                self.refreshes += 1
+                if token:
+                    self._put_locked(key, token, expires_in, time.time())
+                else:
+                    self.failures += 1
+                del self._inflight[key]
+            flight.token = token
+            flight.event.set()
+        return token
+
+    def peek(self, client_id: str, refresh_token: str) -> Optional[str]:
+        """
+        返回仍然有效的缓存令牌，不触发刷新 (计入命中/未命中)。
+
+        供自行合并刷新的调用方 (例如异步后端) 使用，刷新结果通过 put() 写回。
+        """
+        with self._lock:
+            entry = self._tokens.get((client_id, refresh_token))
+            if entry is not None and entry[1] > time.time():
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, client_id: str, refresh_token: str, token: Optional[str], expires_in: float, coalesced: int = 0):
+        """记录一次刷新的结果 (token 为 None 表示失败)，coalesced 为共享这次结果的等待者数量。"""
+        with self._lock:
+            self.refreshes += 1
+            self.coalesced += coalesced
+            if token:
+                self._put_locked((client_id, refresh_token), token, expires_in, time.time())
+            else:
+                self.failures += 1
+
+    def is_cached(self, client_id: str, refresh_token: str) -> bool:
+        """缓存中是否有仍然有效的令牌。"""
+        with self._lock:
+            entry = self._tokens.get((client_id, refresh_token))
+            return entry is not None and entry[1] > time.time()
+
+    def invalidate(self, client_id: str, refresh_token: str):
+        """丢弃缓存的令牌 (例如 IMAP 认证被拒绝时)。"""
+        with self._lock:
+            self._tokens.pop((client_id, refresh_token), None)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._tokens),
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "coalesced": self.coalesced,
+                "failures": self.failures,
+            }
@@ -5,10 +5,11 @@ import json
 import os
 import pathlib
 import threading
-import random
 import queue
-from flask import Flask, request, jsonify
+import hashlib
+from flask import Flask, request, jsonify, Response, stream_with_context
 from typing import Optional, Dict, Any
+from datetime import datetime
 
 # --- Path Setup ---
 # Add project root to sys.path to allow importing src.api etc.
@@ -62,6 +63,17 @@ try:
 except ImportError as e:
     logging.error(f"Failed to import cloud_email_api: {e}. Email processing will be skipped.")
     email_api_available = False
+
+from src.pool.account_store import (
+    FileAccountStore, SqliteAccountStore, AccountNotFoundError, InvalidCredentialsError
+)
+from src.pool.lease_allocator import LeaseAllocator, WaiterQueueFull
+from src.pool.lease_backend import SqliteLeaseBackend, RedisLeaseBackend
+from src.pool.lease_journal import LeaseJournal
+from src.api.clear_jobs import ClearJobManager
+from src.api.deadline import Deadline, DeadlineExceeded
+from src.api.imap_pool import ImapPoolExhausted
+from src.api.code_extractor import CodeExtractor
 # --- End Path Setup ---
 
 # --- 导入配置管理器 ---
@@ -78,6 +90,41 @@ config = {
     'email': {
         'lease_duration_seconds': int(os.getenv('LEASE_DURATION_SECONDS', 600)),
         'cleanup_interval_seconds': int(os.getenv('CLEANUP_INTERVAL_SECONDS', 3600)),
+        # 账号索引检查目录变化的间隔 (秒)，0 表示只在启动时扫描
+        'index_refresh_seconds': float(os.getenv('ACCOUNT_INDEX_REFRESH_SECONDS', 5)),
+        # 账号存储: files (data/oauth 下每个账号一个 JSON 文件) 或 sqlite
+        'account_store': os.getenv('ACCOUNT_STORE', 'files').lower(),
+        'account_db_path': os.getenv('ACCOUNT_DB_PATH', ''),
+        # 租约后端: memory (单进程), sqlite (同一台机器上的多个进程), redis (多台机器)
+        'lease_backend': os.getenv('LEASE_BACKEND', 'memory').lower(),
+        'lease_db_path': os.getenv('LEASE_DB_PATH', ''),
+        'lease_redis_url': os.getenv('LEASE_REDIS_URL', 'redis://localhost:6379/0'),
+        'lease_redis_prefix': os.getenv('LEASE_REDIS_PREFIX', 'email-lease'),
+        # 租约日志 (仅 memory 后端): 重启后恢复租约表；fsync 更安全但每次租约变化都会落盘
+        'lease_journal_enabled': os.getenv('LEASE_JOURNAL_ENABLED', 'true').lower() == 'true',
+        'lease_journal_fsync': os.getenv('LEASE_JOURNAL_FSYNC', 'false').lower() == 'true',
+        # 批量接口单次请求最多处理的邮箱数量
+        'batch_max_count': int(os.getenv('BATCH_MAX_COUNT', 100)),
+        # /request-email?wait=N 长轮询: 最长等待时间与最多排队请求数
+        'request_max_wait_seconds': float(os.getenv('REQUEST_EMAIL_MAX_WAIT_SECONDS', 30)),
+        'request_max_waiters': int(os.getenv('REQUEST_EMAIL_MAX_WAITERS', 100)),
+        # 客户端可通过 lease_seconds 申请更短的租约并用 /renew-lease 续期，最短时长如下
+        'lease_min_seconds': float(os.getenv('LEASE_MIN_SECONDS', 10)),
+        # /wait-for-email 长轮询: 最长等待时间、最多同时等待的请求数、上游轮询间隔的范围 (秒)
+        'wait_for_email_max_seconds': float(os.getenv('WAIT_FOR_EMAIL_MAX_SECONDS', 120)),
+        'wait_for_email_max_waiters': int(os.getenv('WAIT_FOR_EMAIL_MAX_WAITERS', 100)),
+        'wait_for_email_poll_min_seconds': float(os.getenv('WAIT_FOR_EMAIL_POLL_MIN_SECONDS', 2)),
+        'wait_for_email_poll_max_seconds': float(os.getenv('WAIT_FOR_EMAIL_POLL_MAX_SECONDS', 15)),
+        # /get-emails 每页最多返回的邮件数量
+        'email_page_max_limit': int(os.getenv('EMAIL_PAGE_MAX_LIMIT', 500)),
+        # /clear-mailboxes 批量清空任务: 同时清空的邮箱数与单个任务最多包含的邮箱数
+        'clear_job_concurrency': int(os.getenv('CLEAR_JOB_CONCURRENCY', 8)),
+        'clear_job_max_emails': int(os.getenv('CLEAR_JOB_MAX_EMAILS', 5000)),
+        # 上游调用 (刷新令牌、连接、IMAP 命令) 的默认总时间预算；客户端可用 X-Request-Timeout 请求头指定，不超过上限
+        'request_deadline_seconds': float(os.getenv('REQUEST_DEADLINE_SECONDS', 30)),
+        'request_deadline_max_seconds': float(os.getenv('REQUEST_DEADLINE_MAX_SECONDS', 120)),
+        # /get-verification-code 按发件人的专用提取规则 (JSON 文件)，为空时只用内置规则
+        'verification_rules_path': os.getenv('VERIFICATION_RULES_PATH', ''),
         # 保留读取并发数，如果 .env 里没有，提供默认值
         'concurrency': int(os.getenv('EMAIL_CONCURRENCY', 1))
     }
@@ -98,12 +145,290 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%
 concurrency_value = config['email'].get('concurrency', 1)
 
 # --- Lease Mechanism (Scheme 2) ---
-email_leases = {}  # {"email@example.com": timestamp}
-lease_lock = threading.Lock()  # Thread lock for accessing email_leases
 LEASE_DURATION_SECONDS = config['email']['lease_duration_seconds']
+LEASE_MIN_SECONDS = min(config['email']['lease_min_seconds'], LEASE_DURATION_SECONDS)
+REQUEST_MAX_WAIT_SECONDS = config['email']['request_max_wait_seconds']
+WAIT_FOR_EMAIL_MAX_SECONDS = config['email']['wait_for_email_max_seconds']
+WAIT_FOR_EMAIL_POLL_MIN_SECONDS = config['email']['wait_for_email_poll_min_seconds']
+WAIT_FOR_EMAIL_POLL_MAX_SECONDS = max(config['email']['wait_for_email_poll_max_seconds'], WAIT_FOR_EMAIL_POLL_MIN_SECONDS)
+REQUEST_DEADLINE_SECONDS = config['email']['request_deadline_seconds']
+REQUEST_DEADLINE_MAX_SECONDS = max(config['email']['request_deadline_max_seconds'], REQUEST_DEADLINE_SECONDS)
+WAIT_FOR_EMAIL_CLOCK_SKEW_SECONDS = 60  # Messages dated slightly before the lease started still count as new
+WAIT_FOR_EMAIL_SCAN_LIMIT = 10  # Newest messages inspected per upstream check
+wait_for_email_waiters = 0
+wait_for_email_lock = threading.Lock()
+
+def create_lease_backend():
+    """
+    Creates the lease backend selected by LEASE_BACKEND (memory, sqlite or redis).
+
+    Only the sqlite and redis backends can be shared by several service processes.
+    """
+    backend = config['email']['lease_backend']
+    max_waiters = config['email']['request_max_waiters']
+    if backend == 'sqlite':
+        db_path = config['email']['lease_db_path'] or get_data_dir() / 'leases.db'
+        return SqliteLeaseBackend(db_path, LEASE_DURATION_SECONDS, max_waiters=max_waiters)
+    if backend == 'redis':
+        return RedisLeaseBackend(config['email']['lease_redis_url'], LEASE_DURATION_SECONDS,
+                                 prefix=config['email']['lease_redis_prefix'], max_waiters=max_waiters)
+    if backend != 'memory':
+        logging.warning(f"Unknown LEASE_BACKEND '{backend}', falling back to memory")
+    return LeaseAllocator(LEASE_DURATION_SECONDS, max_waiters=max_waiters)
+
+lease_allocator = create_lease_backend()  # Every method locks internally; callers never hold a lease lock
+
+# --- IMAP IDLE Watcher ---
+# email -> (mailbox version, fetch profile, result) of the last /get-latest-email fetch while the mailbox was IDLE-watched
+latest_email_cache = {}
+
+def load_watch_credentials(email):
+    """
+    Returns (refresh_token, client_id) for the IDLE watcher, or None if the account is unavailable.
+    """
+    try:
+        account_data = get_account_store().load_credentials(email)
+    except (AccountNotFoundError, InvalidCredentialsError) as e:
+        logging.warning(f"Cannot watch mailbox of {email}: {e}")
+        return None
+    return account_data['refresh_token'], account_data['client_id']
+
+def watch_leased_mailbox(email):
+    cloud_email_api.watch_mailbox(email, lambda: load_watch_credentials(email))
+
+def unwatch_leased_mailbox(email):
+    cloud_email_api.unwatch_mailbox(email)
+    latest_email_cache.pop(email, None)
+
+class MailboxWatchObserver:
+    """
+    Lease observer that holds an IDLE session on each leased account's INBOX.
+
+    Called on the allocator's event dispatcher thread; it only hands work to the watcher's own threads.
+    """
+
+    def record_allocate(self, lease):
+        watch_leased_mailbox(lease.email)
+
+    def record_renew(self, lease):
+        pass
+
+    def record_release(self, email):
+        unwatch_leased_mailbox(email)
+
+    record_mark_used = record_release
+    record_expire = record_release
+
+if email_api_available and cloud_email_api.IDLE_WATCHER_ENABLED:
+    lease_allocator.add_observer(MailboxWatchObserver())
+    # Leases that end in another process (shared backends) are noticed by polling; the watcher passes
+    # the address the lease was watched under and unwatches through the service so cached results go too
+    cloud_email_api.idle_watcher.set_validator(lambda email: lease_allocator.get(email) is not None,
+                                               on_invalid=unwatch_leased_mailbox)
+BATCH_MAX_COUNT = config['email']['batch_max_count']
+
+# --- Verification Code Extraction ---
+def create_code_extractor():
+    """
+    Creates the /get-verification-code extractor with the sender rules from
+    VERIFICATION_RULES_PATH, falling back to the built-in rules if the file cannot be loaded.
+    """
+    path = config['email']['verification_rules_path']
+    if path:
+        try:
+            return CodeExtractor.from_file(path)
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to load verification code rules from {path}: {e}. Using built-in rules only.")
+    return CodeExtractor()
+
+code_extractor = create_code_extractor()
+
 cleanup_interval_seconds = config['email']['cleanup_interval_seconds']
 cleanup_timer = None
 
+# --- Account Store ---
+account_store = None  # FileAccountStore / SqliteAccountStore, 在 start_service() 中打开
+account_store_lock = threading.Lock()
+
+def create_account_store():
+    """
+    Creates the account store selected by ACCOUNT_STORE (files or sqlite).
+    """
+    refresh_seconds = config['email']['index_refresh_seconds']
+    if config['email']['account_store'] == 'sqlite':
+        db_path = config['email']['account_db_path'] or get_data_dir() / 'accounts.db'
+        return SqliteAccountStore(db_path, refresh_seconds)
+    return FileAccountStore(get_data_dir('oauth'), refresh_seconds)
+
+def get_account_store():
+    """
+    Returns the account store, opening it on first use.
+    """
+    global account_store
+    if account_store is None:
+        with account_store_lock:
+            if account_store is None:
+                store = create_account_store()
+                if isinstance(store, SqliteAccountStore):
+                    # Mirror lease state into the accounts table
+                    lease_allocator.add_observer(store)
+                # Keep the allocator's free pool in step with the stored accounts
+                store.open(lease_allocator.sync, leased=lease_allocator.leased_emails())
+                # Leases restored from the journal and shared backends may still hold accounts
+                # that have since been removed from the store; drop them (leased ones when their lease ends)
+                stale = [email for email in lease_allocator.pool_emails() if email not in store]
+                if stale:
+                    logging.info(f"Removing {len(stale)} accounts missing from the account store from the lease pool")
+                    lease_allocator.remove_accounts(stale)
+                account_store = store
+    return account_store
+
+def quarantine_account(email):
+    """
+    Takes an account whose refresh token was rejected by the token endpoint out of the pool for good.
+    """
+    if get_account_store().quarantine(email):
+        logging.warning(f"Quarantined account with rejected credentials: {email}")
+
+if email_api_available:
+    cloud_email_api.add_credentials_rejected_listener(quarantine_account)
+
+def load_account_credentials(email):
+    """
+    Reads the credentials for an email from the account store.
+
+    Returns:
+        (account_data, None) on success, or (None, (response, status)) on failure.
+    """
+    try:
+        return get_account_store().load_credentials(email), None
+    except AccountNotFoundError:
+        return None, (jsonify({"error": "Credential file not found."}), 500)
+    except InvalidCredentialsError as e:
+        return None, (jsonify({"error": str(e)}), 500)
+    except Exception as e:
+        logging.error(f"Error reading credentials for {email}: {e}", exc_info=True)
+        return None, (jsonify({"error": f"Failed to read credential file: {str(e)}"}), 500)
+
+def get_lease_seconds(value):
+    """
+    Parses a requested lease duration, clamped to [LEASE_MIN_SECONDS, LEASE_DURATION_SECONDS].
+
+    Returns:
+        The duration in seconds, or None when the value is not a number.
+    """
+    if value is None:
+        return LEASE_DURATION_SECONDS
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return min(max(seconds, LEASE_MIN_SECONDS), LEASE_DURATION_SECONDS)
+
+def lease_info(lease):
+    """
+    Builds the lease fields returned to clients.
+    """
+    return {
+        "email": lease.email,
+        "lease_token": lease.token,
+        "lease_duration_seconds": lease.duration,
+        "lease_expires_in": round(lease.remaining(), 3)
+    }
+
+def get_fetch_profile(data):
+    """
+    Reads the optional 'profile' field: 'full' (default, whole message) or 'summary'
+    (From/Subject/Date plus the first IMAP_SUMMARY_MAX_BYTES of the text part).
+
+    Returns:
+        (profile, None) on success, or (None, (response, status)) for an unknown profile.
+    """
+    profile = (data or {}).get('profile') or 'full'
+    if profile not in cloud_email_api.FETCH_PROFILES:
+        return None, (jsonify({"error": f"'profile' must be one of: {', '.join(cloud_email_api.FETCH_PROFILES)}."}), 400)
+    return profile, None
+
+def request_deadline(default=REQUEST_DEADLINE_SECONDS):
+    """
+    Builds the upstream time budget for this request from the optional X-Request-Timeout
+    header (seconds, capped by REQUEST_DEADLINE_MAX_SECONDS), or from default when the
+    header is absent (None means no overall budget, only the per-stage timeouts).
+
+    Returns:
+        (deadline, None) on success, or (None, (response, status)) for a malformed header.
+    """
+    header = request.headers.get('X-Request-Timeout')
+    if header is None:
+        return Deadline.after(default), None
+    try:
+        seconds = float(header)
+    except ValueError:
+        seconds = -1
+    if not seconds > 0:
+        return None, (jsonify({"error": "'X-Request-Timeout' must be a positive number of seconds."}), 400)
+    return Deadline.after(min(seconds, REQUEST_DEADLINE_MAX_SECONDS)), None
+
+def message_etag(*identity):
+    """
+    Builds a strong ETag from the identity of the messages a response carries
+    (UIDVALIDITY, UIDs and the request parameters that shape the body). IMAP never
+    changes the message behind a UIDVALIDITY/UID pair, so an equal identity means an
+    equal body. Returns None when the upstream did not report the UIDs.
+    """
+    if any(part is None for part in identity):
+        return None
+    return hashlib.sha1(json.dumps(identity).encode()).hexdigest()[:20]
+
+def not_modified(etag):
+    """Returns a 304 response when the request's If-None-Match already names etag, else None."""
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+def with_etag(response, etag):
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+def deadline_exceeded(email, e):
+    logging.warning(f"Upstream deadline exceeded for {email}: {e}")
+    return jsonify({"error": f"Upstream request timed out: {e}"}), 504
+
+def upstream_busy(email, e):
+    logging.warning(f"No IMAP connection available for {email}: {e}")
+    return jsonify({"error": f"Upstream connections are busy, retry later: {e}"}), 503
+
+def resolve_lease(data, endpoint):
+    """
+    Finds the valid lease named by a request body, either by 'lease_token' (O(1)) or by 'email'.
+
+    Returns:
+        (lease, None) on success, or (None, (response, status)) on failure.
+    """
+    data = data if isinstance(data, dict) else {}
+    token = data.get('lease_token')
+    email = data.get('email')
+    if not token and not email:
+        logging.warning(f"{endpoint} request missing 'email' in body.")
+        return None, (jsonify({"error": "Missing 'email' or 'lease_token' in request body."}), 400)
+
+    if token:
+        lease = lease_allocator.get_by_token(token)
+        if lease is None or (email and email != lease.email):
+            logging.warning(f"{endpoint} request with unknown or expired lease token.")
+            return None, (jsonify({"error": "Lease token not found or lease expired."}), 404)
+        return lease, None
+
+    # An expired lease is reclaimed by get()
+    lease = lease_allocator.get(email)
+    if lease is None:
+        logging.warning(f"{endpoint} request for non-leased email: {email}")
+        return None, (jsonify({"error": "Email not found or lease expired."}), 404)
+    return lease, None
+
 # --- API Endpoints ---
 
 @app.route('/request-email', methods=['GET'])
@@ -111,66 +436,43 @@ def request_email():
     """
     Allocates an available email address and creates a lease for it.
     Also performs cleanup of expired leases.
-    """
-    # Define oauth_dir_path within the function scope
-    oauth_dir_path = get_data_dir('oauth')
 
-    # Perform lease cleanup
-    with lease_lock:
-        current_time = time.time()
-        expired_leases = [email for email, timestamp in email_leases.items() 
-                         if current_time - timestamp > LEASE_DURATION_SECONDS]
-        for email in expired_leases:
-            email_leases.pop(email, None)
-            logging.info(f"Cleaned up expired lease for email: {email}")
+    With ?wait=N the request is parked for up to N seconds (capped by
+    REQUEST_EMAIL_MAX_WAIT_SECONDS) until an account is released, a lease
+    expires or new accounts are imported, instead of returning 409 at once.
+    Waiting requests are served in FIFO order.
+
+    With ?lease_seconds=N a shorter lease is granted; keep it alive with
+    /renew-lease using the returned lease_token.
+    """
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), REQUEST_MAX_WAIT_SECONDS)
+    except ValueError:
+        return jsonify({"error": "'wait' must be a number of seconds."}), 400
+    duration = get_lease_seconds(request.args.get('lease_seconds'))
+    if duration is None:
+        return jsonify({"error": "'lease_seconds' must be a number of seconds."}), 400
 
-    available_files = []
     try:
-        # Ensure oauth_dir_path is accessible
-        if not oauth_dir_path.exists():
-            logging.error(f"OAuth directory not found: {oauth_dir_path}")
-            return jsonify({"error": "Internal server error: Configuration issue."}), 500
-
-        # Find all .json files that do NOT end with .used
-        all_json_files = list(oauth_dir_path.glob('*.json'))
-        available_files = [f for f in all_json_files if f.is_file() and not f.name.endswith('.used')]
-        logging.debug(f"Found potential email files: {[f.name for f in available_files] if available_files else 'None'}")
+        store = get_account_store()
     except Exception as e:
-        logging.error(f"Error accessing oauth directory {oauth_dir_path}: {e}", exc_info=True)
+        logging.error(f"Error opening account store: {e}", exc_info=True)
         return jsonify({"error": "Internal server error while listing email accounts."}), 500
 
-    if not available_files:
+    # Expired leases are reclaimed inside allocate() before picking from the free pool
+    try:
+        lease = lease_allocator.allocate(wait=wait, duration=duration)
+    except WaiterQueueFull as e:
+        logging.warning(f"Rejected waiting /request-email: {e}")
+        return jsonify({"error": "Too many clients are waiting for an email account."}), 429
+
+    if lease:
+        logging.info(f"Assigned and leased email: {lease.email}")
+        return jsonify(lease_info(lease)), 200
+    elif len(store) == 0:
         logging.warning("No available email account files found in oauth directory.")
         # Return 409 Conflict as specified in docs
         return jsonify({"error": "No available email accounts at the moment."}), 409
-
-    random.shuffle(available_files)  # Shuffle to distribute usage
-
-    assigned_email = None
-    with lease_lock:  # Acquire lock to check and update email_leases safely
-        current_leased_emails = set(email_leases.keys())
-        logging.debug(f"Currently leased emails: {current_leased_emails}")
-
-        for file_path in available_files:
-            try:
-                # Convert filename back to email (e.g., user_at_domain.com.json -> user@domain.com)
-                if file_path.suffix == '.json' and '_at_' in file_path.stem:
-                    email_candidate = file_path.stem.replace('_at_', '@')
-                else:
-                    logging.warning(f"Skipping file with unexpected name format: {file_path.name}")
-                    continue
-
-                if email_candidate not in current_leased_emails:
-                    email_leases[email_candidate] = time.time()
-                    assigned_email = email_candidate
-                    logging.info(f"Assigned and leased email: {assigned_email}")
-                    break  # Exit loop once assigned
-            except Exception as e:
-                logging.error(f"Error processing file {file_path.name} for leasing: {e}", exc_info=True)
-                continue  # Try next file
-
-    if assigned_email:
-        return jsonify({"email": assigned_email, "lease_duration_seconds": LEASE_DURATION_SECONDS}), 200
     else:
         logging.warning("Found email files, but all are currently leased.")
         # Return 409 Conflict as specified in docs
@@ -180,119 +482,361 @@ def request_email():
 def get_latest_email():
     """
     Retrieves the latest email for a leased email address.
-    Returns the raw email data to the client.
-    """
-    data = request.get_json()
-    if not data or 'email' not in data:
-        logging.warning("/get-latest-email request missing 'email' in body.")
-        return jsonify({"error": "Missing 'email' in request body."}), 400
+    Returns the raw email data to the client; with "profile": "summary" only the
+    headers and the start of the text part are fetched.
 
-    email = data['email']
+    The upstream call gets REQUEST_DEADLINE_SECONDS in total, or the number of seconds
+    in the X-Request-Timeout header; 504 is returned when it runs out, and 503 when
+    every pooled IMAP connection stays busy.
+
+    The response carries an ETag derived from the message's UIDVALIDITY and UID; a
+    request whose If-None-Match names it gets 304 with no body.
+    """
+    # Check lease validity (by lease_token or email)
+    data = request.get_json(silent=True)
+    lease, error = resolve_lease(data, '/get-latest-email')
+    if error:
+        return error
+    profile, error = get_fetch_profile(data)
+    if error:
+        return error
+    deadline, error = request_deadline()
+    if error:
+        return error
+
+    email = lease.email
     logging.info(f"Received request for latest email for: {email}")
+    result, error = fetch_latest_email(email, profile, deadline)
+    if error:
+        return error
+    etag = message_etag('latest', profile, (result or {}).get('uidvalidity'), (result or {}).get('uid'))
+    response = not_modified(etag)
+    if response is not None:
+        logging.info(f"Latest email for {email} unchanged (ETag {etag}), returning 304")
+        return response
+    if result:
+        logging.info(f"Raw response from cloud_email_api for {email}: {json.dumps(result, indent=2, ensure_ascii=False)}") # Log the raw response
+        logging.info(f"Successfully fetched email data for {email}")
+    else:
+        logging.warning(f"Received empty response from cloud_email_api for {email}.")
+    return with_etag(jsonify({"success": True, "data": result}), etag), 200
 
-    # Check lease validity
-    with lease_lock:
-        if email not in email_leases:
-            logging.warning(f"Request for non-leased email: {email}")
-            return jsonify({"error": "Email not found or lease expired."}), 404
-        
-        lease_time = email_leases.get(email, 0)
-        if time.time() - lease_time > LEASE_DURATION_SECONDS:
-            # Lease expired
-            email_leases.pop(email, None)
-            logging.warning(f"Lease expired for email: {email}")
-            return jsonify({"error": "Email lease expired."}), 404
-
-    # Construct paths
-    oauth_dir_path = get_data_dir('oauth')
-    filename_base = email.replace('@', '_at_')
-    original_path = oauth_dir_path / f"{filename_base}.json"
+def fetch_latest_email(email, profile, deadline):
+    """
+    Fetches the latest email of a leased mailbox, answering from latest_email_cache while
+    the IDLE watcher has not reported a change since the last fetch.
 
+    Returns:
+        (message or None, None) on success, or (None, (response, status)) on failure.
+    """
     # Read credentials
-    try:
-        if not original_path.is_file():
-            logging.error(f"Credential file not found for leased email {email}: {original_path}")
-            return jsonify({"error": "Credential file not found."}), 500
-
-        with open(original_path, 'r', encoding='utf-8') as f:
-            account_data = json.load(f)
-            refresh_token = account_data.get('refresh_token')
-            client_id = account_data.get('client_id')
-            
-            if not refresh_token or not client_id:
-                logging.error(f"Missing 'refresh_token' or 'client_id' in {original_path}")
-                return jsonify({"error": "Invalid credential file."}), 500
-    except json.JSONDecodeError:
-        logging.error(f"Error decoding JSON from {original_path}", exc_info=True)
-        return jsonify({"error": "Invalid JSON in credential file."}), 500
-    except Exception as e:
-        logging.error(f"Error reading credential file {original_path}: {e}", exc_info=True)
-        return jsonify({"error": f"Failed to read credential file: {str(e)}"}), 500
+    account_data, error = load_account_credentials(email)
+    if error:
+        return None, error
+    refresh_token = account_data['refresh_token']
+    client_id = account_data['client_id']
+
+    # While the INBOX is IDLE-watched, only hit IMAP after the server has reported a change
+    version = cloud_email_api.get_mailbox_version(email)
+    cached = latest_email_cache.get(email)
+    if version is not None and cached is not None and cached[:2] == (version, profile):
+        logging.info(f"No new mail reported for {email} since the last fetch, returning cached result")
+        return cached[2], None
 
     # Call cloud API to get the latest email
     try:
-        result = cloud_email_api.get_latest_email(refresh_token, client_id, email)
-        if result:
-            logging.info(f"Raw response from cloud_email_api for {email}: {json.dumps(result, indent=2, ensure_ascii=False)}") # Log the raw response
-            logging.info(f"Successfully fetched email data for {email}")
-            return jsonify({"success": True, "data": result}), 200
-        else:
-            logging.warning(f"Received empty response from cloud_email_api for {email}.")
-            return jsonify({"success": True, "data": None}), 200
+        result = cloud_email_api.get_latest_email(refresh_token, client_id, email, profile=profile, deadline=deadline)
+    except DeadlineExceeded as e:
+        return None, deadline_exceeded(email, e)
+    except ImapPoolExhausted as e:
+        return None, upstream_busy(email, e)
     except Exception as e:
         logging.error(f"Error calling cloud_email_api for {email}: {e}", exc_info=True)
-        return jsonify({"error": f"Failed to retrieve email from cloud API: {str(e)}"}), 500
+        return None, (jsonify({"error": f"Failed to retrieve email from cloud API: {str(e)}"}), 500)
+    if version is not None and result is not None:
+        latest_email_cache[email] = (version, profile, result)
+    return result, None
+
+@app.route('/get-verification-code', methods=['POST'])
+def get_verification_code():
+    """
+    Extracts the verification code (4-8 digits, an alphanumeric code or a sign-in link)
+    from the latest email of a leased mailbox and returns only the code and the message
+    metadata instead of the whole message.
+
+    The subject and text part are searched first and the HTML part only as a fallback;
+    rules from VERIFICATION_RULES_PATH for the sender take precedence over the built-in ones.
+    Conditional requests work as for /get-latest-email.
+    """
+    data = request.get_json(silent=True)
+    lease, error = resolve_lease(data, '/get-verification-code')
+    if error:
+        return error
+    profile, error = get_fetch_profile(data)
+    if error:
+        return error
+    deadline, error = request_deadline()
+    if error:
+        return error
+
+    email = lease.email
+    logging.info(f"Received request for verification code for: {email}")
+    message, error = fetch_latest_email(email, profile, deadline)
+    if error:
+        return error
+    if not message:
+        logging.warning(f"No email found for {email}, no verification code to extract.")
+        return jsonify({"verification_code": None}), 200
+    etag = message_etag('code', profile, message.get('uidvalidity'), message.get('uid'))
+    response = not_modified(etag)
+    if response is not None:
+        logging.info(f"Latest email for {email} unchanged (ETag {etag}), returning 304")
+        return response
+
+    match = code_extractor.extract_message(message)
+    body = match.to_dict() if match else {"verification_code": None}
+    body.update({key: message.get(key) for key in ('sender', 'subject', 'date', 'date_iso')})
+    if match:
+        logging.info(f"Extracted {match.kind} verification code for {email} from {match.source} ({match.rule} rule)")
+    else:
+        logging.warning(f"No verification code found in the latest email for {email}")
+    return with_etag(jsonify(body), etag), 200
+
+def email_matches(message, sender, subject, since=None):
+    """
+    Checks a parsed message against /wait-for-email filters (case-insensitive substrings).
+
+    When since is given, messages dated before it are rejected; undated messages are accepted.
+    """
+    if sender and sender not in (message.get('sender') or '').lower():
+        return False
+    if subject and subject not in (message.get('subject') or '').lower():
+        return False
+    if since is not None and message.get('date_iso'):
+        try:
+            if datetime.fromisoformat(message['date_iso']).timestamp() < since:
+                return False
+        except ValueError:
+            pass
+    return True
+
+@app.route('/wait-for-email', methods=['POST'])
+def wait_for_email():
+    """
+    Long-polls until a message matching the filters arrives in a leased mailbox.
+
+    Body: 'lease_token' or 'email', optional 'from' and 'subject' substrings and
+    'timeout' seconds (capped by WAIT_FOR_EMAIL_MAX_SECONDS). Only messages newer
+    than the lease start match. Returns the newest matching message, or
+    data=null with timed_out=true when the timeout passes first. 'profile' works as
+    for /get-latest-email.
+
+    While the mailbox is IDLE-watched the upstream check only runs after the server
+    reports a change; otherwise the check interval backs off from
+    WAIT_FOR_EMAIL_POLL_MIN_SECONDS to WAIT_FOR_EMAIL_POLL_MAX_SECONDS and resets when
+    new mail arrives. Every check reuses the account's pooled IMAP connection and gets
+    at most REQUEST_DEADLINE_SECONDS; an X-Request-Timeout header also caps 'timeout'.
+    """
+    global wait_for_email_waiters
+    data = request.get_json(silent=True)
+    lease, error = resolve_lease(data, '/wait-for-email')
+    if error:
+        return error
+    profile, error = get_fetch_profile(data)
+    if error:
+        return error
+    sender = str(data.get('from') or '').lower()
+    subject = str(data.get('subject') or '').lower()
+    try:
+        timeout = min(max(float(data.get('timeout', WAIT_FOR_EMAIL_MAX_SECONDS)), 0), WAIT_FOR_EMAIL_MAX_SECONDS)
+    except (TypeError, ValueError):
+        return jsonify({"error": "'timeout' must be a number of seconds."}), 400
+    request_budget, error = request_deadline(None)
+    if error:
+        return error
+
+    email = lease.email
+    account_data, error = load_account_credentials(email)
+    if error:
+        return error
+    refresh_token = account_data['refresh_token']
+    client_id = account_data['client_id']
+
+    with wait_for_email_lock:
+        if wait_for_email_waiters >= config['email']['wait_for_email_max_waiters']:
+            logging.warning(f"Rejected /wait-for-email for {email}: too many waiting clients")
+            return jsonify({"error": "Too many clients are waiting for email."}), 429
+        wait_for_email_waiters += 1
+    try:
+        logging.info(f"Waiting up to {timeout:.0f}s for email to {email} (from={sender!r}, subject={subject!r})")
+        remaining = request_budget.remaining()
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        deadline = time.monotonic() + timeout
+        since = lease.leased_at - WAIT_FOR_EMAIL_CLOCK_SKEW_SECONDS
+        cursor = None
+        checked_version = None
+        interval = WAIT_FOR_EMAIL_POLL_MIN_SECONDS
+        while True:
+            version = cloud_email_api.get_mailbox_version(email)
+            if version is None or version != checked_version:
+                try:
+                    result = cloud_email_api.get_emails_after_uid(
+                        refresh_token, client_id, email, cursor, limit=WAIT_FOR_EMAIL_SCAN_LIMIT, profile=profile,
+                        deadline=request_budget.child(REQUEST_DEADLINE_SECONDS))
+                except DeadlineExceeded as e:
+                    # The last check may run out of the client's budget; that is an ordinary timeout
+                    if cursor is not None and time.monotonic() >= deadline:
+                        return jsonify({"success": True, "data": None, "timed_out": True}), 200
+                    return deadline_exceeded(email, e)
+                except ImapPoolExhausted as e:
+                    return upstream_busy(email, e)
+                if result is None:
+                    return jsonify({"error": "Failed to retrieve email from cloud API."}), 500
+                first_check = cursor is None
+                cursor, messages = result
+                for message in messages:
+                    if email_matches(message, sender, subject, since if first_check else None):
+                        logging.info(f"Matching email arrived for {email}: {message.get('subject')}")
+                        return jsonify({"success": True, "data": message}), 200
+                checked_version = version
+                if messages and not first_check:
+                    interval = WAIT_FOR_EMAIL_POLL_MIN_SECONDS
+                else:
+                    interval = min(interval * 1.5, WAIT_FOR_EMAIL_POLL_MAX_SECONDS)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return jsonify({"success": True, "data": None, "timed_out": True}), 200
+            if lease_allocator.get_by_token(lease.token) is None:
+                return jsonify({"error": "Lease expired or released while waiting."}), 404
+            if version is not None:
+                cloud_email_api.wait_for_mailbox_change(email, version, min(remaining, WAIT_FOR_EMAIL_POLL_MAX_SECONDS))
+            else:
+                time.sleep(min(interval, remaining))
+    finally:
+        with wait_for_email_lock:
+            wait_for_email_waiters -= 1
+
+@app.route('/get-emails', methods=['POST'])
+def get_emails_route():
+    """
+    Streams one page of a leased mailbox's INBOX as NDJSON, oldest first.
+
+    Body: 'lease_token' or 'email', 'since_uid' (default 0) and 'limit' (default
+    and maximum EMAIL_PAGE_MAX_LIMIT). Each line is a message with its 'uid'; the
+    last line is {"next_since_uid": ..., "has_more": ..., "count": ...}, or
+    {"error": ..., "next_since_uid": ...} if the upstream fails mid-page.
+    Messages are fetched in chunks and written as they are parsed; 'profile' works
+    as for /get-latest-email. An X-Request-Timeout header bounds the whole page
+    (504 if it runs out before the first message, an error line afterwards); 503 means
+    no pooled IMAP connection became free in time.
+
+    The page's UIDs are listed before any message is downloaded, and the ETag is
+    derived from them, UIDVALIDITY and the paging parameters; a request whose
+    If-None-Match names it gets 304 without fetching the messages. A page that ended
+    with an error line must not be kept under its ETag.
+    """
+    data = request.get_json(silent=True)
+    lease, error = resolve_lease(data, '/get-emails')
+    if error:
+        return error
+    profile, error = get_fetch_profile(data)
+    if error:
+        return error
+    max_limit = config['email']['email_page_max_limit']
+    try:
+        since_uid = max(int(data.get('since_uid', 0)), 0)
+        limit = min(max(int(data.get('limit', max_limit)), 1), max_limit)
+    except (TypeError, ValueError):
+        return jsonify({"error": "'since_uid' and 'limit' must be integers."}), 400
+    deadline, error = request_deadline(None)
+    if error:
+        return error
+
+    email = lease.email
+    account_data, error = load_account_credentials(email)
+    if error:
+        return error
+
+    refresh_token = account_data['refresh_token']
+    client_id = account_data['client_id']
+    try:
+        uidvalidity, uids = cloud_email_api.list_uids_after(refresh_token, client_id, email, since_uid=since_uid,
+                                                            deadline=deadline)
+    except DeadlineExceeded as e:
+        return deadline_exceeded(email, e)
+    except ImapPoolExhausted as e:
+        return upstream_busy(email, e)
+    except Exception as e:
+        logging.error(f"Error listing emails for {email}: {e}", exc_info=True)
+        return jsonify({"error": f"Failed to retrieve emails from cloud API: {str(e)}"}), 500
+    # One extra message tells whether another page follows
+    page_uids = uids[:limit + 1]
+    etag = message_etag('emails', profile, uidvalidity, since_uid, limit, page_uids)
+    response = not_modified(etag)
+    if response is not None:
+        logging.info(f"Page after UID {since_uid} for {email} unchanged (ETag {etag}), returning 304")
+        return response
+
+    messages = cloud_email_api.iter_emails(refresh_token, client_id, email, since_uid=since_uid, profile=profile,
+                                           deadline=deadline, uids=page_uids)
+    try:
+        first = next(messages, None)
+    except DeadlineExceeded as e:
+        return deadline_exceeded(email, e)
+    except ImapPoolExhausted as e:
+        return upstream_busy(email, e)
+    except Exception as e:
+        logging.error(f"Error listing emails for {email}: {e}", exc_info=True)
+        return jsonify({"error": f"Failed to retrieve emails from cloud API: {str(e)}"}), 500
+
+    def generate():
+        next_since_uid = since_uid
+        count = 0
+        message = first
+        try:
+            while message is not None and count < limit:
+                yield json.dumps(message, ensure_ascii=False) + '\n'
+                next_since_uid = message['uid']
+                count += 1
+                message = next(messages, None)
+        except Exception as e:
+            logging.error(f"Error streaming emails for {email}: {e}", exc_info=True)
+            yield json.dumps({"error": str(e), "next_since_uid": next_since_uid}) + '\n'
+            return
+        finally:
+            messages.close()
+        logging.info(f"Streamed {count} emails for {email} after UID {since_uid}")
+        yield json.dumps({"next_since_uid": next_since_uid, "has_more": message is not None, "count": count}) + '\n'
+
+    return with_etag(Response(stream_with_context(generate()), mimetype='application/x-ndjson'), etag)
 
 @app.route('/mark-email-used', methods=['POST'])
 def mark_email_used():
     """
-    Marks a leased email as used by renaming its credential file and removing the lease.
+    Marks a leased email as used in the account store and removes the lease.
     """
-    data = request.get_json()
-    if not data or 'email' not in data:
-        logging.warning("/mark-email-used request missing 'email' in body.")
-        return jsonify({"error": "Missing 'email' in request body."}), 400
+    # Check lease validity (by lease_token or email)
+    lease, error = resolve_lease(request.get_json(silent=True), '/mark-email-used')
+    if error:
+        return error
 
-    email = data['email']
+    email = lease.email
     logging.info(f"Received request to mark email as used: {email}")
 
-    # Check lease validity
-    with lease_lock:
-        if email not in email_leases:
-            logging.warning(f"Request to mark non-leased email as used: {email}")
-            return jsonify({"error": "Email not found or lease expired."}), 404
-        
-        lease_time = email_leases.get(email, 0)
-        if time.time() - lease_time > LEASE_DURATION_SECONDS:
-            # Lease expired
-            email_leases.pop(email, None)
-            logging.warning(f"Lease expired for email: {email}")
-            return jsonify({"error": "Email lease expired."}), 404
-
-    # Construct paths
-    oauth_dir_path = get_data_dir('oauth')
-    filename_base = email.replace('@', '_at_')
-    original_path = oauth_dir_path / f"{filename_base}.json"
-    used_path = oauth_dir_path / f"{filename_base}.json.used"
-
-    # Rename the file to mark as used
+    # Mark the account as used in the store
     try:
-        if used_path.exists():
-            logging.warning(f"Used file {used_path.name} already exists. Assuming already marked.")
-        elif original_path.exists():
-            os.rename(original_path, used_path)
-            logging.info(f"Marked email as used by renaming {original_path.name} to {used_path.name}")
-        else:
-            logging.error(f"Original file {original_path.name} not found for marking as used.")
-            return jsonify({"error": "Credential file not found."}), 500
-    except OSError as e:
-        logging.error(f"Failed to rename {original_path.name} to {used_path.name}: {e}", exc_info=True)
+        get_account_store().mark_used(email)
+    except AccountNotFoundError:
+        return jsonify({"error": "Credential file not found."}), 500
+    except Exception as e:
+        logging.error(f"Failed to mark {email} as used: {e}", exc_info=True)
         return jsonify({"error": f"Failed to mark email as used: {str(e)}"}), 500
 
-    # Remove the lease
-    with lease_lock:
-        email_leases.pop(email, None)
-        logging.info(f"Removed lease for email: {email}")
+    # Remove the lease and retire the account from the pool
+    lease_allocator.mark_used(email, token=lease.token)
+    logging.info(f"Removed lease for email: {email}")
 
     return jsonify({"message": "Email marked as used."}), 200
 
@@ -301,63 +845,189 @@ def release_email():
     """
     Releases the lease on an email address.
     """
-    data = request.get_json()
-    if not data or 'email' not in data:
+    data = request.get_json(silent=True) or {}
+    token = data.get('lease_token')
+    email = data.get('email')
+    if token and not email:
+        lease = lease_allocator.get_by_token(token)
+        email = lease.email if lease else None
+        if email is None:
+            logging.info("No active lease found for token during release request.")
+            return jsonify({"message": "Email lease released."}), 200
+    if not email:
         logging.warning("/release-email request missing 'email' in body.")
-        return jsonify({"error": "Missing 'email' in request body."}), 400
+        return jsonify({"error": "Missing 'email' or 'lease_token' in request body."}), 400
 
-    email = data['email']
     logging.info(f"Received request to release email lease: {email}")
 
-    # Remove the lease
-    with lease_lock:
-        if email in email_leases:
-            email_leases.pop(email)
-            logging.info(f"Released lease for email: {email}")
-        else:
-            logging.info(f"No active lease found for {email} during release request.")
+    # Remove the lease (only if the token still matches) and return the account to the free pool
+    if lease_allocator.release(email, token=token):
+        logging.info(f"Released lease for email: {email}")
+    else:
+        logging.info(f"No active lease found for {email} during release request.")
 
     return jsonify({"message": "Email lease released."}), 200
 
+@app.route('/renew-lease', methods=['POST'])
+def renew_lease():
+    """
+    Heartbeat: extends a lease by its own duration (or by 'lease_seconds').
+    """
+    data = request.get_json(silent=True) or {}
+    lease, error = resolve_lease(data, '/renew-lease')
+    if error:
+        return error
+
+    duration = get_lease_seconds(data['lease_seconds']) if 'lease_seconds' in data else lease.duration
+    if duration is None:
+        return jsonify({"error": "'lease_seconds' must be a number of seconds."}), 400
+
+    renewed = lease_allocator.renew(lease.email, duration=duration, token=lease.token)
+    if renewed is None:
+        return jsonify({"error": "Lease token not found or lease expired."}), 404
+
+    logging.debug(f"Renewed lease for email: {lease.email}")
+    return jsonify(lease_info(renewed)), 200
+
+# --- Batch Endpoints ---
+
+def get_email_list(data, endpoint):
+    """
+    Validates the 'emails' list of a batch request body.
+
+    Returns:
+        (emails, None) on success, or (None, (response, status)) on failure.
+    """
+    emails = data.get('emails') if isinstance(data, dict) else None
+    if not isinstance(emails, list) or not emails or not all(isinstance(e, str) for e in emails):
+        logging.warning(f"{endpoint} request missing 'emails' list in body.")
+        return None, (jsonify({"error": "Missing 'emails' list in request body."}), 400)
+    if len(emails) > BATCH_MAX_COUNT:
+        return None, (jsonify({"error": f"At most {BATCH_MAX_COUNT} emails per request."}), 400)
+    # Drop duplicates while keeping the client's order
+    return list(dict.fromkeys(emails)), None
+
+@app.route('/request-emails', methods=['POST'])
+def request_emails():
+    """
+    Allocates up to 'count' email addresses in a single pass and leases them.
+    Returns fewer than requested when the pool runs short.
+    """
+    data = request.get_json(silent=True) or {}
+    count = data.get('count', 1)
+    if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+        return jsonify({"error": "'count' must be a positive integer."}), 400
+    if count > BATCH_MAX_COUNT:
+        return jsonify({"error": f"At most {BATCH_MAX_COUNT} emails per request."}), 400
+
+    try:
+        get_account_store()
+    except Exception as e:
+        logging.error(f"Error opening account store: {e}", exc_info=True)
+        return jsonify({"error": "Internal server error while listing email accounts."}), 500
+
+    duration = get_lease_seconds(data.get('lease_seconds'))
+    if duration is None:
+        return jsonify({"error": "'lease_seconds' must be a number of seconds."}), 400
+
+    leases = lease_allocator.allocate_many(count, duration=duration)
+    if not leases:
+        logging.warning(f"Batch request for {count} emails found no available accounts.")
+        return jsonify({"error": "No available email accounts at the moment."}), 409
+
+    logging.info(f"Assigned and leased {len(leases)}/{count} emails in one batch.")
+    return jsonify({
+        "emails": [lease.email for lease in leases],
+        "leases": [lease_info(lease) for lease in leases],
+        "requested": count,
+        "allocated": len(leases),
+        "lease_duration_seconds": duration
+    }), 200
+
+@app.route('/release-emails', methods=['POST'])
+def release_emails():
+    """
+    Releases the leases on many email addresses at once.
+    """
+    emails, error = get_email_list(request.get_json(silent=True), '/release-emails')
+    if error:
+        return error
+
+    released = lease_allocator.release_many(emails)
+    logging.info(f"Released {sum(released.values())}/{len(emails)} leases in one batch.")
+    return jsonify({
+        "results": [{"email": email, "released": released[email]} for email in emails]
+    }), 200
+
+@app.route('/mark-emails-used', methods=['POST'])
+def mark_emails_used():
+    """
+    Marks many leased email addresses as used in one sweep and removes their leases.
+    Emails without a valid lease are reported and left untouched.
+    """
+    emails, error = get_email_list(request.get_json(silent=True), '/mark-emails-used')
+    if error:
+        return error
+
+    valid = lease_allocator.get_many(emails)
+    results = {email: {"email": email, "success": False, "error": "Email not found or lease expired."}
+               for email in emails if email not in valid}
+
+    try:
+        marked = get_account_store().mark_used_many(list(valid))
+    except Exception as e:
+        logging.error(f"Failed to mark emails as used: {e}", exc_info=True)
+        return jsonify({"error": f"Failed to mark emails as used: {str(e)}"}), 500
+
+    done = []
+    for email, outcome in marked.items():
+        if isinstance(outcome, AccountNotFoundError):
+            results[email] = {"email": email, "success": False, "error": "Credential file not found."}
+        elif isinstance(outcome, Exception):
+            results[email] = {"email": email, "success": False, "error": f"Failed to mark email as used: {str(outcome)}"}
+        else:
+            results[email] = {"email": email, "success": True}
+            done.append(email)
+    lease_allocator.mark_used_many(done)
+
+    logging.info(f"Marked {len(done)}/{len(emails)} emails as used in one batch.")
+    return jsonify({"results": [results[email] for email in emails]}), 200
+
 @app.route('/clear-mailbox', methods=['POST'])
 def clear_mailbox_route():
     """
     Clears the mailbox for a specified email address using the external API.
+    The upstream call is bounded like /get-latest-email.
     """
     data = request.get_json()
     if not data or 'email' not in data:
         return jsonify({"error": "Missing 'email' in request body"}), 400
+    deadline, error = request_deadline()
+    if error:
+        return error
 
     email = data['email']
     logging.info(f"Received request to clear mailbox for: {email}")
 
-    # Define oauth_dir_path within the function scope
-    oauth_dir_path = get_data_dir('oauth')
-    # credential_file = oauth_dir_path / f"{email}.json"
-    # Use the consistent '_at_' format for the filename
-    credential_file = oauth_dir_path / f"{email.replace('@', '_at_')}.json"
-
-    if not credential_file.exists():
-        logging.error(f"Credential file not found for {email} at {credential_file}")
+    try:
+        account_data = get_account_store().load_credentials(email)
+    except AccountNotFoundError:
         return jsonify({"error": f"Email credentials not found or email not leased: {email}"}), 404
+    except InvalidCredentialsError:
+        logging.error(f"Missing credentials for {email}")
+        return jsonify({"error": "Incomplete credentials for email"}), 500
+    except Exception as e:
+        logging.error(f"Error reading credentials for {email}: {e}", exc_info=True)
+        return jsonify({"error": "Internal server error reading credentials"}), 500
 
     try:
-        with open(credential_file, 'r', encoding='utf-8') as f:
-            account_data = json.load(f)
-
-        refresh_token = account_data.get('refresh_token')
-        client_id = account_data.get('client_id')
-
-        if not refresh_token or not client_id:
-            logging.error(f"Missing credentials in file for {email}")
-            return jsonify({"error": "Incomplete credentials for email"}), 500
-
         # Attempt to clear the mailbox using the imported API module
         success = cloud_email_api.clear_mailbox(
-            refresh_token=refresh_token,
-            client_id=client_id,
+            refresh_token=account_data['refresh_token'],
+            client_id=account_data['client_id'],
             email=email,
-            mailbox="INBOX" # Assuming INBOX is always the target
+            mailbox="INBOX", # Assuming INBOX is always the target
+            deadline=deadline
         )
 
         if success:
@@ -367,39 +1037,73 @@ def clear_mailbox_route():
             logging.error(f"Failed to clear mailbox for {email} via API.")
             return jsonify({"success": False, "error": f"Failed to clear mailbox for {email}. Check API logs."}), 500
 
-    except json.JSONDecodeError:
-        logging.error(f"Invalid JSON in credential file for {email}: {credential_file}")
-        return jsonify({"error": "Internal server error reading credentials"}), 500
-    except FileNotFoundError:
-         # This case might be redundant due to the initial check, but good practice
-        logging.error(f"Credential file disappeared for {email}: {credential_file}")
-        return jsonify({"error": "Email credentials not found"}), 404
+    except DeadlineExceeded as e:
+        return deadline_exceeded(email, e)
+    except ImapPoolExhausted as e:
+        return upstream_busy(email, e)
     except Exception as e:
         logging.error(f"Error during mailbox clearing for {email}: {e}", exc_info=True)
         return jsonify({"error": f"Internal server error while clearing mailbox for {email}"}), 500
 
+# --- Bulk Mailbox Clearing ---
+clear_jobs = ClearJobManager(max_workers=config['email']['clear_job_concurrency'])
+
+def clear_account_mailbox(email):
+    """
+    Clears one account's INBOX for a bulk clear job; raises if the account cannot be read.
+    """
+    account_data = get_account_store().load_credentials(email)
+    return cloud_email_api.clear_mailbox(
+        refresh_token=account_data['refresh_token'],
+        client_id=account_data['client_id'],
+        email=email,
+        mailbox="INBOX"
+    )
+
+@app.route('/clear-mailboxes', methods=['POST'])
+def start_clear_job():
+    """
+    Starts a background job that clears the INBOX of every listed email.
+
+    Body: {"emails": [...]} (at most CLEAR_JOB_MAX_EMAILS). At most
+    CLEAR_JOB_CONCURRENCY mailboxes are cleared at once across all jobs.
+    Returns 202 with the job's progress; poll GET /clear-mailboxes/<job_id>.
+    """
+    data = request.get_json(silent=True) or {}
+    emails = data.get('emails')
+    if not isinstance(emails, list) or not emails or not all(isinstance(email, str) for email in emails):
+        return jsonify({"error": "'emails' must be a non-empty list of email addresses."}), 400
+    max_emails = config['email']['clear_job_max_emails']
+    if len(emails) > max_emails:
+        return jsonify({"error": f"At most {max_emails} emails per clear job."}), 400
+
+    job = clear_jobs.submit(list(dict.fromkeys(emails)), clear_account_mailbox)
+    return jsonify(job.progress()), 202
+
+@app.route('/clear-mailboxes', methods=['GET'])
+def list_clear_jobs():
+    """
+    Returns the progress of running and recently finished clear jobs.
+    """
+    return jsonify({"jobs": clear_jobs.list()}), 200
+
+@app.route('/clear-mailboxes/<job_id>', methods=['GET'])
+def get_clear_job(job_id):
+    """
+    Returns the progress of one clear job.
+    """
+    job = clear_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Clear job not found."}), 404
+    return jsonify(job.progress()), 200
+
 # 添加清理函数
 def cleanup_used_emails(max_age_hours=48):
     """
-    清理超过指定时间的已使用邮箱文件
+    清理超过指定时间的已使用邮箱 (文件存储删除 *.json.used，SQLite 存储删除 state=used 的记录)
     """
-    oauth_dir_path = get_data_dir('oauth')
-    current_time = time.time()
-    deleted_count = 0
-    
     try:
-        for file_path in oauth_dir_path.glob('*.json.used'):
-            file_stat = file_path.stat()
-            file_age_hours = (current_time - file_stat.st_mtime) / 3600
-            
-            if file_age_hours > max_age_hours:
-                try:
-                    os.remove(file_path)
-                    deleted_count += 1
-                    logging.info(f"已删除超过{max_age_hours}小时的已使用邮箱文件: {file_path.name}")
-                except OSError as e:
-                    logging.error(f"删除文件失败 {file_path.name}: {e}")
-        
+        deleted_count = get_account_store().cleanup_used(max_age_hours)
         logging.info(f"清理完成，共删除{deleted_count}个过期邮箱文件")
         return deleted_count
     except Exception as e:
@@ -429,6 +1133,24 @@ def cleanup_used_emails_route():
             "error": f"清理过程中出错: {str(e)}"
         }), 500
 
+@app.route('/stats', methods=['GET'])
+def stats_route():
+    """
+    Returns lease pool, access-token cache, IMAP connection pool, parsed-message cache and
+    body decoding counters.
+    """
+    stats = {"leases": lease_allocator.stats()}
+    if email_api_available:
+        stats["token_cache"] = cloud_email_api.get_token_cache_stats()
+        stats["imap_pool"] = cloud_email_api.get_imap_pool_stats()
+        stats["message_cache"] = cloud_email_api.get_message_cache_stats()
+        stats["decode"] = cloud_email_api.get_decode_stats()
+        if cloud_email_api.UPSTREAM_BACKEND == 'asyncio':
+            stats["async_upstream"] = cloud_email_api.get_async_upstream_stats()
+        if cloud_email_api.IDLE_WATCHER_ENABLED:
+            stats["idle_watcher"] = cloud_email_api.get_idle_watcher_stats()
+    return jsonify(stats), 200
+
 # --- Main Execution / Service Start ---
 def start_service(host=None, port=None, debug=None):
     """Starts the Flask email service."""
@@ -443,10 +1165,26 @@ def start_service(host=None, port=None, debug=None):
     # config_file = pathlib.Path(__file__).resolve().parent.parent / 'config' / 'email_config.json'
     # load_config(config_file)
 
-    # Clear any stale leases from previous runs
-    logging.info("Clearing any stale in-memory leases...")
-    with lease_lock:
-        email_leases.clear()
+    if not isinstance(lease_allocator, LeaseAllocator):
+        # Shared backends keep their leases in the shared store; other processes may hold some of them
+        logging.info(f"Using shared lease backend: {config['email']['lease_backend']}")
+    elif config['email']['lease_journal_enabled']:
+        # Recover leases from previous runs so in-flight clients keep their accounts
+        journal = LeaseJournal(get_data_dir() / 'leases.journal', fsync=config['email']['lease_journal_fsync'])
+        restored = lease_allocator.attach_journal(journal)
+        logging.info(f"Restored {restored} leases from journal {journal.path}")
+    else:
+        # Clear any stale leases from previous runs
+        logging.info("Clearing any stale in-memory leases...")
+        lease_allocator.clear()
+
+    # Load the account pool once and keep it current in the background
+    store = get_account_store()
+    store.start_watcher()
+    if email_api_available and cloud_email_api.IDLE_WATCHER_ENABLED and isinstance(lease_allocator, LeaseAllocator):
+        # Leases restored from the journal were allocated before this start
+        for email in lease_allocator.leased_emails():
+            watch_leased_mailbox(email)
     
     # 启动定期清理任务
     def schedule_cleanup():
@@ -469,6 +1207,11 @@ def start_service(host=None, port=None, debug=None):
         if cleanup_timer:
             cleanup_timer.cancel()
             cleanup_timer = None
+        store.stop_watcher()
+        if email_api_available:
+            cloud_email_api.idle_watcher.close()
+            cloud_email_api.async_upstream.close()
+        lease_allocator.close()
         # Perform any necessary cleanup before exiting
         raise  # Re-raise the exception if needed
 
@@ -0,0 +1,3 @@
+"""
+邮箱账号池模块
+"""
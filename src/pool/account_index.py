@@ -0,0 +1,242 @@
+"""
+账号索引模块
+- 启动时用 os.scandir 一次性扫描 data/oauth 目录
+- 定期比较目录 mtime，只有目录发生变化时才重新扫描并计算差异
+- 分配邮箱时只访问内存，不再触碰文件系统
+"""
+
+import os
+import time
+import logging
+import pathlib
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# 账号文件命名约定: user_at_domain.com.json (已使用的文件为 *.json.used)
+ACCOUNT_SUFFIX = '.json'
+
+
+def email_from_filename(filename: str) -> Optional[str]:
+    """将账号文件名转换为邮箱地址，不符合命名约定时返回 None。"""
+    if not filename.endswith(ACCOUNT_SUFFIX):
+        return None
+    stem = filename[:-len(ACCOUNT_SUFFIX)]
+    if '_at_' not in stem:
+        return None
+    return stem.replace('_at_', '@')
+
+
+def filename_from_email(email: str) -> str:
+    """将邮箱地址转换为账号文件名。"""
+    return f"{email.replace('@', '_at_')}{ACCOUNT_SUFFIX}"
+
+
+def scan_account_dir(oauth_dir: pathlib.Path) -> Set[str]:
+    """
+    使用 os.scandir 扫描目录，返回所有可用账号的邮箱集合。
+
+    scandir 在大多数平台上可以直接从目录项得到文件类型，
+    不需要像 glob + is_file() 那样对每个文件单独 stat。
+    """
+    emails = set()
+    with os.scandir(oauth_dir) as entries:
+        for entry in entries:
+            email = email_from_filename(entry.name)
+            if email is None:
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            emails.add(email)
+    return emails
+
+
+class AccountIndex:
+    """
+    可用账号的内存索引。
+
+    内部使用 列表 + 位置字典 的结构，添加、删除均为 O(1)。
+    """
+
+    def __init__(self, oauth_dir, refresh_interval: float = 5.0):
+        """
+        Args:
+            oauth_dir: 账号文件所在目录。
+            refresh_interval: 后台检查目录变化的间隔 (秒)，<= 0 表示不启动后台检查。
+        """
+        self.oauth_dir = pathlib.Path(oauth_dir)
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._emails: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._dir_mtime_ns: Optional[int] = None
+        self._scanned_at = 0.0
+        self._listeners: List[Callable[[Set[str], Set[str]], None]] = []
+        self._timer: Optional[threading.Timer] = None
+        self._stopped = True
+
+    # --- 内部结构操作 (调用方需持有锁) ---
+
+    def _add_locked(self, email: str) -> bool:
+        if email in self._positions:
+            return False
+        self._positions[email] = len(self._emails)
+        self._emails.append(email)
+        return True
+
+    def _discard_locked(self, email: str) -> bool:
+        pos = self._positions.pop(email, None)
+        if pos is None:
+            return False
+        last = self._emails.pop()
+        if pos < len(self._emails):
+            # 用最后一个元素填补空位，保持 O(1) 删除
+            self._emails[pos] = last
+            self._positions[last] = pos
+        return True
+
+    # --- 扫描与刷新 ---
+
+    def _dir_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.oauth_dir).st_mtime_ns
+        except OSError:
+            return None
+
+    def build(self) -> int:
+        """完整扫描目录并重建索引，返回可用账号数量。"""
+        start = time.perf_counter()
+        mtime = self._dir_mtime()
+        emails = scan_account_dir(self.oauth_dir) if mtime is not None else set()
+        with self._lock:
+            old = set(self._positions)
+            self._emails = list(emails)
+            self._positions = {email: i for i, email in enumerate(self._emails)}
+            self._dir_mtime_ns = mtime
+            self._scanned_at = time.time()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logging.info(f"账号索引已建立: {len(emails)} 个可用账号，耗时 {elapsed_ms:.1f} ms")
+        self._notify(emails - old, old - emails)
+        return len(emails)
+
+    def refresh(self, force: bool = False) -> Tuple[Set[str], Set[str]]:
+        """
+        目录 mtime 变化时重新扫描，并把差异合并进索引。
+
+        目录项的增删和重命名都会更新目录 mtime，因此 mtime 不变时可以跳过扫描。
+        若上次扫描与 mtime 处于同一秒内 (文件系统时间精度较粗)，仍然重新扫描一次。
+
+        Returns:
+            (新增的邮箱集合, 移除的邮箱集合)
+        """
+        mtime = self._dir_mtime()
+        if mtime is None:
+            return set(), set()
+        if not force and mtime == self._dir_mtime_ns and self._scanned_at - mtime / 1e9 > 2:
+            return set(), set()
+
+        scanned_at = time.time()
+        emails = scan_account_dir(self.oauth_dir)
+        with self._lock:
+            current = set(self._positions)
+            added = emails - current
+            removed = current - emails
+            for email in added:
+                self._add_locked(email)
+            for email in removed:
+                self._discard_locked(email)
+            self._dir_mtime_ns = mtime
+            self._scanned_at = scanned_at
+        if added or removed:
+            logging.info(f"账号索引已更新: 新增 {len(added)} 个，移除 {len(removed)} 个，当前 {len(self)} 个可用账号")
+        self._notify(added, removed)
+        return added, removed
+
+    # --- 变化通知 ---
+
+    def add_listener(self, listener: Callable[[Set[str], Set[str]], None]):
+        """注册索引变化回调，回调参数为 (新增集合, 移除集合)。"""
+        self._listeners.append(listener)
+
+    def _notify(self, added: Set[str], removed: Set[str]):
+        if not added and not removed:
+            return
+        for listener in self._listeners:
+            try:
+                listener(added, removed)
+            except Exception as e:
+                logging.error(f"账号索引回调出错: {e}", exc_info=True)
+
+    # --- 后台检查 ---
+
+    def start_watcher(self):
+        """启动后台定时检查目录变化。"""
+        if self.refresh_interval <= 0:
+            return
+        self._stopped = False
+        self._schedule()
+
+    def _schedule(self):
+        if self._stopped:
+            return
+        self._timer = threading.Timer(self.refresh_interval, self._tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _tick(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logging.error(f"刷新账号索引时出错: {e}", exc_info=True)
+        finally:
+            self._schedule()
+
+    def stop_watcher(self):
+        """停止后台检查。"""
+        self._stopped = True
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    # --- 查询与修改 ---
+
+    def add(self, email: str) -> bool:
+        """手动加入一个可用账号 (例如导入后)。"""
+        with self._lock:
+            added = self._add_locked(email)
+        if added:
+            self._notify({email}, set())
+        return added
+
+    def discard(self, email: str) -> bool:
+        """从索引中移除账号 (例如标记为已使用后)。"""
+        with self._lock:
+            removed = self._discard_locked(email)
+        if removed:
+            self._notify(set(), {email})
+        return removed
+
+    def discard_many(self, emails: Iterable[str]) -> Set[str]:
+        """批量移除账号，只通知一次。"""
+        with self._lock:
+            removed = {email for email in emails if self._discard_locked(email)}
+        if removed:
+            self._notify(set(), removed)
+        return removed
+
+    def path_for(self, email: str) -> pathlib.Path:
+        """返回账号对应的凭证文件路径。"""
+        return self.oauth_dir / filename_from_email(email)
+
+    def snapshot(self) -> List[str]:
+        """返回当前所有可用账号的副本。"""
+        with self._lock:
+            return list(self._emails)
+
+    def __contains__(self, email: str) -> bool:
+        return email in self._positions
+
+    def __len__(self) -> int:
+        return len(self._emails)
@@ -0,0 +1,550 @@
+"""
+账号存储模块
+- FileAccountStore: 每个账号一个 JSON 文件 (data/oauth/*.json，已使用为 *.json.used，已隔离为 *.json.quarantined)
+- SqliteAccountStore: 单个 SQLite 数据库 (WAL 模式)，状态、使用时间、域名均建有索引
+
+两种存储对服务提供相同的接口: 读取凭证、标记已使用、清理已使用账号，
+并在可用账号发生变化时通知 LeaseAllocator 同步空闲池。
+"""
+
+import os
+import json
+import time
+import logging
+import pathlib
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.pool.account_index import AccountIndex, email_from_filename
+
+# 账号状态
+STATE_AVAILABLE = 'available'
+STATE_LEASED = 'leased'
+STATE_USED = 'used'
+STATE_QUARANTINED = 'quarantined'
+
+# FileAccountStore 在 .json 之后追加的后缀及其对应的状态 (迁移时使用)
+_FILE_SUFFIX_STATES = {'.used': STATE_USED, '.quarantined': STATE_QUARANTINED}
+
+
+class AccountNotFoundError(LookupError):
+    """账号不存在 (或已被标记为已使用)。"""
+
+
+class InvalidCredentialsError(ValueError):
+    """账号凭证不完整或无法解析。"""
+
+
+class AccountStore:
+    """账号存储接口。"""
+
+    def open(self, on_change: Callable[[Set[str], Set[str]], None], leased: Iterable[str] = ()) -> int:
+        """
+        加载可用账号并注册变化回调 (参数为 (新增集合, 移除集合))。
+
+        Args:
+            on_change: 可用账号变化回调。
+            leased: 当前持有租约的邮箱 (从租约日志恢复)。
+
+        Returns:
+            可用账号数量。
+        """
+        raise NotImplementedError
+
+    def start_watcher(self):
+        """开始在后台发现新导入的账号。"""
+
+    def stop_watcher(self):
+        """停止后台发现。"""
+
+    def load_credentials(self, email: str) -> Dict[str, Any]:
+        """
+        读取账号凭证，返回至少包含 'client_id' 和 'refresh_token' 的字典。
+
+        Raises:
+            AccountNotFoundError: 账号不存在、已使用或已隔离。
+            InvalidCredentialsError: 凭证不完整或无法解析。
+        """
+        raise NotImplementedError
+
+    def mark_used(self, email: str) -> bool:
+        """
+        把账号标记为已使用。
+
+        Returns:
+            True 表示本次完成标记，False 表示账号之前已经被标记。
+
+        Raises:
+            AccountNotFoundError: 账号不存在。
+        """
+        raise NotImplementedError
+
+    def mark_used_many(self, emails: Iterable[str]) -> Dict[str, Any]:
+        """
+        批量标记为已使用。
+
+        Returns:
+            {email: True/False (同 mark_used) 或失败时的异常对象}
+        """
+        results = {}
+        for email in emails:
+            try:
+                results[email] = self.mark_used(email)
+            except Exception as e:
+                results[email] = e
+        return results
+
+    def cleanup_used(self, max_age_hours: float = 48) -> int:
+        """删除标记为已使用超过 max_age_hours 小时的账号，返回删除数量。"""
+        raise NotImplementedError
+
+    def quarantine(self, email: str) -> bool:
+        """
+        隔离账号 (刷新令牌被令牌端点拒绝)，隔离后不会再被分配，也不会被 cleanup_used 删除。
+
+        Returns:
+            True 表示本次完成隔离，False 表示账号不存在、已使用或已被隔离。
+        """
+        raise NotImplementedError
+
+    def __contains__(self, email: str) -> bool:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+def _check_credentials(email: str, account_data: Dict[str, Any], source) -> Dict[str, Any]:
+    if not account_data.get('refresh_token') or not account_data.get('client_id'):
+        logging.error(f"Missing 'refresh_token' or 'client_id' in {source}")
+        raise InvalidCredentialsError(f"Invalid credential file for {email}.")
+    return account_data
+
+
+class FileAccountStore(AccountStore):
+    """每个账号一个 JSON 文件的存储，可用账号由 AccountIndex 维护。"""
+
+    def __init__(self, oauth_dir, refresh_interval: float = 5.0):
+        self.oauth_dir = pathlib.Path(oauth_dir)
+        self.index = AccountIndex(self.oauth_dir, refresh_interval)
+
+    def open(self, on_change, leased=()):
+        self.index.add_listener(on_change)
+        return self.index.build()
+
+    def start_watcher(self):
+        self.index.start_watcher()
+
+    def stop_watcher(self):
+        self.index.stop_watcher()
+
+    def load_credentials(self, email):
+        path = self.index.path_for(email)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                account_data = json.load(f)
+        except FileNotFoundError:
+            logging.error(f"Credential file not found for {email}: {path}")
+            raise AccountNotFoundError(f"Credential file not found for {email}.")
+        except json.JSONDecodeError as e:
+            logging.error(f"Error decoding JSON from {path}", exc_info=True)
+            raise InvalidCredentialsError(f"Invalid JSON in credential file for {email}.") from e
+        return _check_credentials(email, account_data, path)
+
+    def _rename_used(self, email: str) -> bool:
+        original_path = self.index.path_for(email)
+        used_path = original_path.with_name(original_path.name + '.used')
+        if used_path.exists():
+            logging.warning(f"Used file {used_path.name} already exists. Assuming already marked.")
+            return False
+        try:
+            os.rename(original_path, used_path)
+        except FileNotFoundError:
+            logging.error(f"Original file {original_path.name} not found for marking as used.")
+            raise AccountNotFoundError(f"Credential file not found for {email}.")
+        logging.info(f"Marked email as used by renaming {original_path.name} to {used_path.name}")
+        return True
+
+    def mark_used(self, email):
+        try:
+            return self._rename_used(email)
+        finally:
+            self.index.discard(email)
+
+    def mark_used_many(self, emails):
+        emails = list(emails)
+        results = {}
+        try:
+            for email in emails:
+                try:
+                    results[email] = self._rename_used(email)
+                except Exception as e:
+                    results[email] = e
+        finally:
+            # 所有重命名完成后一次性更新索引
+            self.index.discard_many(emails)
+        return results
+
+    def quarantine(self, email):
+        original_path = self.index.path_for(email)
+        quarantined_path = original_path.with_name(original_path.name + '.quarantined')
+        try:
+            os.rename(original_path, quarantined_path)
+        except FileNotFoundError:
+            logging.warning(f"Credential file {original_path.name} not found for quarantine.")
+            return False
+        finally:
+            self.index.discard(email)
+        logging.warning(f"Quarantined account by renaming {original_path.name} to {quarantined_path.name}")
+        return True
+
+    def cleanup_used(self, max_age_hours=48):
+        current_time = time.time()
+        deleted_count = 0
+        for file_path in self.oauth_dir.glob('*.json.used'):
+            file_stat = file_path.stat()
+            file_age_hours = (current_time - file_stat.st_mtime) / 3600
+
+            if file_age_hours > max_age_hours:
+                try:
+                    os.remove(file_path)
+                    deleted_count += 1
+                    logging.info(f"已删除超过{max_age_hours}小时的已使用邮箱文件: {file_path.name}")
+                except OSError as e:
+                    logging.error(f"删除文件失败 {file_path.name}: {e}")
+        return deleted_count
+
+    def __contains__(self, email):
+        return email in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    email TEXT PRIMARY KEY,
+    domain TEXT NOT NULL,
+    password TEXT,
+    client_id TEXT NOT NULL,
+    refresh_token TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'available',
+    created_at REAL NOT NULL,
+    leased_at REAL,
+    used_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_accounts_state ON accounts(state);
+CREATE INDEX IF NOT EXISTS idx_accounts_state_used_at ON accounts(state, used_at);
+CREATE INDEX IF NOT EXISTS idx_accounts_domain_state ON accounts(domain, state);
+"""
+
+
+class SqliteAccountStore(AccountStore):
+    """
+    SQLite (WAL 模式) 账号存储。
+
+    每个线程使用自己的连接；写操作使用 BEGIN IMMEDIATE 事务。
+    同时实现了 LeaseAllocator 的观察者接口 (record_*)，把租约状态同步到 state 列。
+    """
+
+    def __init__(self, db_path, refresh_interval: float = 5.0):
+        """
+        Args:
+            db_path: 数据库文件路径。
+            refresh_interval: 后台发现新导入账号的间隔 (秒)，<= 0 表示不启动。
+        """
+        self.db_path = pathlib.Path(db_path)
+        self.refresh_interval = refresh_interval
+        self._local = threading.local()
+        # 请求线程、后台发现线程和观察者回调都会修改 _available/_max_rowid，由 _lock 保护；
+        # on_change 回调在释放 _lock 之后调用
+        self._lock = threading.Lock()
+        self._available: Set[str] = set()
+        self._max_rowid = 0
+        self._on_change: Optional[Callable[[Set[str], Set[str]], None]] = None
+        self._timer: Optional[threading.Timer] = None
+        self._stopped = True
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # --- 可用账号 ---
+
+    def open(self, on_change, leased=()):
+        conn = self._conn()
+        leased = set(leased)
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 上次运行遗留的 leased 状态以租约日志为准
+            stale = [row[0] for row in conn.execute("SELECT email FROM accounts WHERE state = ?", (STATE_LEASED,))
+                     if row[0] not in leased]
+            conn.executemany("UPDATE accounts SET state = ?, leased_at = NULL WHERE email = ?",
+                             [(STATE_AVAILABLE, email) for email in stale])
+            conn.executemany("UPDATE accounts SET state = ?, leased_at = ? WHERE email = ? AND state = ?",
+                             [(STATE_LEASED, now, email, STATE_AVAILABLE) for email in leased])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        # 持有租约的账号也属于账号池，LeaseAllocator 会跳过它们
+        rows = conn.execute("SELECT email FROM accounts WHERE state IN (?, ?)",
+                            (STATE_AVAILABLE, STATE_LEASED)).fetchall()
+        max_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM accounts").fetchone()[0]
+        available = {row[0] for row in rows}
+        with self._lock:
+            self._available = set(available)
+            self._max_rowid = max_rowid
+            self._on_change = on_change
+        logging.info(f"SQLite 账号库已加载: {len(available)} 个可用账号 ({self.db_path})")
+        if available:
+            on_change(available, set())
+        return len(available)
+
+    def refresh(self) -> Set[str]:
+        """通过 rowid 增量查询发现新导入的账号。"""
+        with self._lock:
+            max_rowid = self._max_rowid
+        rows = self._conn().execute(
+            "SELECT rowid, email FROM accounts WHERE rowid > ? AND state = ?",
+            (max_rowid, STATE_AVAILABLE)).fetchall()
+        if not rows:
+            return set()
+        with self._lock:
+            self._max_rowid = max(self._max_rowid, max(rowid for rowid, _ in rows))
+            added = {email for _, email in rows} - self._available
+            self._available |= added
+            on_change = self._on_change
+        if added:
+            logging.info(f"发现 {len(added)} 个新导入的账号")
+            if on_change:
+                on_change(added, set())
+        return added
+
+    def start_watcher(self):
+        if self.refresh_interval <= 0:
+            return
+        self._stopped = False
+        self._schedule()
+
+    def _schedule(self):
+        if self._stopped:
+            return
+        self._timer = threading.Timer(self.refresh_interval, self._tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _tick(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logging.error(f"刷新 SQLite 账号库时出错: {e}", exc_info=True)
+        finally:
+            self._schedule()
+
+    def stop_watcher(self):
+        self._stopped = True
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    # --- 凭证与状态 ---
+
+    def load_credentials(self, email):
+        row = self._conn().execute(
+            "SELECT email, password, client_id, refresh_token FROM accounts WHERE email = ? AND state NOT IN (?, ?)",
+            (email, STATE_USED, STATE_QUARANTINED)).fetchone()
+        if row is None:
+            logging.error(f"Account not found in {self.db_path}: {email}")
+            raise AccountNotFoundError(f"Account not found for {email}.")
+        account_data = {"email": row[0], "password": row[1], "client_id": row[2], "refresh_token": row[3]}
+        return _check_credentials(email, account_data, self.db_path)
+
+    def mark_used(self, email):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                "UPDATE accounts SET state = ?, used_at = ?, leased_at = NULL WHERE email = ? AND state != ?",
+                (STATE_USED, time.time(), email, STATE_USED))
+            if cursor.rowcount == 0:
+                exists = conn.execute("SELECT 1 FROM accounts WHERE email = ?", (email,)).fetchone()
+                conn.execute("COMMIT")
+                if not exists:
+                    raise AccountNotFoundError(f"Account not found for {email}.")
+                logging.warning(f"Account {email} already marked as used.")
+                return False
+            conn.execute("COMMIT")
+        except AccountNotFoundError:
+            raise
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            with self._lock:
+                self._available.discard(email)
+        logging.info(f"Marked email as used in account database: {email}")
+        return True
+
+    def mark_used_many(self, emails):
+        emails = list(emails)
+        results: Dict[str, Any] = {}
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for email in emails:
+                cursor = conn.execute(
+                    "UPDATE accounts SET state = ?, used_at = ?, leased_at = NULL WHERE email = ? AND state != ?",
+                    (STATE_USED, now, email, STATE_USED))
+                if cursor.rowcount:
+                    results[email] = True
+                elif conn.execute("SELECT 1 FROM accounts WHERE email = ?", (email,)).fetchone():
+                    results[email] = False
+                else:
+                    results[email] = AccountNotFoundError(f"Account not found for {email}.")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            with self._lock:
+                self._available.difference_update(emails)
+        logging.info(f"Marked {sum(1 for r in results.values() if r is True)} emails as used in account database")
+        return results
+
+    def quarantine(self, email):
+        cursor = self._conn().execute(
+            "UPDATE accounts SET state = ?, leased_at = NULL WHERE email = ? AND state IN (?, ?)",
+            (STATE_QUARANTINED, email, STATE_AVAILABLE, STATE_LEASED))
+        if not cursor.rowcount:
+            return False
+        with self._lock:
+            removed = email in self._available
+            self._available.discard(email)
+            on_change = self._on_change
+        logging.warning(f"Quarantined account in account database: {email}")
+        if removed and on_change:
+            on_change(set(), {email})
+        return True
+
+    def cleanup_used(self, max_age_hours=48):
+        cutoff = time.time() - max_age_hours * 3600
+        cursor = self._conn().execute(
+            "DELETE FROM accounts WHERE state = ? AND used_at < ?", (STATE_USED, cutoff))
+        if cursor.rowcount:
+            logging.info(f"已从账号库删除 {cursor.rowcount} 个超过{max_age_hours}小时的已使用账号")
+        return cursor.rowcount
+
+    def count_by_state(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT state, COUNT(*) FROM accounts GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    # --- 导入 ---
+
+    def import_accounts(self, accounts: Iterable[Dict[str, Any]], state: str = STATE_AVAILABLE) -> Tuple[int, int]:
+        """
+        在一个事务中批量导入账号，已存在的邮箱会被跳过 (依靠主键索引判断)。
+
+        Args:
+            accounts: 账号字典，包含 email/password/client_id/refresh_token，可选 used_at。
+            state: 导入后的状态。
+
+        Returns:
+            (导入数量, 跳过数量)
+        """
+        now = time.time()
+        rows = []
+        for account in accounts:
+            email = account['email']
+            rows.append((email, email.rpartition('@')[2].lower(), account.get('password'),
+                         account['client_id'], account['refresh_token'],
+                         account.get('state', state), now, account.get('used_at')))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO accounts "
+                "(email, domain, password, client_id, refresh_token, state, created_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            inserted = conn.total_changes - before
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return inserted, len(rows) - inserted
+
+    def migrate_from_dir(self, oauth_dir) -> Dict[str, Any]:
+        """
+        把 data/oauth 目录中的账号文件导入数据库。
+
+        *.json 导入为 available，*.json.used 导入为 used (used_at 取文件修改时间)，
+        *.json.quarantined 导入为 quarantined。原文件保持不变。
+        """
+        oauth_dir = pathlib.Path(oauth_dir)
+        accounts: List[Dict[str, Any]] = []
+        failed = 0
+        with os.scandir(oauth_dir) as entries:
+            for entry in entries:
+                suffix = next((s for s in _FILE_SUFFIX_STATES if entry.name.endswith('.json' + s)), '')
+                name = entry.name[:-len(suffix)] if suffix else entry.name
+                if email_from_filename(name) is None:
+                    continue
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        account_data = json.load(f)
+                    account_data.setdefault('email', email_from_filename(name))
+                    if not account_data.get('client_id') or not account_data.get('refresh_token'):
+                        raise InvalidCredentialsError("missing client_id or refresh_token")
+                    if suffix:
+                        account_data['state'] = _FILE_SUFFIX_STATES[suffix]
+                    if suffix == '.used':
+                        account_data['used_at'] = entry.stat().st_mtime
+                    accounts.append(account_data)
+                except (OSError, ValueError) as e:
+                    logging.error(f"无法导入账号文件 {entry.name}: {e}")
+                    failed += 1
+
+        inserted, skipped = self.import_accounts(accounts)
+        logging.info(f"迁移完成: 导入 {inserted} 个，跳过已存在 {skipped} 个，失败 {failed} 个")
+        return {"success": failed == 0, "total": len(accounts) + failed,
+                "successCount": inserted, "skippedCount": skipped, "failedCount": failed}
+
+    # --- LeaseAllocator 观察者接口 ---
+
+    def record_allocate(self, lease):
+        self._conn().execute("UPDATE accounts SET state = ?, leased_at = ? WHERE email = ? AND state = ?",
+                             (STATE_LEASED, lease.leased_at, lease.email, STATE_AVAILABLE))
+
+    def record_renew(self, lease):
+        pass
+
+    def record_release(self, email):
+        self._conn().execute("UPDATE accounts SET state = ?, leased_at = NULL WHERE email = ? AND state = ?",
+                             (STATE_AVAILABLE, email, STATE_LEASED))
+
+    record_expire = record_release
+
+    def record_mark_used(self, email):
+        pass
+
+    def __contains__(self, email):
+        with self._lock:
+            return email in self._available
+
+    def __len__(self):
+        with self._lock:
+            return len(self._available)
+
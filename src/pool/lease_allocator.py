@@ -0,0 +1,511 @@
+"""
+租约分配模块
+- 空闲池: 列表 + 位置字典，随机取出/放回均为 O(1)
+- 过期堆: 按到期时间排序的最小堆，只有真正到期的租约才需要 O(log n) 的处理
+- 租约记录使用 __slots__，减少大量并发租约时的内存占用
+- 可选的 LeaseJournal，所有租约变化都会追加到日志中，重启后可以恢复
+- 账号池耗尽时可以排队等待 (FIFO)，有账号被释放、租约到期或新账号加入时唤醒队首
+
+LeaseAllocator 只在单个进程内有效；多个服务进程共享租约时使用 lease_backend.py 中的后端。
+"""
+
+import time
+import heapq
+import queue
+import random
+import logging
+import secrets
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+
+class WaiterQueueFull(Exception):
+    """等待队列已满。"""
+
+
+def new_lease_token() -> str:
+    """生成不透明的租约令牌。"""
+    return secrets.token_urlsafe(16)
+
+
+class Lease:
+    """单个邮箱的租约记录。"""
+
+    __slots__ = ('email', 'token', 'leased_at', 'expires_at', 'duration')
+
+    def __init__(self, email: str, leased_at: float, expires_at: float,
+                 token: Optional[str] = None, duration: Optional[float] = None):
+        self.email = email
+        self.token = token or new_lease_token()
+        self.leased_at = leased_at
+        self.expires_at = expires_at
+        # 每次续期延长的时长
+        self.duration = duration if duration is not None else expires_at - leased_at
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        return (now if now is not None else time.time()) > self.expires_at
+
+    def remaining(self, now: Optional[float] = None) -> float:
+        return max(0.0, self.expires_at - (now if now is not None else time.time()))
+
+    def __repr__(self):
+        return f"Lease({self.email!r}, leased_at={self.leased_at:.3f}, expires_at={self.expires_at:.3f}, duration={self.duration})"
+
+
+class LeaseAllocator:
+    """
+    邮箱租约分配器。
+
+    所有公开方法内部自行加锁，调用方不需要 (也不应该) 持有 lock。
+    租约日志在锁内同步写入；其他观察者的事件按发生顺序交给一个后台线程分发，请求线程不会等待观察者的 I/O。
+    """
+
+    # 堆中失效条目超过有效租约数的倍数时重建堆
+    HEAP_COMPACT_RATIO = 2
+    HEAP_COMPACT_MIN = 1024
+
+    def __init__(self, lease_duration: float, journal=None, max_waiters: int = 100):
+        """
+        Args:
+            lease_duration: 默认租约时长 (秒)。
+            journal: 可选的 LeaseJournal，用于持久化租约变化。
+            max_waiters: 账号池耗尽时最多允许排队等待的请求数。
+        """
+        self.lease_duration = lease_duration
+        self.journal = journal
+        # 观察者需实现 record_allocate/record_renew/record_release/record_mark_used/record_expire
+        self.observers: List = []
+        self.lock = threading.Lock()
+        # 观察者可能写数据库或建立 IMAP 会话，事件在锁内放入队列 (保证顺序)，由 _dispatcher 线程分发
+        self._events: queue.Queue = queue.Queue()
+        self._dispatcher: Optional[threading.Thread] = None
+        self.leases: Dict[str, Lease] = {}
+        self.tokens: Dict[str, Lease] = {}
+        self._free: List[str] = []
+        self._free_pos: Dict[str, int] = {}
+        self._heap: List[Tuple[float, str]] = []
+        # 租约期间被移出账号池的邮箱，释放时不再放回空闲池
+        self._retired: set = set()
+        # 等待分配的请求，每个请求一个与 lock 绑定的 Condition，只唤醒队首
+        self.max_waiters = max_waiters
+        self._waiters: Deque[threading.Condition] = deque()
+
+    # --- 空闲池操作 (调用方需持有锁) ---
+
+    def _free_add(self, email: str):
+        if email in self._free_pos:
+            return
+        self._free_pos[email] = len(self._free)
+        self._free.append(email)
+        if self._waiters:
+            self._waiters[0].notify()
+
+    def _free_discard(self, email: str) -> bool:
+        pos = self._free_pos.pop(email, None)
+        if pos is None:
+            return False
+        last = self._free.pop()
+        if pos < len(self._free):
+            self._free[pos] = last
+            self._free_pos[last] = pos
+        return True
+
+    def _spare_locked(self) -> int:
+        """空闲账号中不需要留给排队请求的数量 (每个排队的请求预留一个)。"""
+        return max(0, len(self._free) - len(self._waiters))
+
+    def _free_pop_random(self) -> Optional[str]:
+        if not self._free:
+            return None
+        pos = random.randrange(len(self._free))
+        email = self._free[pos]
+        self._free_discard(email)
+        return email
+
+    # --- 租约内部操作 (调用方需持有锁) ---
+
+    def _push_expiry(self, lease: Lease):
+        heapq.heappush(self._heap, (lease.expires_at, lease.email))
+        if len(self._heap) > self.HEAP_COMPACT_MIN and len(self._heap) > self.HEAP_COMPACT_RATIO * len(self.leases):
+            self._heap = [(l.expires_at, l.email) for l in self.leases.values()]
+            heapq.heapify(self._heap)
+
+    def _record(self, event: str, arg):
+        # 日志必须与内存状态一致，在锁内写入；其他观察者的事件交给分发线程
+        if self.journal is not None:
+            self._notify(self.journal, event, arg)
+        if self.observers:
+            self._events.put((event, arg))
+
+    @staticmethod
+    def _notify(observer, event: str, arg):
+        try:
+            getattr(observer, event)(arg)
+        except Exception as e:
+            logging.error(f"记录租约事件 {event} 失败: {e}", exc_info=True)
+
+    def _dispatch_loop(self):
+        """分发线程: 按顺序把事件交给观察者 (不持有 lock，观察者可以再次调用分配器)，收到 None 时退出。"""
+        while True:
+            item = self._events.get()
+            try:
+                if item is None:
+                    return
+                event, arg = item
+                for observer in list(self.observers):
+                    self._notify(observer, event, arg)
+            finally:
+                self._events.task_done()
+
+    def _maybe_compact_locked(self):
+        if self.journal is not None and self.journal.should_compact(len(self.leases)):
+            try:
+                self.journal.compact(self.leases.values())
+            except OSError as e:
+                logging.error(f"压缩租约日志失败: {e}", exc_info=True)
+
+    def _end_lease(self, email: str, reusable: bool) -> Optional[Lease]:
+        lease = self.leases.pop(email, None)
+        if lease is None:
+            return None
+        self.tokens.pop(lease.token, None)
+        if email in self._retired:
+            self._retired.discard(email)
+        elif reusable:
+            self._free_add(email)
+        return lease
+
+    def _expire_locked(self, now: float) -> List[str]:
+        expired = []
+        heap = self._heap
+        while heap and heap[0][0] < now:
+            expires_at, email = heapq.heappop(heap)
+            lease = self.leases.get(email)
+            # 已释放或已续期的租约在堆中留下的是失效条目，直接丢弃
+            if lease is None or lease.expires_at != expires_at:
+                continue
+            self._end_lease(email, reusable=True)
+            self._record('record_expire', email)
+            expired.append(email)
+        return expired
+
+    # --- 账号池同步 ---
+
+    def add_accounts(self, emails: Iterable[str]):
+        """把账号加入空闲池 (已持有租约的账号会被跳过)。"""
+        with self.lock:
+            for email in emails:
+                self._retired.discard(email)
+                if email not in self.leases:
+                    self._free_add(email)
+
+    def remove_accounts(self, emails: Iterable[str]):
+        """把账号移出账号池；正在租用的账号会在租约结束后丢弃。"""
+        with self.lock:
+            for email in emails:
+                if not self._free_discard(email) and email in self.leases:
+                    self._retired.add(email)
+
+    def sync(self, added: Iterable[str], removed: Iterable[str]):
+        """AccountIndex 的变化回调。"""
+        self.remove_accounts(removed)
+        self.add_accounts(added)
+
+    def pool_emails(self) -> Set[str]:
+        """返回仍属于账号池的邮箱 (空闲的和持有租约的，不包括已移出账号池的)。"""
+        with self.lock:
+            return (set(self._free) | set(self.leases)) - self._retired
+
+    # --- 日志 ---
+
+    def attach_journal(self, journal, now: Optional[float] = None) -> int:
+        """
+        重放日志恢复租约，然后把日志压缩为当前快照并开始追加记录。
+
+        应在账号索引建立之前调用，这样恢复的租约不会再进入空闲池。
+
+        Returns:
+            恢复的租约数量。
+        """
+        now = now if now is not None else time.time()
+        restored = journal.replay(now)
+        with self.lock:
+            for email, (leased_at, expires_at, token, duration) in restored.items():
+                self._free_discard(email)
+                lease = Lease(email, leased_at, expires_at, token or None, duration)
+                self.leases[email] = lease
+                self.tokens[lease.token] = lease
+                heapq.heappush(self._heap, (expires_at, email))
+            journal.open(self.leases.values())
+            self.journal = journal
+        return len(restored)
+
+    def add_observer(self, observer):
+        """注册租约事件观察者 (例如把租约状态同步到账号库)。"""
+        with self.lock:
+            self.observers.append(observer)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name='lease-observers', daemon=True)
+                self._dispatcher.start()
+
+    def flush(self):
+        """等待已发生的租约事件全部分发给观察者 (不能在观察者回调中调用)。"""
+        if self._dispatcher is not None:
+            self._events.join()
+
+    # --- 租约操作 ---
+
+    def expire(self, now: Optional[float] = None) -> List[str]:
+        """回收所有已到期的租约，返回被回收的邮箱列表。"""
+        now = now if now is not None else time.time()
+        with self.lock:
+            expired = self._expire_locked(now)
+        for email in expired:
+            logging.info(f"Cleaned up expired lease for email: {email}")
+        return expired
+
+    def _lease_locked(self, now: float, duration: Optional[float] = None) -> Optional[Lease]:
+        email = self._free_pop_random()
+        if email is None:
+            return None
+        duration = duration if duration is not None else self.lease_duration
+        lease = Lease(email, now, now + duration, duration=duration)
+        self.leases[email] = lease
+        self.tokens[lease.token] = lease
+        self._push_expiry(lease)
+        self._record('record_allocate', lease)
+        return lease
+
+    def _wait_locked(self, timeout: float, expired: List[str], duration: Optional[float] = None) -> Optional[Lease]:
+        """排队等待空闲账号 (调用方需持有锁)，超时返回 None。"""
+        if len(self._waiters) >= self.max_waiters:
+            raise WaiterQueueFull(f"{len(self._waiters)} requests are already waiting for an account")
+        waiter = threading.Condition(self.lock)
+        self._waiters.append(waiter)
+        deadline = time.monotonic() + timeout
+        lease = None
+        try:
+            while True:
+                now = time.time()
+                if self._waiters[0] is waiter:
+                    expired.extend(self._expire_locked(now))
+                    lease = self._lease_locked(now, duration)
+                    if lease is not None:
+                        return lease
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                if self._waiters[0] is waiter and self._heap:
+                    # 队首在最近的租约到期时自行醒来回收
+                    remaining = min(remaining, max(self._heap[0][0] - now, 0) + 0.01)
+                waiter.wait(remaining)
+        finally:
+            self._waiters.remove(waiter)
+            # 把机会交给下一个等待者
+            if self._waiters and (self._free or lease is None):
+                self._waiters[0].notify()
+
+    def allocate(self, now: Optional[float] = None, wait: float = 0, duration: Optional[float] = None) -> Optional[Lease]:
+        """
+        从空闲池随机取出一个账号并创建租约。
+
+        有请求在排队时先为它们各预留一个空闲账号 (按 FIFO 分配给它们)，剩余的空闲账号可以直接分配。
+
+        Args:
+            now: 当前时间 (测试用)。
+            wait: 没有可用账号时最多等待的秒数，0 表示立即返回。
+            duration: 租约时长 (秒)，默认为 lease_duration；续期时按同样时长延长。
+
+        Returns:
+            新的租约，没有可用账号 (或等待超时) 时返回 None。
+
+        Raises:
+            WaiterQueueFull: 需要等待但等待队列已满。
+        """
+        now = now if now is not None else time.time()
+        with self.lock:
+            expired = self._expire_locked(now)
+            # 排队的请求优先 (FIFO)，只有预留给它们之后还有剩余的空闲账号时才直接分配
+            lease = self._lease_locked(now, duration) if self._spare_locked() else None
+            try:
+                if lease is None and wait > 0:
+                    lease = self._wait_locked(wait, expired, duration)
+            finally:
+                self._maybe_compact_locked()
+        for expired_email in expired:
+            logging.info(f"Cleaned up expired lease for email: {expired_email}")
+        return lease
+
+    def allocate_many(self, count: int, now: Optional[float] = None, duration: Optional[float] = None) -> List[Lease]:
+        """
+        在一次加锁内分配最多 count 个租约，可用账号不足时返回的数量少于 count。
+
+        与 allocate 一样先为排队等待的请求各预留一个空闲账号。
+        """
+        now = now if now is not None else time.time()
+        leases = []
+        with self.lock:
+            expired = self._expire_locked(now)
+            for _ in range(min(count, self._spare_locked())):
+                lease = self._lease_locked(now, duration)
+                if lease is None:
+                    break
+                leases.append(lease)
+            self._maybe_compact_locked()
+        for expired_email in expired:
+            logging.info(f"Cleaned up expired lease for email: {expired_email}")
+        return leases
+
+    def get(self, email: str, now: Optional[float] = None) -> Optional[Lease]:
+        """返回有效的租约；租约不存在或已过期时返回 None (过期租约会被立即回收)。"""
+        now = now if now is not None else time.time()
+        with self.lock:
+            lease = self.leases.get(email)
+            if lease is None:
+                return None
+            if lease.is_expired(now):
+                self._end_lease(email, reusable=True)
+                self._record('record_expire', email)
+                logging.warning(f"Lease expired for email: {email}")
+                return None
+            return lease
+
+    def get_by_token(self, token: str, now: Optional[float] = None) -> Optional[Lease]:
+        """按令牌查找有效租约 (O(1))；令牌不存在或租约已过期时返回 None。"""
+        now = now if now is not None else time.time()
+        with self.lock:
+            lease = self.tokens.get(token)
+            if lease is None:
+                return None
+            if lease.is_expired(now):
+                self._end_lease(lease.email, reusable=True)
+                self._record('record_expire', lease.email)
+                logging.warning(f"Lease expired for email: {lease.email}")
+                return None
+            return lease
+
+    def renew(self, email: str, duration: Optional[float] = None, now: Optional[float] = None,
+              token: Optional[str] = None) -> Optional[Lease]:
+        """
+        把有效租约的到期时间延长为 now + duration，租约不存在、已过期或 token 不匹配时返回 None。
+
+        指定 duration 时同时作为该租约之后续期的默认时长，否则沿用租约自身的时长。
+        """
+        now = now if now is not None else time.time()
+        with self.lock:
+            lease = self.leases.get(email)
+            if lease is None or lease.is_expired(now) or (token is not None and lease.token != token):
+                return None
+            if duration is not None:
+                lease.duration = duration
+            lease.expires_at = now + lease.duration
+            # 旧的堆条目会在弹出时因到期时间不一致而被丢弃
+            self._push_expiry(lease)
+            self._record('record_renew', lease)
+            self._maybe_compact_locked()
+            return lease
+
+    def _owned_locked(self, email: str, token: Optional[str]) -> bool:
+        if token is None:
+            return True
+        lease = self.leases.get(email)
+        return lease is not None and lease.token == token
+
+    def release(self, email: str, token: Optional[str] = None) -> bool:
+        """
+        释放租约并把账号放回空闲池，返回是否存在该租约。
+
+        指定 token 时只有令牌匹配才会释放，避免误释放已被重新分配给其他客户端的租约。
+        """
+        with self.lock:
+            if not self._owned_locked(email, token):
+                return False
+            released = self._end_lease(email, reusable=True) is not None
+            if released:
+                self._record('record_release', email)
+            return released
+
+    def mark_used(self, email: str, token: Optional[str] = None) -> bool:
+        """结束租约并把账号永久移出账号池，返回是否存在该租约 (指定 token 时需匹配)。"""
+        with self.lock:
+            if not self._owned_locked(email, token):
+                return False
+            self._free_discard(email)
+            ended = self._end_lease(email, reusable=False) is not None
+            if ended:
+                self._record('record_mark_used', email)
+            return ended
+
+    def get_many(self, emails: Iterable[str], now: Optional[float] = None) -> Dict[str, Lease]:
+        """在一次加锁内检查多个租约，返回其中有效的 {email: Lease}。"""
+        now = now if now is not None else time.time()
+        valid = {}
+        with self.lock:
+            for email in emails:
+                lease = self.leases.get(email)
+                if lease is None:
+                    continue
+                if lease.is_expired(now):
+                    self._end_lease(email, reusable=True)
+                    self._record('record_expire', email)
+                    continue
+                valid[email] = lease
+        return valid
+
+    def release_many(self, emails: Iterable[str]) -> Dict[str, bool]:
+        """在一次加锁内释放多个租约，返回 {email: 是否存在该租约}。"""
+        results = {}
+        with self.lock:
+            for email in emails:
+                released = self._end_lease(email, reusable=True) is not None
+                if released:
+                    self._record('record_release', email)
+                results[email] = released
+            self._maybe_compact_locked()
+        return results
+
+    def mark_used_many(self, emails: Iterable[str]) -> Dict[str, bool]:
+        """在一次加锁内结束多个租约并把账号移出账号池。"""
+        results = {}
+        with self.lock:
+            for email in emails:
+                self._free_discard(email)
+                ended = self._end_lease(email, reusable=False) is not None
+                if ended:
+                    self._record('record_mark_used', email)
+                results[email] = ended
+            self._maybe_compact_locked()
+        return results
+
+    def clear(self):
+        """清空所有租约，账号全部回到空闲池。"""
+        with self.lock:
+            for email in list(self.leases):
+                self._end_lease(email, reusable=True)
+                self._record('record_release', email)
+            self._heap = []
+            self.tokens.clear()
+
+    def leased_emails(self, now: Optional[float] = None) -> List[str]:
+        """返回当前持有租约的邮箱 (包括已到期但尚未回收的)。"""
+        with self.lock:
+            return list(self.leases)
+
+    def close(self):
+        """分发完已发生的租约事件后停止分发线程，然后关闭租约日志。"""
+        dispatcher, self._dispatcher = self._dispatcher, None
+        if dispatcher is not None:
+            self._events.put(None)
+            dispatcher.join(timeout=5)
+        if self.journal:
+            self.journal.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "free": len(self._free),
+                "leased": len(self.leases),
+                "heap_entries": len(self._heap),
+                "waiters": len(self._waiters),
+            }
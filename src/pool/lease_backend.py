@@ -0,0 +1,673 @@
+"""
+共享租约后端模块
+- LeaseAllocator (lease_allocator.py) 是进程内实现，只能在单个服务进程中使用
+- SqliteLeaseBackend: 同一台机器上的多个服务进程共享一个 SQLite 数据库 (WAL + BEGIN IMMEDIATE 文件锁)
+- RedisLeaseBackend: 多台机器共享一个 Redis (兼容 Redis 协议的服务即可)，需要安装 redis 包
+
+三种后端对服务提供相同的接口 (allocate/get/get_by_token/renew/release/mark_used 及批量版本、
+add_accounts/remove_accounts/sync/pool_emails、add_observer、leased_emails、stats、clear、close)。
+
+共享后端中的过期租约不需要后台清理，分配时会顺带回收；跨进程无法使用 Condition，
+wait 参数通过短间隔轮询实现，只在本进程内限制等待数量，不保证跨进程的先来先到。
+"""
+
+import time
+import logging
+import pathlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from src.pool.lease_allocator import Lease, WaiterQueueFull
+
+
+class LeaseBackend:
+    """
+    跨进程共享的租约后端基类。
+
+    子类实现 _allocate_batch 以及查询、续期、释放等操作，基类负责等待轮询与观察者通知。
+    """
+
+    # 等待时的轮询间隔 (秒)，从 POLL_MIN 开始每次翻倍直到 POLL_MAX
+    POLL_MIN = 0.05
+    POLL_MAX = 0.5
+
+    def __init__(self, lease_duration: float, max_waiters: int = 100):
+        self.lease_duration = lease_duration
+        self.max_waiters = max_waiters
+        # 观察者需实现 record_allocate/record_renew/record_release/record_mark_used/record_expire
+        self.observers: List = []
+        self.journal = None
+        self._waiting = 0
+        self._waiting_lock = threading.Lock()
+
+    def _record(self, event: str, arg):
+        for observer in self.observers:
+            try:
+                getattr(observer, event)(arg)
+            except Exception as e:
+                logging.error(f"记录租约事件 {event} 失败: {e}", exc_info=True)
+
+    def _expired(self, emails: Iterable[str]):
+        for email in emails:
+            self._record('record_expire', email)
+            logging.info(f"Cleaned up expired lease for email: {email}")
+
+    def add_observer(self, observer):
+        """注册租约事件观察者 (例如把租约状态同步到账号库)。"""
+        self.observers.append(observer)
+
+    # --- 账号池同步 ---
+
+    def add_accounts(self, emails: Iterable[str]):
+        """把账号加入空闲池 (已持有租约的账号会被跳过)。"""
+        raise NotImplementedError
+
+    def remove_accounts(self, emails: Iterable[str]):
+        """把账号移出账号池；正在租用的账号会在租约结束后丢弃。"""
+        raise NotImplementedError
+
+    def sync(self, added: Iterable[str], removed: Iterable[str]):
+        """AccountStore 的变化回调。"""
+        self.remove_accounts(removed)
+        self.add_accounts(added)
+
+    def pool_emails(self) -> Set[str]:
+        """返回后端中仍属于账号池的邮箱 (空闲的和持有租约的，不包括已移出账号池的)。"""
+        raise NotImplementedError
+
+    # --- 分配 ---
+
+    def _allocate_batch(self, count: int, now: float, duration: float) -> List[Lease]:
+        """原子地分配最多 count 个租约 (同时回收已过期的租约)。"""
+        raise NotImplementedError
+
+    def allocate(self, now: Optional[float] = None, wait: float = 0, duration: Optional[float] = None) -> Optional[Lease]:
+        """
+        分配一个账号并创建租约，参数与 LeaseAllocator.allocate 相同。
+
+        Raises:
+            WaiterQueueFull: 需要等待但本进程的等待数量已满。
+        """
+        duration = duration if duration is not None else self.lease_duration
+        leases = self._allocate_batch(1, now if now is not None else time.time(), duration)
+        if leases or wait <= 0:
+            return leases[0] if leases else None
+
+        with self._waiting_lock:
+            if self._waiting >= self.max_waiters:
+                raise WaiterQueueFull(f"{self._waiting} requests are already waiting for an account")
+            self._waiting += 1
+        try:
+            deadline = time.monotonic() + wait
+            interval = self.POLL_MIN
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                time.sleep(min(interval, remaining))
+                interval = min(interval * 2, self.POLL_MAX)
+                leases = self._allocate_batch(1, time.time(), duration)
+                if leases:
+                    return leases[0]
+        finally:
+            with self._waiting_lock:
+                self._waiting -= 1
+
+    def allocate_many(self, count: int, now: Optional[float] = None, duration: Optional[float] = None) -> List[Lease]:
+        """分配最多 count 个租约，可用账号不足时返回的数量少于 count。"""
+        duration = duration if duration is not None else self.lease_duration
+        return self._allocate_batch(count, now if now is not None else time.time(), duration)
+
+    def expire(self, now: Optional[float] = None) -> List[str]:
+        """共享后端在分配时回收过期租约，这里只为兼容 LeaseAllocator 的接口。"""
+        return []
+
+    # --- 查询与修改 ---
+
+    def get(self, email: str, now: Optional[float] = None) -> Optional[Lease]:
+        """返回有效的租约，租约不存在或已过期时返回 None。"""
+        raise NotImplementedError
+
+    def get_by_token(self, token: str, now: Optional[float] = None) -> Optional[Lease]:
+        """按令牌查找有效租约。"""
+        raise NotImplementedError
+
+    def get_many(self, emails: Iterable[str], now: Optional[float] = None) -> Dict[str, Lease]:
+        now = now if now is not None else time.time()
+        valid = {}
+        for email in emails:
+            lease = self.get(email, now)
+            if lease is not None:
+                valid[email] = lease
+        return valid
+
+    def renew(self, email: str, duration: Optional[float] = None, now: Optional[float] = None,
+              token: Optional[str] = None) -> Optional[Lease]:
+        """延长有效租约，语义同 LeaseAllocator.renew。"""
+        raise NotImplementedError
+
+    def release(self, email: str, token: Optional[str] = None) -> bool:
+        """释放租约并把账号放回空闲池 (指定 token 时需匹配)。"""
+        raise NotImplementedError
+
+    def mark_used(self, email: str, token: Optional[str] = None) -> bool:
+        """结束租约并把账号永久移出账号池 (指定 token 时需匹配)。"""
+        raise NotImplementedError
+
+    def release_many(self, emails: Iterable[str]) -> Dict[str, bool]:
+        return {email: self.release(email) for email in emails}
+
+    def mark_used_many(self, emails: Iterable[str]) -> Dict[str, bool]:
+        return {email: self.mark_used(email) for email in emails}
+
+    def leased_emails(self, now: Optional[float] = None) -> List[str]:
+        """返回当前持有有效租约的邮箱。"""
+        raise NotImplementedError
+
+    def clear(self):
+        """清空所有租约 (会影响共享同一后端的所有进程)。"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def close(self):
+        """释放连接。"""
+
+
+LEASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lease_pool (
+    email TEXT PRIMARY KEY,
+    token TEXT UNIQUE,
+    leased_at REAL,
+    expires_at REAL NOT NULL DEFAULT 0,
+    duration REAL,
+    retired INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_lease_pool_expires ON lease_pool(expires_at);
+"""
+
+
+class SqliteLeaseBackend(LeaseBackend):
+    """
+    基于 SQLite 的租约后端，供同一台机器上的多个服务进程共享。
+
+    每个账号一行: token 为 NULL 表示空闲 (expires_at = 0)，否则表示持有租约。
+    空闲和已过期的行都满足 expires_at < now，分配时按 expires_at 索引取出即可，
+    因此过期租约会在下一次分配时被回收。所有写操作使用 BEGIN IMMEDIATE，由 SQLite 的文件锁串行化。
+    """
+
+    def __init__(self, db_path, lease_duration: float, max_waiters: int = 100):
+        """
+        Args:
+            db_path: 数据库文件路径 (所有服务进程需使用同一个文件)。
+            lease_duration: 默认租约时长 (秒)。
+            max_waiters: 本进程最多允许等待的请求数。
+        """
+        super().__init__(lease_duration, max_waiters)
+        self.db_path = pathlib.Path(db_path)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(LEASE_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _transaction(self, func):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    @staticmethod
+    def _lease_from_row(email, row) -> Lease:
+        token, leased_at, expires_at, duration = row
+        return Lease(email, leased_at, expires_at, token, duration)
+
+    # --- 账号池同步 ---
+
+    def add_accounts(self, emails):
+        rows = [(email,) for email in emails]
+        if not rows:
+            return
+        self._transaction(lambda conn: conn.executemany(
+            "INSERT INTO lease_pool (email) VALUES (?) ON CONFLICT(email) DO UPDATE SET retired = 0", rows))
+
+    def remove_accounts(self, emails):
+        rows = [(email,) for email in emails]
+        if not rows:
+            return
+
+        def remove(conn):
+            conn.executemany("DELETE FROM lease_pool WHERE email = ? AND token IS NULL", rows)
+            conn.executemany("UPDATE lease_pool SET retired = 1 WHERE email = ?", rows)
+
+        self._transaction(remove)
+
+    def pool_emails(self):
+        return {row[0] for row in self._conn().execute("SELECT email FROM lease_pool WHERE retired = 0")}
+
+    # --- 分配 ---
+
+    def _allocate_batch(self, count, now, duration):
+        expired: List[str] = []
+
+        def allocate(conn):
+            leases = []
+            while len(leases) < count:
+                rows = conn.execute(
+                    "SELECT email, token, retired FROM lease_pool WHERE expires_at < ? ORDER BY expires_at LIMIT ?",
+                    (now, count - len(leases))).fetchall()
+                if not rows:
+                    break
+                for email, old_token, retired in rows:
+                    if old_token is not None:
+                        expired.append(email)
+                    if retired:
+                        conn.execute("DELETE FROM lease_pool WHERE email = ?", (email,))
+                        continue
+                    lease = Lease(email, now, now + duration, duration=duration)
+                    conn.execute("UPDATE lease_pool SET token = ?, leased_at = ?, expires_at = ?, duration = ? "
+                                 "WHERE email = ?", (lease.token, lease.leased_at, lease.expires_at, duration, email))
+                    leases.append(lease)
+            return leases
+
+        leases = self._transaction(allocate)
+        self._expired(expired)
+        for lease in leases:
+            self._record('record_allocate', lease)
+        return leases
+
+    # --- 查询与修改 ---
+
+    def get(self, email, now=None):
+        now = now if now is not None else time.time()
+        row = self._conn().execute(
+            "SELECT token, leased_at, expires_at, duration FROM lease_pool "
+            "WHERE email = ? AND token IS NOT NULL AND expires_at >= ?", (email, now)).fetchone()
+        return self._lease_from_row(email, row) if row else None
+
+    def get_by_token(self, token, now=None):
+        now = now if now is not None else time.time()
+        row = self._conn().execute(
+            "SELECT email, token, leased_at, expires_at, duration FROM lease_pool "
+            "WHERE token = ? AND expires_at >= ?", (token, now)).fetchone()
+        return self._lease_from_row(row[0], row[1:]) if row else None
+
+    def renew(self, email, duration=None, now=None, token=None):
+        now = now if now is not None else time.time()
+
+        def renew(conn):
+            row = conn.execute(
+                "SELECT token, leased_at, expires_at, duration FROM lease_pool "
+                "WHERE email = ? AND token IS NOT NULL AND expires_at >= ?", (email, now)).fetchone()
+            if row is None or (token is not None and row[0] != token):
+                return None
+            lease = self._lease_from_row(email, row)
+            if duration is not None:
+                lease.duration = duration
+            lease.expires_at = now + lease.duration
+            conn.execute("UPDATE lease_pool SET expires_at = ?, duration = ? WHERE email = ?",
+                         (lease.expires_at, lease.duration, email))
+            return lease
+
+        lease = self._transaction(renew)
+        if lease is not None:
+            self._record('record_renew', lease)
+        return lease
+
+    def _end_lease(self, conn, email, token, reusable) -> bool:
+        row = conn.execute("SELECT token, retired FROM lease_pool WHERE email = ?", (email,)).fetchone()
+        if row is None:
+            return False
+        current, retired = row
+        if token is not None and current != token:
+            return False
+        if retired or not reusable:
+            conn.execute("DELETE FROM lease_pool WHERE email = ?", (email,))
+        elif current is not None:
+            conn.execute("UPDATE lease_pool SET token = NULL, leased_at = NULL, expires_at = 0, duration = NULL "
+                         "WHERE email = ?", (email,))
+        return current is not None
+
+    def release(self, email, token=None):
+        released = self._transaction(lambda conn: self._end_lease(conn, email, token, reusable=True))
+        if released:
+            self._record('record_release', email)
+        return released
+
+    def mark_used(self, email, token=None):
+        ended = self._transaction(lambda conn: self._end_lease(conn, email, token, reusable=False))
+        if ended:
+            self._record('record_mark_used', email)
+        return ended
+
+    def release_many(self, emails):
+        emails = list(emails)
+        results = self._transaction(
+            lambda conn: {email: self._end_lease(conn, email, None, reusable=True) for email in emails})
+        for email, released in results.items():
+            if released:
+                self._record('record_release', email)
+        return results
+
+    def mark_used_many(self, emails):
+        emails = list(emails)
+        results = self._transaction(
+            lambda conn: {email: self._end_lease(conn, email, None, reusable=False) for email in emails})
+        for email, ended in results.items():
+            if ended:
+                self._record('record_mark_used', email)
+        return results
+
+    def leased_emails(self, now=None):
+        now = now if now is not None else time.time()
+        rows = self._conn().execute(
+            "SELECT email FROM lease_pool WHERE token IS NOT NULL AND expires_at >= ?", (now,)).fetchall()
+        return [row[0] for row in rows]
+
+    def clear(self):
+        def clear(conn):
+            conn.execute("DELETE FROM lease_pool WHERE retired = 1")
+            conn.execute("UPDATE lease_pool SET token = NULL, leased_at = NULL, expires_at = 0, duration = NULL "
+                         "WHERE token IS NOT NULL")
+
+        self._transaction(clear)
+
+    def stats(self):
+        free, leased = self._conn().execute(
+            "SELECT COALESCE(SUM(token IS NULL), 0), COALESCE(SUM(token IS NOT NULL), 0) FROM lease_pool").fetchone()
+        return {"free": free, "leased": leased, "waiters": self._waiting}
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+class RedisLeaseBackend(LeaseBackend):
+    """
+    基于 Redis 的租约后端，供多台机器上的服务进程共享。
+
+    数据结构 (prefix 默认为 "email-lease"):
+        {prefix}:free           SET   空闲账号，SPOP 取出
+        {prefix}:expiry         ZSET  持有租约的账号，分数为到期时间
+        {prefix}:lease:{email}  STRING "token|leased_at|expires_at|duration"
+        {prefix}:token:{token}  STRING 令牌对应的邮箱
+        {prefix}:retired        SET   租约期间被移出账号池的账号
+
+    ZADD NX 是分配的原子点: 即使同一个账号因并发同步被重复放回空闲池，也不会被分配两次；
+    分配进程在写入租约键之前退出时，有序集合中的条目到期后会被当作过期租约回收。
+    修改已有租约时使用 WATCH/MULTI 乐观事务，不依赖 Lua 脚本，因此也可以用 fakeredis 测试。
+    """
+
+    # 每次分配时最多回收的过期租约数
+    REAP_BATCH = 100
+    CHUNK_SIZE = 1000
+
+    def __init__(self, client, lease_duration: float, prefix: str = 'email-lease', max_waiters: int = 100):
+        """
+        Args:
+            client: redis.Redis 客户端或连接 URL (如 redis://localhost:6379/0)。
+            lease_duration: 默认租约时长 (秒)。
+            prefix: 键前缀，多个账号池共用一个 Redis 时用于区分。
+            max_waiters: 本进程最多允许等待的请求数。
+        """
+        super().__init__(lease_duration, max_waiters)
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("LEASE_BACKEND=redis 需要安装 redis 包: pip install redis")
+        self._watch_error = redis.WatchError
+        if isinstance(client, str):
+            client = redis.Redis.from_url(client)
+        self.redis = client
+        self.free_key = f"{prefix}:free"
+        self.expiry_key = f"{prefix}:expiry"
+        self.retired_key = f"{prefix}:retired"
+        self.lease_prefix = f"{prefix}:lease:"
+        self.token_prefix = f"{prefix}:token:"
+
+    @staticmethod
+    def _decode(value) -> Optional[str]:
+        if value is None:
+            return None
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    @staticmethod
+    def _encode_lease(lease: Lease) -> str:
+        return f"{lease.token}|{lease.leased_at!r}|{lease.expires_at!r}|{lease.duration!r}"
+
+    def _parse_lease(self, email: str, value) -> Optional[Lease]:
+        value = self._decode(value)
+        if value is None:
+            return None
+        token, leased_at, expires_at, duration = value.split('|')
+        return Lease(email, float(leased_at), float(expires_at), token, float(duration))
+
+    def _load(self, email: str, client=None) -> Optional[Lease]:
+        return self._parse_lease(email, (client or self.redis).get(self.lease_prefix + email))
+
+    def _scores(self, emails: List[str]) -> List[Optional[float]]:
+        """在一次往返中查询多个账号的到期时间 (不使用 ZMSCORE，兼容 Redis 6.2 之前的版本)。"""
+        pipe = self.redis.pipeline(transaction=False)
+        for email in emails:
+            pipe.zscore(self.expiry_key, email)
+        return pipe.execute()
+
+    # --- 账号池同步 ---
+
+    def add_accounts(self, emails):
+        emails = list(emails)
+        if not emails:
+            return
+        self.redis.srem(self.retired_key, *emails)
+        for i in range(0, len(emails), self.CHUNK_SIZE):
+            chunk = emails[i:i + self.CHUNK_SIZE]
+            leased = self._scores(chunk)
+            free = [email for email, score in zip(chunk, leased) if score is None]
+            if free:
+                self.redis.sadd(self.free_key, *free)
+
+    def remove_accounts(self, emails):
+        emails = list(emails)
+        if not emails:
+            return
+        for i in range(0, len(emails), self.CHUNK_SIZE):
+            chunk = emails[i:i + self.CHUNK_SIZE]
+            self.redis.srem(self.free_key, *chunk)
+            leased = self._scores(chunk)
+            retired = [email for email, score in zip(chunk, leased) if score is not None]
+            if retired:
+                self.redis.sadd(self.retired_key, *retired)
+
+    def pool_emails(self):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.smembers(self.free_key)
+        pipe.zrange(self.expiry_key, 0, -1)
+        pipe.smembers(self.retired_key)
+        free, leased, retired = pipe.execute()
+        return {self._decode(email) for email in (set(free) | set(leased)) - set(retired)}
+
+    # --- 修改已有租约 ---
+
+    def _end_lease(self, email: str, token: Optional[str], reusable: bool,
+                   expired_before: Optional[float] = None) -> Optional[Lease]:
+        """
+        在 WATCH/MULTI 事务中结束租约，返回被结束的租约。
+
+        expired_before 不为空时只结束在该时间之前到期的租约 (回收过期租约用)。
+        """
+        key = self.lease_prefix + email
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    lease = self._load(email, pipe)
+                    if lease is None and token is None:
+                        self._end_orphan(pipe, email, reusable)
+                        return None
+                    if lease is None or (token is not None and lease.token != token) or \
+                            (expired_before is not None and lease.expires_at >= expired_before):
+                        pipe.unwatch()
+                        return None
+                    retired = pipe.sismember(self.retired_key, email)
+                    pipe.multi()
+                    pipe.delete(key, self.token_prefix + lease.token)
+                    pipe.zrem(self.expiry_key, email)
+                    if retired:
+                        pipe.srem(self.retired_key, email)
+                    elif reusable:
+                        pipe.sadd(self.free_key, email)
+                    else:
+                        pipe.srem(self.free_key, email)
+                    pipe.execute()
+                    return lease
+                except self._watch_error:
+                    continue
+
+    def _end_orphan(self, pipe, email: str, reusable: bool):
+        """
+        处理有序集合中没有租约键的条目 (分配进程在写入租约键之前退出)，调用方已 WATCH 租约键。
+
+        租约被正常结束时有序集合条目会在同一个事务中删除，所以这里看不到它们。
+        """
+        orphan = pipe.zscore(self.expiry_key, email) is not None
+        retired = orphan and pipe.sismember(self.retired_key, email)
+        pipe.multi()
+        pipe.zrem(self.expiry_key, email)
+        if retired:
+            pipe.srem(self.retired_key, email)
+        elif not reusable:
+            pipe.srem(self.free_key, email)
+        elif orphan:
+            pipe.sadd(self.free_key, email)
+        pipe.execute()
+
+    def _reap(self, now: float) -> List[str]:
+        expired = []
+        candidates = self.redis.zrangebyscore(self.expiry_key, '-inf', f"({now!r}", start=0, num=self.REAP_BATCH)
+        for email in candidates:
+            email = self._decode(email)
+            if self._end_lease(email, None, reusable=True, expired_before=now) is not None:
+                expired.append(email)
+        return expired
+
+    # --- 分配 ---
+
+    def _allocate_batch(self, count, now, duration):
+        expired = self._reap(now)
+        leases = []
+        while len(leases) < count:
+            popped = self.redis.spop(self.free_key, count - len(leases))
+            if not popped:
+                break
+            for email in popped:
+                email = self._decode(email)
+                lease = Lease(email, now, now + duration, duration=duration)
+                if not self.redis.zadd(self.expiry_key, {email: lease.expires_at}, nx=True):
+                    # 已经被其他进程租用 (空闲集合中的重复条目)，租约结束时会重新放回
+                    continue
+                pipe = self.redis.pipeline()
+                pipe.set(self.lease_prefix + email, self._encode_lease(lease))
+                pipe.set(self.token_prefix + lease.token, email)
+                pipe.execute()
+                leases.append(lease)
+
+        self._expired(expired)
+        for lease in leases:
+            self._record('record_allocate', lease)
+        return leases
+
+    # --- 查询与修改 ---
+
+    def get(self, email, now=None):
+        now = now if now is not None else time.time()
+        lease = self._load(email)
+        if lease is None or lease.is_expired(now):
+            return None
+        return lease
+
+    def get_by_token(self, token, now=None):
+        email = self._decode(self.redis.get(self.token_prefix + token))
+        if email is None:
+            return None
+        lease = self.get(email, now)
+        if lease is None or lease.token != token:
+            return None
+        return lease
+
+    def renew(self, email, duration=None, now=None, token=None):
+        now = now if now is not None else time.time()
+        key = self.lease_prefix + email
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    lease = self._load(email, pipe)
+                    if lease is None or lease.is_expired(now) or (token is not None and lease.token != token):
+                        pipe.unwatch()
+                        return None
+                    if duration is not None:
+                        lease.duration = duration
+                    lease.expires_at = now + lease.duration
+                    pipe.multi()
+                    pipe.set(key, self._encode_lease(lease))
+                    pipe.zadd(self.expiry_key, {email: lease.expires_at})
+                    pipe.execute()
+                    break
+                except self._watch_error:
+                    continue
+        self._record('record_renew', lease)
+        return lease
+
+    def release(self, email, token=None):
+        released = self._end_lease(email, token, reusable=True) is not None
+        if released:
+            self._record('record_release', email)
+        return released
+
+    def mark_used(self, email, token=None):
+        if token is None:
+            self.redis.srem(self.free_key, email)
+        ended = self._end_lease(email, token, reusable=False) is not None
+        if ended:
+            self._record('record_mark_used', email)
+        return ended
+
+    def leased_emails(self, now=None):
+        now = now if now is not None else time.time()
+        return [self._decode(email) for email in self.redis.zrangebyscore(self.expiry_key, now, '+inf')]
+
+    def clear(self):
+        for email in self.redis.zrange(self.expiry_key, 0, -1):
+            self._end_lease(self._decode(email), None, reusable=True)
+
+    def stats(self):
+        return {
+            "free": self.redis.scard(self.free_key),
+            "leased": self.redis.zcard(self.expiry_key),
+            "waiters": self._waiting,
+        }
+
+    def close(self):
+        self.redis.close()
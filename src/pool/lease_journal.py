@@ -0,0 +1,166 @@
+"""
+租约日志模块
+- 只追加的租约日志，记录分配/续期/释放/标记已使用/过期
+- 启动时重放日志恢复租约表，服务重启或崩溃后不会丢失或重复分配租约
+- 日志条数超过阈值时，把当前有效租约写成快照并原子替换旧日志 (压缩)
+
+日志格式为每行一条记录，字段以制表符分隔:
+    A  email  leased_at  expires_at  token  duration    分配
+    R  email  leased_at  expires_at  token  duration    续期
+    F  email                                             释放
+    U  email                                             标记为已使用
+    E  email                                             过期回收
+"""
+
+import os
+import time
+import logging
+import pathlib
+from typing import Dict, Iterable, Optional, Tuple
+
+JOURNAL_HEADER = "#LEASE-JOURNAL 1\n"
+
+
+class LeaseJournal:
+    """
+    只追加的租约日志。
+
+    写入方法不自行加锁，由 LeaseAllocator 在持有其锁时调用，以保证记录顺序与内存状态一致。
+    """
+
+    def __init__(self, path, fsync: bool = False, compact_min_records: int = 10000, compact_ratio: int = 4):
+        """
+        Args:
+            path: 日志文件路径。
+            fsync: 每条记录后是否调用 fsync (更安全但更慢，默认只 flush 到操作系统)。
+            compact_min_records: 触发压缩的最少记录数。
+            compact_ratio: 记录数超过有效租约数的多少倍时触发压缩。
+        """
+        self.path = pathlib.Path(path)
+        self.fsync = fsync
+        self.compact_min_records = compact_min_records
+        self.compact_ratio = compact_ratio
+        self._fh = None
+        self._records = 0
+
+    # --- 重放 ---
+
+    def replay(self, now: Optional[float] = None) -> Dict[str, Tuple[float, float, str, float]]:
+        """
+        重放日志，返回仍然有效的租约 {email: (leased_at, expires_at, token, duration)}。
+
+        旧版本日志中没有 token/duration 字段时，token 为空字符串，duration 取 expires_at - leased_at。
+
+        末尾不完整的行 (写入时崩溃) 和无法解析的行会被跳过。
+        """
+        now = now if now is not None else time.time()
+        if not self.path.exists():
+            return {}
+
+        start = time.perf_counter()
+        with open(self.path, 'r', encoding='utf-8', newline='\n') as f:
+            lines = f.read().split('\n')
+        # 最后一个元素要么是空字符串 (正常结尾)，要么是写到一半的记录
+        skipped = 1 if lines[-1] else 0
+        del lines[-1]
+
+        # 每个邮箱只保留最后一条记录；A/R 记录格式相同，浮点数只在最后对存活的租约解析
+        latest: Dict[str, str] = {}
+        pop = latest.pop
+        for line in lines:
+            op, _, rest = line.partition('\t')
+            if op == 'A' or op == 'R':
+                email, _, times = rest.partition('\t')
+                latest[email] = times
+            elif op == 'F' or op == 'U' or op == 'E':
+                pop(rest, None)
+            elif op and op[0] != '#':
+                skipped += 1
+
+        leases: Dict[str, Tuple[float, float, str, float]] = {}
+        expired = 0
+        for email, fields in latest.items():
+            parts = fields.split('\t')
+            try:
+                expiry = float(parts[1])
+                if expiry < now:
+                    expired += 1
+                    continue
+                leased_at = float(parts[0])
+                token = parts[2] if len(parts) > 2 else ''
+                duration = float(parts[3]) if len(parts) > 3 else expiry - leased_at
+                leases[email] = (leased_at, expiry, token, duration)
+            except (IndexError, ValueError):
+                skipped += 1
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logging.info(f"租约日志重放完成: {len(lines)} 条记录，恢复 {len(leases)} 个有效租约 "
+                     f"(丢弃 {expired} 个已过期，跳过 {skipped} 行)，耗时 {elapsed_ms:.1f} ms")
+        return leases
+
+    # --- 写入 ---
+
+    def open(self, leases: Iterable = ()):
+        """以当前有效租约为快照重写日志，然后打开文件准备追加。"""
+        self.compact(leases)
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+
+    def _write(self, line: str):
+        if self._fh is None:
+            return
+        self._fh.write(line)
+        self._fh.flush()
+        if self.fsync:
+            os.fsync(self._fh.fileno())
+        self._records += 1
+
+    @staticmethod
+    def _lease_line(op: str, lease) -> str:
+        return f"{op}\t{lease.email}\t{lease.leased_at:.3f}\t{lease.expires_at:.3f}\t{lease.token}\t{lease.duration:g}\n"
+
+    def record_allocate(self, lease):
+        self._write(self._lease_line('A', lease))
+
+    def record_renew(self, lease):
+        self._write(self._lease_line('R', lease))
+
+    def record_release(self, email: str):
+        self._write(f"F\t{email}\n")
+
+    def record_mark_used(self, email: str):
+        self._write(f"U\t{email}\n")
+
+    def record_expire(self, email: str):
+        self._write(f"E\t{email}\n")
+
+    # --- 压缩 ---
+
+    def should_compact(self, live_count: int) -> bool:
+        return self._records > max(self.compact_min_records, self.compact_ratio * live_count)
+
+    def compact(self, leases: Iterable):
+        """把有效租约写入临时文件并原子替换日志文件。"""
+        start = time.perf_counter()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        count = 0
+        with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(JOURNAL_HEADER)
+            lines = []
+            for lease in leases:
+                lines.append(self._lease_line('A', lease))
+            f.write(''.join(lines))
+            count = len(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.close()
+        os.replace(tmp_path, self.path)
+        self._fh = open(self.path, 'a', encoding='utf-8', newline='\n')
+        self._records = count
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logging.info(f"租约日志已压缩: 保留 {count} 个有效租约，耗时 {elapsed_ms:.1f} ms")
@@ -46,6 +46,17 @@ def get_data_dir(subdir=None):
 # 定义路径 (使用新的辅助函数)
 OUTPUT_DIR = get_data_dir('oauth')
 
+def get_sqlite_store():
+    """ACCOUNT_STORE=sqlite 时返回 SQLite 账号库，否则返回 None。"""
+    if os.getenv('ACCOUNT_STORE', 'files').lower() != 'sqlite':
+        return None
+    project_root = pathlib.Path(__file__).resolve().parent.parent.parent
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    from src.pool.account_store import SqliteAccountStore
+    db_path = os.getenv('ACCOUNT_DB_PATH') or get_data_dir() / 'accounts.db'
+    return SqliteAccountStore(db_path, refresh_interval=0)
+
 def convert_txt_to_json(input_file_path_str):
     """
     读取指定的文本文件，将每一行账户信息解析并保存为单独的 JSON 文件。
@@ -53,6 +64,11 @@ def convert_txt_to_json(input_file_path_str):
     """
     input_file_path = pathlib.Path(input_file_path_str).resolve()
     logging.info(f"开始处理输入文件: {input_file_path}")
+
+    store = get_sqlite_store()
+    if store is not None:
+        return import_txt_to_sqlite(input_file_path, store)
+
     logging.info(f"JSON 文件将输出到目录: {OUTPUT_DIR}")
 
     # 确保输出目录存在
@@ -159,6 +175,70 @@ def convert_txt_to_json(input_file_path_str):
         "skippedCount": skipped_conversions
     }
 
+def import_txt_to_sqlite(input_file_path, store):
+    """
+    读取文本文件并在一个事务中批量导入 SQLite 账号库，重复邮箱由主键索引跳过。
+    返回与 convert_txt_to_json 相同格式的结果字典。
+    """
+    logging.info(f"账号将导入 SQLite 账号库: {store.db_path}")
+    total_lines = 0
+    failed_conversions = 0
+    errors = []
+    accounts = []
+
+    try:
+        with open(input_file_path, 'r', encoding='utf-8') as infile:
+            for i, line in enumerate(infile):
+                total_lines += 1
+                line = line.strip()
+                if not line:
+                    logging.warning(f"第 {i + 1} 行是空行，已跳过。")
+                    continue
+                parts = line.split('----')
+                if len(parts) >= 4:
+                    accounts.append({
+                        "email": parts[0],
+                        "password": parts[1],
+                        "client_id": parts[2],
+                        "refresh_token": parts[3]
+                    })
+                else:
+                    error_msg = f"第 {i + 1} 行格式错误 (预期至少 4 部分，实际 {len(parts)} 部分)"
+                    logging.error(error_msg + f": {line}")
+                    errors.append(error_msg)
+                    failed_conversions += 1
+    except FileNotFoundError:
+        error_msg = f"输入文件未找到: {input_file_path}"
+        logging.error(error_msg)
+        return {"success": False, "error": error_msg, "total": 0, "successCount": 0, "failedCount": 0, "skippedCount": 0}
+    except Exception as e:
+        error_msg = f"读取输入文件 {input_file_path} 时发生错误: {e}"
+        logging.error(error_msg)
+        return {"success": False, "error": error_msg, "total": total_lines, "successCount": 0, "failedCount": failed_conversions, "skippedCount": 0}
+
+    try:
+        inserted, skipped = store.import_accounts(accounts)
+    except Exception as e:
+        error_msg = f"写入 SQLite 账号库时发生错误: {e}"
+        logging.error(error_msg)
+        return {"success": False, "error": error_msg, "total": total_lines, "successCount": 0, "failedCount": failed_conversions + len(accounts), "skippedCount": 0}
+
+    logging.info("="*30 + " 处理完成 " + "="*30)
+    logging.info(f"总共处理行数: {total_lines}")
+    logging.info(f"成功导入账号数: {inserted}")
+    logging.info(f"跳过重复邮箱数: {skipped}")
+    logging.info(f"失败行数: {failed_conversions}")
+    logging.info("="*60)
+
+    return {
+        "success": failed_conversions == 0,
+        "error": "; ".join(errors) if errors else None,
+        "total": total_lines,
+        "successCount": inserted,
+        "failedCount": failed_conversions,
+        "skippedCount": skipped
+    }
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Convert email account text file to JSON files.')
     parser.add_argument('--input-file', type=str, required=True,
@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import pathlib
+import logging
+import argparse
+
+# 配置日志记录 - 与 convert_txt_to_json 一致，日志输出到 stderr
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+project_root = pathlib.Path(__file__).resolve().parent.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.utils.convert_txt_to_json import get_data_dir
+from src.pool.account_store import SqliteAccountStore
+
+def migrate_oauth_to_sqlite(oauth_dir=None, db_path=None):
+    """
+    把 data/oauth 目录下的账号文件迁移到 SQLite 账号库。
+
+    *.json 导入为可用账号，*.json.used 导入为已使用账号，*.json.quarantined 导入为已隔离账号；
+    已存在的邮箱会被跳过，原文件保持不变。
+
+    Args:
+        oauth_dir: 账号文件目录，默认为 data/oauth。
+        db_path: 数据库路径，默认为 ACCOUNT_DB_PATH 或 data/accounts.db。
+
+    Returns:
+        包含处理结果的字典。
+    """
+    oauth_dir = pathlib.Path(oauth_dir) if oauth_dir else get_data_dir('oauth')
+    db_path = db_path or os.getenv('ACCOUNT_DB_PATH') or get_data_dir() / 'accounts.db'
+    logging.info(f"开始迁移账号文件: {oauth_dir} -> {db_path}")
+
+    if not oauth_dir.is_dir():
+        error_msg = f"账号目录不存在: {oauth_dir}"
+        logging.error(error_msg)
+        return {"success": False, "error": error_msg, "total": 0, "successCount": 0, "failedCount": 0, "skippedCount": 0}
+
+    store = SqliteAccountStore(db_path, refresh_interval=0)
+    result = store.migrate_from_dir(oauth_dir)
+    result["error"] = None if result["success"] else "部分账号文件无法导入，详见日志"
+    result["states"] = store.count_by_state()
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Migrate data/oauth account files into the SQLite account store.')
+    parser.add_argument('--oauth-dir', type=str, default=None, help='Directory containing *.json / *.json.used account files.')
+    parser.add_argument('--db', type=str, default=None, help='Path of the SQLite database (default: data/accounts.db).')
+    args = parser.parse_args()
+
+    result = migrate_oauth_to_sqlite(args.oauth_dir, args.db)
+    print(json.dumps(result, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
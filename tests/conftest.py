@@ -0,0 +1,66 @@
+"""
+测试共用的 fixture: 使用临时账号目录和独立租约分配器的 email_service 测试客户端，
+以及 cloud_email_api 连接的本地 IMAP 服务器
+"""
+
+import types
+
+import pytest
+
+from src.pool.account_store import FileAccountStore
+from src.pool.lease_allocator import LeaseAllocator
+
+from tests.fake_imap import FakeImapServer
+from tests.helpers import write_account
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """
+    email_service 的 Flask 测试客户端，账号池为 tmp_path/oauth 下的 user0..user4@x.com。
+
+    返回的对象包含 client、module (email_service)、allocator、store、oauth_dir 以及 add_accounts(emails)。
+    """
+    from src import email_service
+
+    oauth_dir = tmp_path / 'oauth'
+    oauth_dir.mkdir()
+    for i in range(5):
+        write_account(oauth_dir, f'user{i}@x.com')
+    allocator = LeaseAllocator(600, max_waiters=2)
+    store = FileAccountStore(oauth_dir, refresh_interval=0)
+    store.open(allocator.sync)
+    monkeypatch.setattr(email_service, 'lease_allocator', allocator)
+    monkeypatch.setattr(email_service, 'account_store', store)
+    monkeypatch.setattr(email_service, 'latest_email_cache', {})
+
+    def add_accounts(emails):
+        for email in emails:
+            write_account(oauth_dir, email)
+        store.index.refresh(force=True)
+
+    return types.SimpleNamespace(client=email_service.app.test_client(), module=email_service,
+                                 allocator=allocator, store=store, oauth_dir=oauth_dir, add_accounts=add_accounts)
+
+
+@pytest.fixture
+def imap_server(monkeypatch):
+    """
+    空邮箱的本地 IMAP 服务器；cloud_email_api 改为连接它 (明文、固定的访问令牌)，
+    并使用新的连接池和已解析邮件缓存。
+    """
+    from src.api import cloud_email_api
+    from src.api.imap_pool import ImapConnectionPool
+    from src.api.message_cache import MessageCache
+
+    server = FakeImapServer([]).start()
+    monkeypatch.setattr(cloud_email_api, 'IMAP_SERVER', '127.0.0.1')
+    monkeypatch.setattr(cloud_email_api, 'IMAP_PORT', server.port)
+    monkeypatch.setattr(cloud_email_api, 'IMAP_USE_SSL', False)
+    monkeypatch.setattr(cloud_email_api, 'UPSTREAM_BACKEND', 'sync')
+    monkeypatch.setattr(cloud_email_api, '_token_for', lambda *args: 'token')
+    monkeypatch.setattr(cloud_email_api, 'imap_pool', ImapConnectionPool())
+    monkeypatch.setattr(cloud_email_api, 'message_cache', MessageCache())
+    yield server
+    cloud_email_api.imap_pool.close_all()
+    server.stop()
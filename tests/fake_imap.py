@@ -0,0 +1,221 @@
+"""
+测试用的本地 IMAP 服务器 (明文，不校验 XOAUTH2 令牌)
+
+只实现服务用到的命令: CAPABILITY、AUTHENTICATE、SELECT/EXAMINE、NOOP、SEARCH、FETCH、
+UID SEARCH/FETCH/STORE/EXPUNGE、STORE、EXPUNGE、CLOSE、LOGOUT 和 IDLE。
+消息序号与 UID 相同 (从 1 开始)，UIDVALIDITY 固定为 UIDVALIDITY。
+"""
+
+import re
+import time
+import email
+import imaplib
+import threading
+import socketserver
+from typing import Dict, List
+
+UIDVALIDITY = 7
+
+
+def message(subject: str = 'Code 123456', body: str = 'Your code is 123456', sender: str = 'sender@example.com',
+            date: str = 'Mon, 1 Jan 2024 00:00:00 +0000', content_type: str = 'text/plain') -> bytes:
+    """生成一封简单的单部分邮件。"""
+    return (f"From: {sender}\r\nTo: user@x.com\r\nSubject: {subject}\r\nDate: {date}\r\n"
+            f"Content-Type: {content_type}; charset=utf-8\r\n\r\n{body}\r\n").encode()
+
+
+MESSAGE = message()
+
+_HEADER_FIELDS_RE = re.compile(r'HEADER\.FIELDS \(([^)]*)\)')
+_PARTIAL_RE = re.compile(r'BODY\.PEEK\[([\d.]+)\]<0\.(\d+)>')
+
+
+def _quote(value) -> str:
+    if value is None:
+        return 'NIL'
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _bodystructure(msg) -> str:
+    if msg.is_multipart():
+        return '(' + ''.join(_bodystructure(part) for part in msg.get_payload()) + \
+               f' {_quote(msg.get_content_subtype().upper())})'
+    params = []
+    for name, value in (msg.get_params() or [])[1:]:
+        params += [_quote(name.upper()), _quote(value)]
+    body = msg.get_payload()
+    encoding = (msg.get('Content-Transfer-Encoding') or '7BIT').upper()
+    return (f"({_quote(msg.get_content_maintype().upper())} {_quote(msg.get_content_subtype().upper())} "
+            f"({' '.join(params) or 'NIL'}) NIL NIL {_quote(encoding)} {len(body.encode())} {body.count(chr(10))})")
+
+
+def _section(msg, section: str) -> bytes:
+    for number in section.split('.'):
+        if msg.is_multipart():
+            msg = msg.get_payload()[int(number) - 1]
+    return msg.get_payload().encode()
+
+
+def fetch_response(raw: bytes, number: int, items: str) -> bytes:
+    """按请求的数据项生成一条 FETCH 响应 (总是附带 UID)。"""
+    msg = email.message_from_bytes(raw)
+    items = items.upper()
+    out = [f"* {number} FETCH (UID {number}".encode()]
+    if 'BODYSTRUCTURE' in items:
+        out.append(b' BODYSTRUCTURE ' + _bodystructure(msg).encode())
+    match = _HEADER_FIELDS_RE.search(items)
+    if match:
+        fields = match.group(1).split()
+        header = (''.join(f"{k}: {v}\r\n" for k, v in msg.items() if k.upper() in fields) + "\r\n").encode()
+        out.append(f" BODY[HEADER.FIELDS ({match.group(1)})] {{{len(header)}}}\r\n".encode() + header)
+    match = _PARTIAL_RE.search(items)
+    if match:
+        data = _section(msg, match.group(1))[:int(match.group(2))]
+        out.append(f" BODY[{match.group(1)}]<0> {{{len(data)}}}\r\n".encode() + data)
+    if 'RFC822' in items:
+        out.append(f" RFC822 {{{len(raw)}}}\r\n".encode() + raw)
+    return b''.join(out) + b")\r\n"
+
+
+def expand(message_set: str, count: int) -> List[int]:
+    """展开 1:3,5,7:* 形式的序号集合。"""
+    numbers = []
+    for piece in message_set.split(','):
+        low, _, high = piece.partition(':')
+        low = count if low == '*' else int(low)
+        high = count if high == '*' else int(high or low)
+        low, high = min(low, high), max(low, high)
+        numbers += range(low, min(high, count) + 1)
+    return numbers
+
+
+class MailboxState:
+    """服务器状态，所有连接共享。"""
+
+    def __init__(self, messages: List[bytes]):
+        self.messages = list(messages)
+        self.lock = threading.Lock()
+        # 命令名称 (如 'UID FETCH') 和带参数的完整命令
+        self.commands: List[str] = []
+        self.lines: List[str] = []
+        self.connections = 0
+        # 命令名称 -> 响应前等待的秒数，用于模拟慢服务器
+        self.delays: Dict[str, float] = {}
+        self.idlers: List['Handler'] = []
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def send(self, data):
+        self.wfile.write(data if isinstance(data, bytes) else data.encode())
+
+    def handle(self):
+        state = self.server.state
+        with state.lock:
+            state.connections += 1
+        self.send("* OK fake IMAP ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.decode().strip().split(' ', 2)
+            tag, command = parts[0], parts[1].upper()
+            arg = parts[2] if len(parts) > 2 else ''
+            if command == 'UID':
+                command = 'UID ' + arg.split(' ', 1)[0].upper()
+                arg = arg.split(' ', 1)[1] if ' ' in arg else ''
+            with state.lock:
+                state.commands.append(command)
+                state.lines.append(f"{command} {arg}")
+                messages = list(state.messages)
+            if state.delays.get(command):
+                time.sleep(state.delays[command])
+            if not self.dispatch(state, tag, command, arg, messages):
+                return
+
+    def dispatch(self, state, tag, command, arg, messages) -> bool:
+        count = len(messages)
+        if command == 'CAPABILITY':
+            self.send(f"* CAPABILITY IMAP4rev1 AUTH=XOAUTH2 IDLE UIDPLUS\r\n{tag} OK done\r\n")
+        elif command == 'AUTHENTICATE':
+            self.send("+ \r\n")
+            self.rfile.readline()
+            self.send(f"{tag} OK authenticated\r\n")
+        elif command in ('SELECT', 'EXAMINE'):
+            self.send(f"* {count} EXISTS\r\n* 0 RECENT\r\n* OK [UIDVALIDITY {UIDVALIDITY}] ok\r\n"
+                      f"* OK [UIDNEXT {count + 1}] ok\r\n{tag} OK [READ-WRITE] done\r\n")
+        elif command in ('NOOP', 'CLOSE', 'STORE', 'UID STORE'):
+            self.send(f"{tag} OK done\r\n")
+        elif command == 'SEARCH':
+            self.send("* SEARCH " + ' '.join(str(i) for i in range(1, count + 1)) + f"\r\n{tag} OK done\r\n")
+        elif command == 'UID SEARCH':
+            low = arg.split()[-1].split(':')[0]
+            low = count if low == '*' else int(low)
+            uids = [uid for uid in range(1, count + 1) if uid >= low]
+            if not uids and count and arg.split()[-1].endswith('*'):
+                # n:* 总是至少包含最大的 UID
+                uids = [count]
+            self.send("* SEARCH " + ' '.join(map(str, uids)) + f"\r\n{tag} OK done\r\n")
+        elif command in ('FETCH', 'UID FETCH'):
+            message_set, items = arg.split(' ', 1)
+            for number in expand(message_set, count):
+                self.send(fetch_response(messages[number - 1], number, items))
+            self.send(f"{tag} OK done\r\n")
+        elif command in ('EXPUNGE', 'UID EXPUNGE'):
+            with state.lock:
+                state.messages = []
+            self.send("* 1 EXPUNGE\r\n" * count + f"{tag} OK done\r\n")
+        elif command == 'LOGOUT':
+            self.send(f"* BYE bye\r\n{tag} OK done\r\n")
+            return False
+        elif command == 'IDLE':
+            self.send("+ idling\r\n")
+            with state.lock:
+                state.idlers.append(self)
+            done = self.rfile.readline()
+            with state.lock:
+                if self in state.idlers:
+                    state.idlers.remove(self)
+            if not done:
+                return False
+            self.send(f"{tag} OK IDLE terminated\r\n")
+        else:
+            self.send(f"{tag} BAD unknown command\r\n")
+        return True
+
+
+def connect(port: int, user: str = 'user@x.com') -> imaplib.IMAP4:
+    """建立已认证的明文连接 (服务器不校验令牌)。"""
+    mail = imaplib.IMAP4('127.0.0.1', port)
+    mail.authenticate('XOAUTH2', lambda _: f"user={user}\1auth=Bearer token\1\1".encode())
+    return mail
+
+
+class FakeImapServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, messages: List[bytes]):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.state = MailboxState(messages)
+        self.port = self.server_address[1]
+
+    def start(self) -> 'FakeImapServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def deliver(self, raw: bytes = MESSAGE):
+        """投递一封新邮件并向所有 IDLE 连接推送 EXISTS。"""
+        with self.state.lock:
+            self.state.messages.append(raw)
+            count = len(self.state.messages)
+            idlers = list(self.state.idlers)
+        for handler in idlers:
+            try:
+                handler.send(f"* {count} EXISTS\r\n")
+            except OSError:
+                pass
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
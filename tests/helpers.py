@@ -0,0 +1,14 @@
+"""
+测试辅助函数
+"""
+
+import json
+
+from src.pool.account_index import filename_from_email
+
+
+def write_account(oauth_dir, email, suffix=''):
+    """在账号目录中写入一个账号文件，suffix 为 '.used' 时写入已使用的账号。"""
+    path = oauth_dir / (filename_from_email(email) + suffix)
+    path.write_text(json.dumps({"email": email, "refresh_token": "rt", "client_id": "cid"}), encoding='utf-8')
+    return path
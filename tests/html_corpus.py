@@ -0,0 +1,65 @@
+"""
+HTML 转文本测试样本: 营销邮件风格的 HTML 生成器 (<style> 块、多层嵌套表格、行内样式、Outlook 条件注释、
+跟踪像素、实体、<script>) 和一组边界情况，tests/test_html_text.py 和 scripts/bench_html_text.py 共用
+"""
+
+
+STYLE = ('<style type="text/css">body{margin:0;padding:0}table,td{border-collapse:collapse}'
+         '.btn a{color:#fff!important}@media only screen and (max-width:600px){.col{width:100%!important}}'
+         + ''.join(f'.c{i}{{font-size:{12 + i % 6}px;line-height:{18 + i % 5}px;color:#{i * 997 % 0xffffff:06x}}}'
+                   for i in range(60)) + '</style>')
+WORDS = ('sale', 'new', 'arrivals', 'your', 'account', 'exclusive', 'offer', 'free', 'shipping', 'members', 'today',
+         'only', 'limited', 'collection', 'verify', 'security', 'code', 'don’t', 'miss', 'out')
+
+EDGE_CASES = [
+    '<HTML><BODY><TABLE><TR><TD>Upper <B>case</B></TD></TR></TABLE></BODY></HTML>',
+    '<p>Unclosed paragraph<p>another <div>and a div',
+    '<a href="https://example.com/?a=1&b=2" title="x > y">Link &gt; text</a>',
+    '<p>AT&T &amp Co &copy 2024 &#8364;5 &#x20AC;6 &nbsp;&nbsp;spaced &unknown entity</p>',
+    '<p>if a < b and c > d then</p><p>5 <3 hearts</p>',
+    '<div><![CDATA[cdata text]]></div><!-- comment --><!--[if mso]><table><tr><td>mso</td></tr></table><![endif]-->',
+    '<pre>  keep   this\n    indent</pre><p>after   pre</p>',
+    '<script>if (a < b) { document.write("<p>x</p>") }</script><p>visible</p><style>p{}</style>',
+    '<br/><br /><img src="x.png" alt="alt text"/><hr>Text after hr',
+    '<table><tr><td>Security code:</td><td><span style="font-size:32px">482913</span></td></tr></table>',
+    '<p>unterminated <b>bold <i>italic</p> tail',
+    '<template><p>hidden template</p></template><p>shown</p>',
+    '',
+]
+
+
+def marketing_html(rng, target_bytes):
+    """生成大约 target_bytes 字节的营销邮件 HTML。"""
+    parts = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>Weekly deals</title>', STYLE,
+             '</head><body style="margin:0;padding:0;background:#f4f4f4">',
+             '<div style="display:none;max-height:0;overflow:hidden">Preheader text&nbsp;&zwnj;&nbsp;&zwnj;</div>',
+             '<!--[if mso]><table role="presentation" width="600"><tr><td><![endif]-->']
+    size = sum(len(part) for part in parts)
+    row = 0
+    while size < target_bytes:
+        row += 1
+        words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 14)))
+        cells = ''.join(
+            f'<td class="col c{rng.randint(0, 59)}" width="{rng.choice((180, 200, 300))}" valign="top" '
+            f'style="padding:{rng.randint(4, 24)}px;font-family:Arial,Helvetica,sans-serif;color:#333333">'
+            f'<a href="https://click.example.com/t?u={rng.getrandbits(64):x}&amp;r={row}" target="_blank" '
+            f'style="text-decoration:none;color:#1a73e8"><img src="https://cdn.example.com/p/{row}.jpg" width="180" '
+            f'alt="Product {row}" style="display:block;border:0"></a>'
+            f'<p style="margin:0 0 8px 0">{words.capitalize()} &ndash; ${rng.randint(5, 500)}.{rng.randint(0, 99):02d}'
+            f'&nbsp;<s>${rng.randint(10, 900)}</s></p></td>'
+            for _ in range(rng.randint(1, 3)))
+        html = (f'<table role="presentation" width="100%" cellpadding="0" cellspacing="0" border="0"><tr>{cells}</tr>'
+                f'</table>\n')
+        if row % 15 == 0:
+            html += f'<!-- section {row} --><table><tr><td class="btn"><a href="#">Shop&nbsp;now &rsaquo;</a></td></tr></table>\n'
+        parts.append(html)
+        size += len(html)
+    parts.append('<!--[if mso]></td></tr></table><![endif]--><p>&copy; 2024 Example Inc. &middot; '
+                 '<a href="https://example.com/unsubscribe">Unsubscribe</a></p>'
+                 '<img src="https://t.example.com/open.gif" width="1" height="1">'
+                 '<script type="application/ld+json">{"@context":"http://schema.org"}</script></body></html>')
+    return ''.join(parts)
+
+
+def squash(text):
+    return ''.join(text.split())
@@ -0,0 +1,113 @@
+"""
+账号索引测试: 目录扫描、mtime 差异刷新和变化通知
+"""
+
+import os
+
+from src.pool.account_index import AccountIndex, email_from_filename, filename_from_email, scan_account_dir
+from src.pool.account_store import FileAccountStore
+
+from tests.helpers import write_account
+
+
+def age_dir(path, seconds=60):
+    """把目录 mtime 调到过去，模拟上次扫描之后目录没有变化。"""
+    past = os.stat(path).st_mtime - seconds
+    os.utime(path, (past, past))
+
+
+def test_filename_round_trip():
+    assert filename_from_email('user@example.com') == 'user_at_example.com.json'
+    assert email_from_filename('user_at_example.com.json') == 'user@example.com'
+    assert email_from_filename('user_at_example.com.json.used') is None
+    assert email_from_filename('notes.json') is None
+
+
+def test_scan_skips_used_files_and_directories(tmp_path):
+    write_account(tmp_path, 'a@x.com')
+    write_account(tmp_path, 'b@x.com', '.used')
+    (tmp_path / filename_from_email('c@x.com')).mkdir()
+    (tmp_path / 'readme.txt').write_text('x')
+    assert scan_account_dir(tmp_path) == {'a@x.com'}
+
+
+def test_build_notifies_listener(tmp_path):
+    for email in ('a@x.com', 'b@x.com'):
+        write_account(tmp_path, email)
+    index = AccountIndex(tmp_path, refresh_interval=0)
+    changes = []
+    index.add_listener(lambda added, removed: changes.append((added, removed)))
+    assert index.build() == 2
+    assert changes == [({'a@x.com', 'b@x.com'}, set())]
+    assert 'a@x.com' in index and len(index) == 2
+    assert sorted(index.snapshot()) == ['a@x.com', 'b@x.com']
+
+
+def test_refresh_merges_directory_diff(tmp_path):
+    write_account(tmp_path, 'a@x.com')
+    path_b = write_account(tmp_path, 'b@x.com')
+    index = AccountIndex(tmp_path, refresh_interval=0)
+    index.build()
+    changes = []
+    index.add_listener(lambda added, removed: changes.append((added, removed)))
+
+    write_account(tmp_path, 'c@x.com')
+    os.rename(path_b, str(path_b) + '.used')
+    assert index.refresh() == ({'c@x.com'}, {'b@x.com'})
+    assert changes == [({'c@x.com'}, {'b@x.com'})]
+    assert sorted(index.snapshot()) == ['a@x.com', 'c@x.com']
+
+    # 没有变化时不通知
+    assert index.refresh(force=True) == (set(), set())
+    assert len(changes) == 1
+
+
+def test_refresh_skips_scan_when_mtime_unchanged(tmp_path):
+    write_account(tmp_path, 'a@x.com')
+    age_dir(tmp_path)
+    index = AccountIndex(tmp_path, refresh_interval=0)
+    index.build()
+
+    # 新文件出现但目录 mtime 没有变化 (上次扫描已在 mtime 两秒之后)，不会重新扫描
+    write_account(tmp_path, 'b@x.com')
+    os.utime(tmp_path, ns=(index._dir_mtime_ns, index._dir_mtime_ns))
+    assert index.refresh() == (set(), set())
+    assert index.refresh(force=True) == ({'b@x.com'}, set())
+
+
+def test_refresh_rescans_within_mtime_granularity(tmp_path):
+    write_account(tmp_path, 'a@x.com')
+    index = AccountIndex(tmp_path, refresh_interval=0)
+    index.build()
+    # 与上次扫描处于同一秒内的改动可能不会改变 mtime，因此仍需重新扫描
+    write_account(tmp_path, 'b@x.com')
+    os.utime(tmp_path, ns=(index._dir_mtime_ns, index._dir_mtime_ns))
+    assert index.refresh() == ({'b@x.com'}, set())
+
+
+def test_add_and_discard_keep_positions_consistent(tmp_path):
+    index = AccountIndex(tmp_path, refresh_interval=0)
+    index.build()
+    emails = [f'user{i}@x.com' for i in range(50)]
+    for email in emails:
+        assert index.add(email)
+    assert not index.add(emails[0])
+    for email in emails[::3]:
+        assert index.discard(email)
+    assert not index.discard(emails[0])
+    assert index.discard_many(emails[1:6]) == set(emails[1:6]) - set(emails[::3])
+    expected = set(emails) - set(emails[::3]) - set(emails[1:6])
+    assert set(index.snapshot()) == expected
+    assert all(index._emails[pos] == email for email, pos in index._positions.items())
+
+
+def test_file_store_mark_used_renames_and_updates_index(tmp_path):
+    write_account(tmp_path, 'a@x.com')
+    store = FileAccountStore(tmp_path, refresh_interval=0)
+    removed = []
+    store.open(lambda added, gone: removed.extend(gone))
+    assert store.load_credentials('a@x.com')['client_id'] == 'cid'
+    assert store.mark_used('a@x.com') is True
+    assert 'a@x.com' not in store and removed == ['a@x.com']
+    assert (tmp_path / 'a_at_x.com.json.used').exists()
+    assert store.mark_used('a@x.com') is False
@@ -0,0 +1,153 @@
+"""
+账号存储测试: SQLite 账号库的加载、增量发现、标记已使用、隔离、租约状态同步以及从账号目录迁移
+"""
+
+import threading
+
+import pytest
+
+from src.pool.account_index import filename_from_email
+from src.pool.account_store import (
+    STATE_AVAILABLE, STATE_LEASED, STATE_QUARANTINED, STATE_USED,
+    AccountNotFoundError, FileAccountStore, SqliteAccountStore,
+)
+from src.pool.lease_allocator import LeaseAllocator
+
+NOW = 1_000_000.0
+
+
+def account(email):
+    return {"email": email, "client_id": "cid", "refresh_token": "rt"}
+
+
+def open_store(tmp_path, emails, leased=()):
+    store = SqliteAccountStore(tmp_path / 'accounts.db', refresh_interval=0)
+    store.import_accounts(account(email) for email in emails)
+    changes = []
+    store.open(lambda added, removed: changes.append((added, removed)), leased=leased)
+    return store, changes
+
+
+def test_open_loads_available_accounts_and_resets_stale_leases(tmp_path):
+    store = SqliteAccountStore(tmp_path / 'accounts.db', refresh_interval=0)
+    store.import_accounts([account('a@x.com'), account('b@x.com'), account('c@x.com')])
+    store.import_accounts([dict(account('d@x.com'), used_at=NOW)], state=STATE_USED)
+    store._conn().execute("UPDATE accounts SET state = ? WHERE email IN ('a@x.com', 'b@x.com')", (STATE_LEASED,))
+
+    changes = []
+    assert store.open(lambda added, removed: changes.append((added, removed)), leased=['b@x.com']) == 3
+    assert changes == [({'a@x.com', 'b@x.com', 'c@x.com'}, set())]
+    # 只有租约日志中仍然持有的租约保持 leased
+    assert store.count_by_state() == {STATE_AVAILABLE: 2, STATE_LEASED: 1, STATE_USED: 1}
+    assert 'd@x.com' not in store and len(store) == 3
+
+
+def test_refresh_discovers_imported_accounts(tmp_path):
+    store, changes = open_store(tmp_path, ['a@x.com'])
+    assert store.refresh() == set()
+    store.import_accounts([account('b@x.com'), account('a@x.com')])
+    assert store.refresh() == {'b@x.com'}
+    assert changes[-1] == ({'b@x.com'}, set())
+    assert store.refresh() == set()
+
+
+def test_mark_used_hides_credentials(tmp_path):
+    store, _ = open_store(tmp_path, ['a@x.com', 'b@x.com'])
+    assert store.load_credentials('a@x.com')['refresh_token'] == 'rt'
+    assert store.mark_used('a@x.com') is True
+    assert store.mark_used('a@x.com') is False
+    assert 'a@x.com' not in store
+    results = store.mark_used_many(['b@x.com', 'missing@x.com'])
+    assert results['b@x.com'] is True and isinstance(results['missing@x.com'], LookupError)
+    assert len(store) == 0
+
+
+def test_quarantine_removes_account_from_pool(tmp_path):
+    store, changes = open_store(tmp_path, ['a@x.com', 'b@x.com'])
+    assert store.quarantine('a@x.com') is True
+    assert changes[-1] == (set(), {'a@x.com'})
+    assert store.quarantine('a@x.com') is False
+    assert store.count_by_state() == {STATE_AVAILABLE: 1, STATE_QUARANTINED: 1}
+    # 被拒绝的刷新令牌不会再被读出
+    with pytest.raises(AccountNotFoundError):
+        store.load_credentials('a@x.com')
+    # 隔离的账号不会被清理
+    assert store.cleanup_used(max_age_hours=0) == 0
+
+
+def test_lease_events_are_mirrored_and_quarantine_survives_release(tmp_path):
+    allocator = LeaseAllocator(60)
+    store = SqliteAccountStore(tmp_path / 'accounts.db', refresh_interval=0)
+    store.import_accounts([account('a@x.com'), account('b@x.com')])
+    allocator.add_observer(store)
+    store.open(allocator.sync)
+
+    first = allocator.allocate(now=NOW)
+    second = allocator.allocate(now=NOW)
+    allocator.flush()
+    assert store.count_by_state() == {STATE_LEASED: 2}
+    assert store.quarantine(first.email) is True
+    allocator.release(first.email)
+    allocator.release(second.email)
+    allocator.flush()
+    assert store.count_by_state() == {STATE_AVAILABLE: 1, STATE_QUARANTINED: 1}
+    # 被隔离的账号在租约结束后不再回到空闲池
+    assert allocator.allocate(now=NOW).email == second.email
+    assert allocator.allocate(now=NOW) is None
+
+
+def test_concurrent_refresh_and_mark_used_keep_available_set_consistent(tmp_path):
+    store, _ = open_store(tmp_path, [f'user{i}@x.com' for i in range(200)])
+    errors = []
+
+    def importer():
+        try:
+            for batch in range(20):
+                store.import_accounts(account(f'new{batch}-{i}@x.com') for i in range(10))
+                store.refresh()
+        except Exception as e:
+            errors.append(e)
+
+    def marker(offset):
+        try:
+            for i in range(offset, 200, 4):
+                store.mark_used(f'user{i}@x.com')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=importer)] + [threading.Thread(target=marker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.refresh()
+    assert errors == []
+    assert len(store) == 200
+    assert store.count_by_state() == {STATE_AVAILABLE: 200, STATE_USED: 200}
+
+
+def test_file_store_quarantine_renames_file(tmp_path):
+    (tmp_path / filename_from_email('a@x.com')).write_text('{"refresh_token": "rt", "client_id": "cid"}')
+    store = FileAccountStore(tmp_path, refresh_interval=0)
+    removed = []
+    store.open(lambda added, gone: removed.extend(gone))
+    assert store.quarantine('a@x.com') is True
+    assert removed == ['a@x.com'] and 'a@x.com' not in store
+    assert (tmp_path / 'a_at_x.com.json.quarantined').exists()
+    assert store.quarantine('a@x.com') is False
+    # 重新扫描目录时不会把隔离的账号加回来
+    assert store.index.refresh(force=True) == (set(), set())
+
+
+def test_migrate_from_dir_keeps_used_and_quarantined_state(tmp_path):
+    oauth_dir = tmp_path / 'oauth'
+    oauth_dir.mkdir()
+    credentials = '{"refresh_token": "rt", "client_id": "cid"}'
+    (oauth_dir / filename_from_email('a@x.com')).write_text(credentials)
+    (oauth_dir / (filename_from_email('b@x.com') + '.used')).write_text(credentials)
+    (oauth_dir / (filename_from_email('c@x.com') + '.quarantined')).write_text(credentials)
+    store = SqliteAccountStore(tmp_path / 'accounts.db', refresh_interval=0)
+    result = store.migrate_from_dir(oauth_dir)
+    assert result['successCount'] == 3 and result['failedCount'] == 0
+    assert store.count_by_state() == {STATE_AVAILABLE: 1, STATE_USED: 1, STATE_QUARANTINED: 1}
+    assert store.open(lambda added, removed: None) == 1 and 'c@x.com' not in store
@@ -0,0 +1,128 @@
+"""
+asyncio 上游后端测试: 获取最新邮件和清空邮箱、按账号复用连接、同一账号的并发刷新只请求一次令牌、
+刷新令牌被拒绝时通知回调、时间预算用完时抛出 DeadlineExceeded，
+以及获取最新邮件时只在给出 lookup (缓存启用) 时单独查询 UID
+"""
+
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.api.async_upstream import AsyncUpstream
+from src.api.deadline import DeadlineExceeded
+from src.api.token_cache import TokenCache
+
+from tests.fake_imap import message
+
+
+class TokenHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests += 1
+        time.sleep(0.1)
+        status, payload = self.server.reply
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def token_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), TokenHandler)
+    server.requests = 0
+    server.reply = (200, {"access_token": "at", "expires_in": 3600})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def upstream(imap_server, token_server):
+    rejected = []
+
+    def credentials_rejected(email, e):
+        rejected.append((email, threading.current_thread().name))
+
+    backend = AsyncUpstream('127.0.0.1', imap_server.port, False,
+                            f'http://127.0.0.1:{token_server.server_address[1]}/token', 'scope', TokenCache(),
+                            max_concurrency=10, on_credentials_rejected=credentials_rejected)
+    backend.rejected = rejected
+    yield backend
+    backend.close()
+
+
+def test_fetch_latest_reuses_connection(upstream, imap_server):
+    imap_server.state.messages.extend([message('First'), message('Second')])
+    raw = upstream.run_sync(upstream.fetch_latest('rt', 'cid', 'user@x.com'))
+    assert b'Subject: Second' in raw
+    assert upstream.run_sync(upstream.fetch_latest('rt', 'cid', 'User@x.com')) == raw
+    assert upstream.stats() == dict(upstream.stats(), created=1, reused=1, idle=1, in_flight=0)
+    assert imap_server.state.connections == 1
+
+
+def test_concurrent_requests_refresh_token_once(upstream, imap_server, token_server):
+    imap_server.state.messages.append(message())
+
+    async def poll_many():
+        return await asyncio.gather(*(upstream.fetch_latest('rt', 'cid', 'user@x.com') for _ in range(5)))
+
+    assert all(raw is not None for raw in upstream.run_sync(poll_many()))
+    assert token_server.requests == 1
+
+
+def test_clear_uses_one_store(upstream, imap_server):
+    imap_server.state.messages.extend(message(f'Message {i}') for i in range(50))
+    assert upstream.run_sync(upstream.clear('rt', 'cid', 'user@x.com')) is True
+    assert imap_server.state.messages == []
+    assert [line for line in imap_server.state.lines if line.startswith('STORE')] == \
+        ['STORE 1:50 +FLAGS.SILENT (\\Deleted)']
+
+
+def test_rejected_refresh_token_notifies_callback(upstream, token_server):
+    token_server.reply = (400, {"error": "invalid_grant", "error_description": "AADSTS70000"})
+    assert upstream.run_sync(upstream.fetch_latest('rt', 'cid', 'user@x.com')) is None
+    # 回调可能阻塞 (重命名文件、写数据库)，不在事件循环线程中调用
+    [(email, thread)] = upstream.rejected
+    assert email == 'user@x.com' and thread != 'async-upstream'
+
+
+def test_slow_server_raises_deadline_exceeded(upstream, imap_server):
+    imap_server.state.messages.append(message())
+    imap_server.state.delays['EXAMINE'] = 1.0
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        upstream.run_sync(upstream.fetch_latest('rt', 'cid', 'user@x.com', timeout=0.3))
+    assert time.monotonic() - started < 1.0
+
+
+def test_fetch_latest_message_without_lookup_fetches_uid_with_the_message(upstream, imap_server):
+    imap_server.state.messages.extend([message('First'), message('Second')])
+    latest = upstream.run_sync(upstream.fetch_latest_message('rt', 'cid', 'user@x.com'))
+    assert (latest.uidvalidity, latest.uid, latest.cached) == (7, 2, None)
+    assert b'Subject: Second' in latest.raw
+    assert [line for line in imap_server.state.lines if 'FETCH' in line] == ['FETCH 2 (UID RFC822)']
+
+
+def test_fetch_latest_message_lookup_hit_skips_download(upstream, imap_server):
+    imap_server.state.messages.append(message())
+    seen = []
+
+    def lookup(uidvalidity, uid):
+        seen.append((uidvalidity, uid))
+        return 'cached'
+
+    latest = upstream.run_sync(upstream.fetch_latest_message('rt', 'cid', 'user@x.com', lookup=lookup))
+    assert (latest.uid, latest.raw, latest.cached) == (1, None, 'cached') and seen == [(7, 1)]
+    assert [line for line in imap_server.state.lines if 'FETCH' in line] == ['FETCH 1 (UID)']
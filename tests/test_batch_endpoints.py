@@ -0,0 +1,86 @@
+"""
+批量租约接口测试: /request-emails、/release-emails、/mark-emails-used 以及对应的分配器方法
+"""
+
+from src.pool.lease_allocator import LeaseAllocator
+
+NOW = 1_000_000.0
+
+
+def test_allocate_many_returns_distinct_leases_up_to_pool_size():
+    allocator = LeaseAllocator(60)
+    allocator.add_accounts(f'user{i}@x.com' for i in range(5))
+    leases = allocator.allocate_many(3, now=NOW)
+    assert len({lease.email for lease in leases}) == 3
+    rest = allocator.allocate_many(10, now=NOW)
+    assert len(rest) == 2
+    assert not {lease.email for lease in rest} & {lease.email for lease in leases}
+    assert allocator.allocate_many(1, now=NOW) == []
+
+
+def test_release_many_and_mark_used_many_report_per_email():
+    allocator = LeaseAllocator(60)
+    allocator.add_accounts(['a@x.com', 'b@x.com', 'c@x.com'])
+    leases = allocator.allocate_many(3, now=NOW)
+    emails = sorted(lease.email for lease in leases)
+    assert allocator.release_many([emails[0], 'missing@x.com']) == {emails[0]: True, 'missing@x.com': False}
+    assert allocator.mark_used_many([emails[1], 'missing@x.com']) == {emails[1]: True, 'missing@x.com': False}
+    assert allocator.get_many(emails, now=NOW).keys() == {emails[2]}
+    # 被标记为已使用的账号不会再被分配
+    assert [lease.email for lease in allocator.allocate_many(3, now=NOW)] == [emails[0]]
+
+
+def test_request_emails_allocates_in_one_batch(service):
+    response = service.client.post('/request-emails', json={"count": 3, "lease_seconds": 60})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["requested"] == 3 and body["allocated"] == 3
+    assert len(set(body["emails"])) == 3
+    assert [lease["email"] for lease in body["leases"]] == body["emails"]
+    assert all(lease["lease_token"] for lease in body["leases"])
+    assert body["lease_duration_seconds"] == 60
+
+    # 账号不足时返回剩余的账号，全部租出后返回 409
+    body = service.client.post('/request-emails', json={"count": 5}).get_json()
+    assert body["allocated"] == 2
+    assert service.client.post('/request-emails', json={"count": 1}).status_code == 409
+
+
+def test_request_emails_validates_count(service):
+    for count in (0, -1, "3", True, service.module.BATCH_MAX_COUNT + 1):
+        assert service.client.post('/request-emails', json={"count": count}).status_code == 400
+
+
+def test_release_emails_returns_accounts_to_pool(service):
+    emails = service.client.post('/request-emails', json={"count": 5}).get_json()["emails"]
+    response = service.client.post('/release-emails', json={"emails": emails[:2] + [emails[0], 'other@x.com']})
+    assert response.status_code == 200
+    assert response.get_json()["results"] == [
+        {"email": emails[0], "released": True},
+        {"email": emails[1], "released": True},
+        {"email": 'other@x.com', "released": False},
+    ]
+    assert service.client.post('/request-emails', json={"count": 5}).get_json()["allocated"] == 2
+
+
+def test_mark_emails_used_renames_files_in_one_sweep(service):
+    emails = service.client.post('/request-emails', json={"count": 2}).get_json()["emails"]
+    response = service.client.post('/mark-emails-used', json={"emails": emails + ['user9@x.com']})
+    assert response.status_code == 200
+    assert response.get_json()["results"] == [
+        {"email": emails[0], "success": True},
+        {"email": emails[1], "success": True},
+        {"email": 'user9@x.com', "success": False, "error": "Email not found or lease expired."},
+    ]
+    for email in emails:
+        assert email not in service.store
+        assert (service.oauth_dir / (email.replace('@', '_at_') + '.json.used')).exists()
+    assert service.allocator.leased_emails() == []
+    assert service.client.post('/request-emails', json={"count": 5}).get_json()["allocated"] == 3
+
+
+def test_batch_endpoints_require_email_list(service):
+    for path in ('/release-emails', '/mark-emails-used'):
+        assert service.client.post(path, json={}).status_code == 400
+        assert service.client.post(path, json={"emails": "a@x.com"}).status_code == 400
+        assert service.client.post(path, json={"emails": [1]}).status_code == 400
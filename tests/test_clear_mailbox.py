@@ -0,0 +1,79 @@
+"""
+清空邮箱测试: 一条范围 STORE 标记全部邮件后 EXPUNGE，批量清空任务限制并发并报告进度和失败原因
+"""
+
+import time
+import threading
+
+from src.api import cloud_email_api
+from src.api.clear_jobs import ClearJobManager
+
+from tests.fake_imap import message
+
+
+def wait_finished(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while job.progress()["state"] != "finished":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return job.progress()
+
+
+def test_clear_mailbox_flags_all_messages_with_one_store(imap_server):
+    imap_server.state.messages.extend(message(f'Message {i}') for i in range(2000))
+    assert cloud_email_api.clear_mailbox('rt', 'cid', 'user@x.com') is True
+    assert imap_server.state.messages == []
+    stores = [line for line in imap_server.state.lines if line.startswith('STORE')]
+    assert stores == ['STORE 1:2000 +FLAGS.SILENT (\\Deleted)']
+    assert imap_server.state.commands.count('EXPUNGE') == 1
+
+
+def test_clear_empty_mailbox_sends_no_store(imap_server):
+    assert cloud_email_api.clear_mailbox('rt', 'cid', 'user@x.com') is True
+    assert 'STORE' not in imap_server.state.commands
+
+
+def test_clear_job_bounds_concurrency_and_reports_failures():
+    manager = ClearJobManager(max_workers=2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def clear(email):
+        with lock:
+            running.append(email)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(email)
+        if email == 'broken@x.com':
+            raise RuntimeError('token rejected')
+        return email != 'failed@x.com'
+
+    emails = [f'user{i}@x.com' for i in range(8)] + ['broken@x.com', 'failed@x.com']
+    job = manager.submit(emails, clear)
+    progress = wait_finished(job)
+    assert max(peak) <= 2
+    assert progress["total"] == 10 and progress["done"] == 10 and progress["succeeded"] == 8
+    assert progress["failures"] == {'broken@x.com': 'token rejected', 'failed@x.com': 'clear failed'}
+    assert manager.get(job.id) is job
+
+
+def test_finished_jobs_are_pruned():
+    manager = ClearJobManager(max_workers=1, keep_finished=2)
+    jobs = [manager.submit([], lambda email: True) for _ in range(4)]
+    # 清理发生在创建新任务时，新任务本身还没有结束
+    assert [job["job_id"] for job in manager.list()] == [job.id for job in jobs[-3:]]
+    assert manager.get(jobs[0].id) is None
+
+
+def test_clear_mailboxes_endpoint_runs_a_job(service, imap_server):
+    imap_server.state.messages.append(message())
+    response = service.client.post('/clear-mailboxes', json={'emails': ['user0@x.com', 'missing@x.com']})
+    assert response.status_code == 202
+    job = service.module.clear_jobs.get(response.json["job_id"])
+    progress = wait_finished(job)
+    assert progress["succeeded"] == 1 and list(progress["failures"]) == ['missing@x.com']
+    assert service.client.get(f'/clear-mailboxes/{job.id}').json["state"] == "finished"
+    assert service.client.get('/clear-mailboxes/unknown').status_code == 404
+    assert service.client.post('/clear-mailboxes', json={'emails': []}).status_code == 400
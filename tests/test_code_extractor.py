@@ -0,0 +1,82 @@
+"""
+验证码提取测试: 数字/字母数字验证码和登录链接的规则优先级、容易误判的数字 (日期、金额、编号)、
+HTML 回退 (与 strip_html 相同的解析器，附带 href)、按发件人配置的规则以及 /get-verification-code
+"""
+
+import pytest
+
+from src.api.code_extractor import CodeExtractor, html_search_text
+
+from tests.fake_imap import message
+
+
+@pytest.fixture
+def extractor():
+    return CodeExtractor()
+
+
+@pytest.mark.parametrize('subject, text, code, kind', [
+    ('Your verification code', 'Use code 482913 to sign in.', '482913', 'numeric'),
+    ('验证码', '您的验证码为：605 118，10 分钟内有效。', '605118', 'numeric'),
+    ('Sign in', '739201 is your one-time password.', '739201', 'numeric'),
+    ('Welcome', 'Your code: K7P-9QX', 'K7P-9QX', 'alphanumeric'),
+    ('Login', 'Enter this number:\n\n  8812  \n\nThanks', '8812', 'numeric'),
+    ('Código', 'Tu código es G-582014', '582014', 'numeric'),
+])
+def test_codes_in_text(extractor, subject, text, code, kind):
+    match = extractor.extract(subject, text)
+    assert (match.code, match.kind, match.source) == (code, kind, 'text')
+
+
+@pytest.mark.parametrize('text', [
+    'Your order #48213 ships on 2024-05-01 and costs $1999.',
+    'Meeting at 10:30 on 12/05/2024, room 1204.5',
+    'Invoice INV-2024 totals 1,250.00 EUR',
+])
+def test_numbers_that_are_not_codes(extractor, text):
+    assert extractor.extract('Notice', text) is None
+
+
+def test_html_is_searched_only_when_text_has_no_code(extractor):
+    html = '<p>Your code is <b>111222</b></p>'
+    assert extractor.extract('Hi', 'Your code is 333444', html).code == '333444'
+    match = extractor.extract('Hi', '', html)
+    assert (match.code, match.source) == ('111222', 'html')
+
+
+def test_sign_in_link_from_href(extractor):
+    html = ('<style>.code { color: red } 999999</style>'
+            '<a href="https://example.com/unsubscribe?u=1">Unsubscribe</a>'
+            '<a href="https://example.com/auth/magic?token=abc&amp;next=%2F">Sign in</a>')
+    match = extractor.extract('Sign in to Example', None, html)
+    assert (match.code, match.kind) == ('https://example.com/auth/magic?token=abc&next=%2F', 'link')
+
+
+def test_html_search_text_uses_streaming_parser_and_appends_links():
+    html = '<script>var code = 123456;</script><div>Hello&nbsp;there</div><br><a href="https://x.com/verify?a=1&amp;b=2">go</a>'
+    assert html_search_text(html) == 'Hello\xa0there\n\ngo\nhttps://x.com/verify?a=1&b=2'
+
+
+def test_sender_rules_take_precedence_and_match_subdomains():
+    extractor = CodeExtractor({'example.com': [r'PIN\[(\d{6})\]'], 'alerts@other.org': [r'ref (?P<code>[A-Z]{3}\d{3})']})
+    match = extractor.extract('Code 111111', 'PIN[654321]', sender='Example <noreply@mail.example.com>')
+    assert (match.code, match.rule) == ('654321', 'sender')
+    match = extractor.extract('Alert', 'ref ABC123', sender='alerts@other.org')
+    assert (match.code, match.kind) == ('ABC123', 'alphanumeric')
+    # 其他发件人只使用通用规则
+    assert extractor.extract('Code 111111', 'PIN[654321]', sender='someone@else.com').code == '111111'
+
+
+def test_invalid_sender_rule_is_rejected():
+    with pytest.raises(ValueError):
+        CodeExtractor({'example.com': ['(']})
+
+
+def test_get_verification_code_endpoint(service, imap_server):
+    imap_server.state.messages.append(message('Welcome', 'Your verification code is 271828.'))
+    lease = service.allocator.allocate()
+    response = service.client.post('/get-verification-code', json={'lease_token': lease.token})
+    assert response.status_code == 200
+    assert response.json['verification_code'] == '271828'
+    assert response.json['code_type'] == 'numeric' and response.json['subject'] == 'Welcome'
+    assert 'content' not in response.json
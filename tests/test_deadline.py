@@ -0,0 +1,86 @@
+"""
+上游时间预算测试: 各阶段超时取默认值与剩余预算的较小者，预算用完返回 504，
+IMAP 连接池耗尽返回 503，两者都不会变成 200 + data: null
+"""
+
+import time
+
+import pytest
+
+from src.api import cloud_email_api
+from src.api.deadline import Deadline, DeadlineExceeded
+from src.api.imap_pool import ImapConnectionPool
+
+from tests.fake_imap import message
+
+
+def test_stage_timeout_is_capped_by_remaining_budget():
+    assert Deadline().timeout(15) == 15
+    deadline = Deadline.after(5)
+    assert 4 < deadline.timeout(15) <= 5
+    assert deadline.timeout(1) == 1
+    assert deadline.child(1).remaining() <= 1
+    assert deadline.child(60).remaining() <= 5
+    with pytest.raises(DeadlineExceeded):
+        Deadline.after(-1).timeout(15, 'FETCH')
+
+
+def test_pool_releases_slot_and_reraises_deadline_from_connect():
+    pool = ImapConnectionPool(max_connections=1)
+
+    def connect():
+        raise DeadlineExceeded('token')
+
+    with pytest.raises(DeadlineExceeded):
+        pool.acquire('a', connect)
+    assert pool.stats()["open"] == 0
+
+
+@pytest.fixture
+def leased(service, imap_server):
+    imap_server.state.messages.append(message())
+    service.lease = service.allocator.allocate()
+    return service
+
+
+def busy_pool(monkeypatch):
+    pool = ImapConnectionPool(max_connections=1, acquire_timeout=0.05)
+    monkeypatch.setattr(cloud_email_api, 'imap_pool', pool)
+    busy, _ = pool.acquire('other@x.com', lambda: object())
+    return busy
+
+
+@pytest.mark.parametrize('path', ['/get-latest-email', '/get-emails', '/get-verification-code'])
+def test_exhausted_pool_returns_503(leased, monkeypatch, path):
+    busy_pool(monkeypatch)
+    response = leased.client.post(path, json={'lease_token': leased.lease.token})
+    assert response.status_code == 503
+
+
+@pytest.mark.parametrize('path', ['/get-latest-email', '/get-emails'])
+def test_slow_upstream_returns_504(leased, imap_server, path):
+    imap_server.state.delays['EXAMINE'] = 1.0
+    started = time.monotonic()
+    response = leased.client.post(path, json={'lease_token': leased.lease.token},
+                                  headers={'X-Request-Timeout': '0.3'})
+    assert response.status_code == 504
+    assert time.monotonic() - started < 1.0
+
+
+def test_budget_spent_waiting_for_token_returns_504(leased, monkeypatch):
+    def token_for(*args):
+        # 等待其他请求刷新令牌，直到预算用完仍没有结果
+        time.sleep(0.3)
+        return None
+
+    monkeypatch.setattr(cloud_email_api, '_token_for', token_for)
+    response = leased.client.post('/get-latest-email', json={'lease_token': leased.lease.token},
+                                  headers={'X-Request-Timeout': '0.2'})
+    assert response.status_code == 504
+    assert cloud_email_api.imap_pool.stats()["open"] == 0
+
+
+def test_upstream_within_budget_still_returns_data(leased):
+    response = leased.client.post('/get-latest-email', json={'lease_token': leased.lease.token},
+                                  headers={'X-Request-Timeout': '5'})
+    assert response.status_code == 200 and response.json['data']['subject'] == 'Code 123456'
@@ -0,0 +1,81 @@
+"""
+ETag 测试: /get-latest-email、/get-verification-code 和 /get-emails 的 ETag 由 UIDVALIDITY、UID 和请求参数得出，
+If-None-Match 命中时返回没有正文的 304 (/get-emails 不下载邮件)，有新邮件或参数不同时 ETag 改变
+"""
+
+import pytest
+
+from src.api import cloud_email_api
+from src.api.message_cache import MessageCache
+
+from tests.fake_imap import message
+
+
+@pytest.fixture
+def lease(service, imap_server):
+    return service.allocator.allocate()
+
+
+def post(service, path, body, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    response = service.client.post(path, json=body, headers=headers)
+    # 读完流式响应，让生成器在请求上下文中结束
+    response.get_data()
+    return response
+
+
+@pytest.mark.parametrize('path', ['/get-latest-email', '/get-verification-code'])
+def test_unchanged_latest_email_returns_304(service, imap_server, lease, path):
+    imap_server.state.messages.append(message('Code', 'Your code is 123456'))
+    body = {'lease_token': lease.token}
+    first = post(service, path, body)
+    assert first.status_code == 200 and first.headers['ETag']
+
+    again = post(service, path, body, first.headers['ETag'])
+    assert again.status_code == 304 and again.data == b''
+    assert again.headers['ETag'] == first.headers['ETag']
+    # 弱比较: W/ 前缀的同一个值也算命中
+    assert post(service, path, body, 'W/' + first.headers['ETag']).status_code == 304
+
+    imap_server.state.messages.append(message('Code', 'Your code is 654321'))
+    changed = post(service, path, body, first.headers['ETag'])
+    assert changed.status_code == 200 and changed.headers['ETag'] != first.headers['ETag']
+
+
+def test_etag_depends_on_profile(service, imap_server, lease):
+    imap_server.state.messages.append(message())
+    full = post(service, '/get-latest-email', {'lease_token': lease.token})
+    summary = post(service, '/get-latest-email', {'lease_token': lease.token, 'profile': 'summary'}, full.headers['ETag'])
+    assert summary.status_code == 200 and summary.headers['ETag'] != full.headers['ETag']
+
+
+def test_etag_is_kept_when_message_cache_is_disabled(service, imap_server, lease, monkeypatch):
+    monkeypatch.setattr(cloud_email_api, 'message_cache', MessageCache(max_entries=0))
+    imap_server.state.messages.append(message())
+    first = post(service, '/get-latest-email', {'lease_token': lease.token})
+    assert post(service, '/get-latest-email', {'lease_token': lease.token}, first.headers['ETag']).status_code == 304
+
+
+def test_empty_mailbox_has_no_etag(service, imap_server, lease):
+    response = post(service, '/get-latest-email', {'lease_token': lease.token}, '*')
+    assert response.status_code == 200 and response.json['data'] is None
+    assert 'ETag' not in response.headers
+
+
+def test_unchanged_page_returns_304_without_downloading(service, imap_server, lease):
+    imap_server.state.messages.extend(message(f'Message {i}') for i in range(1, 4))
+    body = {'lease_token': lease.token, 'limit': 2}
+    first = post(service, '/get-emails', body)
+    assert first.status_code == 200 and first.headers['ETag']
+
+    imap_server.state.lines.clear()
+    again = post(service, '/get-emails', body, first.headers['ETag'])
+    assert again.status_code == 304 and again.data == b''
+    assert not any('RFC822' in line or 'BODY' in line for line in imap_server.state.lines)
+
+    # 不同的分页参数对应不同的 ETag
+    assert post(service, '/get-emails', dict(body, limit=1), first.headers['ETag']).status_code == 200
+    # 页内 UID 列表变化 (这里是"是否还有下一页"依据的那封邮件被删除) 时重新返回
+    imap_server.state.messages.pop()
+    changed = post(service, '/get-emails', body, first.headers['ETag'])
+    assert changed.status_code == 200 and changed.headers['ETag'] != first.headers['ETag']
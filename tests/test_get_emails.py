@@ -0,0 +1,56 @@
+"""
+按 UID 分页的邮件列表测试: iter_emails 逐块生成邮件，/get-emails 以 NDJSON 输出一页并给出下一页的游标
+"""
+
+import json
+
+from src.api import cloud_email_api
+
+from tests.fake_imap import message
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_iter_emails_yields_chunks_after_since_uid(imap_server, monkeypatch):
+    monkeypatch.setattr(cloud_email_api, 'IMAP_FETCH_CHUNK_SIZE', 2)
+    imap_server.state.messages.extend(message(f'Message {i}') for i in range(1, 8))
+    emails = cloud_email_api.iter_emails('rt', 'cid', 'user@x.com', since_uid=2)
+    first = next(emails)
+    assert (first['uid'], first['subject']) == (3, 'Message 3')
+    # 只获取了第一块
+    assert imap_server.state.commands.count('UID FETCH') == 1
+    assert [email['uid'] for email in emails] == [4, 5, 6, 7]
+    assert imap_server.state.commands.count('UID FETCH') == 3
+    assert imap_server.state.commands.count('UID SEARCH') == 1
+
+
+def test_iter_emails_stopped_early_returns_connection_to_pool(imap_server, monkeypatch):
+    monkeypatch.setattr(cloud_email_api, 'IMAP_FETCH_CHUNK_SIZE', 2)
+    imap_server.state.messages.extend(message(f'Message {i}') for i in range(1, 8))
+    emails = cloud_email_api.iter_emails('rt', 'cid', 'user@x.com', limit=3)
+    assert next(emails)['uid'] == 1
+    emails.close()
+    assert cloud_email_api.imap_pool.stats()["idle"] == 1
+
+
+def test_get_emails_pages_by_uid_cursor(service, imap_server):
+    imap_server.state.messages.extend(message(f'Message {i}') for i in range(1, 6))
+    lease = service.allocator.allocate()
+    response = service.client.post('/get-emails', json={'lease_token': lease.token, 'limit': 2})
+    assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+    lines = ndjson(response)
+    assert [line['subject'] for line in lines[:-1]] == ['Message 1', 'Message 2']
+    assert lines[-1] == {"next_since_uid": 2, "has_more": True, "count": 2}
+
+    response = service.client.post('/get-emails', json={'lease_token': lease.token, 'since_uid': 4, 'limit': 2})
+    lines = ndjson(response)
+    assert [line['uid'] for line in lines[:-1]] == [5]
+    assert lines[-1] == {"next_since_uid": 5, "has_more": False, "count": 1}
+
+
+def test_get_emails_rejects_non_integer_cursor(service, imap_server):
+    lease = service.allocator.allocate()
+    response = service.client.post('/get-emails', json={'lease_token': lease.token, 'since_uid': 'abc'})
+    assert response.status_code == 400
@@ -0,0 +1,82 @@
+"""
+HTML 转文本测试: 流式解析器与 BeautifulSoup 的结果去掉空白后一致 (边界情况和营销邮件样本)、
+不规范 HTML、跳过 <style>/<script>/<template>、实体、<br> 和块级标签换行、<pre>、链接收集，
+以及 strip_html 在流式解析出错时回退到 BeautifulSoup
+"""
+
+import random
+
+import pytest
+
+from src.api import cloud_email_api
+from src.api.html_text import html_to_text, html_to_text_and_links, html_to_text_bs4
+
+from tests.html_corpus import EDGE_CASES, marketing_html, squash
+
+
+@pytest.mark.parametrize('html', EDGE_CASES)
+def test_edge_cases_match_bs4(html):
+    assert squash(html_to_text(html)) == squash(html_to_text_bs4(html))
+
+
+@pytest.mark.parametrize('seed, size', [(1, 20_000), (2, 20_000), (3, 100_000)])
+def test_marketing_html_matches_bs4(seed, size):
+    html = marketing_html(random.Random(seed), size)
+    assert squash(html_to_text(html)) == squash(html_to_text_bs4(html))
+
+
+@pytest.mark.parametrize('html, text', [
+    ('<p>a<p>b<div>c', 'a\nb\nc'),
+    ('<div><p>x</div></span>y', 'x\ny'),
+    ('<ul><li>one<li>two</ul>', 'one\ntwo'),
+    ('<p>unterminated <b>bold <i>italic</p> tail', 'unterminated bold italic\ntail'),
+    ('<p>if a < b</p>', 'if a < b'),
+])
+def test_malformed_html(html, text):
+    assert html_to_text(html) == text
+
+
+def test_skipped_tags_including_nested_ones():
+    assert html_to_text('<script>document.write("<p>x</p>")</script><p>visible</p>') == 'visible'
+    assert html_to_text('<template><template>x</template>y</template>z') == 'z'
+    # <style> 的内容是原始文本，里面的 <style> 不算嵌套，与浏览器一样在第一个 </style> 处结束
+    assert html_to_text('<style><style>a</style>b</style>c') == 'bc'
+    assert html_to_text('<style>p{}</style><!-- comment -->text') == 'text'
+
+
+def test_entities():
+    assert html_to_text('&amp;lt; &#39;q&#39; &#8364;5 &#x20AC;6 a&nbsp;b') == "&lt; 'q' €5 €6 a\xa0b"
+    assert html_to_text('AT&T &amp Co &copy 2024') == 'AT&T & Co © 2024'
+
+
+def test_br_blocks_cells_and_pre():
+    assert html_to_text('a<br>b<p>c</p>d') == 'a\nb\nc\nd'
+    assert html_to_text('<table><tr><td>a</td><td>b</td></tr><tr><td>c</td></tr></table>') == 'a b\n\nc'
+    assert html_to_text('<p>a    b\n\n c</p>') == 'a b c'
+    assert html_to_text('<pre>  keep   this\n    indent</pre><p>after   pre</p>') == \
+        'keep   this\nindent\n\nafter pre'
+
+
+def test_links_are_collected_outside_skipped_tags():
+    html = ('<template><a href="https://hidden.example.com">x</a></template>'
+            '<p><a href="https://example.com/verify?a=1&amp;b=2">Verify</a></p><a>no href</a>')
+    assert html_to_text_and_links(html) == ('Verify\nno href', ['https://example.com/verify?a=1&b=2'])
+    assert html_to_text_and_links('') == ('', [])
+
+
+def test_strip_html_falls_back_to_bs4_when_parser_fails(monkeypatch):
+    def broken(content):
+        raise ValueError('parser error')
+
+    monkeypatch.setattr(cloud_email_api, 'HTML_TEXT_EXTRACTOR', 'stream')
+    monkeypatch.setattr(cloud_email_api, 'html_to_text', broken)
+    html = '<p>Code:   <b>482913</b></p>'
+    assert cloud_email_api.strip_html(html) == html_to_text_bs4(html) == 'Code:   482913'
+
+
+def test_strip_html_uses_configured_extractor(monkeypatch):
+    html = '<p>a</p><p>b</p>'
+    monkeypatch.setattr(cloud_email_api, 'HTML_TEXT_EXTRACTOR', 'stream')
+    assert cloud_email_api.strip_html(html) == 'a\n\nb'
+    monkeypatch.setattr(cloud_email_api, 'HTML_TEXT_EXTRACTOR', 'bs4')
+    assert cloud_email_api.strip_html(html) == 'ab'
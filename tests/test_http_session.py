@@ -0,0 +1,74 @@
+"""
+令牌端点 HTTP 连接池测试: 多次请求复用同一个 keep-alive 连接，Session 只创建一次，
+并发请求超出连接池大小时不排队等待，连接池只保留 pool_size 个连接
+"""
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.api.http_session import SharedSession
+
+
+class TokenHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.peers.add(self.client_address)
+        time.sleep(self.server.delay)
+        body = json.dumps({"access_token": "at", "expires_in": 3600}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def token_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), TokenHandler)
+    server.peers = set()
+    server.delay = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_shared_session_reuses_connection(token_server):
+    url = f'http://127.0.0.1:{token_server.server_address[1]}/token'
+    shared = SharedSession(pool_size=2)
+    session = shared.get()
+    for _ in range(10):
+        response = shared.get().post(url, data={'grant_type': 'refresh_token'}, timeout=(5, 5))
+        assert response.json()["access_token"] == "at"
+    assert shared.get() is session
+    # 10 次请求只建立了一个 TCP 连接
+    assert len(token_server.peers) == 1
+    shared.close()
+
+
+def test_requests_beyond_pool_size_do_not_wait(token_server):
+    url = f'http://127.0.0.1:{token_server.server_address[1]}/token'
+    token_server.delay = 0.3
+    shared = SharedSession(pool_size=2)
+    threads = [threading.Thread(target=lambda: shared.get().post(url, data={}, timeout=(5, 5))) for _ in range(6)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    # 6 个请求同时进行，而不是每次只有 2 个 (那样至少需要 0.9 秒)
+    assert time.monotonic() - started < 0.8
+    assert len(token_server.peers) == 6
+    pool = shared.get().get_adapter(url).poolmanager.connection_from_url(url)
+    assert sum(1 for conn in list(pool.pool.queue) if conn is not None) <= 2
+    shared.close()
@@ -0,0 +1,98 @@
+"""
+IMAP IDLE 监听测试: 新邮件推送使版本号递增，validator 收到原始大小写的地址，
+租约在其他进程结束后通过服务的 unwatch 停止监听并清除最新邮件缓存
+"""
+
+import time
+
+from src.api.idle_watcher import IdleWatcher
+
+from tests.fake_imap import connect
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_new_mail_bumps_version(imap_server):
+    watcher = IdleWatcher(reconnect_backoff=(0.05, 0.05))
+    events = []
+    watcher.add_listener(lambda key, event, exists: events.append((key, event, exists)))
+    watcher.watch('user@x.com', lambda: connect(imap_server.port))
+    try:
+        assert wait_until(lambda: watcher.is_watching('user@x.com'))
+        assert wait_until(lambda: imap_server.state.idlers)
+        version = watcher.version('user@x.com')
+        imap_server.deliver()
+        assert watcher.wait_for_change('user@x.com', version, timeout=5) == version + 1
+        assert events[-1] == ('user@x.com', 'exists', 1)
+    finally:
+        watcher.close()
+
+
+def test_validator_gets_original_address_and_on_invalid_unwatches():
+    watcher = IdleWatcher(reconnect_backoff=(60, 60))
+    checked, invalidated = [], []
+
+    def on_invalid(address):
+        invalidated.append(address)
+        watcher.unwatch(address.lower())
+
+    watcher.set_validator(lambda address: checked.append(address) or address != 'Gone@x.com',
+                          on_invalid=on_invalid)
+    watcher.watch('kept@x.com', lambda: None, address='Kept@x.com')
+    watcher.watch('gone@x.com', lambda: None, address='Gone@x.com')
+    try:
+        watcher._validate()
+        assert sorted(checked) == ['Gone@x.com', 'Kept@x.com']
+        assert invalidated == ['Gone@x.com']
+        assert watcher.stats()["sessions"] == 1
+    finally:
+        watcher.close()
+
+
+def test_invalid_session_is_unwatched_even_if_callback_fails():
+    watcher = IdleWatcher(reconnect_backoff=(60, 60))
+
+    def on_invalid(address):
+        raise RuntimeError('boom')
+
+    watcher.set_validator(lambda address: False, on_invalid=on_invalid)
+    watcher.watch('user@x.com', lambda: None)
+    try:
+        watcher._validate()
+        assert watcher.stats()["sessions"] == 0
+    finally:
+        watcher.close()
+
+
+def test_mixed_case_lease_stays_watched_until_it_ends(service, monkeypatch):
+    from src.api import cloud_email_api
+
+    watcher = IdleWatcher(reconnect_backoff=(60, 60))
+    monkeypatch.setattr(cloud_email_api, 'IDLE_WATCHER_ENABLED', True)
+    monkeypatch.setattr(cloud_email_api, 'idle_watcher', watcher)
+    monkeypatch.setattr(service.module, 'load_watch_credentials', lambda email: None)
+    service.add_accounts(['Mixed@x.com'])
+    lease = next(lease for lease in service.allocator.allocate_many(6) if lease.email == 'Mixed@x.com')
+    service.module.watch_leased_mailbox(lease.email)
+    service.module.latest_email_cache[lease.email] = (1, 'profile', {'subject': 'cached'})
+    watcher.set_validator(lambda email: service.allocator.get(email) is not None,
+                          on_invalid=service.module.unwatch_leased_mailbox)
+    try:
+        watcher._validate()
+        assert watcher.stats()["sessions"] == 1
+        assert lease.email in service.module.latest_email_cache
+
+        # 模拟租约在其他进程中结束: 本进程的观察者没有收到释放事件
+        service.allocator.release(lease.email)
+        watcher._validate()
+        assert watcher.stats()["sessions"] == 0
+        assert lease.email not in service.module.latest_email_cache
+    finally:
+        watcher.close()
@@ -0,0 +1,34 @@
+"""
+IMAP 获取测试: 最新邮件按 SELECT 返回的数量定位 (不发送 SEARCH)，
+获取全部邮件时按 IMAP_FETCH_CHUNK_SIZE 分块，每块一条 FETCH 命令
+"""
+
+from src.api import cloud_email_api
+
+from tests.fake_imap import message
+
+
+def test_latest_email_uses_select_count_without_search(imap_server):
+    imap_server.state.messages.extend(message(f'Message {i}') for i in range(1, 501))
+    latest = cloud_email_api.get_latest_email('rt', 'cid', 'user@x.com')
+    assert latest['subject'] == 'Message 500'
+    assert 'SEARCH' not in imap_server.state.commands
+    assert 'UID SEARCH' not in imap_server.state.commands
+
+
+def test_latest_email_of_empty_mailbox_is_none(imap_server):
+    assert cloud_email_api.get_latest_email('rt', 'cid', 'user@x.com') is None
+    assert not any('FETCH' in command for command in imap_server.state.commands)
+
+
+def test_all_emails_are_fetched_in_range_chunks(imap_server, monkeypatch):
+    monkeypatch.setattr(cloud_email_api, 'IMAP_FETCH_CHUNK_SIZE', 200)
+    imap_server.state.messages.extend(message(f'Message {i}') for i in range(1, 501))
+    emails = cloud_email_api.get_all_emails('rt', 'cid', 'user@x.com')
+    assert [email['subject'] for email in emails] == [f'Message {i}' for i in range(1, 501)]
+    # 500 封邮件只需要 3 条 FETCH (1:200, 201:400, 401:500)
+    assert imap_server.state.commands.count('FETCH') == 3
+
+
+def test_all_emails_of_empty_mailbox_is_empty_list(imap_server):
+    assert cloud_email_api.get_all_emails('rt', 'cid', 'user@x.com') == []
@@ -0,0 +1,184 @@
+"""
+IMAP 连接池测试: 按账号复用、NOOP 健康检查、过期淘汰、LRU 让出名额以及连接数上限
+"""
+
+import time
+import imaplib
+import threading
+
+import pytest
+
+from src.api import cloud_email_api
+from src.api.imap_pool import ImapConnectionPool, ImapPoolExhausted
+
+
+class FakeSock:
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+
+class FakeConn:
+    def __init__(self, name, healthy=True):
+        self.name = name
+        self.healthy = healthy
+        self.noops = 0
+        self.closed = False
+        self.sock = FakeSock()
+
+    def noop(self):
+        self.noops += 1
+        if not self.healthy:
+            raise imaplib.IMAP4.abort('BYE')
+        return 'OK', [b'']
+
+    def logout(self):
+        self.closed = True
+
+
+def connector(created):
+    def connect(name):
+        def factory():
+            conn = FakeConn(name)
+            created.append(conn)
+            return conn
+        return factory
+    return connect
+
+
+def test_connections_are_reused_per_account():
+    created = []
+    connect = connector(created)
+    pool = ImapConnectionPool(max_connections=4)
+    pooled, reused = pool.acquire('a', connect('a'))
+    assert not reused
+    pool.release(pooled)
+    again, reused = pool.acquire('a', connect('a'))
+    assert reused and again.conn is pooled.conn
+    other, reused = pool.acquire('b', connect('b'))
+    assert not reused and other.conn is not pooled.conn
+    assert pool.stats()["open"] == 2 and pool.stats()["reused"] == 1
+    pool.close_all()
+
+
+def test_idle_connection_is_health_checked_and_replaced():
+    created = []
+    pool = ImapConnectionPool(max_connections=2, noop_interval=0)
+    pooled, _ = pool.acquire('a', connector(created)('a'))
+    pool.release(pooled)
+    pooled.conn.healthy = False
+    replacement, reused = pool.acquire('a', connector(created)('a'))
+    assert not reused and replacement.conn is not pooled.conn
+    assert pooled.conn.closed
+    assert pool.stats()["health_check_failures"] == 1 and pool.stats()["open"] == 1
+
+
+def test_recently_used_connection_skips_noop():
+    pool = ImapConnectionPool(noop_interval=30)
+    pooled, _ = pool.acquire('a', lambda: FakeConn('a'))
+    pool.release(pooled)
+    again, reused = pool.acquire('a', lambda: FakeConn('a'))
+    assert reused and again.conn.noops == 0
+
+
+def test_expired_idle_connections_are_closed():
+    pool = ImapConnectionPool(idle_timeout=60, max_lifetime=600)
+    pooled, _ = pool.acquire('a', lambda: FakeConn('a'))
+    pool.release(pooled)
+    pooled.last_used -= 61
+    fresh, reused = pool.acquire('a', lambda: FakeConn('fresh'))
+    assert not reused and fresh.conn.name == 'fresh' and pooled.conn.closed
+
+    # 超过最长存活时间的连接归还时直接关闭
+    fresh.created_at -= 601
+    pool.release(fresh)
+    assert fresh.conn.closed and pool.stats()["open"] == 0
+
+
+def test_reaper_closes_idle_connections():
+    pool = ImapConnectionPool(idle_timeout=60)
+    pooled, _ = pool.acquire('a', lambda: FakeConn('a'))
+    pool.release(pooled)
+    pooled.last_used -= 61
+    pool._reap()
+    assert pooled.conn.closed and pool.stats()["open"] == 0
+    pool.close_all()
+
+
+def test_full_pool_evicts_least_recently_used_idle_connection():
+    pool = ImapConnectionPool(max_connections=2)
+    first, _ = pool.acquire('a', lambda: FakeConn('a'))
+    second, _ = pool.acquire('b', lambda: FakeConn('b'))
+    pool.release(first)
+    time.sleep(0.01)
+    pool.release(second)
+    third, _ = pool.acquire('c', lambda: FakeConn('c'))
+    assert first.conn.closed and not second.conn.closed
+    assert pool.stats() == dict(pool.stats(), open=2, idle=1, evicted=1)
+    pool.release(third)
+    pool.close_all()
+
+
+def test_full_pool_waits_then_raises():
+    pool = ImapConnectionPool(max_connections=1)
+    busy, _ = pool.acquire('a', lambda: FakeConn('a'))
+    with pytest.raises(ImapPoolExhausted):
+        pool.acquire('b', lambda: FakeConn('b'), timeout=0.05)
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(pool.acquire('b', lambda: FakeConn('b'), timeout=5)))
+    thread.start()
+    time.sleep(0.05)
+    pool.discard(busy)
+    thread.join(5)
+    assert results[0][0].conn.name == 'b'
+    assert busy.conn.closed
+
+
+def test_failed_connect_releases_slot():
+    pool = ImapConnectionPool(max_connections=1)
+    assert pool.acquire('a', lambda: None) == (None, False)
+
+    def broken():
+        raise OSError('refused')
+
+    assert pool.acquire('a', broken) == (None, False)
+    assert pool.stats()["open"] == 0
+    pooled, _ = pool.acquire('a', lambda: FakeConn('a'))
+    assert pooled is not None
+
+
+def test_pool_disabled_closes_on_release():
+    pool = ImapConnectionPool(idle_timeout=0)
+    pooled, _ = pool.acquire('a', lambda: FakeConn('a'))
+    pool.release(pooled)
+    assert pooled.conn.closed and pool.stats()["open"] == 0
+
+
+def test_with_imap_connection_retries_once_when_reused_connection_is_dead(monkeypatch):
+    pool = ImapConnectionPool(noop_interval=30)
+    opened = []
+
+    def open_connection(refresh_token, client_id, email_address, deadline):
+        conn = FakeConn(f'conn{len(opened)}')
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(cloud_email_api, 'imap_pool', pool)
+    monkeypatch.setattr(cloud_email_api, 'open_imap_connection', open_connection)
+    assert cloud_email_api.with_imap_connection('rt', 'cid', 'User@x.com', 5, lambda mail: mail.name) == 'conn0'
+
+    def operation(mail):
+        if mail.name == 'conn0':
+            raise imaplib.IMAP4.abort('socket error: EOF')
+        return mail.name
+
+    # 连接池按小写邮箱复用连接；服务器已断开的复用连接被丢弃并重连一次
+    assert cloud_email_api.with_imap_connection('rt', 'cid', 'user@x.com', 5, operation) == 'conn1'
+    assert opened[0].closed and pool.stats()["open"] == 1
+
+    def always_fails(mail):
+        raise imaplib.IMAP4.abort('BYE')
+
+    with pytest.raises(imaplib.IMAP4.abort):
+        cloud_email_api.with_imap_connection('rt', 'cid', 'user@x.com', 5, always_fails)
+    assert pool.stats()["open"] == 0
@@ -0,0 +1,218 @@
+"""
+租约分配器测试: 空闲池、过期堆、释放与标记已使用
+"""
+
+import threading
+
+from src.pool.lease_allocator import LeaseAllocator
+
+NOW = 1_000_000.0
+
+
+def make_allocator(count=3, duration=60):
+    allocator = LeaseAllocator(duration)
+    allocator.add_accounts(f'user{i}@x.com' for i in range(count))
+    return allocator
+
+
+def test_allocates_each_account_once_until_exhausted():
+    allocator = make_allocator(5)
+    leases = [allocator.allocate(now=NOW) for _ in range(5)]
+    assert len({lease.email for lease in leases}) == 5
+    assert allocator.allocate(now=NOW) is None
+    assert allocator.stats() == {"free": 0, "leased": 5, "heap_entries": 5, "waiters": 0}
+    lease = leases[0]
+    assert (lease.leased_at, lease.expires_at, lease.duration) == (NOW, NOW + 60, 60)
+
+
+def test_leased_accounts_are_not_returned_to_free_pool_by_sync():
+    allocator = make_allocator(1)
+    lease = allocator.allocate(now=NOW)
+    allocator.add_accounts([lease.email])
+    assert allocator.allocate(now=NOW) is None
+
+
+def test_expired_leases_are_reclaimed_on_allocate():
+    allocator = make_allocator(1)
+    first = allocator.allocate(now=NOW)
+    assert allocator.allocate(now=NOW + 30) is None
+    second = allocator.allocate(now=NOW + 61)
+    assert second.email == first.email and second.token != first.token
+    assert allocator.get_by_token(first.token, now=NOW + 61) is None
+
+
+def test_expire_only_pops_due_entries():
+    allocator = make_allocator(3)
+    leases = [allocator.allocate(now=NOW, duration=d) for d in (10, 20, 30)]
+    assert allocator.expire(now=NOW + 15) == [leases[0].email]
+    assert allocator.stats()["heap_entries"] == 2
+    assert allocator.expire(now=NOW + 15) == []
+    assert sorted(allocator.expire(now=NOW + 31)) == sorted(lease.email for lease in leases[1:])
+    assert allocator.stats()["free"] == 3
+
+
+def test_renewed_lease_leaves_stale_heap_entry_that_is_skipped():
+    allocator = make_allocator(1)
+    lease = allocator.allocate(now=NOW)
+    allocator.renew(lease.email, now=NOW + 50)
+    assert allocator.stats()["heap_entries"] == 2
+    # 旧的到期时间已过，但租约已续期，不应被回收
+    assert allocator.expire(now=NOW + 70) == []
+    assert allocator.get(lease.email, now=NOW + 70) is lease
+    assert allocator.stats()["heap_entries"] == 1
+    assert allocator.expire(now=NOW + 111) == [lease.email]
+
+
+def test_get_reclaims_lease_that_expired_before_heap_pop():
+    allocator = make_allocator(1)
+    lease = allocator.allocate(now=NOW)
+    assert allocator.get(lease.email, now=NOW + 61) is None
+    assert allocator.stats()["free"] == 1
+    # 堆中的失效条目随后被丢弃，不会再次回收
+    assert allocator.expire(now=NOW + 62) == []
+
+
+def test_heap_is_compacted_when_mostly_stale():
+    allocator = make_allocator(1)
+    lease = allocator.allocate(now=NOW)
+    for i in range(LeaseAllocator.HEAP_COMPACT_MIN * 3):
+        allocator.renew(lease.email, now=NOW + i * 0.001)
+    assert allocator.stats()["heap_entries"] <= LeaseAllocator.HEAP_COMPACT_MIN + 1
+
+
+def test_release_returns_account_and_mark_used_retires_it():
+    allocator = make_allocator(2)
+    first = allocator.allocate(now=NOW)
+    second = allocator.allocate(now=NOW)
+    assert allocator.release(first.email) is True
+    assert allocator.release(first.email) is False
+    assert allocator.mark_used(second.email) is True
+    assert allocator.stats()["free"] == 1
+    assert allocator.allocate(now=NOW).email == first.email
+    assert allocator.allocate(now=NOW) is None
+
+
+def test_removed_account_is_dropped_when_its_lease_ends():
+    allocator = make_allocator(2)
+    lease = allocator.allocate(now=NOW)
+    allocator.remove_accounts([lease.email])
+    assert allocator.leased_emails() == [lease.email]
+    allocator.release(lease.email)
+    remaining = allocator.allocate(now=NOW)
+    assert remaining.email != lease.email
+    assert allocator.allocate(now=NOW) is None
+
+
+def test_mark_used_of_free_account_removes_it_from_pool():
+    allocator = make_allocator(1)
+    assert allocator.mark_used('user0@x.com') is False
+    assert allocator.allocate(now=NOW) is None
+
+
+def test_observers_receive_lease_events():
+    events = []
+
+    class Recorder:
+        def record_allocate(self, lease):
+            events.append(('allocate', lease.email))
+
+        def record_renew(self, lease):
+            events.append(('renew', lease.email))
+
+        def record_release(self, email):
+            events.append(('release', email))
+
+        def record_mark_used(self, email):
+            events.append(('mark_used', email))
+
+        def record_expire(self, email):
+            events.append(('expire', email))
+
+    allocator = make_allocator(1)
+    allocator.add_observer(Recorder())
+    lease = allocator.allocate(now=NOW)
+    allocator.renew(lease.email, now=NOW)
+    allocator.release(lease.email)
+    lease = allocator.allocate(now=NOW)
+    allocator.expire(now=NOW + 61)
+    lease = allocator.allocate(now=NOW + 61)
+    allocator.mark_used(lease.email)
+    allocator.flush()
+    assert [event for event, _ in events] == ['allocate', 'renew', 'release', 'allocate', 'expire', 'allocate',
+                                              'mark_used']
+
+
+def test_observers_are_notified_on_dispatcher_thread():
+    allocator = make_allocator(2)
+    seen = []
+
+    class Reentrant:
+        def record_allocate(self, lease):
+            # 分发线程不持有分配器的锁，观察者可以再次调用分配器
+            seen.append(threading.current_thread() is not threading.main_thread())
+            seen.append(allocator.get(lease.email, now=NOW) is lease)
+
+        def record_release(self, email):
+            seen.append(email)
+
+    allocator.add_observer(Reentrant())
+    lease = allocator.allocate(now=NOW)
+    allocator.flush()
+    allocator.release(lease.email)
+    allocator.close()
+    assert seen == [True, True, lease.email]
+
+
+def test_slow_observer_does_not_block_allocation():
+    allocator = make_allocator(3)
+    unblock = threading.Event()
+    allocated = []
+
+    class Slow:
+        def record_allocate(self, lease):
+            unblock.wait(5)
+            allocated.append(lease.email)
+
+    allocator.add_observer(Slow())
+    leases = [allocator.allocate(now=NOW) for _ in range(3)]
+    # 观察者还卡在第一个事件上，分配和释放都不需要等它
+    assert all(lease is not None for lease in leases) and allocated == []
+    assert allocator.release(leases[0].email) is True
+    unblock.set()
+    allocator.flush()
+    assert allocated == [lease.email for lease in leases]
+
+
+def test_observer_events_keep_order_across_threads():
+    allocator = make_allocator(20)
+    events = []
+
+    class Recorder:
+        def record_allocate(self, lease):
+            events.append(('allocate', lease.email))
+
+        def record_release(self, email):
+            events.append(('release', email))
+
+    allocator.add_observer(Recorder())
+
+    def worker():
+        for _ in range(200):
+            lease = allocator.allocate(now=NOW)
+            if lease is not None:
+                allocator.release(lease.email)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    allocator.flush()
+    leased = set()
+    for event, email in events:
+        if event == 'allocate':
+            assert email not in leased
+            leased.add(email)
+        else:
+            leased.remove(email)
+    assert leased == set()
@@ -0,0 +1,150 @@
+"""
+共享租约后端测试: 两个后端实例 (以及两个进程) 共享同一个 SQLite 文件或 Redis 时不会重复分配，
+令牌不匹配的续期/释放会被拒绝，启动时移除账号库中已不存在的账号
+"""
+
+import threading
+import multiprocessing
+
+import pytest
+
+from src.pool.account_store import FileAccountStore
+from src.pool.lease_backend import RedisLeaseBackend, SqliteLeaseBackend
+
+from tests.helpers import write_account
+
+NOW = 1_000_000.0
+EMAILS = [f'user{i}@x.com' for i in range(50)]
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def backends(request, tmp_path):
+    """两个共享同一份数据的后端实例，模拟两个服务进程。"""
+    if request.param == 'sqlite':
+        pair = [SqliteLeaseBackend(tmp_path / 'leases.db', 60) for _ in range(2)]
+    else:
+        fakeredis = pytest.importorskip('fakeredis')
+        server = fakeredis.FakeServer()
+        pair = [RedisLeaseBackend(fakeredis.FakeRedis(server=server), 60) for _ in range(2)]
+    pair[0].add_accounts(EMAILS)
+    yield pair
+    for backend in pair:
+        backend.close()
+
+
+def test_concurrent_allocations_never_share_an_account(backends):
+    allocated = []
+    lock = threading.Lock()
+
+    def worker(backend):
+        while True:
+            leases = backend.allocate_many(3)
+            if not leases:
+                return
+            with lock:
+                allocated.extend(lease.email for lease in leases)
+
+    threads = [threading.Thread(target=worker, args=(backends[i % 2],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(allocated) == sorted(EMAILS)
+    assert backends[1].allocate() is None
+
+
+def test_lease_is_visible_and_token_checked_across_instances(backends):
+    first, second = backends
+    lease = first.allocate(now=NOW)
+    assert second.get(lease.email, now=NOW).token == lease.token
+    assert second.get_by_token(lease.token, now=NOW).email == lease.email
+
+    assert second.renew(lease.email, now=NOW + 10, token='stale') is None
+    assert second.release(lease.email, token='stale') is False
+    assert second.mark_used(lease.email, token='stale') is False
+    assert first.renew(lease.email, now=NOW + 10, token=lease.token).expires_at == NOW + 70
+    assert second.release(lease.email, token=lease.token) is True
+    assert first.get(lease.email, now=NOW + 10) is None
+    assert first.release(lease.email, token=lease.token) is False
+
+
+def test_expired_lease_is_reclaimed_by_other_instance(backends):
+    first, second = backends
+    leases = first.allocate_many(len(EMAILS), now=NOW)
+    assert second.allocate(now=NOW + 30) is None
+    reclaimed = second.allocate(now=NOW + 61)
+    assert reclaimed.email in {lease.email for lease in leases}
+    stale = next(lease for lease in leases if lease.email == reclaimed.email)
+    # 旧令牌不能续期或释放重新分配出去的租约
+    assert first.renew(stale.email, now=NOW + 61, token=stale.token) is None
+    assert first.release(stale.email, token=stale.token) is False
+    assert second.get(reclaimed.email, now=NOW + 61).token == reclaimed.token
+
+
+def test_removed_accounts_leave_the_shared_pool(backends):
+    first, second = backends
+    lease = first.allocate(now=NOW)
+    free = next(email for email in EMAILS if email != lease.email)
+    second.remove_accounts([lease.email, free])
+    assert first.pool_emails() == set(EMAILS) - {lease.email, free}
+    assert first.get(lease.email, now=NOW) is not None
+    second.release(lease.email)
+    assert lease.email not in {l.email for l in first.allocate_many(len(EMAILS), now=NOW)}
+
+
+def _allocate_all(db_path, queue):
+    backend = SqliteLeaseBackend(db_path, 60)
+    emails = []
+    while True:
+        leases = backend.allocate_many(2)
+        if not leases:
+            break
+        emails.extend(lease.email for lease in leases)
+    backend.close()
+    queue.put(emails)
+
+
+def test_two_processes_share_sqlite_backend(tmp_path):
+    db_path = tmp_path / 'leases.db'
+    SqliteLeaseBackend(db_path, 60).add_accounts(EMAILS)
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    processes = [context.Process(target=_allocate_all, args=(db_path, queue)) for _ in range(2)]
+    for process in processes:
+        process.start()
+    results = [queue.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+    allocated = results[0] + results[1]
+    assert sorted(allocated) == sorted(EMAILS)
+
+
+def test_add_accounts_skips_accounts_leased_elsewhere(backends):
+    first, second = backends
+    lease = first.allocate(now=NOW)
+    second.add_accounts(EMAILS)
+    assert lease.email not in {l.email for l in second.allocate_many(len(EMAILS), now=NOW)}
+
+
+def test_service_drops_backend_accounts_missing_from_store(service, tmp_path, monkeypatch):
+    backend = SqliteLeaseBackend(tmp_path / 'leases.db', 60)
+    backend.add_accounts(['user0@x.com', 'gone@x.com', 'leased-gone@x.com'])
+    for lease in backend.allocate_many(3):
+        if lease.email != 'leased-gone@x.com':
+            backend.release(lease.email)
+    oauth_dir = tmp_path / 'accounts'
+    oauth_dir.mkdir()
+    write_account(oauth_dir, 'user0@x.com')
+    monkeypatch.setattr(service.module, 'lease_allocator', backend)
+    monkeypatch.setattr(service.module, 'account_store', None)
+    monkeypatch.setattr(service.module, 'create_account_store', lambda: FileAccountStore(oauth_dir, 0))
+
+    service.module.get_account_store()
+    assert backend.pool_emails() == {'user0@x.com'}
+    # 持有租约的账号在租约结束后才会被移除
+    assert backend.get('leased-gone@x.com') is not None
+    backend.release('leased-gone@x.com')
+    assert backend.allocate().email == 'user0@x.com'
+    assert backend.allocate() is None
+    backend.close()
@@ -0,0 +1,122 @@
+"""
+租约日志测试: 重放、崩溃后的不完整记录、压缩以及重启后恢复租约
+"""
+
+from src.pool.lease_allocator import Lease, LeaseAllocator
+from src.pool.lease_journal import JOURNAL_HEADER, LeaseJournal
+
+NOW = 1_000_000.0
+
+
+def restart(path, accounts, now, **journal_options):
+    """模拟服务重启: 新建分配器，先重放日志再加载账号池 (与 start_service 的顺序相同)。"""
+    allocator = LeaseAllocator(60)
+    restored = allocator.attach_journal(LeaseJournal(path, **journal_options), now=now)
+    allocator.add_accounts(accounts)
+    return allocator, restored
+
+
+def test_replay_keeps_last_record_per_email(tmp_path):
+    path = tmp_path / 'leases.journal'
+    path.write_text(JOURNAL_HEADER
+                    + f"A\ta@x.com\t{NOW}\t{NOW + 60}\ttok-a\t60\n"
+                    + f"R\ta@x.com\t{NOW}\t{NOW + 120}\ttok-a\t60\n"
+                    + f"A\tb@x.com\t{NOW}\t{NOW + 60}\ttok-b\t60\n"
+                    + "F\tb@x.com\n"
+                    + f"A\tc@x.com\t{NOW}\t{NOW + 60}\ttok-c\t60\n"
+                    + "U\tc@x.com\n"
+                    + f"A\td@x.com\t{NOW - 100}\t{NOW - 40}\ttok-d\t60\n"
+                    + f"A\te@x.com\t{NOW}\t{NOW + 60}\n"
+                    + "Z\tgarbage\n"
+                    # 写到一半时崩溃留下的不完整记录
+                    + f"A\tf@x.com\t{NOW}\t10000", encoding='utf-8')
+    leases = LeaseJournal(path).replay(now=NOW)
+    assert leases == {
+        'a@x.com': (NOW, NOW + 120, 'tok-a', 60.0),
+        # 旧格式没有 token/duration
+        'e@x.com': (NOW, NOW + 60, '', 60.0),
+    }
+
+
+def test_replay_of_missing_file_is_empty(tmp_path):
+    assert LeaseJournal(tmp_path / 'missing.journal').replay(now=NOW) == {}
+
+
+def test_leases_survive_restart(tmp_path):
+    path = tmp_path / 'leases.journal'
+    accounts = [f'user{i}@x.com' for i in range(4)]
+    allocator, restored = restart(path, accounts, NOW)
+    assert restored == 0
+    kept = allocator.allocate(now=NOW)
+    renewed = allocator.allocate(now=NOW, duration=30)
+    released = allocator.allocate(now=NOW)
+    used = allocator.allocate(now=NOW)
+    allocator.renew(renewed.email, now=NOW + 20)
+    allocator.release(released.email)
+    allocator.mark_used(used.email)
+    allocator.close()
+
+    allocator, restored = restart(path, [email for email in accounts if email != used.email], NOW + 25)
+    assert restored == 2
+    assert sorted(allocator.leased_emails()) == sorted([kept.email, renewed.email])
+    assert allocator.get_by_token(kept.token, now=NOW + 25).email == kept.email
+    assert allocator.get(renewed.email, now=NOW + 25).expires_at == NOW + 50
+    # 恢复的租约不会被再次分配，只剩下被释放的账号
+    assert allocator.allocate(now=NOW + 25).email == released.email
+    assert allocator.allocate(now=NOW + 25) is None
+    allocator.close()
+
+
+def test_restart_drops_leases_that_expired_while_down(tmp_path):
+    path = tmp_path / 'leases.journal'
+    allocator, _ = restart(path, ['a@x.com'], NOW)
+    allocator.allocate(now=NOW)
+    allocator.close()
+    allocator, restored = restart(path, ['a@x.com'], NOW + 61)
+    assert restored == 0
+    assert allocator.allocate(now=NOW + 61).email == 'a@x.com'
+    allocator.close()
+
+
+def test_open_rewrites_journal_as_snapshot(tmp_path):
+    path = tmp_path / 'leases.journal'
+    allocator, _ = restart(path, ['a@x.com', 'b@x.com'], NOW)
+    lease = allocator.allocate(now=NOW)
+    for i in range(5):
+        allocator.renew(lease.email, now=NOW + i)
+    other = allocator.allocate(now=NOW)
+    allocator.release(other.email)
+    allocator.close()
+    assert len(path.read_text().splitlines()) == 1 + 1 + 5 + 2
+
+    allocator, _ = restart(path, ['a@x.com', 'b@x.com'], NOW + 5)
+    assert path.read_text().splitlines()[1:] == [LeaseJournal._lease_line('A', lease).rstrip('\n')]
+    allocator.close()
+
+
+def test_journal_is_compacted_past_threshold(tmp_path):
+    path = tmp_path / 'leases.journal'
+    allocator, _ = restart(path, ['a@x.com', 'b@x.com'], NOW, compact_min_records=10, compact_ratio=2)
+    lease = allocator.allocate(now=NOW)
+    for i in range(30):
+        allocator.renew(lease.email, now=NOW + i)
+    lines = path.read_text().splitlines()
+    assert lines[0] == JOURNAL_HEADER.strip()
+    assert len(lines) <= 1 + 10 + 1
+    allocator.close()
+
+    allocator, restored = restart(path, ['a@x.com', 'b@x.com'], NOW + 30)
+    assert restored == 1
+    assert allocator.get(lease.email, now=NOW + 30).expires_at == NOW + 29 + 60
+    allocator.close()
+
+
+def test_compaction_replaces_journal_with_live_leases(tmp_path):
+    path = tmp_path / 'leases.journal'
+    journal = LeaseJournal(path)
+    journal.open([Lease('a@x.com', NOW, NOW + 60, 'tok', 60)])
+    journal.record_release('a@x.com')
+    journal.compact([])
+    journal.close()
+    assert path.read_text() == JOURNAL_HEADER
+    assert not (tmp_path / 'leases.journal.tmp').exists()
@@ -0,0 +1,79 @@
+"""
+租约令牌与续期测试: 按令牌查找、/renew-lease 心跳以及按令牌释放/标记已使用
+"""
+
+from src.pool.lease_allocator import LeaseAllocator
+
+NOW = 1_000_000.0
+
+
+def test_tokens_identify_the_current_lease_only():
+    allocator = LeaseAllocator(60)
+    allocator.add_accounts(['a@x.com'])
+    lease = allocator.allocate(now=NOW)
+    assert allocator.get_by_token(lease.token, now=NOW) is lease
+    assert allocator.release(lease.email, token='stale') is False
+    assert allocator.mark_used(lease.email, token='stale') is False
+    assert allocator.release(lease.email, token=lease.token) is True
+    assert allocator.get_by_token(lease.token, now=NOW) is None
+
+    again = allocator.allocate(now=NOW)
+    assert again.email == lease.email and again.token != lease.token
+    # 旧令牌不能影响重新分配给其他客户端的租约
+    assert allocator.renew(again.email, now=NOW, token=lease.token) is None
+    assert allocator.mark_used(again.email, token=again.token) is True
+
+
+def test_renew_extends_by_lease_duration():
+    allocator = LeaseAllocator(60)
+    allocator.add_accounts(['a@x.com'])
+    lease = allocator.allocate(now=NOW, duration=30)
+    assert allocator.renew(lease.email, now=NOW + 20).expires_at == NOW + 50
+    assert allocator.renew(lease.email, duration=10, now=NOW + 25).expires_at == NOW + 35
+    # 之后的续期沿用新的时长
+    assert allocator.renew(lease.email, now=NOW + 30).expires_at == NOW + 40
+    assert allocator.renew(lease.email, now=NOW + 41) is None
+    assert allocator.get_by_token(lease.token, now=NOW + 41) is None
+
+
+def test_request_email_returns_token_and_duration(service):
+    body = service.client.get('/request-email?lease_seconds=30').get_json()
+    assert body["lease_token"] and body["lease_duration_seconds"] == 30
+    assert 29 < body["lease_expires_in"] <= 30
+    assert service.client.get('/request-email?lease_seconds=abc').status_code == 400
+    # 过短的租约被提升到 LEASE_MIN_SECONDS
+    body = service.client.get('/request-email?lease_seconds=0.1').get_json()
+    assert body["lease_duration_seconds"] == service.module.LEASE_MIN_SECONDS
+
+
+def test_renew_lease_endpoint(service):
+    lease = service.client.get('/request-email?lease_seconds=30').get_json()
+    response = service.client.post('/renew-lease', json={"lease_token": lease["lease_token"], "lease_seconds": 45})
+    assert response.status_code == 200
+    assert response.get_json()["lease_duration_seconds"] == 45
+    assert service.client.post('/renew-lease', json={"email": lease["email"]}).get_json()["lease_duration_seconds"] == 45
+
+    assert service.client.post('/renew-lease', json={"lease_token": "unknown"}).status_code == 404
+    assert service.client.post('/renew-lease', json={"lease_token": lease["lease_token"],
+                                                     "email": "other@x.com"}).status_code == 404
+    assert service.client.post('/renew-lease', json={}).status_code == 400
+    assert service.client.post('/renew-lease', json={"lease_token": lease["lease_token"],
+                                                     "lease_seconds": "x"}).status_code == 400
+
+
+def test_release_and_mark_used_by_token(service):
+    first = service.client.get('/request-email').get_json()
+    second = service.client.get('/request-email').get_json()
+
+    assert service.client.post('/release-email', json={"lease_token": first["lease_token"]}).status_code == 200
+    assert service.allocator.get(first["email"]) is None
+    # 已失效的令牌释放请求不报错，也不会影响其他租约
+    assert service.client.post('/release-email', json={"lease_token": first["lease_token"]}).status_code == 200
+    assert service.client.post('/release-email', json={"email": second["email"],
+                                                       "lease_token": "stale"}).status_code == 200
+    assert service.allocator.get(second["email"]) is not None
+
+    assert service.client.post('/mark-email-used', json={"lease_token": "stale"}).status_code == 404
+    assert service.client.post('/mark-email-used', json={"lease_token": second["lease_token"]}).status_code == 200
+    assert second["email"] not in service.store
+    assert service.allocator.get(second["email"]) is None
@@ -0,0 +1,149 @@
+"""
+账号池耗尽时的排队等待测试: 唤醒条件、FIFO、超时、队列上限以及 /request-email?wait=N
+"""
+
+import time
+import threading
+
+import pytest
+
+from src.pool.lease_allocator import LeaseAllocator, WaiterQueueFull
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def start_waiter(allocator, results, name, wait=5.0):
+    """在后台线程中等待分配，结果按 name 写入 results。"""
+    def run():
+        results[name] = allocator.allocate(wait=wait)
+
+    thread = threading.Thread(target=run)
+    queued = allocator.stats()["waiters"]
+    thread.start()
+    wait_until(lambda: allocator.stats()["waiters"] > queued)
+    return thread
+
+
+def exhausted_allocator(count=1, duration=60, max_waiters=100):
+    allocator = LeaseAllocator(duration, max_waiters=max_waiters)
+    allocator.add_accounts(f'user{i}@x.com' for i in range(count))
+    leases = [allocator.allocate() for _ in range(count)]
+    return allocator, leases
+
+
+def test_waiter_is_woken_by_release():
+    allocator, (lease,) = exhausted_allocator()
+    results = {}
+    thread = start_waiter(allocator, results, 'a')
+    allocator.release(lease.email)
+    thread.join(5)
+    assert results['a'].email == lease.email
+    assert allocator.stats()["waiters"] == 0
+
+
+def test_waiters_are_served_in_fifo_order():
+    allocator, (lease,) = exhausted_allocator()
+    results = {}
+    first = start_waiter(allocator, results, 'first')
+    second = start_waiter(allocator, results, 'second')
+    # 队列中有等待者时，新的请求不能插队
+    assert allocator.allocate() is None
+
+    allocator.release(lease.email)
+    first.join(5)
+    assert results['first'] is not None and 'second' not in results
+    allocator.release(results['first'].email)
+    second.join(5)
+    assert results['second'].email == lease.email
+
+
+def test_spare_accounts_are_allocated_while_others_wait():
+    allocator, leases = exhausted_allocator(3)
+    results = {}
+    threads = [start_waiter(allocator, results, name) for name in ('a', 'b')]
+    allocator.release_many(lease.email for lease in leases)
+    # 两个账号留给排队的请求，第三个可以立即分配 (不论等待者是否已经醒来)
+    spare = allocator.allocate()
+    assert spare is not None
+    for thread in threads:
+        thread.join(5)
+    assert {results['a'].email, results['b'].email, spare.email} == {lease.email for lease in leases}
+
+
+def test_allocate_many_leaves_accounts_for_waiters():
+    allocator, leases = exhausted_allocator(3)
+    results = {}
+    thread = start_waiter(allocator, results, 'a')
+    allocator.release_many(lease.email for lease in leases)
+    batch = allocator.allocate_many(3)
+    thread.join(5)
+    assert len(batch) == 2 and results['a'] is not None
+    assert {results['a'].email} | {lease.email for lease in batch} == {lease.email for lease in leases}
+
+
+def test_waiter_is_woken_by_new_accounts():
+    allocator, _ = exhausted_allocator()
+    results = {}
+    thread = start_waiter(allocator, results, 'a')
+    allocator.add_accounts(['new@x.com'])
+    thread.join(5)
+    assert results['a'].email == 'new@x.com'
+
+
+def test_waiter_reclaims_lease_when_it_expires():
+    allocator = LeaseAllocator(60)
+    allocator.add_accounts(['a@x.com'])
+    lease = allocator.allocate(duration=0.2)
+    started = time.monotonic()
+    reclaimed = allocator.allocate(wait=5)
+    assert reclaimed.email == lease.email and reclaimed.token != lease.token
+    assert time.monotonic() - started < 2
+
+
+def test_wait_times_out():
+    allocator, _ = exhausted_allocator()
+    started = time.monotonic()
+    assert allocator.allocate(wait=0.1) is None
+    assert 0.1 <= time.monotonic() - started < 2
+    assert allocator.stats()["waiters"] == 0
+
+
+def test_waiter_queue_is_bounded():
+    allocator, (lease,) = exhausted_allocator(max_waiters=1)
+    results = {}
+    thread = start_waiter(allocator, results, 'a')
+    with pytest.raises(WaiterQueueFull):
+        allocator.allocate(wait=1)
+    # 不需要等待的请求不受队列上限影响
+    assert allocator.allocate() is None
+    allocator.release(lease.email)
+    thread.join(5)
+    assert results['a'] is not None
+
+
+def test_request_email_waits_for_release(service):
+    service.allocator.allocate_many(5)
+    email = service.allocator.leased_emails()[0]
+    assert service.client.get('/request-email').status_code == 409
+
+    timer = threading.Timer(0.1, service.allocator.release, args=(email,))
+    timer.start()
+    response = service.client.get('/request-email?wait=5')
+    timer.join()
+    assert response.status_code == 200
+    assert response.get_json()["email"] == email
+
+
+def test_request_email_rejects_when_waiter_queue_is_full(service):
+    service.allocator.allocate_many(5)
+    results = {}
+    threads = [start_waiter(service.allocator, results, name, wait=0.5) for name in ('a', 'b')]
+    assert service.client.get('/request-email?wait=1').status_code == 429
+    assert service.client.get('/request-email?wait=abc').status_code == 400
+    for thread in threads:
+        thread.join(5)
@@ -0,0 +1,47 @@
+"""
+已解析邮件缓存测试: 缓存启用时先只查询最新邮件的 UID，没有变化时不再下载邮件；
+缓存禁用时不单独查询 UID，UID (用于 ETag) 随邮件内容在同一条 FETCH 中获取
+"""
+
+import pytest
+
+from src.api import cloud_email_api
+from src.api.message_cache import MessageCache
+
+from tests.fake_imap import message
+
+
+def fetches(imap_server):
+    return [line for line in imap_server.state.lines if 'FETCH' in line]
+
+
+def test_unchanged_latest_email_is_served_from_cache(imap_server):
+    imap_server.state.messages.append(message('First'))
+    first = cloud_email_api.get_latest_email('rt', 'cid', 'user@x.com')
+    assert (first['uid'], first['uidvalidity']) == (1, 7)
+    assert fetches(imap_server) == ['FETCH 1 (UID)', 'UID FETCH 1 (RFC822)']
+
+    imap_server.state.lines.clear()
+    assert cloud_email_api.get_latest_email('rt', 'cid', 'user@x.com') == first
+    assert fetches(imap_server) == ['FETCH 1 (UID)']
+
+    imap_server.state.lines.clear()
+    imap_server.state.messages.append(message('Second'))
+    assert cloud_email_api.get_latest_email('rt', 'cid', 'user@x.com')['subject'] == 'Second'
+    assert fetches(imap_server) == ['FETCH 2 (UID)', 'UID FETCH 2 (RFC822)']
+
+
+@pytest.mark.parametrize('profile, expected', [
+    ('full', ['FETCH 2 (UID RFC822)']),
+    ('summary', ['FETCH 2 (UID BODY.PEEK[HEADER.FIELDS', 'FETCH 2 (BODY.PEEK[1]<0.']),
+])
+def test_disabled_cache_fetches_uid_with_the_message(imap_server, monkeypatch, profile, expected):
+    monkeypatch.setattr(cloud_email_api, 'message_cache', MessageCache(max_entries=0))
+    imap_server.state.messages.extend([message('First'), message('Second')])
+    for _ in range(2):
+        imap_server.state.lines.clear()
+        latest = cloud_email_api.get_latest_email('rt', 'cid', 'user@x.com', profile=profile)
+        assert (latest['subject'], latest['uid'], latest['uidvalidity']) == ('Second', 2, 7)
+        lines = fetches(imap_server)
+        assert len(lines) == len(expected)
+        assert all(line.startswith(prefix) for line, prefix in zip(lines, expected))
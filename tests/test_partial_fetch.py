@@ -0,0 +1,92 @@
+"""
+摘要获取测试: FETCH 响应和 BODYSTRUCTURE 解析、截断正文的解码，
+以及 profile=summary 时只获取头部和截断的正文部分 (不下载 RFC822 和附件)
+"""
+
+import base64
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from src.api import cloud_email_api
+from src.api.partial_fetch import decode_partial, find_body_item, find_text_part, parse_fetch_response
+
+
+def multipart_message(text: str, html: str = None, attachment: bytes = b'') -> bytes:
+    msg = MIMEMultipart('mixed')
+    msg['From'] = 'Sender <sender@example.com>'
+    msg['Subject'] = 'Summary test'
+    msg['Date'] = 'Mon, 1 Jan 2024 00:00:00 +0000'
+    if html is None:
+        msg.attach(MIMEText(text, 'plain', 'utf-8'))
+    else:
+        alternative = MIMEMultipart('alternative')
+        alternative.attach(MIMEText(text, 'plain', 'utf-8'))
+        alternative.attach(MIMEText(html, 'html', 'utf-8'))
+        msg.attach(alternative)
+    if attachment:
+        msg.attach(MIMEApplication(attachment, Name='file.bin'))
+    return msg.as_bytes()
+
+
+def test_parse_fetch_response_with_literals():
+    data = [
+        (b'1 (UID 7 BODY[HEADER.FIELDS (FROM SUBJECT)] {19}', b'Subject: a "b" (c)\r\n'),
+        b' BODYSTRUCTURE ("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "BASE64" 120 2 NIL NIL NIL))',
+        (b'2 (UID 9 BODY[1]<0> {3}', b'abc'),
+        b')',
+    ]
+    parsed = parse_fetch_response(data)
+    assert [sequence for sequence, _ in parsed] == [1, 2]
+    first = parsed[0][1]
+    assert first['UID'] == b'7'
+    assert find_body_item(first, 'BODY[HEADER') == b'Subject: a "b" (c)\r\n'
+    part = find_text_part(first['BODYSTRUCTURE'])
+    assert (part.section, part.subtype, part.charset, part.encoding, part.size) == ('1', 'plain', 'utf-8', 'base64', 120)
+    assert find_body_item(parsed[1][1], 'BODY[1]') == b'abc'
+
+
+def test_find_text_part_prefers_plain_and_skips_attachments():
+    alternative = [[b'TEXT', b'HTML', [b'CHARSET', b'utf-8'], None, None, b'7BIT', b'10', b'1'],
+                   [b'TEXT', b'PLAIN', [b'CHARSET', b'utf-8'], None, None, b'7BIT', b'10', b'1'],
+                   b'ALTERNATIVE']
+    attachment = [b'TEXT', b'PLAIN', [b'NAME', b'notes.txt'], None, None, b'7BIT', b'10', b'1']
+    part = find_text_part([attachment, alternative, b'MIXED'])
+    assert (part.section, part.subtype) == ('2.2', 'plain')
+
+    html_only = [[b'TEXT', b'HTML', None, None, None, b'QUOTED-PRINTABLE', b'10', b'1'], b'MIXED']
+    part = find_text_part(html_only)
+    assert (part.section, part.subtype, part.encoding) == ('1', 'html', 'quoted-printable')
+    assert find_text_part([b'IMAGE', b'PNG', None, None, None, b'BASE64', b'10']) is None
+
+
+def test_decode_partial_handles_truncated_encodings():
+    encoded = base64.b64encode('验证码 123456'.encode())
+    assert decode_partial(encoded[:10], 'base64') == base64.b64decode(encoded[:8])
+    assert decode_partial(b'caf=C3=A9 =C', 'quoted-printable') == 'café '.encode()
+    assert decode_partial(b'caf=C3=A9 =', 'quoted-printable') == 'café '.encode()
+    assert decode_partial(b'plain', '7bit') == b'plain'
+
+
+def test_summary_profile_fetches_headers_and_capped_text_only(imap_server, monkeypatch):
+    monkeypatch.setattr(cloud_email_api, 'IMAP_SUMMARY_MAX_BYTES', 64)
+    text = 'Your code is 654321. ' + 'x' * 500
+    imap_server.state.messages.append(multipart_message(text, attachment=b'\0' * 100_000))
+    email = cloud_email_api.get_latest_email('rt', 'cid', 'user@x.com', profile='summary')
+    assert email['subject'] == 'Summary test' and email['sender'] == 'Sender <sender@example.com>'
+    assert email['content'].startswith('Your code is 654321.')
+    assert len(email['content']) < 64 and email['truncated'] is True
+    assert email['uid'] == 1 and email['uidvalidity'] == 7
+    assert not any('RFC822' in line for line in imap_server.state.lines)
+
+
+def test_summary_profile_falls_back_to_html_part(imap_server):
+    html = '<p>Code: <b>777888</b></p>'
+    msg = MIMEMultipart('mixed')
+    msg['Subject'] = 'Html only'
+    msg.attach(MIMEText(html, 'html', 'utf-8'))
+    imap_server.state.messages.extend([multipart_message('Plain text', html=html), msg.as_bytes()])
+    emails = cloud_email_api.get_all_emails('rt', 'cid', 'user@x.com', profile='summary')
+    assert emails[0]['content'] == 'Plain text' and emails[0]['html_content'] is None
+    assert emails[1]['content'] == 'Code: 777888' and emails[1]['html_content'] == html
+    assert emails[1]['truncated'] is False
@@ -0,0 +1,79 @@
+"""
+正文解码测试: 优先使用声明的 charset，其次严格按 UTF-8 解码 (两者成功时不调用 chardet)，
+ISO-2022-JP 等含 ESC 序列的内容和错误的声明交给 chardet (只检测前 CHARSET_DETECT_MAX_BYTES 字节)，
+检测失败时使用备选编码，以及 /stats 中的解码计数
+"""
+
+from email.mime.text import MIMEText
+
+import chardet
+import pytest
+
+from src.api import cloud_email_api
+
+
+@pytest.fixture
+def detector(monkeypatch):
+    """记录 chardet.detect 收到的内容，并清零解码计数。"""
+    calls = []
+    original = chardet.detect
+
+    def detect(data):
+        calls.append(data)
+        return original(data)
+
+    monkeypatch.setattr(cloud_email_api.chardet, 'detect', detect)
+    monkeypatch.setattr(cloud_email_api, '_decode_stats', dict.fromkeys(cloud_email_api.get_decode_stats(), 0))
+    return calls
+
+
+def test_declared_charset_skips_detection(detector):
+    assert cloud_email_api.safe_decode('验证码 123456'.encode('gbk'), 'GBK') == '验证码 123456'
+    assert detector == []
+    assert cloud_email_api.get_decode_stats()['declared'] == 1
+
+
+@pytest.mark.parametrize('charset', [None, 'x-unknown-charset'])
+def test_utf8_fast_path_without_usable_declaration(detector, charset):
+    assert cloud_email_api.safe_decode('Código 123456 ✓'.encode(), charset) == 'Código 123456 ✓'
+    assert detector == []
+    assert cloud_email_api.get_decode_stats()['utf8'] == 1
+
+
+def test_iso_2022_jp_is_detected_instead_of_read_as_utf8(detector):
+    text = '日本語のメール本文です。確認コード'
+    assert cloud_email_api.safe_decode(text.encode('iso2022_jp')) == text
+    assert len(detector) == 1
+    assert cloud_email_api.get_decode_stats()['detected'] == 1
+
+
+def test_wrong_declaration_falls_through_to_detection(detector):
+    payload = 'Le café coûte 3 €, merci beaucoup pour votre commande.'.encode('cp1252')
+    assert cloud_email_api.safe_decode(payload, 'utf-8') == payload.decode('cp1252')
+    assert len(detector) == 1
+    stats = cloud_email_api.get_decode_stats()
+    assert stats['declared'] == 0 and stats['utf8'] == 0 and stats['detected'] == 1
+
+
+def test_detection_only_reads_a_prefix(detector, monkeypatch):
+    monkeypatch.setattr(cloud_email_api, 'CHARSET_DETECT_MAX_BYTES', 16)
+    cloud_email_api.safe_decode('é'.encode('latin-1') * 1000)
+    assert [len(data) for data in detector] == [16]
+
+
+def test_fallback_when_detection_fails(detector, monkeypatch):
+    monkeypatch.setattr(cloud_email_api.chardet, 'detect', lambda data: {'encoding': None})
+    assert cloud_email_api.safe_decode(b'caf\xe9') == 'café'
+    assert cloud_email_api.get_decode_stats()['fallback'] == 1
+
+
+def test_parse_email_message_uses_part_charset(detector):
+    msg = MIMEText('您的验证码为 605118', 'plain', 'gb2312')
+    assert cloud_email_api.parse_email_message(msg)['content'] == '您的验证码为 605118'
+    assert detector == []
+    assert cloud_email_api.get_decode_stats()['declared'] == 1
+
+
+def test_stats_endpoint_reports_decode_counters(service, detector):
+    cloud_email_api.safe_decode(b'plain ascii')
+    assert service.client.get('/stats').json['decode'] == {'declared': 0, 'utf8': 1, 'detected': 0, 'fallback': 0}
@@ -0,0 +1,219 @@
+"""
+访问令牌缓存测试: 缓存与安全余量、并发刷新合并 (single-flight)、失效刷新令牌的识别以及通知隔离账号
+"""
+
+import time
+import threading
+
+import pytest
+
+from src.api import cloud_email_api
+from src.api.token_cache import CredentialsRejected, TokenCache, check_token_error
+
+
+def test_token_is_cached_until_margin_before_expiry():
+    cache = TokenCache(margin_seconds=300)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return f'token-{len(calls)}', 3600
+
+    assert cache.get('cid', 'rt', fetch) == 'token-1'
+    assert cache.get('cid', 'rt', fetch) == 'token-1'
+    assert cache.is_cached('cid', 'rt')
+    # 有效期内减去余量之后视为过期
+    key = ('cid', 'rt')
+    cache._tokens[key] = (cache._tokens[key][0], time.time() - 1)
+    assert cache.get('cid', 'rt', fetch) == 'token-2'
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 2, "refreshes": 2, "coalesced": 0, "failures": 0}
+
+
+def test_margin_is_at_most_half_of_lifetime():
+    cache = TokenCache(margin_seconds=300)
+    cache.put('cid', 'rt', 'short', 60)
+    valid_until = cache._tokens[('cid', 'rt')][1]
+    assert 25 < valid_until - time.time() <= 30
+
+
+def test_concurrent_misses_share_one_refresh():
+    cache = TokenCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'shared', 3600
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get('cid', 'rt', fetch)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(cache.get('cid', 'rt', fetch))) for _ in range(5)]
+    for thread in followers:
+        thread.start()
+    while cache.stats()["coalesced"] < 5:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert results == ['shared'] * 6 and len(calls) == 1
+    assert cache.stats()["refreshes"] == 1
+
+
+def test_failed_refresh_is_not_cached_and_followers_get_none():
+    cache = TokenCache()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fetch():
+        started.set()
+        release.wait(5)
+        raise CredentialsRejected('invalid_grant')
+
+    errors, follower_results = [], []
+
+    def leader():
+        try:
+            cache.get('cid', 'rt', fetch)
+        except CredentialsRejected as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: follower_results.append(cache.get('cid', 'rt', fetch)))
+    follower.start()
+    while cache.stats()["coalesced"] < 1:
+        time.sleep(0.001)
+    release.set()
+    thread.join(5)
+    follower.join(5)
+    # 异常只传给发起刷新的线程
+    assert len(errors) == 1 and follower_results == [None]
+    assert cache.stats()["failures"] == 1
+    assert cache.get('cid', 'rt', lambda: (None, 0)) is None
+    assert not cache.is_cached('cid', 'rt')
+
+
+def test_follower_wait_is_bounded():
+    cache = TokenCache(wait_timeout=0.05)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'late', 3600
+
+    thread = threading.Thread(target=lambda: cache.get('cid', 'rt', slow))
+    thread.start()
+    started.wait(5)
+    begin = time.monotonic()
+    assert cache.get('cid', 'rt', slow, wait_timeout=10) is None
+    assert time.monotonic() - begin < 1
+    release.set()
+    thread.join(5)
+    assert cache.get('cid', 'rt', slow) == 'late'
+
+
+def test_cache_evicts_oldest_entries_when_full():
+    cache = TokenCache(max_entries=2)
+    for i in range(3):
+        cache.put('cid', f'rt{i}', f'token{i}', 3600)
+    assert not cache.is_cached('cid', 'rt0')
+    assert cache.is_cached('cid', 'rt1') and cache.is_cached('cid', 'rt2')
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+        self.text = str(body)
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise cloud_email_api.requests.exceptions.HTTPError(response=self)
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+        self.posts = 0
+
+    def post(self, url, data, timeout):
+        self.posts += 1
+        return self.response
+
+
+@pytest.fixture
+def token_endpoint(monkeypatch):
+    def respond(status_code, body):
+        session = FakeSession(FakeResponse(status_code, body))
+        monkeypatch.setattr(cloud_email_api.token_session, 'get', lambda: session)
+        return session
+
+    cloud_email_api.token_cache.clear()
+    yield respond
+    cloud_email_api.token_cache.clear()
+
+
+def test_check_token_error_only_rejects_dead_refresh_tokens():
+    with pytest.raises(CredentialsRejected, match='expired'):
+        check_token_error(400, {"error": "invalid_grant", "error_description": "expired"})
+    with pytest.raises(CredentialsRejected):
+        check_token_error(401, {"error": "invalid_client"})
+    # 限流、服务端错误和无法解析的响应可以重试，不隔离账号
+    check_token_error(429, {"error": "invalid_grant"})
+    check_token_error(400, {"error": "temporarily_unavailable"})
+    check_token_error(400, None)
+
+
+def test_rejected_refresh_token_notifies_listeners(token_endpoint, monkeypatch):
+    session = token_endpoint(400, {"error": "invalid_grant", "error_description": "AADSTS70000"})
+    rejected = []
+    monkeypatch.setattr(cloud_email_api, '_credentials_rejected_listeners', [rejected.append])
+    assert cloud_email_api.open_imap_connection('dead-rt', 'cid', 'User@x.com') is None
+    assert rejected == ['User@x.com'] and session.posts == 1
+
+
+def test_transient_token_failure_does_not_notify(token_endpoint, monkeypatch):
+    token_endpoint(503, {"error": "temporarily_unavailable"})
+    rejected = []
+    monkeypatch.setattr(cloud_email_api, '_credentials_rejected_listeners', [rejected.append])
+    assert cloud_email_api.open_imap_connection('rt', 'cid', 'user@x.com') is None
+    assert rejected == []
+
+
+def test_open_imap_connection_reuses_cached_token(token_endpoint, monkeypatch):
+    session = token_endpoint(200, {"access_token": "at", "expires_in": 3600})
+    tokens = []
+
+    def connect(email_address, access_token, timeout=None):
+        tokens.append(access_token)
+        return object(), True
+
+    monkeypatch.setattr(cloud_email_api, 'connect_to_imap', connect)
+    assert cloud_email_api.open_imap_connection('rt', 'cid', 'user@x.com') is not None
+    assert cloud_email_api.open_imap_connection('rt', 'cid', 'user@x.com') is not None
+    assert tokens == ['at', 'at'] and session.posts == 1
+
+
+def test_cached_token_rejected_by_imap_is_refreshed_once(token_endpoint, monkeypatch):
+    session = token_endpoint(200, {"access_token": "fresh", "expires_in": 3600})
+    cloud_email_api.token_cache.put('cid', 'rt', 'revoked', 3600)
+    tokens = []
+
+    def connect(email_address, access_token, timeout=None):
+        tokens.append(access_token)
+        return (object(), True) if access_token == 'fresh' else (None, False)
+
+    monkeypatch.setattr(cloud_email_api, 'connect_to_imap', connect)
+    assert cloud_email_api.open_imap_connection('rt', 'cid', 'user@x.com') is not None
+    assert tokens == ['revoked', 'fresh'] and session.posts == 1
@@ -0,0 +1,67 @@
+"""
+/wait-for-email 长轮询测试: 租约开始之后到达的匹配邮件立即返回，旧邮件和不匹配过滤条件的邮件被忽略，
+超时返回 timed_out，等待的客户端数量有上限
+"""
+
+import time
+import threading
+from email.utils import formatdate
+
+import pytest
+
+from tests.fake_imap import message
+
+
+@pytest.fixture
+def waiting(service, imap_server, monkeypatch):
+    monkeypatch.setattr(service.module, 'WAIT_FOR_EMAIL_POLL_MIN_SECONDS', 0.05)
+    monkeypatch.setattr(service.module, 'WAIT_FOR_EMAIL_POLL_MAX_SECONDS', 0.1)
+    imap_server.state.messages.append(message('Old code 111111'))
+    return service
+
+
+def deliver_later(imap_server, raw, delay=0.3):
+    timer = threading.Timer(delay, imap_server.deliver, args=(raw,))
+    timer.start()
+    return timer
+
+
+def test_returns_matching_message_that_arrives_while_waiting(waiting, imap_server):
+    lease = waiting.allocator.allocate()
+    deliver_later(imap_server, message('Other', sender='noise@example.com', date=formatdate()), delay=0.1)
+    deliver_later(imap_server, message('Your code 222222', sender='Login@Example.com', date=formatdate()))
+    started = time.monotonic()
+    response = waiting.client.post('/wait-for-email', json={
+        'lease_token': lease.token, 'from': 'login@example.com', 'subject': 'code', 'timeout': 10})
+    assert response.status_code == 200
+    assert response.json['data']['subject'] == 'Your code 222222'
+    assert time.monotonic() - started < 5
+    # 每次检查都复用同一个连接池里的连接
+    assert imap_server.state.connections == 1
+
+
+def test_old_message_does_not_match_and_wait_times_out(waiting, imap_server):
+    lease = waiting.allocator.allocate()
+    response = waiting.client.post('/wait-for-email', json={'lease_token': lease.token, 'timeout': 0.3})
+    assert response.status_code == 200
+    assert response.json == {"success": True, "data": None, "timed_out": True}
+
+
+def test_message_dated_just_after_lease_start_matches_on_first_check(waiting, imap_server):
+    imap_server.state.messages.append(message('Fresh', date=formatdate()))
+    lease = waiting.allocator.allocate()
+    response = waiting.client.post('/wait-for-email', json={'lease_token': lease.token, 'timeout': 5})
+    assert response.json['data']['subject'] == 'Fresh'
+
+
+def test_too_many_waiters_are_rejected(waiting, monkeypatch):
+    monkeypatch.setitem(waiting.module.config['email'], 'wait_for_email_max_waiters', 0)
+    lease = waiting.allocator.allocate()
+    response = waiting.client.post('/wait-for-email', json={'lease_token': lease.token, 'timeout': 1})
+    assert response.status_code == 429
+
+
+def test_invalid_timeout_is_rejected(waiting):
+    lease = waiting.allocator.allocate()
+    response = waiting.client.post('/wait-for-email', json={'lease_token': lease.token, 'timeout': 'soon'})
+    assert response.status_code == 400